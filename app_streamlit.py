@@ -104,41 +104,17 @@ def main():
         st.header("📁 Procesar Archivo")
         archivo_subido = st.file_uploader(
             "Subir archivo de WhatsApp o Excel",
-            type=['txt', 'xlsx', 'xls'],
-            help="Sube un archivo .txt exportado de WhatsApp o un archivo Excel (.xlsx, .xls) con recetas"
+            type=['txt', 'zip', 'xlsx', 'xls'],
+            help="Sube un archivo .txt o .zip (exportación con archivos) de WhatsApp o un archivo Excel (.xlsx, .xls) con recetas"
         )
         
         if archivo_subido:
             if st.button("Procesar Archivo"):
                 with st.spinner("Procesando archivo..."):
-                    # Detectar tipo de archivo por extensión
-                    nombre_archivo = archivo_subido.name.lower()
-
-                    if nombre_archivo.endswith(('.xlsx', '.xls')):
-                        # Procesar como Excel
-                        with open('temp_excel.xlsx', 'wb') as f:
-                            f.write(archivo_subido.read())
-
-                        # Procesar archivo Excel
-                        resultado = extractor.procesar_archivo('temp_excel.xlsx')
-
-                        # Limpiar archivo temporal
-                        import os
-                        if os.path.exists('temp_excel.xlsx'):
-                            os.remove('temp_excel.xlsx')
-
-                    else:
-                        # Procesar como WhatsApp (txt)
-                        contenido = archivo_subido.read().decode('utf-8')
-                        with open('temp_whatsapp.txt', 'w', encoding='utf-8') as f:
-                            f.write(contenido)
-
-                        # Procesar archivo WhatsApp
-                        resultado = extractor.procesar_archivo('temp_whatsapp.txt')
-
-                        # Limpiar archivo temporal
-                        if os.path.exists('temp_whatsapp.txt'):
-                            os.remove('temp_whatsapp.txt')
+                    # El extractor detecta el tipo por el nombre y lee el
+                    # archivo subido en streaming, sin copiarlo a disco
+                    archivo_subido.seek(0)
+                    resultado = extractor.procesar_archivo(archivo_subido)
 
                     # Mostrar resultados
                     if resultado.get('error'):
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""Mide el coste por llamada del cliente de Mistral contra un servidor local.
+
+El servidor imita `/v1/chat/completions` y responde al instante, así que lo
+medido es solo la sobrecarga del lado del cliente: crear el SDK y abrir la
+conexión en cada llamada (antes) frente a reutilizar un cliente persistente
+con keep-alive (después). El servidor es HTTP plano: contra la API real cada
+conexión nueva añade además el handshake TLS y la latencia de red.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# Asegurar que src esté en el path
+BASE_DIR = Path(__file__).resolve().parent.parent
+SRC_DIR = BASE_DIR / "src"
+sys.path.insert(0, str(SRC_DIR))
+from mistralai import Mistral
+
+from recetario_whatsapp.mistral_client import MistralClient
+
+RESPUESTA = json.dumps(
+    {
+        "id": "stub",
+        "object": "chat.completion",
+        "model": "mistral-small-latest",
+        "created": 0,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": '{"recetas": []}'},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 5, "total_tokens": 15},
+    }
+).encode("utf-8")
+
+
+class ServidorStub(BaseHTTPRequestHandler):
+    """Responde a cualquier POST con una respuesta de chat vacía."""
+
+    protocol_version = "HTTP/1.1"
+    # Cabeceras y cuerpo en un solo envío, sin esperar al ACK retardado
+    wbufsize = -1
+    disable_nagle_algorithm = True
+    conexiones = 0
+
+    def setup(self) -> None:
+        super().setup()
+        type(self).conexiones += 1
+
+    def do_POST(self) -> None:
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPUESTA)))
+        self.end_headers()
+        self.wfile.write(RESPUESTA)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def llamar_sin_reutilizar(cliente: MistralClient, llamadas: int) -> None:
+    """Comportamiento anterior: un SDK y una conexión nuevos por llamada."""
+    for _ in range(llamadas):
+        with Mistral(
+            api_key=cliente.backend.api_key, server_url=cliente.backend.server_url
+        ) as sdk:
+            sdk.chat.complete(**cliente._peticion("hola"))
+
+
+def llamar_reutilizando(cliente: MistralClient, llamadas: int) -> None:
+    """Cliente persistente de `MistralClient` con conexiones keep-alive."""
+    for _ in range(llamadas):
+        cliente.backend._cliente().chat.complete(**cliente._peticion("hola"))
+
+
+def medir(nombre: str, funcion, cliente: MistralClient, llamadas: int) -> None:
+    """Ejecuta las llamadas y muestra el coste medio y las conexiones abiertas."""
+    ServidorStub.conexiones = 0
+    inicio = time.perf_counter()
+    funcion(cliente, llamadas)
+    duracion = time.perf_counter() - inicio
+    print(
+        f"{nombre:<8} {llamadas:>6} llamadas  {duracion:6.2f}s  "
+        f"{duracion / llamadas * 1000:8.2f} ms/llamada  "
+        f"{ServidorStub.conexiones:>6} conexiones"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Benchmark del cliente HTTP de Mistral contra un servidor local"
+    )
+    parser.add_argument(
+        "--llamadas", type=int, default=500, help="Llamadas por medición"
+    )
+    args = parser.parse_args()
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), ServidorStub)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+
+    os.environ["MISTRAL_API_KEY"] = "stub"
+    os.environ["MISTRAL_SERVER_URL"] = f"http://127.0.0.1:{servidor.server_port}"
+    cliente = MistralClient()
+    try:
+        medir("antes", llamar_sin_reutilizar, cliente, args.llamadas)
+        medir("después", llamar_reutilizando, cliente, args.llamadas)
+    finally:
+        cliente.cerrar()
+        servidor.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""Mide líneas/segundo del parser de WhatsApp sobre una exportación sintética."""
+
+from __future__ import annotations
+
+import argparse
+import random
+import re
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Asegurar que src esté en el path
+BASE_DIR = Path(__file__).resolve().parent.parent
+SRC_DIR = BASE_DIR / "src"
+sys.path.insert(0, str(SRC_DIR))
+from recetario_whatsapp.chat_parser import ParserWhatsApp, abrir_lineas
+
+AUTORES = ["Pablo Iru", "Pili", "Xemi", "Rubén", "Iruruelas Ecu", "María"]
+TEXTOS = [
+    "Jajajaj",
+    "Receta de lentejas",
+    "Ingredientes:",
+    "Mañana lo pruebo",
+    "<Multimedia omitido>",
+]
+CONTINUACIONES = ["- 200 g harina", "2 huevos", "Hornear 30 minutos", "y listo"]
+
+
+def generar_exportacion(ruta: Path, lineas: int, semilla: int = 1) -> None:
+    """Escribe una exportación Android (`DD/MM/YY, HH:MM - Autor: texto`)."""
+    aleatorio = random.Random(semilla)
+    with open(ruta, "w", encoding="utf-8") as f:
+        for i in range(lineas):
+            if aleatorio.random() < 0.2:
+                f.write(aleatorio.choice(CONTINUACIONES) + "\n")
+                continue
+            minuto = i // 50
+            fecha = (
+                f"{(minuto // 1440) % 28 + 1:02d}/{(minuto // 40320) % 12 + 1:02d}/25"
+            )
+            hora = f"{(minuto // 60) % 24:02d}:{minuto % 60:02d}"
+            autor = aleatorio.choice(AUTORES)
+            f.write(f"{fecha}, {hora} - {autor}: {aleatorio.choice(TEXTOS)}\n")
+
+
+def parsear_legacy(ruta: Path) -> int:
+    """Réplica del parser anterior: lectura completa y tres patrones por línea."""
+    patron_mensaje = re.compile(
+        r"\[(\d{2}/\d{2}/\d{2}),\s*(\d{2}:\d{2}:\d{2})\]\s*([^:]+):\s*(.*)"
+    )
+    patron_alternativo = re.compile(
+        r"\[(\d{2}/\d{2}/\d{2}),\s*(\d{2}:\d{2})\]\s*([^:]+):\s*(.*)"
+    )
+    patron_real = re.compile(
+        r"(\d{2}/\d{2}/\d{2}),\s*(\d{2}:\d{2})\s*-\s*([^:]+):\s*(.*)"
+    )
+    with open(ruta, "r", encoding="utf-8") as f:
+        contenido = f.read()
+
+    mensajes = []
+    for linea in contenido.split("\n"):
+        linea = linea.strip()
+        if not linea:
+            continue
+        match = patron_mensaje.match(linea)
+        if match:
+            fecha_str, hora_str, creador, mensaje = match.groups()
+            mensajes.append(
+                {
+                    "fecha": f"{fecha_str} {hora_str}",
+                    "creador": creador.strip(),
+                    "mensaje": mensaje.strip(),
+                }
+            )
+            continue
+        for patron in (patron_alternativo, patron_real):
+            match = patron.match(linea)
+            if match:
+                fecha_str, hora_str, creador, mensaje = match.groups()
+                mensajes.append(
+                    {
+                        "fecha": f"{fecha_str} {hora_str}:00",
+                        "creador": creador.strip(),
+                        "mensaje": mensaje.strip(),
+                    }
+                )
+                break
+        else:
+            if mensajes:
+                mensajes[-1]["mensaje"] += f"\n{linea.strip()}"
+    return len(mensajes)
+
+
+def parsear_actual(ruta: Path) -> int:
+    """Parser actual en streaming con detección de formato."""
+    parser = ParserWhatsApp(lambda linea: True)
+    with abrir_lineas(ruta) as lineas:
+        return sum(1 for _ in parser.iterar_mensajes(lineas))
+
+
+def medir(nombre: str, funcion, ruta: Path, lineas: int, repeticiones: int) -> None:
+    """Ejecuta la función varias veces y muestra la mejor marca."""
+    duracion = float("inf")
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        mensajes = funcion(ruta)
+        duracion = min(duracion, time.perf_counter() - inicio)
+    print(
+        f"{nombre:<8} {mensajes:>9} mensajes  {duracion:6.2f}s  "
+        f"{lineas / duracion:>12,.0f} líneas/s"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark del parser de WhatsApp")
+    parser.add_argument(
+        "--lineas", type=int, default=1_000_000, help="Líneas a generar"
+    )
+    parser.add_argument(
+        "--repeticiones", type=int, default=3, help="Repeticiones por medición"
+    )
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ruta = Path(tmp) / "chat_sintetico.txt"
+        generar_exportacion(ruta, args.lineas)
+        print(f"Exportación sintética: {args.lineas:,} líneas")
+        medir("antes", parsear_legacy, ruta, args.lineas, args.repeticiones)
+        medir("después", parsear_actual, ruta, args.lineas, args.repeticiones)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,21 @@
+-- Script de migración para la ingesta incremental de chats de WhatsApp
+-- Ejecuta en Supabase SQL Editor sin perder datos existentes
+-- Compatible con tabla estado_procesamiento y funciones actuales
+
+-- Un checkpoint por chat (nombre del archivo exportado):
+-- - offset_bytes: hasta qué byte de la exportación se procesó
+-- - hash_prefijo: SHA-256 de esos bytes, para comprobar que una nueva
+--   exportación es continuación de la anterior
+-- - ultimo_timestamp: segundos desde epoch del último mensaje procesado
+CREATE TABLE IF NOT EXISTS checkpoints_chat (
+  chat TEXT PRIMARY KEY,
+  offset_bytes BIGINT NOT NULL,
+  hash_prefijo TEXT NOT NULL,
+  ultimo_timestamp BIGINT,
+  ultima_fecha TEXT,
+  ultima_actualizacion TIMESTAMP WITH TIME ZONE DEFAULT NOW()
+);
+
+-- ¡Listo! Si la tabla no existe el extractor guarda los checkpoints solo
+-- en state/last_processed.json. La fecha única de estado_procesamiento ya
+-- no se usa para decidir desde dónde se procesa un chat
@@ -0,0 +1,16 @@
+-- Script de migración para el registro de huellas de mensajes procesados
+-- Ejecuta en Supabase SQL Editor sin perder datos existentes
+-- Solo es necesario si se activa LEDGER_SUPABASE=true
+
+-- Una fila por mensaje ya enviado a Mistral:
+-- - chat: nombre del archivo exportado
+-- - huella: SHA-256 truncado (hex) de timestamp + autor + texto
+CREATE TABLE IF NOT EXISTS huellas_mensajes (
+  chat TEXT NOT NULL,
+  huella TEXT NOT NULL,
+  creado_en TIMESTAMP WITH TIME ZONE DEFAULT NOW(),
+  PRIMARY KEY (chat, huella)
+);
+
+-- ¡Listo! Sin esta tabla el registro sigue funcionando en
+-- state/ledger.sqlite3 (o la ruta de LEDGER_PATH)
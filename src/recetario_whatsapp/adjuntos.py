@@ -0,0 +1,125 @@
+"""
+Exportaciones de WhatsApp "con archivos" (.zip) y sus adjuntos.
+
+El .zip trae el chat (`_chat.txt` en iOS, `WhatsApp Chat with ….txt` en
+Android) junto con las fotos. El chat se lee en streaming desde el propio
+archivo comprimido, sin extraerlo a disco, y las referencias a adjuntos del
+texto se resuelven contra los miembros del .zip; los bytes de cada imagen
+solo se leen cuando hace falta subirla.
+"""
+
+import os
+import re
+import zipfile
+from typing import IO, Any, Dict, List, Optional
+
+# Solo estas extensiones se consideran fotos de una receta
+EXTENSIONES_IMAGEN = (".jpg", ".jpeg", ".png", ".webp", ".gif", ".heic")
+
+# iOS: "<adjunto: 00000012-PHOTO-2025-10-01-18-02-12.jpg>"
+# Android: "IMG-20251001-WA0003.jpg (archivo adjunto)"
+_PATRON_ADJUNTO = re.compile(
+    r"<(?:adjunto|attached):\s*(?P<ios>[^<>]+?)\s*>"
+    r"|(?P<android>[^\s<>\u200e]+\.\w{2,5})\s+\((?:archivo adjunto|file attached)\)",
+    re.IGNORECASE,
+)
+
+
+def es_zip(nombre: str) -> bool:
+    """Indica si un nombre de archivo corresponde a una exportación .zip."""
+    return nombre.lower().endswith(".zip")
+
+
+def adjuntos_referenciados(texto: str) -> List[str]:
+    """
+    Devuelve los nombres de archivo adjunto que aparecen en un mensaje.
+
+    Args:
+        texto: Texto del mensaje
+
+    Returns:
+        Nombres de los adjuntos en el orden en que aparecen
+    """
+    # Atajo: la mayoría de mensajes no mencionan ningún adjunto
+    if "<" not in texto and "(" not in texto:
+        return []
+    return [
+        match.group("ios") or match.group("android")
+        for match in _PATRON_ADJUNTO.finditer(texto)
+    ]
+
+
+def solo_adjuntos(texto: str) -> bool:
+    """Indica si un mensaje consiste únicamente en referencias a adjuntos."""
+    return not _PATRON_ADJUNTO.sub("", texto).strip(" \n\u200e")
+
+
+class ExportacionZip:
+    """Exportación de WhatsApp comprimida, abierta sin extraerla."""
+
+    def __init__(self, fuente: Any):
+        """
+        Abre el .zip y localiza el chat y los adjuntos.
+
+        Args:
+            fuente: Ruta al .zip o stream binario con acceso aleatorio
+
+        Raises:
+            zipfile.BadZipFile: Si el archivo no es un .zip válido
+            ValueError: Si el .zip no contiene ningún chat
+        """
+        self.zip = zipfile.ZipFile(fuente)
+        self._miembros: Dict[str, zipfile.ZipInfo] = {}
+        textos: List[zipfile.ZipInfo] = []
+        for info in self.zip.infolist():
+            if info.is_dir():
+                continue
+            nombre = os.path.basename(info.filename)
+            self._miembros.setdefault(nombre.lower(), info)
+            if nombre.lower().endswith(".txt"):
+                textos.append(info)
+
+        miembro_chat = self._miembros.get("_chat.txt")
+        if miembro_chat is None and textos:
+            # Android nombra el chat según el grupo; si hay varios .txt, el
+            # chat es el más grande (el resto suelen ser documentos adjuntos)
+            miembro_chat = max(textos, key=lambda info: info.file_size)
+        if miembro_chat is None:
+            self.zip.close()
+            raise ValueError("El .zip no contiene ningún chat (.txt)")
+        self.miembro_chat = miembro_chat
+        self.chat: Optional[IO[bytes]] = None
+
+    def __enter__(self) -> "ExportacionZip":
+        # El chat se descomprime a medida que se lee
+        self.chat = self.zip.open(self.miembro_chat)
+        return self
+
+    def __exit__(self, *excepcion: Any) -> None:
+        self.cerrar()
+
+    def resolver(self, nombre: str) -> Optional[str]:
+        """
+        Busca en el .zip la imagen a la que se refiere un mensaje.
+
+        Args:
+            nombre: Nombre del adjunto tal como aparece en el chat
+
+        Returns:
+            Nombre del miembro del .zip, o None si no está o no es una imagen
+        """
+        info = self._miembros.get(os.path.basename(nombre.strip()).lower())
+        if info is None or not info.filename.lower().endswith(EXTENSIONES_IMAGEN):
+            return None
+        return info.filename
+
+    def leer(self, miembro: str) -> bytes:
+        """Lee los bytes de un adjunto del .zip."""
+        return self.zip.read(miembro)
+
+    def cerrar(self) -> None:
+        """Cierra el chat y el .zip."""
+        if self.chat is not None:
+            self.chat.close()
+            self.chat = None
+        self.zip.close()
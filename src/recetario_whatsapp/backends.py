@@ -0,0 +1,392 @@
+"""
+Backends de extracción: servidores a los que se envían las peticiones.
+
+`MistralClient` prepara las peticiones (prompts, esquema, reintentos, caché)
+y las envía al backend que indica `EXTRACCION_BACKEND`:
+
+- `mistral` (por defecto): la API de Mistral con su SDK, para el uso
+  interactivo, con el ritmo limitado por el nivel contratado.
+- `openai`: cualquier servidor de inferencia con la API de OpenAI
+  (`/chat/completions`), como vLLM, llama.cpp u Ollama en máquinas propias,
+  para las importaciones masivas sin límites de ritmo.
+
+Cada backend tiene su propio modelo, concurrencia, timeout y límites, y
+devuelve las respuestas con la misma forma que el SDK de Mistral
+(`choices[0].message.content`, `finish_reason`, `usage`).
+"""
+
+import asyncio
+import json
+import os
+import threading
+from abc import ABC, abstractmethod
+from types import SimpleNamespace
+from typing import Any, AsyncIterator, Dict, Optional
+
+import httpx
+from mistralai import Mistral
+
+from .limitador import LimitadorMistral, crear_limitador
+
+# Valores admitidos en EXTRACCION_BACKEND
+BACKEND_MISTRAL = "mistral"
+BACKEND_OPENAI = "openai"
+BACKENDS = (BACKEND_MISTRAL, BACKEND_OPENAI)
+
+
+class BackendExtraccion(ABC):
+    """Servidor de inferencia que responde a las peticiones de extracción."""
+
+    nombre = ""
+
+    def __init__(
+        self,
+        modelo: str,
+        concurrencia: int,
+        timeout: float,
+        context_window: int,
+        conexiones: int,
+        keepalive: float = 60.0,
+    ):
+        """
+        Inicializa la configuración común.
+
+        Args:
+            modelo: Modelo al que se piden las extracciones
+            concurrencia: Llamadas en vuelo a la vez por recorrido
+            timeout: Segundos máximos de cada petición HTTP
+            context_window: Tokens de contexto del modelo
+            conexiones: Conexiones HTTP keep-alive reutilizadas
+            keepalive: Segundos que se conserva una conexión sin uso
+        """
+        self.modelo = modelo
+        self.concurrencia = max(1, concurrencia)
+        self.timeout = timeout
+        self.context_window = context_window
+        self._limites_http = httpx.Limits(
+            max_connections=conexiones,
+            max_keepalive_connections=conexiones,
+            keepalive_expiry=keepalive,
+        )
+
+    @abstractmethod
+    def crear_limitador(self) -> LimitadorMistral:
+        """Limitador de peticiones y tokens por minuto de este backend."""
+
+    @abstractmethod
+    def completar(self, peticion: Dict[str, Any]) -> Any:
+        """
+        Envía una petición y espera la respuesta completa.
+
+        Args:
+            peticion: Parámetros de `chat.complete` (modelo, mensajes...)
+
+        Returns:
+            Respuesta con `choices` y `usage`, como la del SDK de Mistral
+        """
+
+    @abstractmethod
+    async def completar_async(self, peticion: Dict[str, Any]) -> Any:
+        """Versión asíncrona de `completar`."""
+
+    @abstractmethod
+    def stream_async(self, peticion: Dict[str, Any]) -> AsyncIterator[Any]:
+        """
+        Pide la respuesta por streaming.
+
+        Returns:
+            Fragmentos con `choices[0].delta.content`, `finish_reason` y
+            `usage`, según van llegando
+        """
+
+    def cerrar(self) -> None:
+        """Cierra el cliente HTTP síncrono y sus conexiones."""
+
+    async def cerrar_async(self) -> None:
+        """Cierra el cliente HTTP asíncrono desde el bucle que lo usa."""
+
+
+class BackendMistral(BackendExtraccion):
+    """API de Mistral a través de su SDK."""
+
+    nombre = BACKEND_MISTRAL
+
+    def __init__(self):
+        """Inicializa el backend con la API key desde variables de entorno."""
+        self.api_key = os.getenv("MISTRAL_API_KEY")
+        if not self.api_key:
+            raise ValueError(
+                "MISTRAL_API_KEY no encontrada en las variables de entorno"
+            )
+        conexiones = int(os.getenv("MISTRAL_CONEXIONES", "10"))
+        super().__init__(
+            # Usar Mistral Small para eficiencia y menor costo
+            modelo="mistral-small-latest",
+            concurrencia=int(os.getenv("MISTRAL_CONCURRENCIA", "4")),
+            timeout=float(os.getenv("MISTRAL_TIMEOUT_SEG", "120")),
+            context_window=32000,
+            conexiones=conexiones,
+            keepalive=float(os.getenv("MISTRAL_KEEPALIVE_SEG", "60")),
+        )
+        self.server_url = os.getenv("MISTRAL_SERVER_URL") or None
+        self.delay_entre_llamadas = float(os.getenv("MISTRAL_DELAY_SEG", "1.5"))
+
+        # Un único cliente HTTP con conexiones keep-alive para todas las
+        # llamadas (y reintentos) en lugar de uno nuevo, con su handshake TLS,
+        # por bloque. Se crean al primer uso y se comparten entre hilos.
+        self._sdk: Optional[Mistral] = None
+        # El cliente asíncrono queda ligado al bucle de eventos que lo usa
+        self._sdk_async: Optional[Mistral] = None
+        self._bucle_async: Optional[asyncio.AbstractEventLoop] = None
+        self._lock_clientes = threading.Lock()
+
+    def crear_limitador(self) -> LimitadorMistral:
+        """
+        Ritmo de llamadas según el nivel contratado; sin MISTRAL_RPM se
+        mantiene el ritmo que marcaba MISTRAL_DELAY_SEG. La cuota es de la
+        cuenta, así que el saldo se comparte con los demás procesos.
+        """
+        rpm_por_defecto = (
+            60 / self.delay_entre_llamadas if self.delay_entre_llamadas > 0 else 0
+        )
+        return crear_limitador(
+            peticiones_por_minuto=float(os.getenv("MISTRAL_RPM") or rpm_por_defecto),
+            tokens_por_minuto=float(os.getenv("MISTRAL_TPM", "500000")),
+        )
+
+    def completar(self, peticion: Dict[str, Any]) -> Any:
+        return self._cliente().chat.complete(**peticion)
+
+    async def completar_async(self, peticion: Dict[str, Any]) -> Any:
+        return await self._cliente_async().chat.complete_async(**peticion)
+
+    async def stream_async(self, peticion: Dict[str, Any]) -> AsyncIterator[Any]:
+        eventos = await self._cliente_async().chat.stream_async(**peticion)
+        async with eventos:
+            async for evento in eventos:
+                yield evento.data
+
+    def cerrar(self) -> None:
+        with self._lock_clientes:
+            sdk, self._sdk = self._sdk, None
+        if sdk is not None:
+            sdk.sdk_configuration.client.close()
+
+    async def cerrar_async(self) -> None:
+        with self._lock_clientes:
+            sdk, self._sdk_async = self._sdk_async, None
+            self._bucle_async = None
+        if sdk is not None:
+            await sdk.sdk_configuration.async_client.aclose()
+
+    def _cliente(self) -> Mistral:
+        """Cliente síncrono compartido, creado al primer uso."""
+        with self._lock_clientes:
+            if self._sdk is None:
+                self._sdk = Mistral(
+                    api_key=self.api_key,
+                    server_url=self.server_url,
+                    client=httpx.Client(
+                        limits=self._limites_http, timeout=self.timeout
+                    ),
+                )
+            return self._sdk
+
+    def _cliente_async(self) -> Mistral:
+        """Cliente asíncrono compartido por las llamadas del bucle actual."""
+        bucle = asyncio.get_running_loop()
+        with self._lock_clientes:
+            # Las conexiones de httpx no se pueden usar desde otro bucle
+            if self._sdk_async is None or self._bucle_async is not bucle:
+                self._sdk_async = Mistral(
+                    api_key=self.api_key,
+                    server_url=self.server_url,
+                    async_client=httpx.AsyncClient(
+                        limits=self._limites_http, timeout=self.timeout
+                    ),
+                )
+                self._bucle_async = bucle
+            return self._sdk_async
+
+
+class BackendOpenAI(BackendExtraccion):
+    """Servidor propio compatible con la API de OpenAI (`/chat/completions`)."""
+
+    nombre = BACKEND_OPENAI
+
+    def __init__(self):
+        """Inicializa el backend con la URL y el modelo desde variables de entorno."""
+        self.url = (os.getenv("OPENAI_COMPAT_URL") or "").rstrip("/")
+        modelo = os.getenv("OPENAI_COMPAT_MODELO")
+        if not self.url or not modelo:
+            raise ValueError(
+                "OPENAI_COMPAT_URL y OPENAI_COMPAT_MODELO son obligatorias con "
+                "EXTRACCION_BACKEND=openai"
+            )
+        concurrencia = int(os.getenv("OPENAI_COMPAT_CONCURRENCIA", "8"))
+        super().__init__(
+            modelo=modelo,
+            concurrencia=concurrencia,
+            # En CPU una respuesta larga tarda minutos
+            timeout=float(os.getenv("OPENAI_COMPAT_TIMEOUT_SEG", "600")),
+            context_window=int(os.getenv("OPENAI_COMPAT_CONTEXTO", "32000")),
+            conexiones=int(os.getenv("OPENAI_COMPAT_CONEXIONES") or concurrencia),
+        )
+        self.api_key = os.getenv("OPENAI_COMPAT_API_KEY") or None
+        self._cabeceras = (
+            {"Authorization": f"Bearer {self.api_key}"} if self.api_key else {}
+        )
+        self._http: Optional[httpx.Client] = None
+        self._http_async: Optional[httpx.AsyncClient] = None
+        self._bucle_async: Optional[asyncio.AbstractEventLoop] = None
+        self._lock_clientes = threading.Lock()
+
+    def crear_limitador(self) -> LimitadorMistral:
+        """
+        Sin límites por defecto: el servidor es nuestro y la cola la marca la
+        concurrencia. OPENAI_COMPAT_RPM/TPM los ponen si hace falta.
+        """
+        return LimitadorMistral(
+            peticiones_por_minuto=float(os.getenv("OPENAI_COMPAT_RPM", "0")),
+            tokens_por_minuto=float(os.getenv("OPENAI_COMPAT_TPM", "0")),
+        )
+
+    def completar(self, peticion: Dict[str, Any]) -> Any:
+        respuesta = self._cliente().post(
+            "/chat/completions", json=cuerpo_openai(peticion)
+        )
+        respuesta.raise_for_status()
+        return respuesta_openai(respuesta.json())
+
+    async def completar_async(self, peticion: Dict[str, Any]) -> Any:
+        respuesta = await self._cliente_async().post(
+            "/chat/completions", json=cuerpo_openai(peticion)
+        )
+        respuesta.raise_for_status()
+        return respuesta_openai(respuesta.json())
+
+    async def stream_async(self, peticion: Dict[str, Any]) -> AsyncIterator[Any]:
+        cuerpo = {
+            **cuerpo_openai(peticion),
+            "stream": True,
+            "stream_options": {"include_usage": True},
+        }
+        async with self._cliente_async().stream(
+            "POST", "/chat/completions", json=cuerpo
+        ) as respuesta:
+            respuesta.raise_for_status()
+            # Eventos SSE: "data: {...}" por fragmento y "data: [DONE]" al final
+            async for linea in respuesta.aiter_lines():
+                if not linea.startswith("data:"):
+                    continue
+                datos = linea[len("data:") :].strip()
+                if datos == "[DONE]":
+                    break
+                yield fragmento_openai(json.loads(datos))
+
+    def cerrar(self) -> None:
+        with self._lock_clientes:
+            http, self._http = self._http, None
+        if http is not None:
+            http.close()
+
+    async def cerrar_async(self) -> None:
+        with self._lock_clientes:
+            http, self._http_async = self._http_async, None
+            self._bucle_async = None
+        if http is not None:
+            await http.aclose()
+
+    def _cliente(self) -> httpx.Client:
+        """Cliente síncrono compartido, creado al primer uso."""
+        with self._lock_clientes:
+            if self._http is None:
+                self._http = httpx.Client(
+                    base_url=self.url,
+                    headers=self._cabeceras,
+                    limits=self._limites_http,
+                    timeout=self.timeout,
+                )
+            return self._http
+
+    def _cliente_async(self) -> httpx.AsyncClient:
+        """Cliente asíncrono compartido por las llamadas del bucle actual."""
+        bucle = asyncio.get_running_loop()
+        with self._lock_clientes:
+            if self._http_async is None or self._bucle_async is not bucle:
+                self._http_async = httpx.AsyncClient(
+                    base_url=self.url,
+                    headers=self._cabeceras,
+                    limits=self._limites_http,
+                    timeout=self.timeout,
+                )
+                self._bucle_async = bucle
+            return self._http_async
+
+
+def crear_backend(nombre: Optional[str] = None) -> BackendExtraccion:
+    """
+    Backend configurado por entorno.
+
+    Args:
+        nombre: `mistral` u `openai` (por defecto, EXTRACCION_BACKEND)
+
+    Returns:
+        El backend, sin conexiones abiertas todavía
+    """
+    nombre = (nombre or os.getenv("EXTRACCION_BACKEND") or BACKEND_MISTRAL).lower()
+    if nombre == BACKEND_MISTRAL:
+        return BackendMistral()
+    if nombre == BACKEND_OPENAI:
+        return BackendOpenAI()
+    raise ValueError(f"EXTRACCION_BACKEND debe ser uno de {BACKENDS}")
+
+
+def cuerpo_openai(peticion: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Cuerpo JSON de `/chat/completions` a partir de los parámetros del SDK de
+    Mistral: solo cambia el nombre del esquema en `response_format`.
+    """
+    cuerpo = dict(peticion)
+    formato = cuerpo.get("response_format")
+    if formato and "json_schema" in formato:
+        esquema = dict(formato["json_schema"])
+        esquema["schema"] = esquema.pop("schema_definition", None)
+        cuerpo["response_format"] = {**formato, "json_schema": esquema}
+    return cuerpo
+
+
+def respuesta_openai(datos: Dict[str, Any]) -> Any:
+    """Respuesta de `/chat/completions` con la forma de la del SDK de Mistral."""
+    elecciones = [
+        SimpleNamespace(
+            message=SimpleNamespace(
+                content=(eleccion.get("message") or {}).get("content")
+            ),
+            finish_reason=eleccion.get("finish_reason"),
+        )
+        for eleccion in datos.get("choices") or []
+    ]
+    return SimpleNamespace(choices=elecciones, usage=_uso(datos.get("usage")))
+
+
+def fragmento_openai(datos: Dict[str, Any]) -> Any:
+    """Fragmento de un stream de OpenAI con la forma del de Mistral."""
+    elecciones = [
+        SimpleNamespace(
+            delta=SimpleNamespace(content=(eleccion.get("delta") or {}).get("content")),
+            finish_reason=eleccion.get("finish_reason"),
+        )
+        for eleccion in datos.get("choices") or []
+    ]
+    return SimpleNamespace(choices=elecciones, usage=_uso(datos.get("usage")))
+
+
+def _uso(datos: Optional[Dict[str, Any]]) -> Optional[SimpleNamespace]:
+    """Tokens de la petición y totales, si el servidor los indica."""
+    if not datos:
+        return None
+    return SimpleNamespace(
+        prompt_tokens=datos.get("prompt_tokens"),
+        total_tokens=datos.get("total_tokens"),
+    )
@@ -0,0 +1,200 @@
+"""
+Caché en disco de las extracciones de Mistral, direccionada por contenido.
+
+Cada resultado ya interpretado (`{"recetas": [...]}`) se guarda en un SQLite
+local bajo el hash de modelo + versión del prompt + texto del bloque, así que
+volver a procesar una exportación (tras un fallo, una caída de Supabase o con
+otra `--fecha-desde`) no repite llamadas ya pagadas. Cambiar de modelo o de
+prompt cambia la clave y deja las entradas antiguas sin uso hasta que las
+expulsa la política de antigüedad y tamaño (las menos usadas primero).
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Optional
+
+# Cada cuántas escrituras se comprueba si hay que expulsar entradas
+ESCRITURAS_POR_PURGA = 200
+# Al superar el tamaño máximo se libera hasta quedar en esta fracción
+FRACCION_TRAS_PURGA = 0.9
+
+
+def clave_extraccion(modelo: str, version_prompt: str, texto: str) -> bytes:
+    """
+    Calcula la clave de caché de un bloque.
+
+    Args:
+        modelo: Modelo de Mistral usado
+        version_prompt: Versión del prompt de extracción
+        texto: Texto del bloque enviado
+
+    Returns:
+        Hash SHA-256 binario
+    """
+    contenido = f"{modelo}\x1f{version_prompt}\x1f{texto}"
+    return hashlib.sha256(contenido.encode("utf-8")).digest()
+
+
+class CacheExtracciones:
+    """Resultados de Mistral por clave de contenido, con expulsión por edad y tamaño."""
+
+    def __init__(
+        self,
+        ruta: Optional[str] = None,
+        max_mb: Optional[float] = None,
+        max_dias: Optional[float] = None,
+    ):
+        """
+        Inicializa la caché. La base de datos se abre al primer uso.
+
+        Args:
+            ruta: Archivo SQLite (por defecto `CACHE_LLM_PATH` o
+                `state/cache_llm.sqlite3`)
+            max_mb: Tamaño máximo de los resultados guardados (`CACHE_LLM_MAX_MB`,
+                0 = sin límite)
+            max_dias: Días que se conserva una entrada (`CACHE_LLM_MAX_DIAS`,
+                0 = sin límite)
+        """
+        self.ruta = ruta or os.getenv("CACHE_LLM_PATH", "state/cache_llm.sqlite3")
+        if max_mb is None:
+            max_mb = float(os.getenv("CACHE_LLM_MAX_MB", "100"))
+        if max_dias is None:
+            max_dias = float(os.getenv("CACHE_LLM_MAX_DIAS", "180"))
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.max_segundos = max_dias * 86400
+        self._conexion: Optional[sqlite3.Connection] = None
+        self._escrituras = 0
+        # Se usa desde el bucle de extracción y desde varios hilos de ingesta
+        self._lock = threading.RLock()
+
+    @property
+    def conexion(self) -> sqlite3.Connection:
+        """Conexión a SQLite, creando el archivo y la tabla si no existen."""
+        with self._lock:
+            if self._conexion is None:
+                directorio = os.path.dirname(self.ruta)
+                if directorio:
+                    os.makedirs(directorio, exist_ok=True)
+                self._conexion = sqlite3.connect(self.ruta, check_same_thread=False)
+                self._conexion.execute("PRAGMA journal_mode=WAL")
+                self._conexion.execute("PRAGMA synchronous=NORMAL")
+                with self._conexion:
+                    self._conexion.execute(
+                        "CREATE TABLE IF NOT EXISTS extracciones ("
+                        "clave BLOB PRIMARY KEY, resultado TEXT NOT NULL, "
+                        "bytes INTEGER NOT NULL, creada REAL NOT NULL, "
+                        "usada REAL NOT NULL) WITHOUT ROWID"
+                    )
+                    self._conexion.execute(
+                        "CREATE INDEX IF NOT EXISTS extracciones_usada "
+                        "ON extracciones (usada)"
+                    )
+                self.purgar()
+            return self._conexion
+
+    def obtener(self, clave: bytes, no_antes_de: float = 0.0) -> Optional[Dict]:
+        """
+        Devuelve el resultado guardado para una clave.
+
+        Args:
+            clave: Clave calculada con `clave_extraccion`
+            no_antes_de: Ignorar entradas guardadas antes de este instante
+                (`time.time`); se usa para refrescar la caché
+
+        Returns:
+            Resultado guardado, o None si no hay entrada válida
+        """
+        with self._lock:
+            fila = self.conexion.execute(
+                "SELECT resultado, creada FROM extracciones WHERE clave = ?",
+                (clave,),
+            ).fetchone()
+            if fila is None:
+                return None
+            resultado, creada = fila
+            ahora = time.time()
+            if creada < no_antes_de or self._caducada(creada, ahora):
+                return None
+            with self.conexion:
+                self.conexion.execute(
+                    "UPDATE extracciones SET usada = ? WHERE clave = ?",
+                    (ahora, clave),
+                )
+        return json.loads(resultado)
+
+    def guardar(self, clave: bytes, resultado: Dict[str, Any]) -> None:
+        """
+        Guarda (o reemplaza) el resultado de una clave.
+
+        Args:
+            clave: Clave calculada con `clave_extraccion`
+            resultado: Resultado ya interpretado de Mistral
+        """
+        contenido = json.dumps(resultado, ensure_ascii=False)
+        ahora = time.time()
+        with self._lock:
+            with self.conexion:
+                self.conexion.execute(
+                    "INSERT OR REPLACE INTO extracciones "
+                    "(clave, resultado, bytes, creada, usada) VALUES (?, ?, ?, ?, ?)",
+                    (clave, contenido, len(contenido.encode("utf-8")), ahora, ahora),
+                )
+            self._escrituras += 1
+            if self._escrituras % ESCRITURAS_POR_PURGA == 0:
+                self.purgar()
+
+    def purgar(self) -> int:
+        """
+        Expulsa las entradas caducadas y, si se supera el tamaño máximo, las
+        usadas hace más tiempo.
+
+        Returns:
+            Número de entradas eliminadas
+        """
+        with self._lock:
+            conexion = self._conexion
+            if conexion is None:
+                return 0
+            eliminadas = 0
+            with conexion:
+                if self.max_segundos > 0:
+                    eliminadas += conexion.execute(
+                        "DELETE FROM extracciones WHERE creada < ?",
+                        (time.time() - self.max_segundos,),
+                    ).rowcount
+
+                if self.max_bytes > 0:
+                    total = conexion.execute(
+                        "SELECT COALESCE(SUM(bytes), 0) FROM extracciones"
+                    ).fetchone()[0]
+                    if total > self.max_bytes:
+                        objetivo = total - int(self.max_bytes * FRACCION_TRAS_PURGA)
+                        liberados = 0
+                        expulsadas = []
+                        for clave, bytes_ in conexion.execute(
+                            "SELECT clave, bytes FROM extracciones ORDER BY usada"
+                        ):
+                            expulsadas.append((clave,))
+                            liberados += bytes_
+                            if liberados >= objetivo:
+                                break
+                        conexion.executemany(
+                            "DELETE FROM extracciones WHERE clave = ?", expulsadas
+                        )
+                        eliminadas += len(expulsadas)
+            return eliminadas
+
+    def cerrar(self) -> None:
+        """Aplica la política de expulsión y cierra la conexión con SQLite."""
+        with self._lock:
+            if self._conexion is not None:
+                self.purgar()
+                self._conexion.close()
+                self._conexion = None
+
+    def _caducada(self, creada: float, ahora: float) -> bool:
+        return self.max_segundos > 0 and creada < ahora - self.max_segundos
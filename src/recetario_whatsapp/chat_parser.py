@@ -0,0 +1,615 @@
+"""
+Parser incremental para exportaciones de chat de WhatsApp.
+
+Lee la exportación línea a línea (ruta, fichero abierto o `UploadedFile` de
+Streamlit) y produce los mensajes de uno en uno, de modo que la memoria no
+depende del tamaño del archivo.
+"""
+
+import io
+import os
+import re
+import sys
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import date, datetime, timezone
+from itertools import chain, islice
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+# Ruta en disco, fichero binario/texto ya abierto o UploadedFile de Streamlit
+FuenteChat = Union[str, "os.PathLike[str]", IO[bytes], IO[str]]
+
+
+def nombre_fuente(fuente: Any) -> str:
+    """Devuelve el nombre de archivo asociado a una fuente (vacío si no tiene)."""
+    if isinstance(fuente, (str, os.PathLike)):
+        return os.fspath(fuente)
+    return str(getattr(fuente, "name", "") or "")
+
+
+@dataclass(slots=True)
+class Mensaje:
+    """
+    Mensaje de un chat ya parseado.
+
+    Usa `__slots__` en lugar de un diccionario por mensaje: en exportaciones
+    de millones de mensajes la diferencia de memoria es grande. El creador se
+    interna (todos los mensajes de una persona comparten la misma cadena) y
+    la fecha normalizada se comparte entre los mensajes del mismo minuto.
+    Admite `mensaje["clave"]` y `mensaje.get("clave")` como los antiguos
+    diccionarios.
+    """
+
+    fecha: str
+    timestamp: Optional[int]
+    creador: str
+    mensaje: str
+
+    def __getitem__(self, clave: str) -> Any:
+        try:
+            return getattr(self, clave)
+        except AttributeError:
+            raise KeyError(clave) from None
+
+    def get(self, clave: str, defecto: Any = None) -> Any:
+        """Equivalente a `dict.get` sobre los campos del mensaje."""
+        return getattr(self, clave, defecto)
+
+    @classmethod
+    def desde(cls, mensaje: Union["Mensaje", Dict[str, Any]]) -> "Mensaje":
+        """
+        Convierte un diccionario con las claves de un mensaje en `Mensaje`.
+
+        Args:
+            mensaje: `Mensaje` (se devuelve tal cual) o diccionario
+
+        Returns:
+            El mensaje como `Mensaje`
+        """
+        if isinstance(mensaje, cls):
+            return mensaje
+        return cls(
+            fecha=mensaje.get("fecha", ""),
+            timestamp=mensaje.get("timestamp"),
+            creador=sys.intern(mensaje.get("creador", "")),
+            mensaje=mensaje.get("mensaje", ""),
+        )
+
+
+@contextmanager
+def abrir_lineas(fuente: FuenteChat) -> Iterator[Iterable[str]]:
+    """
+    Abre una fuente de chat y devuelve un iterable perezoso de líneas de texto.
+
+    Las rutas se abren y cierran aquí; los ficheros ya abiertos (incluido el
+    `UploadedFile` de Streamlit) se leen desde su posición actual y no se cierran.
+
+    Args:
+        fuente: Ruta al archivo o stream binario/de texto
+
+    Yields:
+        Iterable de líneas decodificadas en UTF-8
+    """
+    # utf-8-sig descarta el BOM con el que suelen empezar las exportaciones de iOS
+    if isinstance(fuente, (str, os.PathLike)):
+        with open(fuente, "r", encoding="utf-8-sig") as f:
+            yield f
+    elif isinstance(fuente, io.TextIOBase):
+        yield fuente
+    elif hasattr(fuente, "readable"):
+        texto = io.TextIOWrapper(fuente, encoding="utf-8-sig")
+        try:
+            yield texto
+        finally:
+            # No cerrar el stream del llamador al liberar el wrapper
+            texto.detach()
+    else:
+        yield (
+            linea.decode("utf-8-sig") if isinstance(linea, bytes) else linea
+            for linea in fuente
+        )
+
+
+# Piezas comunes de las cabeceras. El año puede venir con 2 o 4 dígitos y el
+# orden día/mes se decide después, al detectar el formato de cada archivo.
+_FECHA = r"(?P<fecha>\d{1,2}/\d{1,2}/\d{2}(?:\d{2})?)"
+_HORA_24 = r"(?P<hora>\d{1,2}:\d{2})"
+_HORA_24_SEGUNDOS = r"(?P<hora>\d{1,2}:\d{2}:\d{2})"
+_HORA_AMPM = r"(?P<hora>\d{1,2}:\d{2}(?::\d{2})?\s*[AaPp]\.?\s*[Mm]\.?)"
+_RESTO = r"\s*(?P<creador>[^:]+):\s*(?P<mensaje>.*)"
+
+
+def _patron_cabecera(hora: str, corchetes: bool) -> "re.Pattern[str]":
+    """Compila un dialecto; `marca` agrupa fecha y hora tal como aparecen."""
+    marca = rf"(?P<marca>{_FECHA},\s*{hora})"
+    # iOS antepone una marca de dirección (U+200E) a los mensajes con adjuntos
+    if corchetes:
+        return re.compile(rf"\u200e?\[{marca}\]{_RESTO}")
+    return re.compile(rf"\u200e?{marca}\s*-{_RESTO}")
+
+
+# Número de líneas que se inspeccionan para decidir el formato de un archivo
+LINEAS_MUESTRA_FORMATO = 200
+
+# Por debajo de este tamaño (bytes) no compensa seguir bisecando el archivo
+BYTES_MINIMOS_BISECCION = 64 * 1024
+# Líneas que se leen tras un punto de bisección buscando una cabecera
+LINEAS_MAXIMAS_BISECCION = 1000
+
+_ORDINAL_EPOCH = date(1970, 1, 1).toordinal()
+
+
+def timestamp_de_fecha_iso(fecha: str) -> int:
+    """
+    Convierte una fecha `YYYY-MM-DD` en segundos desde epoch (medianoche).
+
+    Las horas de WhatsApp no llevan zona horaria; todas las marcas se tratan
+    como UTC para que sean comparables entre sí.
+
+    Raises:
+        ValueError: Si la fecha no tiene el formato esperado
+    """
+    return _a_timestamp(datetime.strptime(fecha, "%Y-%m-%d"))
+
+
+def timestamp_de_fecha(fecha: str) -> int:
+    """
+    Convierte una fecha normalizada (`DD/MM/YY HH:MM:SS` o `DD/MM/YY`) en epoch.
+
+    Solo hace falta para mensajes que no vienen del parser, que ya adjunta el
+    timestamp al crear cada mensaje.
+
+    Raises:
+        ValueError: Si la fecha no tiene el formato esperado
+    """
+    try:
+        return _a_timestamp(datetime.strptime(fecha, "%d/%m/%y %H:%M:%S"))
+    except ValueError:
+        return _a_timestamp(datetime.strptime(fecha.split()[0], "%d/%m/%y"))
+
+
+def fecha_iso_de_timestamp(timestamp: int) -> str:
+    """Convierte segundos desde epoch en una fecha `YYYY-MM-DD`."""
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime("%Y-%m-%d")
+
+
+def _a_timestamp(fecha: datetime) -> int:
+    return int(fecha.replace(tzinfo=timezone.utc).timestamp())
+
+
+class FormatoChat(NamedTuple):
+    """Dialecto de cabecera de mensaje de una exportación de WhatsApp."""
+
+    nombre: str
+    patron: "re.Pattern[str]"
+    ampm: bool
+
+
+# Dialectos conocidos, en orden de preferencia en caso de empate
+FORMATOS_CHAT: Tuple[FormatoChat, ...] = (
+    # [01/10/25, 18:02:13] Ana: ...
+    FormatoChat("ios", _patron_cabecera(_HORA_24_SEGUNDOS, True), False),
+    # [01/10/25, 18:02] Ana: ...
+    FormatoChat("ios_sin_segundos", _patron_cabecera(_HORA_24, True), False),
+    # 21/10/25, 16:35 - Pablo: ...
+    FormatoChat("android", _patron_cabecera(_HORA_24, False), False),
+    # [10/1/25, 6:02:13 PM] Ana: ...
+    FormatoChat("ios_ampm", _patron_cabecera(_HORA_AMPM, True), True),
+    # 10/1/25, 6:02 p. m. - Ana: ...
+    FormatoChat("android_ampm", _patron_cabecera(_HORA_AMPM, False), True),
+)
+
+
+def detectar_formato(muestra: Iterable[str]) -> Tuple[FormatoChat, bool]:
+    """
+    Elige el dialecto de cabecera que más líneas de la muestra reconoce.
+
+    Además decide si las fechas van en orden mes/día (exportaciones en inglés
+    de EE. UU.): si algún primer campo es mayor que 12 el orden es día/mes; si
+    lo es algún segundo campo, mes/día. Si la muestra no lo aclara se asume
+    mes/día solo en los formatos de 12 horas.
+
+    Args:
+        muestra: Primeras líneas del archivo
+
+    Returns:
+        Tupla (formato, fechas_mes_primero)
+    """
+    lineas = [linea.strip() for linea in muestra]
+    mejor = FORMATOS_CHAT[0]
+    mejor_aciertos = 0
+    fechas: List[str] = []
+
+    for formato in FORMATOS_CHAT:
+        matches = [m for m in map(formato.patron.match, lineas) if m]
+        if len(matches) > mejor_aciertos:
+            mejor, mejor_aciertos = formato, len(matches)
+            fechas = [m.group("fecha") for m in matches]
+
+    mes_primero = mejor.ampm
+    for fecha in fechas:
+        primero, segundo, _ = fecha.split("/")
+        if int(primero) > 12:
+            mes_primero = False
+            break
+        if int(segundo) > 12:
+            mes_primero = True
+            break
+
+    return mejor, mes_primero
+
+
+class _LectorCabeceras:
+    """Reconoce cabeceras de un archivo concreto con el dialecto ya detectado."""
+
+    def __init__(self, formato: FormatoChat, mes_primero: bool):
+        self.patron = formato.patron
+        self.alternativos = tuple(
+            f.patron for f in FORMATOS_CHAT if f.patron is not formato.patron
+        )
+        self.mes_primero = mes_primero
+        # Las mismas marcas de tiempo se repiten mucho: normalizar cada una una
+        # vez. Cada entrada guarda el texto normalizado y su timestamp.
+        self.marcas: Dict[str, Tuple[str, Optional[int]]] = {}
+        self._fechas: Dict[str, Tuple[str, Optional[int]]] = {}
+        self._horas: Dict[str, Tuple[str, int]] = {}
+
+    def buscar(self, linea: str) -> Optional["re.Match[str]"]:
+        """Reconoce una cabecera con el dialecto principal o, si falla, el resto."""
+        return self.patron.match(linea) or self.buscar_alternativo(linea)
+
+    def buscar_alternativo(self, linea: str) -> Optional["re.Match[str]"]:
+        """Prueba el resto de dialectos con una línea que el principal no reconoce."""
+        # Solo las líneas que empiezan como una cabecera pagan el resto de patrones
+        if linea[0] != "[" and not linea[0].isdigit():
+            return None
+        for patron in self.alternativos:
+            match = patron.match(linea)
+            if match:
+                return match
+        return None
+
+    def normalizar(self, match: "re.Match[str]") -> Tuple[str, Optional[int]]:
+        """
+        Convierte la marca de tiempo de una cabecera a `DD/MM/YY HH:MM:SS`.
+
+        Returns:
+            Tupla (fecha normalizada, segundos desde epoch o None si la fecha
+            no existe en el calendario)
+        """
+        marca, fecha_raw, hora_raw = match.group("marca", "fecha", "hora")
+        fecha = self._fechas.get(fecha_raw)
+        if fecha is None:
+            fecha = self._fechas[fecha_raw] = self._normalizar_fecha(fecha_raw)
+        hora = self._horas.get(hora_raw)
+        if hora is None:
+            hora = self._horas[hora_raw] = self._normalizar_hora(hora_raw)
+        timestamp = None if fecha[1] is None else fecha[1] + hora[1]
+        normalizada = self.marcas[marca] = (f"{fecha[0]} {hora[0]}", timestamp)
+        return normalizada
+
+    def _normalizar_fecha(self, fecha: str) -> Tuple[str, Optional[int]]:
+        """Convierte cualquier dialecto de fecha a DD/MM/YY y a epoch del día."""
+        primero, segundo, anio = fecha.split("/")
+        dia, mes = (segundo, primero) if self.mes_primero else (primero, segundo)
+        anio_int = int(anio)
+        if len(anio) == 2:
+            # Misma regla que `%y` de strptime: 69-99 -> 19xx, 00-68 -> 20xx
+            anio_int += 1900 if anio_int >= 69 else 2000
+        try:
+            ordinal = date(anio_int, int(mes), int(dia)).toordinal()
+            timestamp: Optional[int] = (ordinal - _ORDINAL_EPOCH) * 86400
+        except ValueError:
+            timestamp = None
+        return f"{int(dia):02d}/{int(mes):02d}/{anio[-2:]}", timestamp
+
+    @staticmethod
+    def _normalizar_hora(hora: str) -> Tuple[str, int]:
+        """Convierte cualquier dialecto de hora a HH:MM:SS en 24 horas y a segundos."""
+        match = _PATRON_HORA.match(hora)
+        horas, minutos, segundos = match.groups(default="00")
+        horas_int = int(horas)
+        sufijo = hora[match.end() :].lower()
+        if "p" in sufijo and horas_int < 12:
+            horas_int += 12
+        elif "a" in sufijo and horas_int == 12:
+            horas_int = 0
+        return (
+            f"{horas_int:02d}:{minutos}:{segundos}",
+            horas_int * 3600 + int(minutos) * 60 + int(segundos),
+        )
+
+    def timestamp(self, linea: str) -> Optional[int]:
+        """Timestamp de una línea de cabecera (None si no lo es o no tiene fecha válida)."""
+        match = self.buscar(linea) if linea else None
+        if match is None:
+            return None
+        return (self.marcas.get(match.group("marca")) or self.normalizar(match))[1]
+
+    def buscar_inicio(self, binario: IO[bytes], inicio: int, desde: int) -> int:
+        """
+        Busca por bisección un punto del archivo desde el que empezar a leer.
+
+        Supone que los mensajes están en orden cronológico (como en cualquier
+        exportación). Devuelve el inicio de una línea de cabecera anterior a
+        `desde`, de modo que todo lo que queda detrás es anterior al corte y
+        puede saltarse sin leerlo.
+
+        Args:
+            binario: Archivo binario con acceso aleatorio
+            inicio: Posición donde empieza la exportación
+            desde: Timestamp mínimo de los mensajes que interesan
+
+        Returns:
+            Posición en bytes desde la que continuar
+        """
+        bajo = inicio
+        alto = binario.seek(0, io.SEEK_END)
+        while alto - bajo > BYTES_MINIMOS_BISECCION:
+            medio = (bajo + alto) // 2
+            cabecera = None
+            for posicion, linea in islice(
+                _lineas_siguientes(binario, medio, alto), LINEAS_MAXIMAS_BISECCION
+            ):
+                timestamp = self.timestamp(linea)
+                if timestamp is not None:
+                    cabecera = (posicion, timestamp)
+                    break
+
+            if cabecera is not None and cabecera[1] < desde:
+                bajo = cabecera[0]
+            else:
+                alto = medio
+        return bajo
+
+    def dividir(
+        self, binario: IO[bytes], inicio: int, fin: int, tamano: int
+    ) -> List[Tuple[int, int]]:
+        """
+        Parte un archivo en tramos que empiezan siempre en una cabecera.
+
+        Cada línea de continuación queda en el mismo tramo que la cabecera de
+        su mensaje, así que los tramos se pueden parsear por separado.
+
+        Args:
+            binario: Archivo binario con acceso aleatorio
+            inicio: Primer byte a procesar
+            fin: Byte donde termina el archivo
+            tamano: Tamaño aproximado de cada tramo en bytes
+
+        Returns:
+            Lista ordenada de tramos (inicio, fin) que cubren [inicio, fin)
+        """
+        cortes = [inicio]
+        objetivo = inicio + tamano
+        while objetivo < fin:
+            siguiente = next(
+                (
+                    posicion
+                    for posicion, linea in _lineas_siguientes(binario, objetivo, fin)
+                    if linea and self.buscar(linea)
+                ),
+                None,
+            )
+            if siguiente is None:
+                break
+            cortes.append(siguiente)
+            objetivo = siguiente + tamano
+        cortes.append(fin)
+        return list(zip(cortes, cortes[1:]))
+
+
+def _lineas_siguientes(
+    binario: IO[bytes], posicion: int, hasta: int
+) -> Iterator[Tuple[int, str]]:
+    """Recorre las líneas completas que empiezan entre `posicion` y `hasta`."""
+    binario.seek(posicion)
+    binario.readline()  # Línea probablemente cortada por la mitad
+    while True:
+        inicio_linea = binario.tell()
+        if inicio_linea >= hasta:
+            return
+        cruda = binario.readline()
+        if not cruda:
+            return
+        yield inicio_linea, cruda.decode("utf-8", errors="replace").strip()
+
+
+_PATRON_HORA = re.compile(r"(\d{1,2}):(\d{2})(?::(\d{2}))?")
+
+
+class ParserWhatsApp:
+    """Convierte líneas de una exportación de WhatsApp en mensajes."""
+
+    def __init__(self, es_linea_continuacion: Callable[[str], bool]):
+        """
+        Inicializa el parser.
+
+        Args:
+            es_linea_continuacion: Decide si una línea sin cabecera pertenece
+                al mensaje anterior (p. ej. ingredientes en varias líneas)
+        """
+        self.es_linea_continuacion = es_linea_continuacion
+
+    def parsear(self, contenido: str) -> List[Mensaje]:
+        """Parsea un chat completo ya cargado en memoria."""
+        return list(self.iterar_mensajes(io.StringIO(contenido)))
+
+    def iterar_mensajes(
+        self,
+        lineas: Iterable[str],
+        desde: Optional[int] = None,
+        posicion: Optional[int] = None,
+        formato: Optional[Tuple[FormatoChat, bool]] = None,
+    ) -> Iterator[Mensaje]:
+        """
+        Genera los mensajes del chat a medida que se leen las líneas.
+
+        El dialecto de cabecera se detecta una vez con las primeras líneas y
+        después se usa un único patrón por línea; los demás solo se prueban si
+        ese falla. Las líneas de continuación se acumulan en una lista y se
+        unen una sola vez cuando llega la cabecera del mensaje siguiente.
+
+        Con `desde`, los mensajes anteriores se descartan sin analizar sus
+        líneas de continuación y, si las líneas vienen de un archivo con
+        acceso aleatorio, se salta por bisección la parte anterior al corte.
+
+        Con `posicion` (solo archivos con acceso aleatorio) el formato se
+        detecta igualmente con el principio del archivo, pero los mensajes se
+        leen a partir de ese byte; sirve para reanudar desde un checkpoint.
+
+        Args:
+            lineas: Iterable de líneas (fichero abierto, lista, generador...)
+            desde: Timestamp (segundos desde epoch) del primer mensaje que interesa
+            posicion: Byte desde el que leer mensajes
+            formato: Dialecto y orden de fecha ya detectados (p. ej. al parsear
+                un tramo intermedio del archivo); si se indica no se muestrea
+
+        Yields:
+            `Mensaje` con `fecha`, `timestamp`, `creador` y `mensaje`
+        """
+        binario = None
+        if desde is not None or posicion is not None:
+            binario = buffer_con_acceso_aleatorio(lineas)
+        inicio = binario.tell() if binario is not None else 0
+
+        lineas = iter(lineas)
+        muestra = [] if formato else list(islice(lineas, LINEAS_MUESTRA_FORMATO))
+        lector = _LectorCabeceras(*(formato or detectar_formato(muestra)))
+
+        pendientes: Iterable[str] = chain(muestra, lineas)
+        if binario is not None:
+            if posicion is not None:
+                inicio = posicion
+            if desde is not None:
+                inicio = lector.buscar_inicio(binario, inicio, desde)
+            # La muestra y la bisección mueven el buffer: recolocar el archivo
+            # de texto en la posición hallada (o al principio, releyendo la muestra)
+            archivo: Any = lineas
+            archivo.seek(inicio)
+            pendientes = archivo
+
+        # Referencias locales: este bucle se ejecuta una vez por línea
+        patron_match = lector.patron.match
+        buscar_alternativo = lector.buscar_alternativo
+        marcas = lector.marcas
+        es_linea_continuacion = self.es_linea_continuacion
+        intern = sys.intern
+
+        pendiente: Optional[Mensaje] = None
+        continuaciones: List[str] = []
+
+        for linea in pendientes:
+            linea = linea.strip()
+            if not linea:
+                continue
+
+            match = patron_match(linea)
+            if match is None:
+                match = buscar_alternativo(linea)
+
+            if match is not None:
+                if pendiente is not None:
+                    if continuaciones:
+                        pendiente.mensaje = "\n".join(
+                            [pendiente.mensaje, *continuaciones]
+                        )
+                        continuaciones = []
+                    yield pendiente
+
+                marca, _, _, creador, texto_mensaje = match.groups()
+                fecha, timestamp = marcas.get(marca) or lector.normalizar(match)
+                if desde is not None and timestamp is not None and timestamp < desde:
+                    # Mensaje anterior al corte: ignorar también sus continuaciones
+                    pendiente = None
+                    continue
+                pendiente = Mensaje(
+                    fecha, timestamp, intern(creador.strip()), texto_mensaje.strip()
+                )
+                continue
+
+            # Si no coincide con ningún patrón, podría ser una línea de receta sin formato
+            if pendiente is not None and es_linea_continuacion(linea):
+                continuaciones.append(linea)
+
+        if pendiente is not None:
+            if continuaciones:
+                pendiente.mensaje = "\n".join([pendiente.mensaje, *continuaciones])
+            yield pendiente
+
+
+class PlanTramos(NamedTuple):
+    """Reparto de un archivo en tramos que se pueden parsear por separado."""
+
+    formato: str
+    mes_primero: bool
+    tramos: List[Tuple[int, int]]
+
+
+def planificar_tramos(
+    lineas: Any,
+    tamano: int,
+    desde: Optional[int] = None,
+    posicion: Optional[int] = None,
+) -> Optional[PlanTramos]:
+    """
+    Detecta el formato de un archivo y lo parte en tramos por cabeceras.
+
+    Aplica el mismo punto de inicio que `iterar_mensajes` (checkpoint y
+    bisección por fecha), así que parsear los tramos en orden da los mismos
+    mensajes que el recorrido en serie.
+
+    Args:
+        lineas: Archivo de texto devuelto por `abrir_lineas`
+        tamano: Tamaño aproximado de cada tramo en bytes
+        desde: Timestamp del primer mensaje que interesa
+        posicion: Byte desde el que leer mensajes
+
+    Returns:
+        Plan de tramos, o None si el archivo no admite acceso aleatorio
+    """
+    binario = buffer_con_acceso_aleatorio(lineas)
+    if binario is None:
+        return None
+
+    inicio = binario.tell()
+    formato, mes_primero = detectar_formato(islice(lineas, LINEAS_MUESTRA_FORMATO))
+    lector = _LectorCabeceras(formato, mes_primero)
+    if posicion is not None:
+        inicio = posicion
+    if desde is not None:
+        inicio = lector.buscar_inicio(binario, inicio, desde)
+    fin = binario.seek(0, io.SEEK_END)
+    return PlanTramos(
+        formato.nombre, mes_primero, lector.dividir(binario, inicio, fin, tamano)
+    )
+
+
+def formato_por_nombre(nombre: str) -> FormatoChat:
+    """Devuelve el dialecto de `FORMATOS_CHAT` con ese nombre."""
+    return next(formato for formato in FORMATOS_CHAT if formato.nombre == nombre)
+
+
+def buffer_con_acceso_aleatorio(lineas: Any) -> Optional[IO[bytes]]:
+    """Devuelve el buffer binario de un archivo de texto si admite `seek`."""
+    if not isinstance(lineas, io.TextIOWrapper):
+        return None
+    binario = lineas.buffer
+    try:
+        if binario.seekable() and lineas.seekable():
+            return binario
+    except (AttributeError, ValueError):
+        pass
+    return None
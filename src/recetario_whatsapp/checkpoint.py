@@ -0,0 +1,129 @@
+"""
+Checkpoints por chat para la ingesta incremental de exportaciones de WhatsApp.
+
+Una nueva exportación del mismo chat contiene la anterior más los mensajes
+añadidos después. El checkpoint guarda hasta qué byte se procesó el archivo y
+un hash SHA-256 de ese prefijo: si el prefijo coincide, basta con saltar a ese
+byte y parsear solo lo nuevo.
+"""
+
+import hashlib
+import os
+from typing import IO, Any, Dict, Optional
+
+from .chat_parser import buffer_con_acceso_aleatorio, nombre_fuente
+
+# Tamaño de los bloques leídos al calcular el hash del prefijo
+BYTES_BLOQUE_HASH = 1024 * 1024
+
+
+def clave_chat(fuente: Any) -> Optional[str]:
+    """Identifica un chat por el nombre de su archivo de exportación."""
+    nombre = os.path.basename(nombre_fuente(fuente))
+    return nombre or None
+
+
+class ReanudacionChat:
+    """Comprueba un checkpoint contra un archivo abierto y genera el siguiente."""
+
+    def __init__(self, lineas: Any, checkpoint: Optional[Dict[str, Any]]):
+        """
+        Prepara la reanudación de un archivo ya abierto con `abrir_lineas`.
+
+        Args:
+            lineas: Archivo de texto devuelto por `abrir_lineas`
+            checkpoint: Checkpoint guardado para este chat (o None)
+        """
+        self.lineas = lineas
+        self.checkpoint = checkpoint
+        self.binario: Optional[IO[bytes]] = buffer_con_acceso_aleatorio(lineas)
+        self.inicio = self.binario.tell() if self.binario is not None else 0
+        self.posicion: Optional[int] = None
+        self._hash = hashlib.sha256()
+        self._hash_hasta = self.inicio
+
+    @property
+    def disponible(self) -> bool:
+        """Indica si el archivo admite checkpoints (necesita acceso aleatorio)."""
+        return self.binario is not None
+
+    def verificar(self) -> Optional[int]:
+        """
+        Comprueba que el archivo empieza por el prefijo ya procesado.
+
+        Returns:
+            Byte desde el que continuar, o None si no hay checkpoint válido
+        """
+        if self.binario is None or not self.checkpoint:
+            return None
+
+        try:
+            offset = int(self.checkpoint["offset_bytes"])
+            esperado = str(self.checkpoint["hash_prefijo"])
+        except (KeyError, TypeError, ValueError):
+            return None
+
+        if offset <= 0 or offset > self._tamano():
+            return None
+
+        self._actualizar_hash(self.inicio + offset)
+        # Dejar el archivo de texto donde estaba antes de leer el prefijo
+        self.lineas.seek(self.inicio)
+
+        if self._hash.hexdigest() != esperado:
+            # No es una continuación del archivo anterior: empezar de cero
+            self._hash = hashlib.sha256()
+            self._hash_hasta = self.inicio
+            return None
+
+        self.posicion = self.inicio + offset
+        return self.posicion
+
+    def nuevo_checkpoint(
+        self, ultimo_timestamp: Optional[int], ultima_fecha: Optional[str]
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Genera el checkpoint del archivo completo tras procesarlo.
+
+        El hash continúa desde el prefijo ya verificado, así que cada byte
+        del archivo se lee una sola vez para calcularlo.
+
+        Args:
+            ultimo_timestamp: Timestamp del último mensaje procesado
+            ultima_fecha: Fecha normalizada del último mensaje procesado
+
+        Returns:
+            Checkpoint serializable en JSON, o None si el archivo no lo admite
+        """
+        if self.binario is None:
+            return None
+
+        fin = self._tamano()
+        self._actualizar_hash(fin)
+        anterior = self.checkpoint if self.posicion is not None else None
+        if ultimo_timestamp is None and anterior:
+            # Sin mensajes nuevos: conservar los datos del último procesado
+            ultimo_timestamp = anterior.get("ultimo_timestamp")
+            ultima_fecha = anterior.get("ultima_fecha")
+
+        return {
+            "offset_bytes": fin - self.inicio,
+            "hash_prefijo": self._hash.hexdigest(),
+            "ultimo_timestamp": ultimo_timestamp,
+            "ultima_fecha": ultima_fecha,
+        }
+
+    def _tamano(self) -> int:
+        return self.binario.seek(0, os.SEEK_END)
+
+    def _actualizar_hash(self, hasta: int) -> None:
+        """Añade al hash los bytes que faltan hasta la posición indicada."""
+        self.binario.seek(self._hash_hasta)
+        pendiente = hasta - self._hash_hasta
+        while pendiente > 0:
+            bloque = self.binario.read(min(BYTES_BLOQUE_HASH, pendiente))
+            if not bloque:
+                break
+            self._hash.update(bloque)
+            pendiente -= len(bloque)
+        self._hash_hasta = hasta - pendiente
@@ -0,0 +1,359 @@
+"""
+Pre-clasificador local de bloques candidatos a receta.
+
+Muchos bloques que pasan las heurísticas solo mencionan una receta de pasada.
+Antes de llamar a Mistral, un modelo naive Bayes puntúa cada bloque con los
+rasgos del detector heurístico y los unigramas y bigramas de sus mensajes; los
+que quedan por debajo de `CLASIFICADOR_UMBRAL` no se envían.
+
+El modelo se entrena con el historial propio de extracciones: cada bloque que
+Mistral procesa se anota con la etiqueta "tuvo recetas / no tuvo" en
+`state/historial_bloques.sqlite3`. El artefacto entrenado es un JSON pequeño
+que guarda también las puntuaciones de una muestra etiquetada reservada, de
+modo que se puede estimar la pérdida de recall con cualquier umbral.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import sqlite3
+import sys
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import Counter
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from .recipe_matcher import DetectorReceta
+
+# Cabecera "[fecha] autor: " de cada mensaje del bloque: no aporta al contenido
+_PATRON_CABECERA = re.compile(r"^\[[^\]\n]*\] [^:\n]+: ", re.MULTILINE)
+_PATRON_PALABRA = re.compile(r"\w+")
+_PATRON_NUMERO = re.compile(r"\d+")
+
+# Rasgos que aparecen menos veces se descartan del vocabulario
+MINIMO_APARICIONES = 2
+# Fracción del historial reservada para estimar la pérdida de recall
+FRACCION_VALIDACION = 0.2
+
+
+def rasgos_bloque(texto: str, detector: DetectorReceta) -> Set[str]:
+    """
+    Extrae los rasgos de un bloque: heurísticas del detector y n-gramas.
+
+    Args:
+        texto: Texto del bloque tal como se envía a Mistral
+        detector: Detector heurístico de recetas
+
+    Returns:
+        Conjunto de rasgos presentes (la frecuencia no se usa)
+    """
+    cuerpo = _PATRON_CABECERA.sub("", texto)
+    rasgos = {
+        f"@{nombre}"
+        for nombre, valor in detector.analizar(cuerpo)._asdict().items()
+        if valor
+    }
+    lineas = cuerpo.count("\n") + 1
+    rasgos.add(f"@lineas_{min(lineas, 10)}")
+
+    normalizado = unicodedata.normalize("NFKD", cuerpo.lower())
+    normalizado = "".join(c for c in normalizado if not unicodedata.combining(c))
+    palabras = [
+        _PATRON_NUMERO.sub("0", palabra)
+        for palabra in _PATRON_PALABRA.findall(normalizado)
+    ]
+    rasgos.update(palabras)
+    rasgos.update(f"{a} {b}" for a, b in zip(palabras, palabras[1:]))
+    return rasgos
+
+
+class ClasificadorBloques:
+    """Naive Bayes binario (presencia de rasgos) para bloques de receta."""
+
+    def __init__(
+        self,
+        documentos: Dict[str, int],
+        conteos: Dict[str, Dict[str, int]],
+        validacion: Optional[Dict[str, List[float]]] = None,
+    ):
+        """
+        Crea el clasificador a partir de sus conteos.
+
+        Args:
+            documentos: Bloques de entrenamiento por clase (`receta`, `otro`)
+            conteos: Por clase, en cuántos bloques aparece cada rasgo
+            validacion: Probabilidades de la muestra reservada por clase
+        """
+        self.documentos = documentos
+        self.conteos = conteos
+        self.validacion = validacion or {"receta": [], "otro": []}
+        self.detector = DetectorReceta()
+        self._preparar()
+
+    @classmethod
+    def entrenar(
+        cls, ejemplos: Iterable[Tuple[str, bool]], detector: Optional[Any] = None
+    ) -> "ClasificadorBloques":
+        """
+        Entrena el modelo con bloques etiquetados.
+
+        Args:
+            ejemplos: Tuplas (texto del bloque, tuvo recetas)
+            detector: Detector heurístico (por defecto uno nuevo)
+
+        Returns:
+            Clasificador entrenado
+        """
+        detector = detector or DetectorReceta()
+        documentos = {"receta": 0, "otro": 0}
+        conteos: Dict[str, Counter] = {"receta": Counter(), "otro": Counter()}
+        for texto, es_receta in ejemplos:
+            clase = "receta" if es_receta else "otro"
+            documentos[clase] += 1
+            conteos[clase].update(rasgos_bloque(texto, detector))
+
+        total = conteos["receta"] + conteos["otro"]
+        vocabulario = {
+            rasgo for rasgo, veces in total.items() if veces >= MINIMO_APARICIONES
+        }
+        return cls(
+            documentos,
+            {
+                clase: {r: n for r, n in contador.items() if r in vocabulario}
+                for clase, contador in conteos.items()
+            },
+        )
+
+    def probabilidad(self, texto: str) -> float:
+        """
+        Probabilidad de que el bloque contenga alguna receta.
+
+        Args:
+            texto: Texto del bloque
+
+        Returns:
+            Valor entre 0 y 1
+        """
+        logit = self._logit_base
+        for rasgo in rasgos_bloque(texto, self.detector):
+            logit += self._pesos.get(rasgo, 0.0)
+        if logit >= 0:
+            return 1.0 / (1.0 + math.exp(-logit))
+        exponencial = math.exp(logit)
+        return exponencial / (1.0 + exponencial)
+
+    def perdida_recall(self, umbral: float) -> Optional[float]:
+        """
+        Fracción de bloques con receta de la muestra reservada que el umbral
+        descartaría, o None si no hay muestra.
+        """
+        positivos = self.validacion["receta"]
+        if not positivos:
+            return None
+        return bisect_left(positivos, umbral) / len(positivos)
+
+    def ahorro(self, umbral: float) -> Optional[float]:
+        """Fracción de bloques de la muestra reservada que no llegarían a Mistral."""
+        puntuaciones = self.validacion["receta"] + self.validacion["otro"]
+        if not puntuaciones:
+            return None
+        return sum(p < umbral for p in puntuaciones) / len(puntuaciones)
+
+    def evaluar(self, ejemplos: Iterable[Tuple[str, bool]]) -> None:
+        """Guarda las probabilidades de una muestra etiquetada para estimar recall."""
+        validacion: Dict[str, List[float]] = {"receta": [], "otro": []}
+        for texto, es_receta in ejemplos:
+            clase = "receta" if es_receta else "otro"
+            validacion[clase].append(round(self.probabilidad(texto), 4))
+        self.validacion = {clase: sorted(p) for clase, p in validacion.items()}
+
+    def guardar(self, ruta: str) -> None:
+        """Guarda el modelo como JSON."""
+        directorio = os.path.dirname(ruta)
+        if directorio:
+            os.makedirs(directorio, exist_ok=True)
+        with open(ruta, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": 1,
+                    "documentos": self.documentos,
+                    "conteos": self.conteos,
+                    "validacion": self.validacion,
+                },
+                f,
+                ensure_ascii=False,
+                separators=(",", ":"),
+            )
+
+    @classmethod
+    def cargar(cls, ruta: str) -> Optional["ClasificadorBloques"]:
+        """
+        Carga un modelo guardado.
+
+        Args:
+            ruta: Archivo JSON generado por `guardar`
+
+        Returns:
+            Clasificador, o None si el archivo no existe o no es válido
+        """
+        try:
+            with open(ruta, "r", encoding="utf-8") as f:
+                datos = json.load(f)
+            return cls(datos["documentos"], datos["conteos"], datos.get("validacion"))
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Warning: clasificador de bloques no válido en {ruta}: {e}")
+            return None
+
+    def _preparar(self) -> None:
+        """Precalcula el logit sin rasgos y el peso de cada rasgo presente."""
+        recetas = self.documentos.get("receta", 0)
+        otros = self.documentos.get("otro", 0)
+        conteos_receta = self.conteos.get("receta", {})
+        conteos_otro = self.conteos.get("otro", {})
+
+        # Bernoulli con suavizado de Laplace: la ausencia de cada rasgo también
+        # aporta; se agrupa en un término fijo y cada rasgo presente lo corrige
+        self._logit_base = math.log((recetas + 1) / (otros + 1))
+        self._pesos: Dict[str, float] = {}
+        for rasgo in set(conteos_receta) | set(conteos_otro):
+            p_receta = (conteos_receta.get(rasgo, 0) + 1) / (recetas + 2)
+            p_otro = (conteos_otro.get(rasgo, 0) + 1) / (otros + 2)
+            ausente = math.log((1 - p_receta) / (1 - p_otro))
+            self._logit_base += ausente
+            self._pesos[rasgo] = math.log(p_receta / p_otro) - ausente
+
+
+class HistorialBloques:
+    """Bloques ya enviados a Mistral con la etiqueta de si tenían recetas."""
+
+    def __init__(self, ruta: Optional[str] = None):
+        """
+        Inicializa el historial. La base de datos se abre al primer uso.
+
+        Args:
+            ruta: Archivo SQLite (por defecto `HISTORIAL_BLOQUES_PATH` o
+                `state/historial_bloques.sqlite3`)
+        """
+        self.ruta = ruta or os.getenv(
+            "HISTORIAL_BLOQUES_PATH", "state/historial_bloques.sqlite3"
+        )
+        self._conexion: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    @property
+    def conexion(self) -> sqlite3.Connection:
+        """Conexión a SQLite, creando el archivo y la tabla si no existen."""
+        if self._conexion is None:
+            directorio = os.path.dirname(self.ruta)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            self._conexion = sqlite3.connect(self.ruta, check_same_thread=False)
+            with self._conexion:
+                self._conexion.execute(
+                    "CREATE TABLE IF NOT EXISTS bloques ("
+                    "clave BLOB PRIMARY KEY, texto TEXT NOT NULL, "
+                    "es_receta INTEGER NOT NULL) WITHOUT ROWID"
+                )
+        return self._conexion
+
+    def registrar(self, texto: str, es_receta: bool) -> None:
+        """Anota (o actualiza) la etiqueta de un bloque."""
+        clave = hashlib.sha256(texto.encode("utf-8")).digest()[:16]
+        with self._lock:
+            with self.conexion:
+                self.conexion.execute(
+                    "INSERT OR REPLACE INTO bloques (clave, texto, es_receta) "
+                    "VALUES (?, ?, ?)",
+                    (clave, texto, int(es_receta)),
+                )
+
+    def ejemplos(self) -> Iterator[Tuple[str, bool]]:
+        """Recorre los bloques etiquetados en un orden estable."""
+        with self._lock:
+            filas = self.conexion.execute(
+                "SELECT texto, es_receta FROM bloques ORDER BY clave"
+            ).fetchall()
+        for texto, es_receta in filas:
+            yield texto, bool(es_receta)
+
+    def cerrar(self) -> None:
+        """Cierra la conexión con SQLite."""
+        with self._lock:
+            if self._conexion is not None:
+                self._conexion.close()
+                self._conexion = None
+
+
+def imprimir_estimaciones(clasificador: ClasificadorBloques, umbral: float) -> None:
+    """Muestra el ahorro y la pérdida de recall estimados para un umbral."""
+    perdida = clasificador.perdida_recall(umbral)
+    ahorro = clasificador.ahorro(umbral)
+    if perdida is None or ahorro is None:
+        print("Sin muestra etiquetada para estimar recall")
+        return
+    muestra = sum(len(p) for p in clasificador.validacion.values())
+    print(
+        f"Umbral {umbral:.2f}: {ahorro:.1%} de bloques sin llamar a Mistral, "
+        f"pérdida de recall estimada {perdida:.1%} (muestra de {muestra} bloques)"
+    )
+
+
+def main():
+    """Entrena o evalúa el pre-clasificador desde línea de comandos."""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description="Pre-clasificador de bloques de receta a partir del historial"
+    )
+    parser.add_argument("accion", choices=("entrenar", "evaluar"))
+    parser.add_argument(
+        "--modelo",
+        default=os.getenv("CLASIFICADOR_PATH", "state/clasificador_bloques.json"),
+        help="Archivo del modelo (por defecto CLASIFICADOR_PATH)",
+    )
+    parser.add_argument(
+        "--umbral",
+        type=float,
+        action="append",
+        help="Umbrales a evaluar (por defecto CLASIFICADOR_UMBRAL)",
+    )
+    args = parser.parse_args()
+    umbrales = args.umbral or [float(os.getenv("CLASIFICADOR_UMBRAL", "0.05"))]
+
+    if args.accion == "entrenar":
+        historial = HistorialBloques()
+        ejemplos = list(historial.ejemplos())
+        historial.cerrar()
+        if not ejemplos:
+            print("El historial de bloques está vacío: procesa algún chat primero")
+            sys.exit(1)
+        random.Random(0).shuffle(ejemplos)
+        corte = int(len(ejemplos) * (1 - FRACCION_VALIDACION))
+        clasificador = ClasificadorBloques.entrenar(ejemplos[:corte])
+        clasificador.evaluar(ejemplos[corte:])
+        clasificador.guardar(args.modelo)
+        print(
+            f"✅ Modelo entrenado con {corte} bloques "
+            f"({clasificador.documentos['receta']} con recetas) en {args.modelo}"
+        )
+    else:
+        clasificador = ClasificadorBloques.cargar(args.modelo)
+        if clasificador is None:
+            print(f"No hay modelo en {args.modelo}")
+            sys.exit(1)
+
+    for umbral in umbrales:
+        imprimir_estimaciones(clasificador, umbral)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Peticiones duplicadas para recortar la cola de latencias de la extracción.
+
+Unas pocas llamadas tardan muchas veces la mediana y, en una subida desde
+Streamlit, un solo bloque lento retiene todo el archivo. Con la cobertura
+activada, si una llamada no ha respondido cuando se cumple el percentil 90
+de las latencias recientes se lanza una copia y se usa la primera respuesta.
+
+Las copias están presupuestadas: como mucho un 5% de llamadas de más sobre
+las enviadas, y cada una reserva su saldo en el limitador (si no hay saldo
+para enviarla ya, no se envía). Mientras no hay suficientes muestras no se
+duplica nada.
+"""
+
+import math
+import threading
+from collections import deque
+from typing import Deque, Optional
+
+
+class CoberturaLatencia:
+    """Latencias recientes y presupuesto de llamadas duplicadas."""
+
+    def __init__(
+        self,
+        percentil: float = 0.9,
+        presupuesto: float = 0.05,
+        muestras_minimas: int = 20,
+        ventana: int = 200,
+    ):
+        """
+        Inicializa el registro vacío.
+
+        Args:
+            percentil: Percentil de la latencia a partir del cual se duplica
+            presupuesto: Fracción máxima de llamadas duplicadas sobre las
+                enviadas
+            muestras_minimas: Latencias necesarias antes de duplicar nada
+            ventana: Latencias recientes con las que se calcula el percentil
+        """
+        self.percentil = percentil
+        self.presupuesto = presupuesto
+        self.muestras_minimas = max(1, muestras_minimas)
+        self._latencias: Deque[float] = deque(maxlen=max(ventana, muestras_minimas))
+        self.llamadas = 0
+        self.duplicadas = 0
+        # Duplicadas que respondieron antes que la llamada original
+        self.ganadas = 0
+        self._lock = threading.Lock()
+
+    def registrar_llamada(self) -> None:
+        """Anota una llamada enviada (la original, no sus copias)."""
+        with self._lock:
+            self.llamadas += 1
+
+    def registrar_latencia(self, segundos: float) -> None:
+        """Anota lo que tardó en llegar la respuesta de una llamada."""
+        with self._lock:
+            self._latencias.append(segundos)
+
+    def umbral(self) -> Optional[float]:
+        """
+        Segundos tras los que conviene duplicar una llamada.
+
+        Returns:
+            El percentil de las latencias recientes, o None si aún no hay
+            suficientes muestras
+        """
+        with self._lock:
+            if len(self._latencias) < self.muestras_minimas:
+                return None
+            ordenadas = sorted(self._latencias)
+        posicion = math.ceil(self.percentil * len(ordenadas)) - 1
+        return ordenadas[min(max(posicion, 0), len(ordenadas) - 1)]
+
+    def permitir(self) -> bool:
+        """
+        Consume una duplicada del presupuesto, si queda.
+
+        Returns:
+            True si se puede lanzar la copia
+        """
+        with self._lock:
+            if self.duplicadas + 1 > self.presupuesto * self.llamadas:
+                return False
+            self.duplicadas += 1
+            return True
+
+    def devolver(self) -> None:
+        """Reintegra una duplicada que al final no se envió."""
+        with self._lock:
+            self.duplicadas = max(0, self.duplicadas - 1)
+
+    def registrar_ganada(self) -> None:
+        """La copia respondió antes que la llamada original."""
+        with self._lock:
+            self.ganadas += 1
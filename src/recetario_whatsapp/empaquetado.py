@@ -0,0 +1,194 @@
+"""
+Empaquetado de varios bloques candidatos en una sola llamada a Mistral.
+
+La mayoría de bloques son un mensaje corto, y cada llamada repite las
+instrucciones y ejemplos del prompt. Los bloques consecutivos se agrupan hasta
+un presupuesto de tokens; cada uno va precedido de una marca con su número y
+se pide a Mistral que indique en cada receta el bloque del que procede, para
+repartir después las recetas entre sus bloques de origen.
+
+A la inversa, un bloque que no cabe en una llamada se divide por los límites
+entre mensajes (y, si un mensaje solo ya no cabe, por líneas) en trozos que
+se procesan por separado.
+"""
+
+import re
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Set, Tuple
+
+from .tokenizador import contar_aproximado
+
+# Marca que precede a cada bloque dentro de un paquete
+MARCA_BLOQUE = "### BLOQUE {}"
+# Tokens que añade la marca de cada bloque
+TOKENS_MARCA = 8
+
+# Autor de cada mensaje formateado como "[fecha] autor: texto"
+_PATRON_AUTOR = re.compile(r"^\[[^\]\n]*\] ([^:\n]+):", re.MULTILINE)
+
+
+def empaquetar_bloques(
+    bloques: Iterable[Tuple[int, Dict[str, Any]]],
+    presupuesto_tokens: int,
+    max_bloques: int,
+    contar: Callable[[str], int] = contar_aproximado,
+) -> Iterator[List[Tuple[int, Dict[str, Any]]]]:
+    """
+    Agrupa bloques consecutivos en paquetes que caben en el presupuesto.
+
+    Un bloque que por sí solo supera el presupuesto va en un paquete propio.
+
+    Args:
+        bloques: Tuplas (posición, bloque con `texto`), en el orden del chat
+        presupuesto_tokens: Tokens de texto máximos por paquete
+        max_bloques: Bloques máximos por paquete
+        contar: Función que cuenta los tokens de un texto
+
+    Yields:
+        Listas de tuplas (posición del bloque, bloque)
+    """
+    paquete: List[Tuple[int, Dict[str, Any]]] = []
+    tokens = 0
+    for indice, bloque in bloques:
+        coste = contar(bloque["texto"]) + TOKENS_MARCA
+        if paquete and (
+            tokens + coste > presupuesto_tokens or len(paquete) >= max_bloques
+        ):
+            yield paquete
+            paquete = []
+            tokens = 0
+        paquete.append((indice, bloque))
+        tokens += coste
+    if paquete:
+        yield paquete
+
+
+def dividir_partes(
+    partes: List[str], contar: Callable[[str], int], limite: int
+) -> List[Tuple[str, List[int]]]:
+    """
+    Divide el texto de un bloque en trozos que no superan el límite de tokens.
+
+    Los cortes caen entre mensajes; un mensaje que por sí solo supera el
+    límite se corta por líneas (o, en última instancia, por caracteres).
+
+    Args:
+        partes: Mensajes formateados del bloque, en orden
+        contar: Función que cuenta los tokens de un texto
+        limite: Tokens máximos por trozo
+
+    Returns:
+        Lista de (texto del trozo, posiciones de los mensajes que terminan en él)
+    """
+    trozos: List[Tuple[str, List[int]]] = []
+    actual: List[str] = []
+    terminados: List[int] = []
+    tokens = 0
+    for posicion, parte in enumerate(partes):
+        coste_parte = contar(parte)
+        piezas = (
+            [parte] if coste_parte <= limite else _partir_texto(parte, contar, limite)
+        )
+        for pieza in piezas:
+            coste = coste_parte if len(piezas) == 1 else contar(pieza)
+            if actual and tokens + coste > limite:
+                trozos.append(("".join(actual), terminados))
+                actual, terminados, tokens = [], [], 0
+            actual.append(pieza)
+            tokens += coste
+        terminados.append(posicion)
+    if actual:
+        trozos.append(("".join(actual), terminados))
+    return trozos
+
+
+def _partir_texto(texto: str, contar: Callable[[str], int], limite: int) -> List[str]:
+    """Corta un texto por líneas en piezas de como mucho `limite` tokens."""
+    piezas: List[str] = []
+    actual = ""
+    for linea in texto.splitlines(keepends=True):
+        # Una línea enorme sin saltos se corta por caracteres
+        while contar(linea) > limite:
+            corte = len(linea)
+            while corte > 1 and contar(linea[:corte]) > limite:
+                corte //= 2
+            if actual:
+                piezas.append(actual)
+                actual = ""
+            piezas.append(linea[:corte])
+            linea = linea[corte:]
+        if actual and contar(actual + linea) > limite:
+            piezas.append(actual)
+            actual = ""
+        actual += linea
+    if actual:
+        piezas.append(actual)
+    return piezas
+
+
+def componer_paquete(textos: List[str]) -> str:
+    """Une los textos de los bloques, cada uno precedido de su marca numerada."""
+    return "\n".join(
+        f"{MARCA_BLOQUE.format(numero)}\n{texto}"
+        for numero, texto in enumerate(textos, 1)
+    )
+
+
+def autores_bloque(texto: str) -> Set[str]:
+    """Autores de los mensajes de un bloque (o paquete) formateado."""
+    return set(_PATRON_AUTOR.findall(texto))
+
+
+def mensajes_de_autor(texto: str, autor: str) -> str:
+    """Mensajes de un autor dentro de un bloque (o paquete) formateado."""
+    inicios = [cabecera.start() for cabecera in _PATRON_AUTOR.finditer(texto)]
+    finales = inicios[1:] + [len(texto)]
+    return "".join(
+        texto[inicio:final]
+        for inicio, final in zip(inicios, finales)
+        if _PATRON_AUTOR.match(texto, inicio).group(1) == autor
+    )
+
+
+def repartir_recetas(
+    resultado: Dict[str, Any], textos: List[str]
+) -> List[Dict[str, Any]]:
+    """
+    Reparte las recetas de la respuesta de un paquete entre sus bloques.
+
+    Las recetas sin un número de bloque válido se asignan al primer bloque
+    con mensajes del mismo autor (o al primero si no hay ninguno). Los demás
+    campos de la respuesta (`error`, `warning`...) se copian a cada bloque.
+
+    Args:
+        resultado: Respuesta de Mistral para el paquete completo
+        textos: Textos de los bloques en el orden en que se enviaron
+
+    Returns:
+        Un resultado `{"recetas": [...]}` por bloque
+    """
+    extras = {clave: valor for clave, valor in resultado.items() if clave != "recetas"}
+    autores = [autores_bloque(texto) for texto in textos]
+    por_bloque: List[List[Dict[str, Any]]] = [[] for _ in textos]
+    for receta in resultado.get("recetas") or []:
+        if not isinstance(receta, dict):
+            continue
+        receta = dict(receta)
+        por_bloque[bloque_de_receta(receta, autores)].append(receta)
+    return [{**extras, "recetas": recetas} for recetas in por_bloque]
+
+
+def bloque_de_receta(receta: Dict[str, Any], autores: List[Set[str]]) -> int:
+    """Posición del bloque de origen de una receta (quita su campo `bloque`)."""
+    numero = receta.pop("bloque", None)
+    try:
+        numero = int(numero)
+    except (TypeError, ValueError):
+        numero = 0
+    if 1 <= numero <= len(autores):
+        return numero - 1
+
+    creador = receta.get("creador")
+    for posicion, nombres in enumerate(autores):
+        if creador in nombres:
+            return posicion
+    return 0
@@ -0,0 +1,394 @@
+"""
+Esquema de las respuestas de extracción y lectura tolerante del JSON.
+
+Las peticiones a Mistral piden salida JSON ajustada a `esquema_respuesta`,
+pero una respuesta cortada por `max_tokens` o con algún desliz de formato
+(comas finales, texto o bloques de código alrededor) no se descarta: se
+repara localmente y cada receta se valida por separado. Las que se pueden
+normalizar sin dudas (listas en lugar de texto, fechas del chat, booleanos
+como cadena) se corrigen aquí; las demás se devuelven aparte para volver a
+pedir solo esa receta.
+"""
+
+import json
+import re
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Campos de una receta, en el orden del prompt
+CAMPOS_RECETA = (
+    "creador",
+    "nombre_receta",
+    "ingredientes",
+    "pasos_preparacion",
+    "tiene_foto",
+    "fecha_mensaje",
+)
+# Intentos de cierre al reparar una respuesta cortada (de la más larga a la más corta)
+MAX_CORTES_REPARACION = 50
+
+# Formatos de fecha del chat que Mistral copia a veces tal cual
+_FORMATOS_FECHA = (
+    "%d/%m/%y %H:%M:%S",
+    "%d/%m/%y, %H:%M:%S",
+    "%d/%m/%Y %H:%M:%S",
+    "%d/%m/%y",
+    "%Y-%m-%d",
+)
+_PATRON_BLOQUE_CODIGO = re.compile(r"```(?:json)?\s*(.*?)(?:```|$)", re.DOTALL)
+_VERDADEROS = {"true", "sí", "si", "yes", "1"}
+_FALSOS = {"false", "no", "0", ""}
+
+# Una receta que no cumple el esquema, con los motivos
+RecetaInvalida = Tuple[Any, List[str]]
+
+
+def esquema_respuesta(con_bloque: bool = False) -> Dict[str, Any]:
+    """
+    Esquema JSON de la respuesta `{"recetas": [...]}`.
+
+    Args:
+        con_bloque: Exigir en cada receta el número de bloque (paquetes)
+
+    Returns:
+        Esquema para `response_format` de tipo `json_schema`
+    """
+    texto_o_nulo = {"type": ["string", "null"]}
+    propiedades: Dict[str, Any] = {
+        "creador": {"type": "string"},
+        "nombre_receta": texto_o_nulo,
+        "ingredientes": {"type": "string"},
+        "pasos_preparacion": texto_o_nulo,
+        "tiene_foto": {"type": "boolean"},
+        "fecha_mensaje": texto_o_nulo,
+    }
+    if con_bloque:
+        propiedades["bloque"] = {"type": "integer"}
+    receta = {
+        "type": "object",
+        "properties": propiedades,
+        "required": list(propiedades),
+        "additionalProperties": False,
+    }
+    return {
+        "type": "object",
+        "properties": {"recetas": {"type": "array", "items": receta}},
+        "required": ["recetas"],
+        "additionalProperties": False,
+    }
+
+
+def cargar_json_tolerante(texto: str) -> Tuple[Any, bool]:
+    """
+    Interpreta el JSON de una respuesta aunque esté rodeado de texto,
+    tenga comas finales o esté cortado.
+
+    Una respuesta cortada se cierra tras el último valor completo, así que
+    se pierde como mucho el elemento que se estaba escribiendo.
+
+    Args:
+        texto: Contenido de la respuesta
+
+    Returns:
+        Tupla (valor, si hubo que cerrar estructuras abiertas)
+
+    Raises:
+        ValueError: Si no hay ningún JSON recuperable
+    """
+    bloque = _PATRON_BLOQUE_CODIGO.search(texto)
+    if bloque:
+        texto = bloque.group(1)
+    inicio = min(
+        (posicion for posicion in (texto.find("{"), texto.find("[")) if posicion >= 0),
+        default=-1,
+    )
+    if inicio < 0:
+        raise ValueError("La respuesta no contiene JSON")
+
+    try:
+        return json.JSONDecoder().raw_decode(texto, inicio)[0], False
+    except json.JSONDecodeError:
+        pass
+
+    salida, cortes, completo = _limpiar_json(texto, inicio)
+    if completo:
+        try:
+            return json.loads(salida), False
+        except json.JSONDecodeError:
+            pass
+    # Cerrar lo que quedó abierto tras el último valor completo
+    for longitud, abiertos in reversed(cortes[-MAX_CORTES_REPARACION:]):
+        cierre = "".join("}" if c == "{" else "]" for c in reversed(abiertos))
+        try:
+            return json.loads(salida[:longitud] + cierre), True
+        except json.JSONDecodeError:
+            continue
+    raise ValueError("JSON no recuperable")
+
+
+def _limpiar_json(texto: str, inicio: int) -> Tuple[str, List[Tuple[int, str]], bool]:
+    """
+    Recorre el JSON una vez quitando comas finales y anotando dónde cortar.
+
+    Returns:
+        Tupla (texto limpio, cortes (longitud, contenedores abiertos), si el
+        valor raíz llegó a cerrarse)
+    """
+    salida: List[str] = []
+    longitud = 0
+    abiertos: List[str] = []
+    cortes: List[Tuple[int, str]] = []
+    en_cadena = escapado = False
+    for caracter in texto[inicio:]:
+        if en_cadena:
+            if escapado:
+                escapado = False
+            elif caracter == "\\":
+                escapado = True
+            elif caracter == '"':
+                en_cadena = False
+        elif caracter == '"':
+            en_cadena = True
+        elif caracter in "{[":
+            abiertos.append(caracter)
+        elif caracter in "}]":
+            # Coma justo antes del cierre: se descarta
+            while salida and salida[-1].isspace():
+                salida.pop()
+                longitud -= 1
+            if salida and salida[-1] == ",":
+                salida.pop()
+                longitud -= 1
+            if not abiertos:
+                break
+            abiertos.pop()
+            salida.append(caracter)
+            longitud += 1
+            if not abiertos:
+                return "".join(salida), cortes, True
+            cortes.append((longitud, "".join(abiertos)))
+            continue
+        elif caracter == "," and abiertos:
+            cortes.append((longitud, "".join(abiertos)))
+        salida.append(caracter)
+        longitud += 1
+    return "".join(salida), cortes, False
+
+
+class LectorRecetas:
+    """
+    Lee una respuesta JSON que llega por trozos (streaming) y entrega cada
+    objeto de receta en cuanto se cierra su llave.
+
+    Las recetas son los objetos de la lista `recetas` (o de una lista raíz);
+    el resto de la respuesta se interpreta al final con
+    `cargar_json_tolerante`.
+    """
+
+    def __init__(self):
+        self._abiertos: List[str] = []
+        self._en_cadena = False
+        self._escapado = False
+        # Caracteres del objeto de receta en curso (None fuera de uno)
+        self._captura: Optional[List[str]] = None
+        self._nivel_captura = 0
+
+    def alimentar(self, trozo: str) -> List[Any]:
+        """
+        Procesa un trozo de la respuesta.
+
+        Args:
+            trozo: Texto recibido desde el trozo anterior
+
+        Returns:
+            Recetas cuyo objeto se ha cerrado en este trozo
+        """
+        completas: List[Any] = []
+        abiertos = self._abiertos
+        for caracter in trozo:
+            if self._captura is not None:
+                self._captura.append(caracter)
+            if self._en_cadena:
+                if self._escapado:
+                    self._escapado = False
+                elif caracter == "\\":
+                    self._escapado = True
+                elif caracter == '"':
+                    self._en_cadena = False
+            elif caracter == '"':
+                # Fuera del JSON (texto alrededor) las comillas no cuentan
+                self._en_cadena = bool(abiertos)
+            elif caracter in "{[":
+                # Un objeto dentro de la lista raíz o de la lista `recetas`
+                if (
+                    caracter == "{"
+                    and self._captura is None
+                    and abiertos
+                    and abiertos[-1] == "["
+                    and len(abiertos) <= 2
+                ):
+                    self._captura = [caracter]
+                    self._nivel_captura = len(abiertos)
+                abiertos.append(caracter)
+            elif caracter in "}]" and abiertos:
+                abiertos.pop()
+                if self._captura is not None and len(abiertos) == self._nivel_captura:
+                    try:
+                        completas.append(json.loads("".join(self._captura)))
+                    except json.JSONDecodeError:
+                        pass
+                    self._captura = None
+        return completas
+
+
+def recetas_de_respuesta(valor: Any) -> List[Any]:
+    """
+    Lista de recetas de una respuesta ya interpretada.
+
+    Acepta `{"recetas": [...]}`, una lista de recetas suelta, una receta
+    suelta y el formato antiguo con `es_receta`.
+    """
+    if isinstance(valor, list):
+        return valor
+    if not isinstance(valor, dict):
+        return []
+    if "recetas" in valor:
+        recetas = valor["recetas"]
+        if isinstance(recetas, dict):
+            return [recetas]
+        return recetas if isinstance(recetas, list) else []
+    if "es_receta" in valor:
+        return [valor] if valor.get("es_receta") else []
+    return [valor] if "ingredientes" in valor else []
+
+
+def validar_receta(
+    receta: Any, autores: Iterable[str] = (), completa: bool = False
+) -> Tuple[Optional[Dict[str, Any]], List[str]]:
+    """
+    Comprueba una receta contra el esquema y normaliza lo inequívoco.
+
+    Args:
+        receta: Receta tal como llega en la respuesta
+        autores: Autores de los mensajes enviados; si solo hay uno, se usa
+            como creador cuando falta
+        completa: Exigir todos los campos (en una respuesta cortada, la
+            última receta puede haberse quedado a medias)
+
+    Returns:
+        Tupla (receta normalizada o None, motivos por los que no es válida).
+        Una receta completa con los ingredientes vacíos no es una receta
+        según el prompt: se devuelve (None, []) para descartarla sin más.
+    """
+    if not isinstance(receta, dict):
+        return None, ["la receta no es un objeto JSON"]
+
+    errores: List[str] = []
+    normalizada: Dict[str, Any] = {}
+    if completa:
+        faltan = [campo for campo in CAMPOS_RECETA if campo not in receta]
+        if faltan:
+            errores.append(f"receta incompleta, faltan: {', '.join(faltan)}")
+
+    creador = _texto(receta.get("creador"))
+    autores = set(autores)
+    if not creador and len(autores) == 1:
+        creador = next(iter(autores))
+    if creador:
+        normalizada["creador"] = creador
+    else:
+        errores.append("falta creador")
+
+    normalizada["nombre_receta"] = _texto(receta.get("nombre_receta")) or None
+
+    ingredientes = _texto(receta.get("ingredientes"), ", ")
+    if ingredientes:
+        normalizada["ingredientes"] = ingredientes
+    elif "ingredientes" in receta and not errores:
+        return None, []
+    else:
+        errores.append("faltan ingredientes")
+
+    normalizada["pasos_preparacion"] = (
+        _texto(receta.get("pasos_preparacion"), " ") or None
+    )
+
+    tiene_foto = receta.get("tiene_foto", False)
+    if isinstance(tiene_foto, str) and tiene_foto.strip().lower() in _VERDADEROS:
+        tiene_foto = True
+    elif isinstance(tiene_foto, str) and tiene_foto.strip().lower() in _FALSOS:
+        tiene_foto = False
+    elif tiene_foto is None or isinstance(tiene_foto, (bool, int)):
+        tiene_foto = bool(tiene_foto)
+    else:
+        errores.append("tiene_foto no es booleano")
+    normalizada["tiene_foto"] = tiene_foto
+
+    fecha = receta.get("fecha_mensaje")
+    if fecha in (None, ""):
+        normalizada["fecha_mensaje"] = None
+    else:
+        normalizada["fecha_mensaje"] = fecha_iso(str(fecha))
+        if normalizada["fecha_mensaje"] is None:
+            errores.append(f"fecha_mensaje no es una fecha ISO 8601: {fecha!r}")
+
+    try:
+        normalizada["bloque"] = int(receta["bloque"])
+    except (KeyError, TypeError, ValueError):
+        pass
+
+    if errores:
+        return None, errores
+    return normalizada, []
+
+
+def validar_recetas(
+    recetas: Iterable[Any], autores: Iterable[str] = (), completas: bool = False
+) -> Tuple[List[Dict[str, Any]], List[RecetaInvalida]]:
+    """
+    Valida cada receta de una respuesta por separado (ver `validar_receta`).
+
+    Returns:
+        Tupla (recetas válidas, lista de (receta, motivos) de las inválidas);
+        las que no son recetas no aparecen en ninguna de las dos
+    """
+    autores = set(autores)
+    validas: List[Dict[str, Any]] = []
+    invalidas: List[RecetaInvalida] = []
+    for receta in recetas:
+        normalizada, errores = validar_receta(receta, autores, completas)
+        if normalizada is not None:
+            validas.append(normalizada)
+        elif errores:
+            invalidas.append((receta, errores))
+    return validas, invalidas
+
+
+def _texto(valor: Any, separador: str = " ") -> str:
+    """Texto de un campo; las listas se unen con `separador`."""
+    if valor is None or isinstance(valor, (dict, bool)):
+        return ""
+    if isinstance(valor, list):
+        return separador.join(
+            parte for parte in (_texto(elemento) for elemento in valor) if parte
+        )
+    return str(valor).strip()
+
+
+def fecha_iso(fecha: str) -> Optional[str]:
+    """Fecha en ISO 8601 con zona (UTC si no la trae), o None si no se entiende."""
+    fecha = fecha.strip()
+    try:
+        fecha_obj = datetime.fromisoformat(fecha)
+    except ValueError:
+        for formato in _FORMATOS_FECHA:
+            try:
+                fecha_obj = datetime.strptime(fecha, formato)
+                break
+            except ValueError:
+                continue
+        else:
+            return None
+    if fecha_obj.tzinfo is None:
+        fecha_obj = fecha_obj.replace(tzinfo=timezone.utc)
+    return fecha_obj.isoformat()
@@ -0,0 +1,223 @@
+"""
+Extracción concurrente de recetas con Mistral.
+
+Los bloques consecutivos se empaquetan hasta un presupuesto de tokens y cada
+paquete se envía con `MistralClient.extraer_recetas_async` desde un bucle de
+eventos que vive en un hilo propio, con varias peticiones en vuelo a la vez;
+el ritmo lo marca el limitador de peticiones y tokens por minuto del
+cliente, no una espera fija entre llamadas. Los resultados se devuelven al
+hilo que consume a medida que terminan, de modo que las inserciones en
+Supabase avanzan mientras siguen las llamadas. Los bloques que ya traen su
+resultado en `extraccion_local` (extraídos por reglas) se devuelven sin
+llamar a Mistral. Con respuestas por streaming, cada receta se devuelve
+además en cuanto llega, antes de que termine la llamada de su paquete.
+"""
+
+import asyncio
+import queue
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import (
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from .empaquetado import empaquetar_bloques
+from .tokenizador import contar_aproximado
+
+# Resultado de un bloque: (posición del bloque, bloque, respuesta de Mistral)
+ResultadoBloque = Tuple[int, Dict[str, Any], Dict[str, Any]]
+# Paquete enviado en una llamada: (posición, bloque) de cada bloque
+Paquete = List[Tuple[int, Dict[str, Any]]]
+# Aviso del bucle de eventos: (llamada terminada, None) o (None, receta parcial)
+Evento = Tuple[Optional[Future], Optional[ResultadoBloque]]
+
+
+class MotorExtraccion:
+    """Mantiene hasta `concurrencia` llamadas a Mistral en vuelo."""
+
+    def __init__(
+        self,
+        cliente: Any,
+        concurrencia: int = 4,
+        presupuesto_tokens: int = 6000,
+        bloques_por_llamada: int = 20,
+        contar_tokens: Callable[[str], int] = contar_aproximado,
+        parciales: bool = False,
+    ):
+        """
+        Inicializa el motor. El bucle de eventos se arranca al primer uso.
+
+        Args:
+            cliente: `MistralClient` (o cualquier objeto con `extraer_recetas_async`)
+            concurrencia: Llamadas simultáneas por recorrido
+            presupuesto_tokens: Tokens de texto de los bloques por llamada
+            bloques_por_llamada: Bloques máximos por llamada (1 = sin empaquetar)
+            contar_tokens: Función que cuenta los tokens de un texto
+            parciales: Pedir al cliente cada receta en cuanto llega
+                (`MistralClient.streaming`)
+        """
+        self.cliente = cliente
+        self.concurrencia = max(1, concurrencia)
+        self.presupuesto_tokens = presupuesto_tokens
+        self.bloques_por_llamada = max(1, bloques_por_llamada)
+        self.contar_tokens = contar_tokens
+        self.parciales = parciales
+        self._bucle: Optional[asyncio.AbstractEventLoop] = None
+        self._hilo: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def iterar_resultados(
+        self, bloques: Iterable[Dict[str, Any]]
+    ) -> Iterator[ResultadoBloque]:
+        """
+        Envía los bloques a Mistral y devuelve cada resultado según termina.
+
+        Los bloques se leen del iterable solo cuando hay hueco para otra
+        llamada, así que un chat enorme no se carga entero en memoria. Los
+        bloques de un mismo paquete se devuelven juntos al terminar su llamada;
+        los que traen `extraccion_local` se devuelven con ese resultado sin
+        llamar a Mistral. Con `parciales`, cada receta se devuelve antes, en
+        un resultado `{"recetas": [receta], "parcial": True}`, y el resultado
+        final del bloque trae solo las que faltaban.
+
+        Args:
+            bloques: Bloques con `texto` (y opcionalmente `extraccion_local`),
+                en el orden del chat
+
+        Yields:
+            Tuplas (posición, bloque, resultado) en orden de finalización
+        """
+        bucle = self._arrancar()
+        pendientes: Dict[Future, Paquete] = {}
+        eventos: "queue.Queue[Evento]" = queue.Queue()
+        locales: Deque[ResultadoBloque] = deque()
+        paquetes = empaquetar_bloques(
+            self._separar_locales(bloques, locales),
+            self.presupuesto_tokens,
+            self.bloques_por_llamada,
+            self.contar_tokens,
+        )
+        try:
+            for paquete in paquetes:
+                if len(pendientes) >= self.concurrencia:
+                    yield from self._recoger(pendientes, eventos, bloquear=True)
+                textos = [bloque["texto"] for _, bloque in paquete]
+                if self.parciales:
+                    llamada = self.cliente.extraer_recetas_async(
+                        textos, self._al_recibir(paquete, eventos)
+                    )
+                else:
+                    llamada = self.cliente.extraer_recetas_async(textos)
+                futuro = asyncio.run_coroutine_threadsafe(llamada, bucle)
+                pendientes[futuro] = paquete
+                futuro.add_done_callback(lambda f: eventos.put((f, None)))
+                # Los extraídos por reglas mientras se llenaba el paquete
+                yield from self._vaciar(locales)
+                yield from self._recoger(pendientes, eventos, bloquear=False)
+
+            yield from self._vaciar(locales)
+            while pendientes:
+                yield from self._recoger(pendientes, eventos, bloquear=True)
+        finally:
+            # Si el consumidor se detiene, no dejar llamadas huérfanas
+            for futuro in pendientes:
+                futuro.cancel()
+
+    def cerrar(self) -> None:
+        """Cierra las conexiones del cliente y detiene el bucle y su hilo."""
+        with self._lock:
+            if self._bucle is None:
+                return
+            cerrar_async = getattr(self.cliente, "cerrar_async", None)
+            if asyncio.iscoroutinefunction(cerrar_async):
+                asyncio.run_coroutine_threadsafe(cerrar_async(), self._bucle).result()
+            self._bucle.call_soon_threadsafe(self._bucle.stop)
+            self._hilo.join()
+            self._bucle.close()
+            self._bucle = None
+            self._hilo = None
+
+    def _arrancar(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._bucle is None:
+                self._bucle = asyncio.new_event_loop()
+                self._hilo = threading.Thread(
+                    target=self._bucle.run_forever,
+                    name="extraccion-mistral",
+                    daemon=True,
+                )
+                self._hilo.start()
+            return self._bucle
+
+    @staticmethod
+    def _separar_locales(
+        bloques: Iterable[Dict[str, Any]], locales: Deque[ResultadoBloque]
+    ) -> Iterator[Tuple[int, Dict[str, Any]]]:
+        """Numera los bloques y aparta en `locales` los que no necesitan llamada."""
+        for indice, bloque in enumerate(bloques):
+            resultado = bloque.pop("extraccion_local", None)
+            if resultado is not None:
+                locales.append((indice, bloque, resultado))
+            else:
+                yield indice, bloque
+
+    @staticmethod
+    def _vaciar(locales: Deque[ResultadoBloque]) -> Iterator[ResultadoBloque]:
+        """Devuelve (y olvida) los resultados locales acumulados."""
+        while locales:
+            yield locales.popleft()
+
+    @staticmethod
+    def _al_recibir(
+        paquete: Paquete, eventos: "queue.Queue[Evento]"
+    ) -> Callable[[int, Dict[str, Any]], None]:
+        """Pasa al hilo que consume cada receta que llega de una llamada."""
+
+        def al_recibir(posicion: int, receta: Dict[str, Any]) -> None:
+            indice, bloque = paquete[posicion]
+            eventos.put(
+                (None, (indice, bloque, {"recetas": [receta], "parcial": True}))
+            )
+
+        return al_recibir
+
+    @staticmethod
+    def _recoger(
+        pendientes: Dict[Future, Paquete],
+        eventos: "queue.Queue[Evento]",
+        bloquear: bool,
+    ) -> Iterator[ResultadoBloque]:
+        """
+        Devuelve las recetas parciales y los resultados ya terminados; si
+        `bloquear`, espera hasta que termine al menos una llamada.
+        """
+        while True:
+            try:
+                futuro, parcial = eventos.get(block=bloquear)
+            except queue.Empty:
+                return
+            if parcial is not None:
+                yield parcial
+                continue
+            # Una llamada cancelada ya no está entre las pendientes
+            paquete = pendientes.pop(futuro, None)
+            if paquete is None:
+                continue
+            try:
+                resultados = futuro.result()
+            except Exception as e:
+                error = {"recetas": [], "error": f"Error en la API de Mistral: {e}"}
+                resultados = [error] * len(paquete)
+            for (indice, bloque), resultado in zip(paquete, resultados):
+                yield indice, bloque, resultado
+            # Tras una llamada terminada, solo se vacía lo que ya haya llegado
+            bloquear = False
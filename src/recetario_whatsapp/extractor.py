@@ -6,12 +6,52 @@ import re
 import json
 import os
 import argparse
+import threading
+import time
 import unicodedata
+import zipfile
+from bisect import bisect_left
 from datetime import datetime
-from typing import List, Dict, Any, Optional, Tuple, Set
+from typing import (
+    List,
+    Dict,
+    Any,
+    Iterable,
+    Iterator,
+    Optional,
+    Tuple,
+    Set,
+    Union,
+)
 
 from openpyxl import load_workbook
+from .adjuntos import (
+    ExportacionZip,
+    adjuntos_referenciados,
+    es_zip,
+    solo_adjuntos,
+)
+from .backends import crear_backend
+from .chat_parser import (
+    FuenteChat,
+    Mensaje,
+    ParserWhatsApp,
+    abrir_lineas,
+    fecha_iso_de_timestamp,
+    nombre_fuente,
+    planificar_tramos,
+    timestamp_de_fecha,
+    timestamp_de_fecha_iso,
+)
+from .checkpoint import ReanudacionChat, clave_chat
+from .clasificador import ClasificadorBloques, HistorialBloques, imprimir_estimaciones
+from .empaquetado import dividir_partes
+from .extraccion_async import MotorExtraccion
+from .ledger import LedgerMensajes, huella_mensaje, huella_receta
 from .mistral_client import MistralClient
+from .paralelo import BYTES_POR_TRAMO, MensajeAnalizado, iterar_analizados_en_paralelo
+from .recipe_matcher import DetectorReceta
+from .reglas import ORIGEN_REGLAS, extraer_receta_por_reglas
 from .supabase_utils import SupabaseManager
 
 # Importar pandas y openpyxl para procesamiento de Excel
@@ -32,18 +72,24 @@ class ExcelExtractor:
         self.supabase_manager = supabase_manager
         self.existing_keys: Set[Tuple[str, str]] = set()
         self.nuevas_claves: Set[Tuple[str, str]] = set()
+        # Varios archivos pueden procesarse a la vez compartiendo las claves
+        self._lock_claves = threading.Lock()
         self.creador_aliases = {
             # Alias comunes para evitar duplicados por variaciones de nombre
             "carlitos": "carlos",
         }
         self._refrescar_claves_existentes()
 
-    def procesar_excel(self, ruta_archivo: str) -> Dict[str, Any]:
+    def procesar_excel(
+        self, ruta_archivo: Any, refrescar_claves: bool = True
+    ) -> Dict[str, Any]:
         """
         Procesa un archivo Excel y extrae recetas.
 
         Args:
-            ruta_archivo: Ruta al archivo Excel
+            ruta_archivo: Ruta al archivo Excel o stream binario con su contenido
+            refrescar_claves: Volver a descargar las claves de recetas existentes;
+                en ingestas por lotes se descargan una vez y se comparten
 
         Returns:
             Diccionario con estadísticas del procesamiento
@@ -53,15 +99,19 @@ class ExcelExtractor:
                 "error": "pandas not available. Install with: pip install pandas openpyxl"
             }
 
-        print(f"Procesando archivo Excel: {ruta_archivo}")
+        print(f"Procesando archivo Excel: {nombre_fuente(ruta_archivo)}")
 
         # Refrescar deduplicación y limpiar cache por ejecución
-        self._refrescar_claves_existentes()
-        self.nuevas_claves.clear()
+        if refrescar_claves:
+            self._refrescar_claves_existentes()
+            self.nuevas_claves.clear()
 
         try:
             # Leer todas las hojas del Excel (datos tabulares)
             excel_data = pd.read_excel(ruta_archivo, sheet_name=None)
+            if hasattr(ruta_archivo, "seek"):
+                # Los streams se leen dos veces (pandas y openpyxl)
+                ruta_archivo.seek(0)
             # Cargar workbook con openpyxl para inspeccionar imágenes embebidas
             workbook = load_workbook(ruta_archivo, data_only=True)
             print(f"Encontradas {len(excel_data)} hojas")
@@ -202,13 +252,22 @@ class ExcelExtractor:
                 "url_imagen": imagenes_receta[0]["url"] if imagenes_receta else None,
             }
 
+            # Reservar la clave: otro archivo procesado a la vez puede traer
+            # la misma receta
+            if not self._reservar_clave(clave_normalizada):
+                print(
+                    f"  ⚠️ Receta duplicada detectada: '{nombre_receta}' de {creador}. Saltando."
+                )
+                continue
+
             # Insertar en la base de datos
             if self.supabase_manager.insertar_receta(receta):
                 recetas_insertadas += 1
-                self.nuevas_claves.add(clave_normalizada)
                 self.existing_keys.add(clave_normalizada)
                 print(f"  ✅ Receta '{nombre_receta}' insertada")
             else:
+                with self._lock_claves:
+                    self.nuevas_claves.discard(clave_normalizada)
                 print(f"  ❌ Error insertando receta '{nombre_receta}'")
 
             recetas_extraidas += 1
@@ -571,6 +630,14 @@ class ExcelExtractor:
         texto = unicodedata.normalize("NFKD", texto)
         return "".join(c for c in texto if not unicodedata.combining(c))
 
+    def _reservar_clave(self, clave: Tuple[str, str]) -> bool:
+        """Anota la clave como nueva si nadie la tenía; False si ya existía."""
+        with self._lock_claves:
+            if clave in self.existing_keys or clave in self.nuevas_claves:
+                return False
+            self.nuevas_claves.add(clave)
+            return True
+
     def _refrescar_claves_existentes(self) -> None:
         try:
             self.existing_keys = self.supabase_manager.obtener_claves_recetas()
@@ -584,491 +651,831 @@ class WhatsAppExtractor:
 
     def __init__(self):
         """Inicializa el extractor con los clientes necesarios."""
-        self.mistral_client = MistralClient()
+        # Mistral o un servidor propio compatible con OpenAI (EXTRACCION_BACKEND),
+        # cada uno con su concurrencia y sus límites
+        backend = crear_backend()
+        self.mistral_client = MistralClient(backend)
         self.supabase_manager = SupabaseManager()
         self.excel_extractor = (
             ExcelExtractor(self.supabase_manager) if PANDAS_AVAILABLE else None
         )
 
-        # Patrones para detectar mensajes de WhatsApp - formato real del archivo
-        self.patron_mensaje = re.compile(
-            r"\[(\d{2}/\d{2}/\d{2}),\s*(\d{2}:\d{2}:\d{2})\]\s*([^:]+):\s*(.*)"
+        self.detector = DetectorReceta()
+        self.parser = ParserWhatsApp(self.detector.es_linea_receta)
+        self.ledger = LedgerMensajes(supabase_manager=self.supabase_manager)
+        # Llamadas a Mistral en vuelo a la vez, cada una con varios bloques
+        # empaquetados; el ritmo lo limita el cliente
+        self.motor = MotorExtraccion(
+            self.mistral_client,
+            concurrencia=backend.concurrencia,
+            presupuesto_tokens=int(os.getenv("MISTRAL_PRESUPUESTO_TOKENS", "6000")),
+            bloques_por_llamada=int(os.getenv("MISTRAL_BLOQUES_POR_LLAMADA", "20")),
+            contar_tokens=self.mistral_client.contar_tokens,
+            parciales=self.mistral_client.streaming,
         )
-        self.patron_mensaje_alternativo = re.compile(
-            r"\[(\d{2}/\d{2}/\d{2}),\s*(\d{2}:\d{2})\]\s*([^:]+):\s*(.*)"
+        # Recetas con secciones explícitas se extraen sin llamar a Mistral
+        self.extraccion_reglas = (
+            os.getenv("EXTRACCION_REGLAS", "true").lower() == "true"
         )
-
-        # Patrón para el formato real del archivo: DD/MM/YY, HH:MM - Nombre: mensaje
-        self.patron_mensaje_real = re.compile(
-            r"(\d{2}/\d{2}/\d{2}),\s*(\d{2}:\d{2})\s*-\s*([^:]+):\s*(.*)"
+        # Pre-clasificador local: descarta bloques sin receta antes de Mistral
+        self.clasificador = ClasificadorBloques.cargar(
+            os.getenv("CLASIFICADOR_PATH", "state/clasificador_bloques.json")
         )
+        self.umbral_clasificador = float(os.getenv("CLASIFICADOR_UMBRAL", "0.05"))
+        # Bloques etiquetados por Mistral con los que se entrena el clasificador
+        self.historial = (
+            HistorialBloques()
+            if os.getenv("HISTORIAL_BLOQUES", "true").lower() == "true"
+            else None
+        )
+        # Protege state/last_processed.json si se procesan varios chats a la vez
+        self._lock_estado = threading.Lock()
+
+    def cerrar(self) -> None:
+        """Cierra las conexiones con Mistral, el registro de huellas y el historial."""
+        self.motor.cerrar()
+        self.mistral_client.cerrar()
+        self.ledger.cerrar()
+        if self.historial is not None:
+            self.historial.cerrar()
 
     def procesar_archivo(
-        self, ruta_archivo: str, fecha_desde: Optional[str] = None
+        self,
+        ruta_archivo: FuenteChat,
+        fecha_desde: Optional[str] = None,
+        workers: int = 1,
+        refrescar_claves: bool = True,
     ) -> Dict[str, Any]:
         """
         Procesa un archivo y extrae recetas. Detecta automáticamente si es WhatsApp o Excel.
 
+        Las exportaciones de WhatsApp "con archivos" (.zip) se leen sin
+        descomprimirlas a disco y sus fotos se enlazan con las recetas.
+
         Args:
-            ruta_archivo: Ruta al archivo
+            ruta_archivo: Ruta al archivo o stream abierto (p. ej. `UploadedFile` de Streamlit)
             fecha_desde: Fecha desde la cual procesar (formato YYYY-MM-DD) - solo para WhatsApp
+            workers: Procesos para parsear y clasificar el chat - solo para WhatsApp
+            refrescar_claves: Volver a descargar las claves de recetas - solo para Excel
 
         Returns:
             Diccionario con estadísticas del procesamiento
         """
-        print(f"Procesando archivo: {ruta_archivo}")
+        nombre_archivo = nombre_fuente(ruta_archivo)
+        print(f"Procesando archivo: {nombre_archivo}")
 
         # Detectar tipo de archivo por extensión
-        if ruta_archivo.lower().endswith((".xlsx", ".xls")):
+        if nombre_archivo.lower().endswith((".xlsx", ".xls")):
             # Procesar como Excel
             if not self.excel_extractor:
                 return {
                     "error": "Excel support not available. Install pandas and openpyxl."
                 }
-            return self.excel_extractor.procesar_excel(ruta_archivo)
+            return self.excel_extractor.procesar_excel(ruta_archivo, refrescar_claves)
+        elif es_zip(nombre_archivo):
+            return self._procesar_zip(ruta_archivo, fecha_desde, workers)
         else:
             # Procesar como WhatsApp
-            return self._procesar_whatsapp(ruta_archivo, fecha_desde)
+            return self._procesar_whatsapp(ruta_archivo, fecha_desde, workers)
 
-    def _procesar_whatsapp(
-        self, ruta_archivo: str, fecha_desde: Optional[str] = None
+    def _procesar_zip(
+        self,
+        ruta_archivo: FuenteChat,
+        fecha_desde: Optional[str] = None,
+        workers: int = 1,
     ) -> Dict[str, Any]:
         """
-        Procesa un archivo de WhatsApp y extrae recetas.
+        Procesa una exportación de WhatsApp comprimida con sus adjuntos.
 
         Args:
-            ruta_archivo: Ruta al archivo de WhatsApp
+            ruta_archivo: Ruta al .zip o stream abierto
             fecha_desde: Fecha desde la cual procesar (formato YYYY-MM-DD)
+            workers: Número de procesos pedido; el chat comprimido se parsea
+                en uno solo y se avisa si se pidieron más
 
         Returns:
             Diccionario con estadísticas del procesamiento
         """
-        print(f"Procesando archivo: {ruta_archivo}")
-
-        # Leer archivo
         try:
-            with open(ruta_archivo, "r", encoding="utf-8") as f:
-                contenido = f.read()
-        except Exception as e:
-            print(f"Error leyendo archivo: {e}")
+            exportacion = ExportacionZip(ruta_archivo)
+        except (zipfile.BadZipFile, ValueError, OSError) as e:
+            print(f"Error abriendo exportación .zip: {e}")
             return {"error": str(e)}
 
-        # Parsear mensajes
-        mensajes = self._parsear_mensajes(contenido)
-        print(f"Encontrados {len(mensajes)} mensajes")
+        with exportacion:
+            return self._procesar_whatsapp(
+                ruta_archivo, fecha_desde, workers, adjuntos=exportacion
+            )
 
-        # Determinar fecha mínima a procesar
-        fecha_limite = fecha_desde
-        if not fecha_limite:
-            fecha_limite = self._obtener_fecha_guardada()
-            if fecha_limite:
-                print(f"Usando fecha guardada: {fecha_limite}")
+    def _procesar_whatsapp(
+        self,
+        ruta_archivo: FuenteChat,
+        fecha_desde: Optional[str] = None,
+        workers: int = 1,
+        adjuntos: Optional[ExportacionZip] = None,
+    ) -> Dict[str, Any]:
+        """
+        Procesa un archivo de WhatsApp y extrae recetas.
 
-        # Filtrar por fecha si se especifica
-        if fecha_limite:
-            mensajes = self._filtrar_por_fecha(mensajes, fecha_limite)
-            print(f"Después del filtro desde {fecha_limite}: {len(mensajes)} mensajes")
+        El archivo se lee en streaming: parseo, filtrado y agrupación son
+        generadores encadenados, así que solo hay en memoria el bloque en curso.
+        Con varios workers (solo rutas en disco) el parseo y la clasificación
+        se reparten por tramos entre procesos y se recombinan en orden.
 
-        # Agrupar mensajes consecutivos
-        bloques = self._agrupar_mensajes_consecutivos(mensajes)
-        print(f"Agrupados en {len(bloques)} bloques")
+        Args:
+            ruta_archivo: Ruta al archivo de WhatsApp o stream abierto
+            fecha_desde: Fecha desde la cual procesar (formato YYYY-MM-DD)
+            workers: Número de procesos para parsear y clasificar
+            adjuntos: Exportación .zip de la que sale el chat; sus fotos se
+                enlazan con las recetas de cada bloque
 
-        # Procesar cada bloque
+        Returns:
+            Diccionario con estadísticas del procesamiento
+        """
+        # Con una fecha explícita se reprocesa desde ella; si no, se intenta
+        # continuar donde terminó la última ingesta de este mismo chat
+        clave = clave_chat(ruta_archivo)
+        checkpoint = (
+            None if fecha_desde or not clave else self._obtener_checkpoint(clave)
+        )
+
+        estadisticas: Dict[str, Any] = {
+            "mensajes": 0,
+            "ultima_fecha": None,
+            "ultimo_timestamp": None,
+        }
+        estadisticas["bloques_repetidos"] = 0
+        estadisticas["bloques_descartados"] = 0
+        detalle_bloques: Dict[int, Dict[str, Any]] = {}
+        bloques_procesados = 0
+        cache_aciertos = 0
+        # Tokens de entrada enviados a Mistral (prompts, reintentos con
+        # ejemplos y correcciones)
+        tokens_enviados = 0
+        bloques_reglas = 0
         recetas_extraidas = 0
+        recetas_reglas = 0
         recetas_insertadas = 0
+        # Bloques que fallaron (se vuelven a pedir en la próxima importación)
+        bloques_con_error = 0
+        # Segundos hasta guardar la primera receta (latencia percibida)
+        primera_receta: Optional[float] = None
+        inicio = time.perf_counter()
+        chat = clave or "chat"
 
-        for bloque in bloques:
-            print(f"Procesando bloque grande ({len(bloque['texto'])} caracteres)")
-
-            # Mostrar tokens aproximados
-            tokens_aprox = len(bloque["texto"]) // 4
-            print(f"  🔢 Tokens aproximados: {tokens_aprox}")
-
-            # Extraer recetas con Mistral (ahora devuelve múltiples recetas)
-            resultado = self.mistral_client.extraer_receta(bloque["texto"])
-
-            if resultado.get("error"):
-                print(f"  ❌ Error procesando bloque: {resultado['error']}")
-                continue
-
-            # Procesar todas las recetas encontradas en el bloque
-            recetas_en_bloque = resultado.get("recetas", [])
+        try:
+            fuente = ruta_archivo if adjuntos is None else adjuntos.chat
+            with abrir_lineas(fuente) as lineas:
+                reanudacion = ReanudacionChat(lineas, checkpoint)
+                posicion = reanudacion.verificar()
+
+                # Determinar fecha mínima a procesar. Sin checkpoint del chat
+                # no hay corte: la última fecha de otro chat no sirve y el
+                # registro de huellas salta lo ya procesado
+                fecha_limite = fecha_desde
+                desde = None
+                if posicion is not None:
+                    print(f"♻️ Reanudando {clave} desde el byte {posicion}")
+                elif checkpoint:
+                    # Puede ser otro chat exportado con el mismo nombre de
+                    # archivo: sin corte por fecha, el registro de huellas
+                    # salta los mensajes ya procesados
+                    print(
+                        f"⚠️ {clave} no continúa la exportación anterior; "
+                        "procesando el archivo completo"
+                    )
 
-            if recetas_en_bloque:
-                print(f"  Encontradas {len(recetas_en_bloque)} recetas en el bloque")
+                # Convertir el corte una sola vez; el parser compara enteros
+                if fecha_limite:
+                    desde = self._timestamp_limite(fecha_limite)
 
-                for receta in recetas_en_bloque:
-                    # El nuevo formato ya viene con recetas válidas directamente
-                    recetas_extraidas += 1
+                # El parser filtra por fecha y, si puede, salta lo anterior al corte
+                plan = None
+                es_ruta = isinstance(ruta_archivo, (str, os.PathLike))
+                if workers > 1 and es_ruta and adjuntos is None:
+                    plan = planificar_tramos(
+                        lineas, BYTES_POR_TRAMO, desde=desde, posicion=posicion
+                    )
+                elif workers > 1:
                     print(
-                        f"  ✅ Receta: {receta.get('nombre_receta', 'Sin nombre')} de {receta.get('creador')}"
+                        "⚠️ Procesamiento en paralelo solo disponible para rutas .txt"
                     )
 
-                    # Preparar datos para Supabase
-                    datos_receta = {
-                        "creador": receta.get("creador"),
-                        "nombre_receta": receta.get("nombre_receta"),
-                        "ingredientes": receta.get("ingredientes"),
-                        "pasos_preparacion": receta.get("pasos_preparacion"),
-                        "tiene_foto": receta.get("tiene_foto", False),
-                        "url_imagen": None,
-                        "fecha_mensaje": receta.get("fecha_mensaje"),
-                    }
-
-                    # Insertar en Supabase
-                    if self.supabase_manager.insertar_receta(datos_receta):
-                        recetas_insertadas += 1
+                if plan is not None:
+                    print(f"⚙️ {len(plan.tramos)} tramos en {workers} procesos")
+                    analizados = iterar_analizados_en_paralelo(
+                        ruta_archivo, plan, workers, desde=desde
+                    )
+                else:
+                    analizados = self._analizar_mensajes(
+                        self.parser.iterar_mensajes(
+                            lineas, desde=desde, posicion=posicion
+                        )
+                    )
+                analizados = self._contar_mensajes(analizados, estadisticas)
+
+                # Agrupar mensajes consecutivos, saltar los bloques que ya se
+                # enviaron a Mistral en otra importación, resolver por reglas
+                # los que siguen la plantilla y descartar los que el
+                # pre-clasificador ve improbables
+                bloques = self._omitir_bloques_improbables(
+                    self._extraer_bloques_por_reglas(
+                        self._omitir_bloques_repetidos(
+                            self._iterar_bloques_analizados(analizados, adjuntos),
+                            chat,
+                            estadisticas,
+                        )
+                    ),
+                    estadisticas,
+                )
+
+                # Varias llamadas a Mistral en vuelo; cada resultado (o cada
+                # receta, con streaming) se guarda en cuanto llega
+                for indice, bloque, resultado in self.motor.iterar_resultados(bloques):
+                    if resultado.get("parcial"):
+                        extraidas, insertadas = self._insertar_recetas(
+                            bloque, resultado["recetas"], chat, adjuntos
+                        )
                     else:
-                        print(f"  ❌ Error insertando receta")
-            else:
-                print(f"  ℹ️ No se encontraron recetas en el bloque")
+                        bloques_procesados += 1
+                        if resultado.get("desde_cache"):
+                            cache_aciertos += 1
+                        tokens_enviados += resultado.get("tokens_entrada", 0)
+                        extraidas, insertadas = self._guardar_resultado_bloque(
+                            bloque, resultado, chat, adjuntos
+                        )
+                    if resultado.get("origen") == ORIGEN_REGLAS:
+                        bloques_reglas += 1
+                        recetas_reglas += extraidas
+                    if insertadas and primera_receta is None:
+                        primera_receta = time.perf_counter() - inicio
+                    recetas_extraidas += extraidas
+                    recetas_insertadas += insertadas
+                    detalle = detalle_bloques.setdefault(
+                        indice,
+                        {
+                            "creador": bloque["creador"],
+                            "fecha": bloque["fecha"],
+                            "recetas_extraidas": 0,
+                            "recetas_insertadas": 0,
+                        },
+                    )
+                    detalle["recetas_extraidas"] += extraidas
+                    detalle["recetas_insertadas"] += insertadas
+                    if resultado.get("error"):
+                        if "error" not in detalle:
+                            bloques_con_error += 1
+                        detalle["error"] = resultado["error"]
+
+                nuevo_checkpoint = reanudacion.nuevo_checkpoint(
+                    estadisticas["ultimo_timestamp"], estadisticas["ultima_fecha"]
+                )
+        except (OSError, UnicodeDecodeError) as e:
+            print(f"Error leyendo archivo: {e}")
+            return {"error": str(e)}
+        finally:
+            # Guardar el filtro de Bloom para que el próximo arranque no lo reconstruya
+            self.ledger.guardar()
 
-        # Actualizar estado de procesamiento
-        self._actualizar_estado_procesamiento(
-            mensajes[-1]["fecha"] if mensajes else None
+        if posicion is not None:
+            print(f"Mensajes nuevos desde el checkpoint: {estadisticas['mensajes']}")
+        elif fecha_limite:
+            print(
+                f"Después del filtro desde {fecha_limite}: {estadisticas['mensajes']} mensajes"
+            )
+        else:
+            print(f"Encontrados {estadisticas['mensajes']} mensajes")
+        print(f"Agrupados en {bloques_procesados} bloques")
+        if estadisticas["bloques_repetidos"]:
+            print(
+                f"♻️ Omitidos {estadisticas['bloques_repetidos']} bloques ya procesados"
+            )
+        if estadisticas["bloques_descartados"]:
+            print(
+                f"🧮 {estadisticas['bloques_descartados']} bloques descartados por el "
+                "pre-clasificador sin llamar a Mistral"
+            )
+        if bloques_reglas:
+            print(
+                f"📐 {recetas_reglas} recetas extraídas por reglas en "
+                f"{bloques_reglas} bloques sin llamar a Mistral; "
+                f"{recetas_extraidas - recetas_reglas} extraídas por Mistral"
+            )
+        # Sin caché no hay fallos que contar: todos los bloques van a Mistral
+        cache_fallos = (
+            bloques_procesados - bloques_reglas - cache_aciertos
+            if self.mistral_client.cache is not None
+            else 0
         )
+        if cache_aciertos:
+            print(f"💾 {cache_aciertos} bloques servidos desde la caché de Mistral")
+        if primera_receta is not None:
+            print(f"⚡ Primera receta guardada a los {primera_receta:.1f}s")
+        recetas_llm = recetas_extraidas - recetas_reglas
+        tokens_por_receta = tokens_enviados / recetas_llm if recetas_llm else None
+        if tokens_enviados:
+            print(
+                f"🔢 {tokens_enviados} tokens enviados a Mistral"
+                + (
+                    f" ({tokens_por_receta:.0f} por receta extraída)"
+                    if tokens_por_receta is not None
+                    else ""
+                )
+            )
+
+        # Guardar el checkpoint del chat. Con bloques fallidos no avanza: la
+        # próxima importación vuelve a leer estos mensajes y el registro de
+        # huellas salta los ya procesados
+        if bloques_con_error:
+            print(
+                f"⚠️ {bloques_con_error} bloques con error: no se avanza el "
+                "checkpoint y se volverán a pedir en la próxima importación"
+            )
+        elif clave and nuevo_checkpoint:
+            self._actualizar_estado_procesamiento(clave, nuevo_checkpoint)
 
         return {
-            "mensajes_procesados": len(mensajes),
-            "bloques_procesados": len(bloques),
+            "mensajes_procesados": estadisticas["mensajes"],
+            "bloques_procesados": bloques_procesados,
+            "bloques_repetidos": estadisticas["bloques_repetidos"],
             "recetas_extraidas": recetas_extraidas,
+            "recetas_reglas": recetas_reglas,
+            "recetas_llm": recetas_llm,
             "recetas_insertadas": recetas_insertadas,
+            "cache_aciertos": cache_aciertos,
+            "cache_fallos": cache_fallos,
+            "tokens_enviados": tokens_enviados,
+            "tokens_por_receta": tokens_por_receta,
+            "bloques_descartados": estadisticas["bloques_descartados"],
+            "segundos_primera_receta": primera_receta,
+            # Resumen por bloque en el orden del chat, no en el de llegada
+            "bloques": [detalle_bloques[i] for i in sorted(detalle_bloques)],
         }
 
-    def _parsear_mensajes(self, contenido: str) -> List[Dict[str, Any]]:
-        """Parsea los mensajes del archivo de WhatsApp."""
-        mensajes = []
-        lineas = contenido.split("\n")
-
-        for linea in lineas:
-            linea = linea.strip()
-            if not linea:
-                continue
-
-            # Intentar patrón principal
-            match = self.patron_mensaje.match(linea)
-            if match:
-                fecha_str, hora_str, creador, mensaje = match.groups()
-                fecha_completa = f"{fecha_str} {hora_str}"
-                mensajes.append(
-                    {
-                        "fecha": fecha_completa,
-                        "creador": creador.strip(),
-                        "mensaje": mensaje.strip(),
-                    }
-                )
+    def _omitir_bloques_repetidos(
+        self,
+        bloques: Iterable[Dict[str, Any]],
+        chat: str,
+        estadisticas: Dict[str, Any],
+    ) -> Iterator[Dict[str, Any]]:
+        """Deja pasar los bloques con algún mensaje que Mistral no haya visto."""
+        for bloque in bloques:
+            if self.ledger.todas_conocidas(chat, bloque["huellas"]):
+                estadisticas["bloques_repetidos"] += 1
                 continue
-
-            # Intentar patrón alternativo
-            match = self.patron_mensaje_alternativo.match(linea)
-            if match:
-                fecha_str, hora_str, creador, mensaje = match.groups()
-                fecha_completa = f"{fecha_str} {hora_str}:00"
-                mensajes.append(
-                    {
-                        "fecha": fecha_completa,
-                        "creador": creador.strip(),
-                        "mensaje": mensaje.strip(),
-                    }
-                )
+            yield bloque
+
+    def _extraer_bloques_por_reglas(
+        self, bloques: Iterable[Dict[str, Any]]
+    ) -> Iterator[Dict[str, Any]]:
+        """Anota en `extraccion_local` la receta de los bloques con plantilla."""
+        if not self.extraccion_reglas:
+            yield from bloques
+            return
+        for bloque in bloques:
+            resultado = extraer_receta_por_reglas(bloque["texto"])
+            if resultado is not None:
+                bloque["extraccion_local"] = resultado
+            yield bloque
+
+    def _omitir_bloques_improbables(
+        self, bloques: Iterable[Dict[str, Any]], estadisticas: Dict[str, Any]
+    ) -> Iterator[Dict[str, Any]]:
+        """Deja pasar los bloques que el pre-clasificador no descarta."""
+        if self.clasificador is None or self.umbral_clasificador <= 0:
+            yield from bloques
+            return
+        for bloque in bloques:
+            # Fuera del ledger, pero el checkpoint los deja atrás: solo se
+            # vuelven a puntuar reimportando con --fecha-desde
+            if (
+                "extraccion_local" not in bloque
+                and self.clasificador.probabilidad(bloque["texto"])
+                < self.umbral_clasificador
+            ):
+                estadisticas["bloques_descartados"] += 1
                 continue
+            yield bloque
 
-            # Intentar patrón real del archivo: DD/MM/YY, HH:MM - Nombre: mensaje
-            match = self.patron_mensaje_real.match(linea)
-            if match:
-                fecha_str, hora_str, creador, mensaje = match.groups()
-                fecha_completa = f"{fecha_str} {hora_str}:00"
-                mensajes.append(
-                    {
-                        "fecha": fecha_completa,
-                        "creador": creador.strip(),
-                        "mensaje": mensaje.strip(),
-                    }
-                )
-                continue
+    def _guardar_resultado_bloque(
+        self,
+        bloque: Dict[str, Any],
+        resultado: Dict[str, Any],
+        chat: Optional[str] = None,
+        adjuntos: Optional[ExportacionZip] = None,
+    ) -> Tuple[int, int]:
+        """
+        Inserta las recetas que Mistral encontró en un bloque.
 
-            # Si no coincide con ningún patrón, podría ser una línea de receta sin formato
-            # Buscar si la línea anterior fue una receta y esta es continuación
-            if mensajes and self._es_linea_receta(linea):
-                # Agregar como continuación de la última receta
-                ultimo_mensaje = mensajes[-1]
-                ultimo_mensaje["mensaje"] += f"\n{linea.strip()}"
-                continue
+        Args:
+            bloque: Bloque generado por `_iterar_bloques`
+            resultado: Respuesta de `MistralClient.extraer_receta` (o de las
+                reglas locales) para el bloque; `emitidas` cuenta las recetas
+                que ya se insertaron al llegar por streaming
+            chat: Chat en cuyo registro de huellas se anotan los mensajes del
+                bloque una vez procesados
+            adjuntos: Exportación .zip con las fotos enlazadas en el bloque
 
-        return mensajes
+        Returns:
+            Tupla (recetas extraídas, recetas insertadas)
+        """
+        print(f"Procesado bloque grande ({len(bloque['texto'])} caracteres)")
+
+        # Los trozos de un bloque dividido no traen el recuento
+        tokens = bloque.get("tokens")
+        if tokens is None:
+            tokens = self.mistral_client.contar_tokens(bloque["texto"])
+        print(f"  🔢 Tokens del bloque: {tokens}")
+
+        if resultado.get("error"):
+            print(f"  ❌ Error procesando bloque: {resultado['error']}")
+            return 0, 0
+
+        # Mistral ya ha visto estos mensajes: no volver a enviarlos
+        if chat is not None:
+            self.ledger.registrar(chat, bloque.get("huellas", []))
+
+        # Procesar todas las recetas encontradas en el bloque
+        recetas_en_bloque = resultado.get("recetas", [])
+        if self.historial is not None:
+            self.historial.registrar(
+                bloque["texto"],
+                bool(recetas_en_bloque or resultado.get("emitidas")),
+            )
 
-    def _filtrar_por_fecha(
-        self, mensajes: List[Dict[str, Any]], fecha_desde: str
-    ) -> List[Dict[str, Any]]:
-        """Filtra mensajes desde una fecha específica."""
-        try:
-            fecha_limite = datetime.strptime(fecha_desde, "%Y-%m-%d")
-            mensajes_filtrados = []
-
-            for mensaje in mensajes:
-                try:
-                    # Convertir fecha del mensaje (formato DD/MM/YY)
-                    fecha_mensaje = datetime.strptime(
-                        mensaje["fecha"].split()[0], "%d/%m/%y"
-                    )
-                    if fecha_mensaje >= fecha_limite:
-                        mensajes_filtrados.append(mensaje)
-                except ValueError:
-                    # Si no se puede parsear la fecha, incluir el mensaje
-                    mensajes_filtrados.append(mensaje)
+        if not recetas_en_bloque:
+            if not resultado.get("emitidas"):
+                print(f"  ℹ️ No se encontraron recetas en el bloque")
+            return 0, 0
 
-            return mensajes_filtrados
+        print(f"  Encontradas {len(recetas_en_bloque)} recetas en el bloque")
+        return self._insertar_recetas(bloque, recetas_en_bloque, chat, adjuntos)
 
-        except ValueError:
-            print(
-                f"Error en formato de fecha: {fecha_desde}. Usando formato YYYY-MM-DD"
-            )
-            return mensajes
+    def _insertar_recetas(
+        self,
+        bloque: Dict[str, Any],
+        recetas_en_bloque: List[Dict[str, Any]],
+        chat: Optional[str] = None,
+        adjuntos: Optional[ExportacionZip] = None,
+    ) -> Tuple[int, int]:
+        """
+        Inserta en Supabase recetas de un bloque.
 
-    def _agrupar_mensajes_consecutivos(
-        self, mensajes: List[Dict[str, Any]]
-    ) -> List[Dict[str, Any]]:
-        """Agrupa mensajes en bloques más inteligentes basados en conversación y contenido."""
-        if not mensajes:
-            return []
+        Las recetas ya insertadas desde el mismo chat se saltan: un bloque
+        cuyas recetas llegaron por streaming y que luego falló se vuelve a
+        pedir en la próxima importación.
 
-        bloques = []
+        Args:
+            bloque: Bloque del que proceden las recetas
+            recetas_en_bloque: Recetas a insertar (todas las del bloque o las
+                que van llegando por streaming)
+            chat: Chat en cuyo registro se anotan las recetas insertadas
+            adjuntos: Exportación .zip con las fotos enlazadas en el bloque
 
-        # Procesar mensajes de manera más granular
-        i = 0
-        while i < len(mensajes):
-            mensaje_actual = mensajes[i]
-            texto_actual = mensaje_actual["mensaje"].lower()
-            es_receta_actual = self._es_mensaje_receta(texto_actual)
+        Returns:
+            Tupla (recetas extraídas, recetas insertadas)
+        """
+        # Con la exportación .zip se sabe qué fotos acompañan al bloque; se
+        # asignan a la primera receta insertada
+        fotos = bloque.get("adjuntos", []) if adjuntos is not None else []
 
-            # Si no es receta, procesar siguiente
-            if not es_receta_actual:
-                i += 1
-                continue
+        recetas_extraidas = 0
+        recetas_insertadas = 0
+        for receta in recetas_en_bloque:
+            # El nuevo formato ya viene con recetas válidas directamente
+            recetas_extraidas += 1
+            print(
+                f"  ✅ Receta: {receta.get('nombre_receta', 'Sin nombre')} de {receta.get('creador')}"
+            )
 
-            # Encontramos un mensaje que podría ser receta, buscar mensajes relacionados
-            bloque = {
-                "creador": mensaje_actual["creador"],
-                "fecha": mensaje_actual["fecha"],
-                "texto": f"[{mensaje_actual['fecha']}] {mensaje_actual['creador']}: {mensaje_actual['mensaje']}\n",
+            # Preparar datos para Supabase
+            datos_receta = {
+                "creador": receta.get("creador"),
+                "nombre_receta": receta.get("nombre_receta"),
+                "ingredientes": receta.get("ingredientes"),
+                "pasos_preparacion": receta.get("pasos_preparacion"),
+                "tiene_foto": receta.get("tiene_foto", False),
+                "url_imagen": None,
+                "fecha_mensaje": receta.get("fecha_mensaje"),
             }
+            if adjuntos is not None:
+                datos_receta["tiene_foto"] = bool(fotos)
 
-            # Buscar mensajes consecutivos del mismo autor que puedan ser parte de la misma receta
-            j = i + 1
-            while j < len(mensajes):
-                siguiente_mensaje = mensajes[j]
-
-                # Si cambió de autor o pasaron más de 5 mensajes, parar
-                if (
-                    siguiente_mensaje["creador"] != mensaje_actual["creador"]
-                    or j - i > 5
-                ):  # Máximo 5 mensajes consecutivos
-                    break
-
-                # Verificar si el siguiente mensaje parece relacionado con receta
-                texto_siguiente = siguiente_mensaje["mensaje"].lower()
-                if self._es_mensaje_receta_continuacion(texto_siguiente):
-                    bloque[
-                        "texto"
-                    ] += f"[{siguiente_mensaje['fecha']}] {siguiente_mensaje['creador']}: {siguiente_mensaje['mensaje']}\n"
-                    j += 1
-                else:
-                    break
+            huella = huella_receta(datos_receta)
+            if chat is not None and self.ledger.receta_registrada(chat, huella):
+                print("  ♻️ Receta ya insertada en una importación anterior")
+                continue
 
-            # Agregar bloque si tiene contenido
-            if bloque["texto"].strip():
-                bloques.append(bloque)
+            # Insertar en Supabase
+            insertada = self.supabase_manager.insertar_receta(datos_receta)
+            if insertada:
+                recetas_insertadas += 1
+                if chat is not None:
+                    self.ledger.registrar_receta(chat, huella)
+                if fotos:
+                    self._subir_fotos_receta(adjuntos, fotos, insertada, datos_receta)
+                    # Las recetas que lleguen después no repiten las fotos
+                    fotos = bloque["adjuntos"] = []
+            else:
+                print(f"  ❌ Error insertando receta")
 
-            i = j  # Saltar los mensajes que ya procesamos
+        return recetas_extraidas, recetas_insertadas
 
-        return bloques
+    def _subir_fotos_receta(
+        self,
+        adjuntos: ExportacionZip,
+        fotos: List[str],
+        insertada: Dict[str, Any],
+        receta: Dict[str, Any],
+    ) -> None:
+        """
+        Sube las fotos de una receta ya insertada y las enlaza en Supabase.
 
-    def _es_mensaje_receta(self, texto: str) -> bool:
-        """Determina si un mensaje individual parece contener una receta."""
-        texto_lower = texto.lower()
+        Los bytes de cada foto se leen del .zip justo antes de subirla.
 
-        # Palabras clave que indican inicio de receta
-        indicadores_receta = [
-            "receta:",
-            "receta de",
-            "ingredientes:",
-            "receta",  # Permitir "receta" suelto ahora
-        ]
+        Args:
+            adjuntos: Exportación .zip que contiene las fotos
+            fotos: Miembros del .zip con las fotos de la receta
+            insertada: Fila devuelta por `insertar_receta`
+            receta: Datos con los que se insertó la receta
+        """
+        if not insertada.get("id"):
+            return
+        if not self.supabase_manager.imagenes_habilitadas():
+            print("  ⚠️ Cloudinary no disponible: no se subirán las fotos del chat")
+            return
 
-        # Palabras que sugieren nombres de recetas
-        palabras_receta = [
-            "estofado",
-            "flan",
-            "torta",
-            "salsa",
-            "guiso",
-            "sopa",
-            "ensalada",
-            "pasta",
-            "arroz",
-            "pescado",
-            "carne",
-            "pollo",
-            "verduras",
-            "costilla",
-            "milagros",
-            "teriyaki",
-            "césar",
-            "patatas",
-        ]
+        imagenes: List[Dict[str, Any]] = []
+        for posicion, miembro in enumerate(fotos, start=1):
+            extension = os.path.splitext(miembro)[1] or ".jpg"
+            nombre_archivo = ExcelExtractor._generar_nombre_imagen(
+                receta.get("nombre_receta") or "receta",
+                receta.get("creador") or "",
+                posicion,
+                extension,
+            )
+            subida = self.supabase_manager.subir_imagen(
+                adjuntos.leer(miembro), nombre_archivo
+            )
+            if subida:
+                subida["autor"] = receta.get("creador")
+                imagenes.append(subida)
+            else:
+                print(f"  ⚠️ Error subiendo foto '{miembro}'")
 
-        # Patrones de cantidades (números seguidos de unidades de medida)
-        patrones_cantidad = [
-            r"\d+\s*(g|kg|ml|l|lt|onzas?|onz|tazas?|taza|cucharadas?|cucharada|cuch|cdas?|cdita)",
-            r"\d+\s*(piezas?|unidades?|uds?\.?|pz|pz\.?)",
-            r"\d+\s*(kg|gr|mg|cl|dl)",  # Más unidades
-        ]
-        tiene_cantidades = any(
-            re.search(patron, texto, re.IGNORECASE) for patron in patrones_cantidad
-        )
+        if imagenes:
+            self.supabase_manager.actualizar_receta(
+                insertada["id"],
+                {"imagenes": imagenes, "url_imagen": imagenes[0]["url"]},
+            )
+            print(f"  📷 {len(imagenes)} fotos enlazadas")
 
-        # Verificar si parece nombre de receta
-        tiene_palabras_receta = any(
-            palabra in texto_lower for palabra in palabras_receta
-        )
+    @staticmethod
+    def _contar_mensajes(
+        analizados: Iterable[MensajeAnalizado], estadisticas: Dict[str, Any]
+    ) -> Iterator[MensajeAnalizado]:
+        """Deja pasar los mensajes anotando cuántos hay y la fecha del último."""
+        for analizado in analizados:
+            mensaje = analizado[0]
+            estadisticas["mensajes"] += 1
+            estadisticas["ultima_fecha"] = mensaje.fecha
+            estadisticas["ultimo_timestamp"] = mensaje.timestamp
+            yield analizado
+
+    def _analizar_mensajes(
+        self, mensajes: Iterable[Mensaje]
+    ) -> Iterator[MensajeAnalizado]:
+        """Acompaña cada mensaje de sus rasgos de receta (un recorrido por texto)."""
+        analizar = self.detector.analizar
+        for mensaje in mensajes:
+            yield mensaje, analizar(mensaje.mensaje)
+
+    def _parsear_mensajes(self, contenido: str) -> List[Mensaje]:
+        """Parsea los mensajes del archivo de WhatsApp."""
+        return self.parser.parsear(contenido)
 
-        # Verificar indicadores específicos
-        tiene_indicador_especifico = any(
-            indicador in texto_lower for indicador in indicadores_receta
-        )
+    def _filtrar_por_fecha(
+        self, mensajes: List[Mensaje], fecha_desde: str
+    ) -> List[Mensaje]:
+        """
+        Filtra mensajes desde una fecha específica.
 
-        # Considerar receta si:
-        # 1. Tiene indicador específico
-        # 2. Tiene palabras de receta + cantidades
-        # 3. Tiene palabras de receta + parece nombre corto
-        if tiene_indicador_especifico:
-            return True
+        Los mensajes de una exportación están en orden cronológico, así que el
+        corte se localiza por búsqueda binaria entre los mensajes con fecha.
+        Los que no la tienen no cuentan para el corte (romperían el orden de
+        la búsqueda): se conservan los que quedan después de él.
+        """
+        desde = self._timestamp_limite(fecha_desde)
+        if desde is None:
+            return list(mensajes)
 
-        if tiene_palabras_receta and (tiene_cantidades or len(texto.split()) <= 3):
-            return True
+        fechados: List[Tuple[int, int]] = []
+        for posicion, mensaje in enumerate(mensajes):
+            timestamp = self._timestamp_mensaje(mensaje)
+            if timestamp is not None:
+                fechados.append((posicion, timestamp))
 
-        # Para casos sin indicador específico, ser más permisivo
-        palabras_cocina = [
-            "hornear",
-            "cocinar",
-            "mezclar",
-            "batir",
-            "freír",
-            "asar",
-            "hervir",
-            "15min",
-            "olla",
-        ]
-        tiene_palabras_cocina = any(
-            palabra in texto_lower for palabra in palabras_cocina
-        )
+        corte = bisect_left(fechados, desde, key=lambda fechado: fechado[1])
+        inicio = fechados[corte][0] if corte < len(fechados) else len(mensajes)
+        return mensajes[inicio:]
 
-        return tiene_cantidades and tiene_palabras_cocina
+    @staticmethod
+    def _timestamp_limite(fecha_desde: str) -> Optional[int]:
+        """Convierte la fecha de corte (YYYY-MM-DD) en timestamp."""
+        try:
+            return timestamp_de_fecha_iso(fecha_desde)
+        except (TypeError, ValueError):
+            print(
+                f"Error en formato de fecha: {fecha_desde}. Usando formato YYYY-MM-DD"
+            )
+            return None
 
-    def _es_mensaje_receta_continuacion(self, texto: str) -> bool:
-        """Determina si un mensaje parece ser continuación de una receta."""
-        texto_lower = texto.lower()
+    @staticmethod
+    def _timestamp_mensaje(mensaje: Mensaje) -> Optional[int]:
+        """Timestamp de un mensaje; solo se parsea `fecha` si el parser no lo adjuntó."""
+        timestamp = mensaje.get("timestamp")
+        if timestamp is not None:
+            return timestamp
+        try:
+            return timestamp_de_fecha(mensaje["fecha"])
+        except (KeyError, ValueError):
+            return None
 
-        # Palabras clave de continuación
-        continuacion = [
-            "ingredientes",
-            "pasos",
-            "preparación",
-            "receta",
-            "-",
-            "•",
-            "*",  # Marcadores de lista
-            "mezclar",
-            "hornear",
-            "cocinar",
-            "batir",
-            "revolver",  # Acciones de cocina
-        ]
+    def _agrupar_mensajes_consecutivos(
+        self, mensajes: Iterable[Union[Mensaje, Dict[str, Any]]]
+    ) -> List[Dict[str, Any]]:
+        """Agrupa mensajes en bloques más inteligentes basados en conversación y contenido."""
+        return list(self._iterar_bloques(mensajes))
 
-        # Si tiene guiones al inicio (listas)
-        tiene_guiones = bool(re.search(r"^\s*[-•*]\s", texto))
+    def _iterar_bloques(
+        self, mensajes: Iterable[Union[Mensaje, Dict[str, Any]]]
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Genera los bloques candidatos a receta consumiendo los mensajes de uno en uno.
 
-        # Si tiene números al inicio (pasos numerados)
-        tiene_numeros = bool(re.search(r"^\s*\d+\.?\s*", texto))
+        Un bloque empieza en un mensaje que parece receta y absorbe hasta 5
+        mensajes consecutivos del mismo autor que parezcan su continuación.
+        Acepta también mensajes en forma de diccionario.
+        """
+        return self._iterar_bloques_analizados(
+            self._analizar_mensajes(map(Mensaje.desde, mensajes))
+        )
 
-        # Si tiene palabras de continuación
-        tiene_palabras = any(palabra in texto_lower for palabra in continuacion)
+    def _iterar_bloques_analizados(
+        self,
+        analizados: Iterable[MensajeAnalizado],
+        adjuntos: Optional[ExportacionZip] = None,
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        `_iterar_bloques` con los rasgos de cada mensaje ya calculados.
 
-        # Si tiene cantidades
-        tiene_cantidades = bool(
-            re.search(
-                r"\d+\s*(g|kg|ml|l|lt|cucharadas?|cuch|cdas?|tazas?|onzas?|piezas?)",
-                texto,
-                re.IGNORECASE,
+        Con una exportación .zip, cada bloque lleva en `adjuntos` las fotos
+        del .zip citadas en sus mensajes y las que el mismo autor envía
+        (en mensajes que solo contienen adjuntos) justo antes o justo después.
+        """
+        bloque: Optional[Dict[str, Any]] = None
+        partes: List[str] = []
+        huellas: List[bytes] = []
+        # Posición en `huellas` de la huella de cada parte (para trocear)
+        inicios: List[int] = []
+        fotos: List[str] = []
+        agregados = 0
+        # Fotos sueltas del último autor, por si a continuación envía la receta
+        previas: List[str] = []
+        autor_previas: Optional[str] = None
+
+        for mensaje, rasgos in analizados:
+            referenciadas = (
+                self._fotos_mensaje(mensaje, adjuntos) if adjuntos is not None else []
             )
-        )
+            sueltas = bool(referenciadas) and solo_adjuntos(mensaje.mensaje)
+
+            if bloque is not None:
+                # Buscar mensajes consecutivos del mismo autor que puedan ser parte de la misma receta
+                if mensaje.creador == bloque["creador"] and sueltas:
+                    # Fotos enviadas justo después de la receta
+                    fotos.extend(referenciadas)
+                    huellas.append(huella_mensaje(mensaje))
+                    continue
+                if (
+                    mensaje.creador == bloque["creador"]
+                    and agregados < 5  # Máximo 5 mensajes consecutivos
+                    and rasgos.es_continuacion
+                ):
+                    partes.append(self._formatear_mensaje(mensaje))
+                    inicios.append(len(huellas))
+                    huellas.append(huella_mensaje(mensaje))
+                    fotos.extend(referenciadas)
+                    agregados += 1
+                    continue
+
+                yield from self._cerrar_bloque(bloque, partes, inicios)
+                bloque = None
 
-        return tiene_guiones or tiene_numeros or tiene_palabras or tiene_cantidades
+            # Si no es receta, procesar siguiente
+            if not rasgos.es_receta:
+                if sueltas:
+                    if mensaje.creador != autor_previas:
+                        previas = []
+                    previas.extend(referenciadas)
+                    autor_previas = mensaje.creador
+                else:
+                    previas = []
+                continue
 
-    def _es_linea_receta(self, texto: str) -> bool:
-        """Determina si una línea sin formato de WhatsApp podría ser parte de una receta."""
-        texto_lower = texto.lower().strip()
+            # Encontramos un mensaje que podría ser receta, buscar mensajes relacionados
+            huellas = [huella_mensaje(mensaje)]
+            bloque = {
+                "creador": mensaje.creador,
+                "fecha": mensaje.fecha,
+                "huellas": huellas,
+            }
+            if adjuntos is not None:
+                fotos = previas if autor_previas == mensaje.creador else []
+                fotos.extend(referenciadas)
+                bloque["adjuntos"] = fotos
+                previas = []
+            partes = [self._formatear_mensaje(mensaje)]
+            inicios = [0]
+            agregados = 0
+
+        if bloque is not None:
+            yield from self._cerrar_bloque(bloque, partes, inicios)
+
+    def _cerrar_bloque(
+        self, bloque: Dict[str, Any], partes: List[str], inicios: List[int]
+    ) -> Iterator[Dict[str, Any]]:
+        """
+        Completa el texto de un bloque y, si no cabe en una llamada, lo trocea.
 
-        # Si está vacía, no es receta
-        if not texto_lower:
-            return False
+        Los trozos se cortan entre mensajes y cada uno lleva las huellas de los
+        mensajes que terminan en él, para que el registro solo marque como
+        procesado lo que Mistral ha visto entero. Las fotos van con el primero.
+        Un bloque que cabe entero guarda su recuento en `tokens`.
 
-        # Si parece un mensaje del sistema de WhatsApp, no es receta
-        if any(
-            palabra in texto_lower
-            for palabra in ["multimedia omitido", "cifrado", "extremo a extremo"]
-        ):
-            return False
+        Args:
+            bloque: Bloque sin `texto`
+            partes: Mensajes formateados del bloque
+            inicios: Posición en `bloque["huellas"]` de la huella de cada parte
+        """
+        texto = "".join(partes)
+        limite = self.mistral_client.max_tokens_bloque
+        # Sin atajo por caracteres: con emojis o alfabetos no latinos un
+        # tokenizador con bytes de respaldo da más tokens que caracteres
+        tokens = self.mistral_client.contar_tokens(texto)
+        if tokens <= limite:
+            bloque["texto"] = texto
+            bloque["tokens"] = tokens
+            yield bloque
+            return
+
+        huellas = bloque["huellas"]
+        finales = inicios[1:] + [len(huellas)]
+        trozos = dividir_partes(partes, self.mistral_client.contar_tokens, limite)
+        print(
+            f"  ✂️ Bloque de {bloque['creador']} demasiado largo: "
+            f"dividido en {len(trozos)} partes"
+        )
+        for numero, (texto_trozo, terminados) in enumerate(trozos):
+            trozo = {
+                **bloque,
+                "texto": texto_trozo,
+                "huellas": [
+                    huella
+                    for posicion in terminados
+                    for huella in huellas[inicios[posicion] : finales[posicion]]
+                ],
+            }
+            if numero and "adjuntos" in bloque:
+                trozo["adjuntos"] = []
+            yield trozo
 
-        # Si tiene cantidades, probablemente es receta
-        if re.search(
-            r"\d+\s*(g|kg|ml|l|lt|cucharadas?|cuch|cdas?|tazas?|onzas?|piezas?)",
-            texto,
-            re.IGNORECASE,
-        ):
-            return True
+    @staticmethod
+    def _fotos_mensaje(mensaje: Mensaje, adjuntos: ExportacionZip) -> List[str]:
+        """Miembros del .zip con las fotos citadas en un mensaje."""
+        return [
+            miembro
+            for miembro in map(
+                adjuntos.resolver, adjuntos_referenciados(mensaje.mensaje)
+            )
+            if miembro is not None
+        ]
 
-        # Si tiene guiones al inicio (listas)
-        if re.search(r"^\s*[-•*]\s", texto):
-            return True
+    @staticmethod
+    def _formatear_mensaje(mensaje: Mensaje) -> str:
+        return f"[{mensaje.fecha}] {mensaje.creador}: {mensaje.mensaje}\n"
 
-        # Si tiene números al inicio (pasos numerados)
-        if re.search(r"^\s*\d+\.?\s*", texto):
-            return True
+    def _es_mensaje_receta(self, texto: str) -> bool:
+        """Determina si un mensaje individual parece contener una receta."""
+        return self.detector.analizar(texto).es_receta
 
-        # Palabras que sugieren ingredientes o pasos
-        palabras_receta = [
-            "hornear",
-            "cocinar",
-            "mezclar",
-            "batir",
-            "freír",
-            "asar",
-            "hervir",
-            "min",
-            "hora",
-            "minutos",
-            "pasos",
-            "preparación",
-            "olla",
-            "sartén",
-            "tomates",
-            "cebolla",
-            "ajo",
-            "pimiento",
-            "patatas",
-            "carne",
-            "pollo",
-            "pescado",
-            "arroz",
-            "pasta",
-            "salsa",
-            "estofado",
-            "guiso",
-            "sopa",
-        ]
+    def _es_mensaje_receta_continuacion(self, texto: str) -> bool:
+        """Determina si un mensaje parece ser continuación de una receta."""
+        return self.detector.analizar(texto).es_continuacion
 
-        return any(palabra in texto_lower for palabra in palabras_receta)
+    def _es_linea_receta(self, texto: str) -> bool:
+        """Determina si una línea sin formato de WhatsApp podría ser parte de una receta."""
+        return self.detector.analizar(texto).es_linea_receta
 
     def _es_candidato_receta(self, texto: str) -> bool:
         """Determina si un bloque de texto puede contener recetas."""
@@ -1095,83 +1502,86 @@ class WhatsAppExtractor:
         return tiene_palabras_clave or tiene_patrones_lista
         """
 
-    def _actualizar_estado_procesamiento(self, ultima_fecha: Optional[str]):
-        """Actualiza el archivo de estado con la última fecha procesada."""
-        estado = {
-            "ultima_fecha_procesada": ultima_fecha,
-            "ultima_fecha_iso": None,
-            "ultima_actualizacion": datetime.now().isoformat(),
-        }
+    def _actualizar_estado_procesamiento(self, clave: str, checkpoint: Dict[str, Any]):
+        """
+        Guarda el checkpoint de un chat sin tocar los de los demás.
 
-        if ultima_fecha:
-            try:
-                fecha_dt = datetime.strptime(ultima_fecha, "%d/%m/%y %H:%M:%S")
-                estado["ultima_fecha_iso"] = fecha_dt.strftime("%Y-%m-%d")
-            except ValueError:
-                try:
-                    fecha_dt = datetime.strptime(ultima_fecha.split()[0], "%d/%m/%y")
-                    estado["ultima_fecha_iso"] = fecha_dt.strftime("%Y-%m-%d")
-                except ValueError:
-                    pass
-
-        # Guardar estado en Supabase si es posible
-        try:
-            if self.supabase_manager:
-                self.supabase_manager.guardar_estado_procesamiento(
-                    estado["ultima_fecha_iso"]
-                )
-        except Exception as e:
-            print(f"Error guardando estado en Supabase: {e}")
+        No se guarda una fecha común a todos los chats: con varios archivos a
+        la vez, el corte de cada uno dependería de cuál terminó antes.
 
-        try:
-            os.makedirs("state", exist_ok=True)
-            with open("state/last_processed.json", "w", encoding="utf-8") as f:
-                json.dump(estado, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            print(f"Error guardando estado: {e}")
+        Args:
+            clave: Chat al que pertenece el checkpoint
+            checkpoint: Checkpoint de ingesta incremental del chat
+        """
+        with self._lock_estado:
+            # Conservar los checkpoints de otros chats ya guardados
+            checkpoints = self._leer_estado_local().get("checkpoints")
+            if not isinstance(checkpoints, dict):
+                checkpoints = {}
+            checkpoints[clave] = checkpoint
+            estado = {
+                "checkpoints": checkpoints,
+                "ultima_actualizacion": datetime.now().isoformat(),
+            }
 
-    def _obtener_fecha_guardada(self) -> Optional[str]:
-        """Obtiene la fecha guardada del último procesamiento en formato YYYY-MM-DD."""
+            # Guardar estado en Supabase si es posible
+            try:
+                if self.supabase_manager:
+                    self.supabase_manager.guardar_checkpoint_chat(clave, checkpoint)
+            except Exception as e:
+                print(f"Error guardando estado en Supabase: {e}")
+
+            try:
+                os.makedirs("state", exist_ok=True)
+                with open("state/last_processed.json", "w", encoding="utf-8") as f:
+                    json.dump(estado, f, indent=2, ensure_ascii=False)
+            except Exception as e:
+                print(f"Error guardando estado: {e}")
+
+    def _obtener_checkpoint(self, clave: str) -> Optional[Dict[str, Any]]:
+        """Obtiene el checkpoint de ingesta incremental guardado para un chat."""
         # Priorizar estado persistido en Supabase
         try:
             if self.supabase_manager:
-                fecha_supabase = self.supabase_manager.obtener_estado_procesamiento()
-                if fecha_supabase:
-                    return fecha_supabase
+                checkpoint = self.supabase_manager.obtener_checkpoint_chat(clave)
+                if isinstance(checkpoint, dict):
+                    return checkpoint
         except Exception as e:
-            print(f"Error leyendo estado de Supabase: {e}")
+            print(f"Error leyendo checkpoint de Supabase: {e}")
 
-        ruta_estado = os.path.join("state", "last_processed.json")
+        checkpoints = self._leer_estado_local().get("checkpoints")
+        if isinstance(checkpoints, dict) and isinstance(checkpoints.get(clave), dict):
+            return checkpoints[clave]
+        return None
 
+    @staticmethod
+    def _leer_estado_local() -> Dict[str, Any]:
+        """Lee `state/last_processed.json` (vacío si no existe o no es válido)."""
+        ruta_estado = os.path.join("state", "last_processed.json")
         if not os.path.exists(ruta_estado):
-            return None
-
+            return {}
         try:
             with open(ruta_estado, "r", encoding="utf-8") as f:
                 estado = json.load(f)
-
-            fecha_iso = estado.get("ultima_fecha_iso")
-            if fecha_iso:
-                return fecha_iso
-
-            # Intentar convertir el formato antiguo si existe
-            fecha_original = estado.get("ultima_fecha_procesada")
-            if not fecha_original:
-                return None
-
-            try:
-                fecha_dt = datetime.strptime(fecha_original, "%d/%m/%y %H:%M:%S")
-                return fecha_dt.strftime("%Y-%m-%d")
-            except ValueError:
-                try:
-                    fecha_dt = datetime.strptime(fecha_original.split()[0], "%d/%m/%y")
-                    return fecha_dt.strftime("%Y-%m-%d")
-                except ValueError:
-                    return None
-
+            return estado if isinstance(estado, dict) else {}
         except (IOError, json.JSONDecodeError) as e:
             print(f"Error leyendo estado previo: {e}")
-            return None
+            return {}
+
+
+def agregar_opciones_cache(parser: argparse.ArgumentParser) -> None:
+    """Añade las opciones de la caché de Mistral a un parser de argumentos."""
+    grupo = parser.add_mutually_exclusive_group()
+    grupo.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="No consultar ni guardar resultados en la caché de Mistral",
+    )
+    grupo.add_argument(
+        "--refresh-cache",
+        action="store_true",
+        help="Volver a pedir a Mistral los bloques ya cacheados y reemplazarlos",
+    )
 
 
 def main():
@@ -1183,6 +1593,13 @@ def main():
     parser.add_argument(
         "--fecha-desde", help="Fecha desde la cual procesar (YYYY-MM-DD)"
     )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Procesos para parsear y clasificar exportaciones muy grandes",
+    )
+    agregar_opciones_cache(parser)
 
     args = parser.parse_args()
 
@@ -1193,20 +1610,40 @@ def main():
 
     # Crear extractor y procesar
     extractor = WhatsAppExtractor()
+    extractor.mistral_client.configurar_cache(
+        usar=not args.no_cache, refrescar=args.refresh_cache
+    )
 
-    fecha_desde = args.fecha_desde
-    if not fecha_desde:
-        fecha_desde = extractor._obtener_fecha_guardada()
-        if fecha_desde:
-            print(f"Usando fecha guardada por defecto: {fecha_desde}")
-
-    resultado = extractor.procesar_archivo(args.file, fecha_desde)
+    # Sin fecha explícita el extractor reanuda desde el checkpoint del chat o,
+    # si no lo hay, lee el archivo completo
+    try:
+        resultado = extractor.procesar_archivo(
+            args.file, args.fecha_desde, args.workers
+        )
+    finally:
+        extractor.cerrar()
 
     print("\n=== RESUMEN ===")
     print(f"Mensajes procesados: {resultado.get('mensajes_procesados', 0)}")
     print(f"Bloques procesados: {resultado.get('bloques_procesados', 0)}")
     print(f"Recetas extraídas: {resultado.get('recetas_extraidas', 0)}")
+    print(
+        f"  Por reglas: {resultado.get('recetas_reglas', 0)}, "
+        f"por Mistral: {resultado.get('recetas_llm', 0)}"
+    )
     print(f"Recetas insertadas: {resultado.get('recetas_insertadas', 0)}")
+    print(
+        f"Caché de Mistral: {resultado.get('cache_aciertos', 0)} aciertos, "
+        f"{resultado.get('cache_fallos', 0)} fallos"
+    )
+    if resultado.get("tokens_por_receta") is not None:
+        print(
+            f"Tokens enviados: {resultado['tokens_enviados']} "
+            f"({resultado['tokens_por_receta']:.0f} por receta de Mistral)"
+        )
+    if extractor.clasificador is not None:
+        print(f"Bloques descartados: {resultado.get('bloques_descartados', 0)}")
+        imprimir_estimaciones(extractor.clasificador, extractor.umbral_clasificador)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,257 @@
+"""
+Ingesta por lotes de exportaciones de WhatsApp y libros de Excel.
+
+Acepta archivos, directorios y patrones glob y los procesa todos con un único
+`WhatsAppExtractor`: los clientes de Mistral y Supabase, el registro de
+huellas y las claves de recetas ya existentes se crean una sola vez y se
+comparten entre archivos. Los archivos se procesan a la vez en varios hilos
+(el trabajo es sobre todo esperar a la red) hasta un límite configurable.
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from .clasificador import imprimir_estimaciones
+from .extractor import WhatsAppExtractor, agregar_opciones_cache
+
+# Extensiones que se recogen al recorrer directorios o patrones
+EXTENSIONES_INGESTA = (".txt", ".zip", ".xlsx", ".xls")
+
+# Campos numéricos de los resultados que se suman en el resumen
+CAMPOS_TOTALES = (
+    "mensajes_procesados",
+    "bloques_procesados",
+    "bloques_repetidos",
+    "bloques_descartados",
+    "hojas_procesadas",
+    "recetas_extraidas",
+    "recetas_reglas",
+    "recetas_llm",
+    "recetas_insertadas",
+    "cache_aciertos",
+    "cache_fallos",
+    "tokens_enviados",
+)
+
+
+def descubrir_archivos(entradas: Iterable[str]) -> List[str]:
+    """
+    Expande directorios y patrones glob en la lista de archivos a ingerir.
+
+    Los directorios se recorren recursivamente y, como los patrones, solo
+    aportan archivos con extensión de `EXTENSIONES_INGESTA`; las rutas
+    indicadas explícitamente se respetan sea cual sea su extensión. Un mismo
+    archivo alcanzado por varias entradas se procesa una sola vez.
+
+    Args:
+        entradas: Rutas, directorios o patrones glob
+
+    Returns:
+        Rutas de los archivos en el orden en que se encontraron
+    """
+    archivos: List[str] = []
+    vistos: Set[str] = set()
+
+    for entrada in entradas:
+        explicita = False
+        if os.path.isdir(entrada):
+            patron = os.path.join(glob.escape(entrada), "**", "*")
+            candidatos = sorted(glob.glob(patron, recursive=True))
+        elif any(caracter in entrada for caracter in "*?["):
+            candidatos = sorted(glob.glob(entrada, recursive=True))
+        else:
+            candidatos = [entrada]
+            explicita = True
+
+        for ruta in candidatos:
+            if not explicita and (
+                os.path.isdir(ruta) or not ruta.lower().endswith(EXTENSIONES_INGESTA)
+            ):
+                continue
+            real = os.path.realpath(ruta)
+            if real in vistos:
+                continue
+            vistos.add(real)
+            archivos.append(ruta)
+
+    return archivos
+
+
+def ingerir_archivos(
+    extractor: WhatsAppExtractor,
+    archivos: List[str],
+    concurrencia: int = 4,
+    fecha_desde: Optional[str] = None,
+    workers: int = 1,
+) -> List[Dict[str, Any]]:
+    """
+    Procesa varios archivos con el mismo extractor, varios a la vez.
+
+    Args:
+        extractor: Extractor compartido por todos los archivos
+        archivos: Rutas a procesar
+        concurrencia: Máximo de archivos en proceso a la vez
+        fecha_desde: Fecha desde la cual procesar los chats (YYYY-MM-DD)
+        workers: Procesos para parsear cada chat muy grande
+
+    Returns:
+        Un resultado por archivo, en el mismo orden, con `archivo` y `segundos`
+        además de las estadísticas de `procesar_archivo`
+    """
+
+    def procesar(ruta: str) -> Dict[str, Any]:
+        inicio = time.perf_counter()
+        try:
+            # Las claves de recetas se descargaron al crear el extractor y se
+            # comparten: no volver a descargarlas por cada Excel
+            resultado = extractor.procesar_archivo(
+                ruta, fecha_desde, workers, refrescar_claves=False
+            )
+        except Exception as e:
+            print(f"❌ Error procesando {ruta}: {e}")
+            resultado = {"error": str(e)}
+        return {
+            **(resultado or {}),
+            "archivo": ruta,
+            "segundos": time.perf_counter() - inicio,
+        }
+
+    with ThreadPoolExecutor(max_workers=max(1, concurrencia)) as pool:
+        return list(pool.map(procesar, archivos))
+
+
+def resumir_resultados(resultados: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Suma las estadísticas de todos los archivos."""
+    totales = {campo: 0 for campo in CAMPOS_TOTALES}
+    totales["archivos"] = len(resultados)
+    totales["errores"] = 0
+    for resultado in resultados:
+        if resultado.get("error"):
+            totales["errores"] += 1
+        for campo in CAMPOS_TOTALES:
+            totales[campo] += resultado.get(campo) or 0
+    return totales
+
+
+def imprimir_resumen(resultados: List[Dict[str, Any]]) -> Dict[str, int]:
+    """Muestra una línea por archivo y los totales; devuelve los totales."""
+    print("\n=== RESUMEN DE INGESTA ===")
+    for resultado in resultados:
+        nombre = resultado["archivo"]
+        segundos = resultado.get("segundos", 0.0)
+        if resultado.get("error"):
+            print(f"❌ {nombre}: {resultado['error']} ({segundos:.1f}s)")
+            continue
+        if resultado.get("archivo_tipo") == "excel":
+            detalle = f"{resultado.get('hojas_procesadas', 0)} hojas"
+        else:
+            detalle = (
+                f"{resultado.get('mensajes_procesados', 0)} mensajes, "
+                f"{resultado.get('bloques_procesados', 0)} bloques"
+            )
+            if resultado.get("bloques_repetidos"):
+                detalle += f" ({resultado['bloques_repetidos']} ya procesados)"
+            if resultado.get("bloques_descartados"):
+                detalle += f" ({resultado['bloques_descartados']} descartados)"
+        print(
+            f"✅ {nombre}: {detalle}, "
+            f"{resultado.get('recetas_extraidas', 0)} recetas extraídas, "
+            f"{resultado.get('recetas_insertadas', 0)} insertadas ({segundos:.1f}s)"
+        )
+
+    totales = resumir_resultados(resultados)
+    print(
+        f"\nArchivos: {totales['archivos']} ({totales['errores']} con errores)\n"
+        f"Mensajes procesados: {totales['mensajes_procesados']}\n"
+        f"Bloques procesados: {totales['bloques_procesados']}\n"
+        f"Bloques ya procesados: {totales['bloques_repetidos']}\n"
+        f"Bloques descartados por el pre-clasificador: "
+        f"{totales['bloques_descartados']}\n"
+        f"Hojas procesadas: {totales['hojas_procesadas']}\n"
+        f"Recetas extraídas: {totales['recetas_extraidas']} "
+        f"({totales['recetas_reglas']} por reglas, "
+        f"{totales['recetas_llm']} por Mistral)\n"
+        f"Recetas insertadas: {totales['recetas_insertadas']}\n"
+        f"Caché de Mistral: {totales['cache_aciertos']} aciertos, "
+        f"{totales['cache_fallos']} fallos"
+    )
+    if totales["recetas_llm"]:
+        print(
+            f"Tokens enviados: {totales['tokens_enviados']} "
+            f"({totales['tokens_enviados'] / totales['recetas_llm']:.0f} "
+            "por receta de Mistral)"
+        )
+    return totales
+
+
+def main():
+    """Ingiere desde línea de comandos todos los archivos indicados."""
+    # Cargar variables de entorno antes de leer los valores por defecto
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description="Extraer recetas de varios chats de WhatsApp y Excel a la vez"
+    )
+    parser.add_argument(
+        "rutas",
+        nargs="+",
+        help="Archivos, directorios o patrones glob (p. ej. 'exports/**/*.txt')",
+    )
+    parser.add_argument(
+        "-j",
+        "--concurrencia",
+        type=int,
+        default=int(os.getenv("INGESTA_CONCURRENCIA", "4")),
+        help="Archivos procesados a la vez (por defecto INGESTA_CONCURRENCIA o 4)",
+    )
+    parser.add_argument(
+        "--fecha-desde", help="Fecha desde la cual procesar los chats (YYYY-MM-DD)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Procesos para parsear y clasificar cada exportación muy grande",
+    )
+    agregar_opciones_cache(parser)
+
+    args = parser.parse_args()
+
+    archivos = descubrir_archivos(args.rutas)
+    if not archivos:
+        print("No se encontraron archivos para procesar")
+        sys.exit(1)
+    print(f"📂 {len(archivos)} archivos, {args.concurrencia} a la vez")
+
+    # Un solo extractor: clientes, registro de huellas y claves compartidos
+    extractor = WhatsAppExtractor()
+    extractor.mistral_client.configurar_cache(
+        usar=not args.no_cache, refrescar=args.refresh_cache
+    )
+    try:
+        resultados = ingerir_archivos(
+            extractor,
+            archivos,
+            concurrencia=args.concurrencia,
+            fecha_desde=args.fecha_desde,
+            workers=args.workers,
+        )
+    finally:
+        extractor.cerrar()
+
+    totales = imprimir_resumen(resultados)
+    if extractor.clasificador is not None:
+        imprimir_estimaciones(extractor.clasificador, extractor.umbral_clasificador)
+    if totales["errores"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,421 @@
+"""
+Registro persistente de huellas de mensajes ya procesados.
+
+Cada exportación de WhatsApp vuelve a traer todo el historial del chat. El
+registro guarda, por chat, una huella de cada mensaje que ya se ha enviado a
+Mistral (hash de timestamp + autor + texto) para descartar los bloques
+repetidos antes de llamar al LLM, aunque se importe una copia antigua o una
+exportación que se solapa con otra.
+
+Las huellas se guardan en un SQLite local (y opcionalmente en Supabase). Las
+consultas pasan antes por un filtro de Bloom en memoria, así que comprobar un
+mensaje nuevo no toca el disco; el filtro se guarda también en SQLite para no
+reconstruirlo en cada arranque.
+
+Aparte se guarda la huella de cada receta insertada desde un chat. Con
+streaming, las recetas de un bloque se insertan antes de que termine; si el
+bloque falla no entra en el registro y la próxima importación lo vuelve a
+pedir, así que sus recetas no deben insertarse otra vez.
+"""
+
+import functools
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from .chat_parser import Mensaje
+
+# Huellas de 16 bytes: colisiones despreciables incluso con miles de millones
+BYTES_HUELLA = 16
+# Capacidad inicial del filtro de Bloom de cada chat
+CAPACIDAD_MINIMA_BLOOM = 1024
+# Probabilidad de falso positivo del filtro (se confirma luego en SQLite)
+ERROR_BLOOM = 0.01
+# Huellas por consulta `IN (...)` al confirmar candidatas en SQLite
+LOTE_CONSULTA = 500
+
+
+def huella_mensaje(mensaje: Union[Mensaje, Dict[str, Any]]) -> bytes:
+    """
+    Calcula la huella de un mensaje a partir de su fecha, autor y texto.
+
+    Args:
+        mensaje: Mensaje con `timestamp` (o `fecha`), `creador` y `mensaje`
+
+    Returns:
+        Huella binaria de `BYTES_HUELLA` bytes
+    """
+    marca = mensaje.get("timestamp")
+    if marca is None:
+        marca = mensaje.get("fecha", "")
+    contenido = (
+        f"{marca}\x1f{mensaje.get('creador', '')}\x1f{mensaje.get('mensaje', '')}"
+    )
+    return hashlib.sha256(contenido.encode("utf-8")).digest()[:BYTES_HUELLA]
+
+
+def huella_receta(receta: Dict[str, Any]) -> bytes:
+    """
+    Calcula la huella de una receta a partir de su autor, nombre y fecha.
+
+    Args:
+        receta: Receta extraída con `creador`, `nombre_receta` y `fecha_mensaje`
+
+    Returns:
+        Huella binaria de `BYTES_HUELLA` bytes (sin distinguir mayúsculas)
+    """
+    contenido = "\x1f".join(
+        str(receta.get(campo) or "").strip().lower()
+        for campo in ("creador", "nombre_receta", "fecha_mensaje")
+    )
+    return hashlib.sha256(contenido.encode("utf-8")).digest()[:BYTES_HUELLA]
+
+
+class FiltroBloom:
+    """Filtro de Bloom para huellas que ya son hashes uniformes."""
+
+    def __init__(self, capacidad: int, error: float = ERROR_BLOOM):
+        """
+        Dimensiona el filtro para `capacidad` elementos con la tasa de error dada.
+
+        El número de bits es potencia de dos: cada posición se toma
+        directamente de un tramo de bits de la huella, sin volver a hashear.
+
+        Args:
+            capacidad: Número de elementos previsto
+            error: Probabilidad de falso positivo deseada
+        """
+        self.capacidad = max(capacidad, CAPACIDAD_MINIMA_BLOOM)
+        bits_necesarios = -self.capacidad * math.log(error) / (math.log(2) ** 2)
+        self.orden = max(3, math.ceil(math.log2(bits_necesarios)))
+        self.funciones = max(
+            1,
+            min(
+                round((1 << self.orden) / self.capacidad * math.log(2)),
+                BYTES_HUELLA * 8 // self.orden,
+            ),
+        )
+        self.elementos = 0
+        self._tabla = bytearray((1 << self.orden) // 8)
+
+    def agregar(self, huella: bytes) -> None:
+        """Añade una huella al filtro."""
+        self.agregar_varias((huella,))
+
+    def agregar_varias(self, huellas: Iterable[bytes]) -> None:
+        """Añade varias huellas al filtro (más rápido que una a una)."""
+        tabla = self._tabla
+        mascara = (1 << self.orden) - 1
+        orden = self.orden
+        funciones = range(self.funciones)
+        elementos = 0
+        for huella in huellas:
+            valor = int.from_bytes(huella, "little")
+            for _ in funciones:
+                posicion = valor & mascara
+                tabla[posicion >> 3] |= 1 << (posicion & 7)
+                valor >>= orden
+            elementos += 1
+        self.elementos += elementos
+
+    def __contains__(self, huella: bytes) -> bool:
+        return bool(self.posibles((huella,)))
+
+    def posibles(self, huellas: Iterable[bytes]) -> List[bytes]:
+        """Devuelve las huellas que pueden estar en el filtro (sin falsos negativos)."""
+        tabla = self._tabla
+        mascara = (1 << self.orden) - 1
+        orden = self.orden
+        funciones = range(self.funciones)
+        posibles = []
+        for huella in huellas:
+            valor = int.from_bytes(huella, "little")
+            for _ in funciones:
+                posicion = valor & mascara
+                if not tabla[posicion >> 3] & (1 << (posicion & 7)):
+                    break
+                valor >>= orden
+            else:
+                posibles.append(huella)
+        return posibles
+
+    @property
+    def lleno(self) -> bool:
+        """Indica si se ha superado la capacidad y la tasa de error ya no se cumple."""
+        return self.elementos > self.capacidad
+
+    def serializar(self) -> Tuple[int, int, int, int, bytes]:
+        """Devuelve (capacidad, orden, funciones, elementos, tabla) para guardarlo."""
+        return (
+            self.capacidad,
+            self.orden,
+            self.funciones,
+            self.elementos,
+            bytes(self._tabla),
+        )
+
+    @classmethod
+    def deserializar(
+        cls, capacidad: int, orden: int, funciones: int, elementos: int, tabla: bytes
+    ) -> "FiltroBloom":
+        """Reconstruye un filtro guardado con `serializar`."""
+        filtro = cls.__new__(cls)
+        filtro.capacidad = capacidad
+        filtro.orden = orden
+        filtro.funciones = funciones
+        filtro.elementos = elementos
+        filtro._tabla = bytearray(tabla)
+        return filtro
+
+
+def _sincronizado(metodo: Callable) -> Callable:
+    """Ejecuta el método con el lock del registro (se usa desde varios hilos)."""
+
+    @functools.wraps(metodo)
+    def envoltorio(self, *args, **kwargs):
+        with self._lock:
+            return metodo(self, *args, **kwargs)
+
+    return envoltorio
+
+
+class LedgerMensajes:
+    """Registro de huellas de mensajes procesados, separado por chat."""
+
+    def __init__(
+        self,
+        ruta: Optional[str] = None,
+        supabase_manager: Optional[Any] = None,
+    ):
+        """
+        Inicializa el registro. La base de datos se abre al primer uso.
+
+        Args:
+            ruta: Archivo SQLite (por defecto `LEDGER_PATH` o `state/ledger.sqlite3`)
+            supabase_manager: Gestor de Supabase para replicar las huellas
+                (solo se usa si `LEDGER_SUPABASE` está activado)
+        """
+        self.ruta = ruta or os.getenv("LEDGER_PATH", "state/ledger.sqlite3")
+        usar_supabase = os.getenv("LEDGER_SUPABASE", "false").lower() == "true"
+        self.supabase_manager = supabase_manager if usar_supabase else None
+        self._conexion: Optional[sqlite3.Connection] = None
+        self._filtros: Dict[str, FiltroBloom] = {}
+        # Chats cuyo filtro ha cambiado desde que se guardó
+        self._modificados: Set[str] = set()
+        # Varios archivos pueden ingerirse a la vez desde hilos distintos
+        self._lock = threading.RLock()
+
+    @property
+    @_sincronizado
+    def conexion(self) -> sqlite3.Connection:
+        """Conexión a SQLite, creando el archivo y las tablas si no existen."""
+        if self._conexion is None:
+            directorio = os.path.dirname(self.ruta)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            self._conexion = sqlite3.connect(self.ruta, check_same_thread=False)
+            # Las huellas son aleatorias: con caché grande y WAL las inserciones
+            # no reescriben páginas del índice en cada lote
+            self._conexion.execute("PRAGMA journal_mode=WAL")
+            self._conexion.execute("PRAGMA synchronous=NORMAL")
+            self._conexion.execute("PRAGMA cache_size=-65536")
+            with self._conexion:
+                self._conexion.execute(
+                    "CREATE TABLE IF NOT EXISTS huellas ("
+                    "chat TEXT NOT NULL, huella BLOB NOT NULL, "
+                    "PRIMARY KEY (chat, huella)) WITHOUT ROWID"
+                )
+                # Copia del filtro de Bloom para no reconstruirlo en cada arranque
+                self._conexion.execute(
+                    "CREATE TABLE IF NOT EXISTS filtros ("
+                    "chat TEXT PRIMARY KEY, capacidad INTEGER, orden INTEGER, "
+                    "funciones INTEGER, elementos INTEGER, tabla BLOB)"
+                )
+                # Recetas ya insertadas, aunque su bloque no llegara a registrarse
+                self._conexion.execute(
+                    "CREATE TABLE IF NOT EXISTS recetas ("
+                    "chat TEXT NOT NULL, huella BLOB NOT NULL, "
+                    "PRIMARY KEY (chat, huella)) WITHOUT ROWID"
+                )
+        return self._conexion
+
+    @_sincronizado
+    def conocidas(self, chat: str, huellas: Iterable[bytes]) -> Set[bytes]:
+        """
+        Devuelve las huellas que ya están registradas para un chat.
+
+        Args:
+            chat: Identificador del chat
+            huellas: Huellas a comprobar
+
+        Returns:
+            Subconjunto de `huellas` ya registradas
+        """
+        filtro = self._filtro(chat)
+        # El filtro descarta en memoria casi todas las huellas nuevas; solo las
+        # que pasan (conocidas o falsos positivos) se confirman en SQLite
+        candidatas = filtro.posibles(huellas)
+
+        conocidas: Set[bytes] = set()
+        for inicio in range(0, len(candidatas), LOTE_CONSULTA):
+            lote = candidatas[inicio : inicio + LOTE_CONSULTA]
+            marcadores = ",".join("?" * len(lote))
+            conocidas.update(
+                fila[0]
+                for fila in self.conexion.execute(
+                    "SELECT huella FROM huellas "
+                    f"WHERE chat = ? AND huella IN ({marcadores})",
+                    (chat, *lote),
+                )
+            )
+        return conocidas
+
+    @_sincronizado
+    def todas_conocidas(self, chat: str, huellas: List[bytes]) -> bool:
+        """Indica si todas las huellas de un bloque ya estaban registradas."""
+        if not huellas:
+            return False
+        filtro = self._filtro(chat)
+        # Caso habitual con mensajes nuevos: el filtro lo descarta sin consultas
+        if len(filtro.posibles(huellas)) < len(huellas):
+            return False
+        return len(self.conocidas(chat, huellas)) == len(set(huellas))
+
+    @_sincronizado
+    def registrar(self, chat: str, huellas: Iterable[bytes]) -> int:
+        """
+        Registra huellas de mensajes procesados.
+
+        Args:
+            chat: Identificador del chat
+            huellas: Huellas a registrar
+
+        Returns:
+            Número de huellas nuevas
+        """
+        huellas = list(dict.fromkeys(huellas))
+        conocidas = self.conocidas(chat, huellas)
+        nuevas = [huella for huella in huellas if huella not in conocidas]
+        if not nuevas:
+            return 0
+
+        filtro = self._filtro(chat)
+        if filtro.elementos + len(nuevas) > filtro.capacidad:
+            # Reconstruir con más capacidad para mantener la tasa de error
+            filtro = self._construir_filtro(chat, filtro.elementos + len(nuevas))
+            self._filtros[chat] = filtro
+        filtro.agregar_varias(nuevas)
+        self._modificados.add(chat)
+
+        with self.conexion:
+            # Insertar en orden de clave recorre el índice de forma secuencial
+            self.conexion.executemany(
+                "INSERT OR IGNORE INTO huellas (chat, huella) VALUES (?, ?)",
+                [(chat, huella) for huella in sorted(nuevas)],
+            )
+
+        if self.supabase_manager:
+            self.supabase_manager.guardar_huellas_chat(
+                chat, [huella.hex() for huella in nuevas]
+            )
+        return len(nuevas)
+
+    @_sincronizado
+    def receta_registrada(self, chat: str, huella: bytes) -> bool:
+        """Indica si ya se insertó una receta con esta huella desde el chat."""
+        return (
+            self.conexion.execute(
+                "SELECT 1 FROM recetas WHERE chat = ? AND huella = ?", (chat, huella)
+            ).fetchone()
+            is not None
+        )
+
+    @_sincronizado
+    def registrar_receta(self, chat: str, huella: bytes) -> None:
+        """Anota una receta insertada desde el chat."""
+        with self.conexion:
+            self.conexion.execute(
+                "INSERT OR IGNORE INTO recetas (chat, huella) VALUES (?, ?)",
+                (chat, huella),
+            )
+
+    @_sincronizado
+    def guardar(self) -> None:
+        """Guarda en SQLite los filtros modificados para el próximo arranque."""
+        if not self._modificados:
+            return
+        with self.conexion:
+            self.conexion.executemany(
+                "INSERT OR REPLACE INTO filtros "
+                "(chat, capacidad, orden, funciones, elementos, tabla) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [
+                    (chat, *self._filtros[chat].serializar())
+                    for chat in self._modificados
+                    if chat in self._filtros
+                ],
+            )
+        self._modificados.clear()
+
+    @_sincronizado
+    def cerrar(self) -> None:
+        """Guarda los filtros y cierra la conexión con SQLite."""
+        if self._conexion is not None:
+            self.guardar()
+            self._conexion.close()
+            self._conexion = None
+
+    def _filtro(self, chat: str) -> FiltroBloom:
+        """Filtro de Bloom del chat, cargado desde SQLite la primera vez."""
+        filtro = self._filtros.get(chat)
+        if filtro is not None:
+            return filtro
+
+        if self.supabase_manager:
+            self._importar_de_supabase(chat)
+
+        total = self._contar(chat)
+        guardado = self.conexion.execute(
+            "SELECT capacidad, orden, funciones, elementos, tabla "
+            "FROM filtros WHERE chat = ?",
+            (chat,),
+        ).fetchone()
+        if guardado is not None and guardado[3] == total:
+            filtro = FiltroBloom.deserializar(*guardado)
+        else:
+            # No hay copia o está desfasada (p. ej. el proceso terminó antes
+            # de guardarla): reconstruir desde las huellas
+            filtro = self._construir_filtro(chat, total)
+            self._modificados.add(chat)
+        self._filtros[chat] = filtro
+        return filtro
+
+    def _construir_filtro(self, chat: str, previstas: int) -> FiltroBloom:
+        """Crea un filtro con margen para crecer y carga las huellas del chat."""
+        filtro = FiltroBloom(2 * previstas)
+        filtro.agregar_varias(
+            fila[0]
+            for fila in self.conexion.execute(
+                "SELECT huella FROM huellas WHERE chat = ?", (chat,)
+            )
+        )
+        return filtro
+
+    def _contar(self, chat: str) -> int:
+        return self.conexion.execute(
+            "SELECT COUNT(*) FROM huellas WHERE chat = ?", (chat,)
+        ).fetchone()[0]
+
+    def _importar_de_supabase(self, chat: str) -> None:
+        """Trae a SQLite las huellas del chat guardadas en Supabase."""
+        remotas = self.supabase_manager.obtener_huellas_chat(chat)
+        if not remotas:
+            return
+        with self.conexion:
+            self.conexion.executemany(
+                "INSERT OR IGNORE INTO huellas (chat, huella) VALUES (?, ?)",
+                [(chat, bytes.fromhex(huella)) for huella in remotas],
+            )
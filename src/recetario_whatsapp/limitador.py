@@ -0,0 +1,375 @@
+"""
+Limitador de ritmo para la API de Mistral basado en cubos de tokens.
+
+Los límites de cada nivel de la API se expresan por minuto: peticiones (RPM)
+y tokens (TPM). Cada llamada reserva una petición y los tokens estimados; si
+el cubo no tiene saldo la reserva queda en deuda y la llamada espera lo justo
+para que se rellene, de modo que las llamadas salen en orden de llegada. La
+reserva se hace bajo un lock y no depende de ningún bucle de eventos, así que
+el mismo limitador sirve para llamadas síncronas, asíncronas y desde varios
+hilos a la vez.
+
+El CLI nocturno, otra ejecución manual y cada sesión de Streamlit tienen su
+propio `MistralClient`, pero comparten la cuota de la cuenta. Con
+`LimitadorCompartido` los cubos viven en un SQLite local y cada reserva se
+hace dentro de una transacción exclusiva, así que todos los procesos del
+equipo descuentan del mismo saldo. `recetario-limitador` muestra su uso.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+# A partir de esta espera (segundos) se avisa por pantalla
+ESPERA_AVISO = 1.0
+
+
+class CuboTokens:
+    """Cubo que se rellena de forma continua hasta su capacidad por minuto."""
+
+    def __init__(self, por_minuto: float, ahora: Optional[float] = None):
+        """
+        Crea un cubo lleno.
+
+        Args:
+            por_minuto: Unidades que se recuperan cada minuto (y capacidad máxima)
+            ahora: Instante de creación (por defecto `time.monotonic`)
+        """
+        self.capacidad = float(por_minuto)
+        self.tasa = self.capacidad / 60.0
+        self.saldo = self.capacidad
+        self.actualizado = time.monotonic() if ahora is None else ahora
+
+    def reservar(self, cantidad: float, ahora: float) -> float:
+        """
+        Descuenta una cantidad del cubo, aunque lo deje en negativo.
+
+        Args:
+            cantidad: Unidades a consumir
+            ahora: Instante actual (`time.monotonic`)
+
+        Returns:
+            Segundos que hay que esperar hasta que la reserva quede cubierta
+        """
+        self._rellenar(ahora)
+        # Una petición mayor que el cubo entero nunca quedaría cubierta
+        self.saldo -= min(cantidad, self.capacidad)
+        return 0.0 if self.saldo >= 0 else -self.saldo / self.tasa
+
+    def cubre(self, cantidad: float, ahora: float) -> bool:
+        """Indica si el saldo actual cubre la cantidad sin dejar deuda."""
+        self._rellenar(ahora)
+        return self.saldo >= min(cantidad, self.capacidad)
+
+    def devolver(self, cantidad: float, ahora: float) -> None:
+        """Reintegra unidades reservadas de más."""
+        self._rellenar(ahora)
+        self.saldo = min(self.capacidad, self.saldo + cantidad)
+
+    def utilizacion(self, ahora: float) -> Dict[str, float]:
+        """
+        Estado del cubo para monitorización.
+
+        Returns:
+            `por_minuto`, `disponible` (saldo actual), `uso` (fracción de la
+            capacidad consumida; más de 1 indica llamadas en cola) y
+            `espera_seg` (lo que esperaría ahora una reserva)
+        """
+        self._rellenar(ahora)
+        return {
+            "por_minuto": self.capacidad,
+            "disponible": self.saldo,
+            "uso": 1 - self.saldo / self.capacidad,
+            "espera_seg": max(0.0, -self.saldo) / self.tasa,
+        }
+
+    def _rellenar(self, ahora: float) -> None:
+        transcurrido = max(0.0, ahora - self.actualizado)
+        self.saldo = min(self.capacidad, self.saldo + transcurrido * self.tasa)
+        self.actualizado = ahora
+
+
+class LimitadorMistral:
+    """Limita peticiones y tokens por minuto; un límite a 0 lo desactiva."""
+
+    def __init__(self, peticiones_por_minuto: float, tokens_por_minuto: float):
+        """
+        Inicializa los cubos de peticiones y de tokens.
+
+        Args:
+            peticiones_por_minuto: Peticiones por minuto permitidas (RPM)
+            tokens_por_minuto: Tokens por minuto permitidos (TPM)
+        """
+        self._peticiones: Optional[CuboTokens] = (
+            CuboTokens(peticiones_por_minuto) if peticiones_por_minuto > 0 else None
+        )
+        self._tokens: Optional[CuboTokens] = (
+            CuboTokens(tokens_por_minuto) if tokens_por_minuto > 0 else None
+        )
+        self._lock = threading.Lock()
+
+    def reservar(self, tokens: int) -> float:
+        """
+        Reserva una petición y sus tokens.
+
+        Args:
+            tokens: Tokens estimados de la petición (entrada + salida máxima)
+
+        Returns:
+            Segundos que hay que esperar antes de enviarla
+        """
+        with self._sincronizado() as ahora:
+            espera = 0.0
+            if self._peticiones is not None:
+                espera = self._peticiones.reservar(1, ahora)
+            if self._tokens is not None:
+                espera = max(espera, self._tokens.reservar(tokens, ahora))
+            return espera
+
+    def reservar_sin_esperar(self, tokens: int) -> bool:
+        """
+        Reserva una petición y sus tokens solo si pueden salir ya.
+
+        Para llamadas prescindibles (las duplicadas de `cobertura.py`): nunca
+        dejan deuda que retrase a las demás.
+
+        Args:
+            tokens: Tokens estimados de la petición (entrada + salida máxima)
+
+        Returns:
+            True si se ha hecho la reserva
+        """
+        with self._sincronizado() as ahora:
+            if self._peticiones is not None and not self._peticiones.cubre(1, ahora):
+                return False
+            if self._tokens is not None and not self._tokens.cubre(tokens, ahora):
+                return False
+            if self._peticiones is not None:
+                self._peticiones.reservar(1, ahora)
+            if self._tokens is not None:
+                self._tokens.reservar(tokens, ahora)
+            return True
+
+    def ajustar(self, reservados: int, usados: Optional[int]) -> None:
+        """
+        Devuelve al cubo los tokens reservados que la respuesta no consumió.
+
+        Args:
+            reservados: Tokens reservados con `reservar`
+            usados: Tokens que indicó la API (None si no lo indicó)
+        """
+        if self._tokens is None or usados is None or usados >= reservados:
+            return
+        with self._sincronizado() as ahora:
+            self._tokens.devolver(reservados - usados, ahora)
+
+    def utilizacion(self) -> Dict[str, Dict[str, float]]:
+        """
+        Uso actual de cada límite activo (ver `CuboTokens.utilizacion`).
+
+        Returns:
+            Diccionario con las claves `peticiones` y `tokens` de los límites
+            que no están desactivados
+        """
+        with self._sincronizado() as ahora:
+            return {
+                nombre: cubo.utilizacion(ahora)
+                for nombre, cubo in self._cubos().items()
+            }
+
+    def esperar(self, tokens: int) -> None:
+        """Reserva y espera (bloqueando el hilo) hasta poder llamar."""
+        espera = self.reservar(tokens)
+        if espera > 0:
+            self._avisar(espera)
+            time.sleep(espera)
+
+    async def esperar_async(self, tokens: int) -> None:
+        """Reserva y espera sin bloquear el bucle de eventos."""
+        espera = self.reservar(tokens)
+        if espera > 0:
+            self._avisar(espera)
+            await asyncio.sleep(espera)
+
+    def cerrar(self) -> None:
+        """Libera los recursos del limitador (nada que cerrar en memoria)."""
+
+    @staticmethod
+    def _avisar(espera: float) -> None:
+        if espera >= ESPERA_AVISO:
+            print(f"  ⏳ Esperando {espera:.1f}s por el límite de Mistral")
+
+    def _cubos(self) -> Dict[str, CuboTokens]:
+        """Cubos de los límites activos, por nombre."""
+        cubos = {}
+        if self._peticiones is not None:
+            cubos["peticiones"] = self._peticiones
+        if self._tokens is not None:
+            cubos["tokens"] = self._tokens
+        return cubos
+
+    @contextmanager
+    def _sincronizado(self) -> Iterator[float]:
+        """Acceso exclusivo a los cubos; da el instante actual."""
+        with self._lock:
+            yield time.monotonic()
+
+
+class LimitadorCompartido(LimitadorMistral):
+    """`LimitadorMistral` con los cubos compartidos por todos los procesos."""
+
+    def __init__(
+        self,
+        peticiones_por_minuto: float,
+        tokens_por_minuto: float,
+        ruta: Optional[str] = None,
+    ):
+        """
+        Inicializa el limitador. La base de datos se abre al primer uso.
+
+        Args:
+            peticiones_por_minuto: Peticiones por minuto permitidas (RPM)
+            tokens_por_minuto: Tokens por minuto permitidos (TPM)
+            ruta: Archivo SQLite compartido (por defecto
+                `MISTRAL_LIMITADOR_PATH` o `state/limitador_mistral.sqlite3`)
+        """
+        super().__init__(peticiones_por_minuto, tokens_por_minuto)
+        self.ruta = ruta or os.getenv(
+            "MISTRAL_LIMITADOR_PATH", "state/limitador_mistral.sqlite3"
+        )
+        self._conexion: Optional[sqlite3.Connection] = None
+
+    @property
+    def conexion(self) -> sqlite3.Connection:
+        """Conexión a SQLite, creando el archivo y la tabla si no existen."""
+        if self._conexion is None:
+            directorio = os.path.dirname(self.ruta)
+            if directorio:
+                os.makedirs(directorio, exist_ok=True)
+            # Sin transacciones implícitas: cada reserva abre la suya
+            self._conexion = sqlite3.connect(
+                self.ruta, timeout=30, isolation_level=None, check_same_thread=False
+            )
+            self._conexion.execute("PRAGMA journal_mode=WAL")
+            self._conexion.execute(
+                "CREATE TABLE IF NOT EXISTS cubos ("
+                "nombre TEXT PRIMARY KEY, saldo REAL NOT NULL, "
+                "actualizado REAL NOT NULL)"
+            )
+        return self._conexion
+
+    async def esperar_async(self, tokens: int) -> None:
+        """
+        Reserva en un hilo aparte y espera sin bloquear el bucle de eventos.
+
+        La transacción de SQLite puede esperar a que otro proceso suelte el
+        bloqueo; hecha en el bucle pararía todas las llamadas en vuelo.
+        """
+        espera = await asyncio.to_thread(self.reservar, tokens)
+        if espera > 0:
+            self._avisar(espera)
+            await asyncio.sleep(espera)
+
+    def cerrar(self) -> None:
+        """Cierra la conexión con SQLite."""
+        with self._lock:
+            if self._conexion is not None:
+                self._conexion.close()
+                self._conexion = None
+
+    @contextmanager
+    def _sincronizado(self) -> Iterator[float]:
+        """
+        Carga los cubos de SQLite dentro de una transacción exclusiva (que
+        bloquea a los demás procesos) y guarda el saldo resultante.
+        """
+        cubos = self._cubos()
+        with self._lock:
+            if not cubos:
+                yield time.time()
+                return
+            conexion = self.conexion
+            conexion.execute("BEGIN IMMEDIATE")
+            try:
+                # Reloj de pared: `time.monotonic` no es comparable entre procesos
+                ahora = time.time()
+                guardados = {
+                    nombre: (saldo, actualizado)
+                    for nombre, saldo, actualizado in conexion.execute(
+                        "SELECT nombre, saldo, actualizado FROM cubos"
+                    )
+                }
+                for nombre, cubo in cubos.items():
+                    cubo.saldo, cubo.actualizado = guardados.get(
+                        nombre, (cubo.capacidad, ahora)
+                    )
+                yield ahora
+                conexion.executemany(
+                    "INSERT OR REPLACE INTO cubos (nombre, saldo, actualizado) "
+                    "VALUES (?, ?, ?)",
+                    [
+                        (nombre, cubo.saldo, cubo.actualizado)
+                        for nombre, cubo in cubos.items()
+                    ],
+                )
+                conexion.execute("COMMIT")
+            except BaseException:
+                conexion.execute("ROLLBACK")
+                raise
+
+
+def crear_limitador(
+    peticiones_por_minuto: float, tokens_por_minuto: float
+) -> LimitadorMistral:
+    """
+    Limitador configurado por entorno: compartido entre procesos salvo con
+    `MISTRAL_LIMITADOR_COMPARTIDO=false`.
+    """
+    if os.getenv("MISTRAL_LIMITADOR_COMPARTIDO", "true").lower() == "true":
+        return LimitadorCompartido(peticiones_por_minuto, tokens_por_minuto)
+    return LimitadorMistral(peticiones_por_minuto, tokens_por_minuto)
+
+
+def main():
+    """Muestra el uso actual del limitador compartido."""
+    from dotenv import load_dotenv
+
+    load_dotenv()
+
+    parser = argparse.ArgumentParser(
+        description="Uso del límite de Mistral compartido por los procesos"
+    )
+    parser.add_argument(
+        "--json", action="store_true", help="Salida en JSON para monitorización"
+    )
+    args = parser.parse_args()
+
+    # Sin los límites configurados no se sabe la capacidad de los cubos
+    retardo = float(os.getenv("MISTRAL_DELAY_SEG", "1.5"))
+    limitador = LimitadorCompartido(
+        peticiones_por_minuto=float(
+            os.getenv("MISTRAL_RPM") or (60 / retardo if retardo > 0 else 0)
+        ),
+        tokens_por_minuto=float(os.getenv("MISTRAL_TPM", "500000")),
+    )
+    utilizacion = limitador.utilizacion()
+    limitador.cerrar()
+
+    if args.json:
+        print(json.dumps(utilizacion))
+        return
+    for nombre, uso in utilizacion.items():
+        print(
+            f"{nombre}: {uso['uso']:.0%} de {uso['por_minuto']:.0f}/min usado, "
+            f"{uso['disponible']:.0f} disponibles, espera {uso['espera_seg']:.1f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,55 +1,201 @@
 """
 Cliente para la API de Mistral para extraer recetas de texto de WhatsApp.
+
+Las peticiones se envían al backend configurado en `EXTRACCION_BACKEND`: la
+API de Mistral o un servidor propio compatible con la API de OpenAI.
 """
 
+import asyncio
+import functools
 import json
 import os
-import re
 import time
-from typing import Dict, Any, Optional, List
-from mistralai import Mistral
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .backends import BackendExtraccion, crear_backend
+from .cache_llm import CacheExtracciones, clave_extraccion
+from .cobertura import CoberturaLatencia
+from .empaquetado import (
+    MARCA_BLOQUE,
+    autores_bloque,
+    bloque_de_receta,
+    componer_paquete,
+    mensajes_de_autor,
+    repartir_recetas,
+)
+from .esquema import (
+    LectorRecetas,
+    RecetaInvalida,
+    cargar_json_tolerante,
+    esquema_respuesta,
+    recetas_de_respuesta,
+    validar_receta,
+    validar_recetas,
+)
+from .prompts import MODO_ADAPTATIVO, Prompt, cadena_prompts, version_cadena
+from .reintentos import (
+    ERROR_CAPACIDAD,
+    ERROR_PERMANENTE,
+    CircuitoMistral,
+    PoliticaReintentos,
+    clasificar_error,
+    codigo_http,
+    segundos_retry_after,
+)
+from .respaldo import extraer_recetas_regex
+from .tokenizador import ContadorTokens
+
+# Antes del texto del chat, en el mensaje de usuario
+SEPARADOR_TEXTO = "Texto del chat de WhatsApp:\n"
+
+# Se añade al prompt cuando una llamada lleva varios bloques empaquetados
+INSTRUCCION_PAQUETE = f"""
+
+VARIOS BLOQUES:
+- El texto contiene varios bloques independientes, cada uno precedido de "{MARCA_BLOQUE.format('N')}"
+- Añade a cada receta el campo "bloque" con el número N del bloque del que procede
+- Una receta nunca mezcla mensajes de bloques distintos"""
+
+# Vuelve a pedir una sola receta de la respuesta que no cumple el esquema
+PROMPT_CORRECCION = """Esta receta extraída de un chat de WhatsApp no cumple el formato pedido: {errores}.
+Corrígela a partir de los mensajes originales. Responde SOLO con JSON válido: {{"recetas": [receta corregida]}}, o {{"recetas": []}} si no es una receta con ingredientes.
+
+Receta:
+{receta}
+
+Mensajes originales:
+{mensajes}"""
+
+# Error de una respuesta que no se pudo interpretar como JSON
+ERROR_RESPUESTA_NO_VALIDA = "Respuesta no válida de Mistral"
+
+# Formatos de respuesta admitidos en MISTRAL_FORMATO_RESPUESTA
+FORMATOS_RESPUESTA = ("json_schema", "json_object", "text")
+
+# Recibe (posición del bloque en la llamada, receta) en cuanto llega una receta
+AlRecibir = Callable[[int, Dict[str, Any]], None]
 
 
 class MistralClient:
-    """Cliente para interactuar con la API de Mistral."""
+    """Cliente para interactuar con la API de Mistral (u otro backend)."""
 
-    def __init__(self):
-        """Inicializa el cliente con la API key desde variables de entorno."""
-        self.api_key = os.getenv("MISTRAL_API_KEY")
-        if not self.api_key:
-            raise ValueError(
-                "MISTRAL_API_KEY no encontrada en las variables de entorno"
-            )
+    def __init__(self, backend: Optional[BackendExtraccion] = None):
+        """
+        Inicializa el cliente con la configuración de las variables de entorno.
 
-        # Usar Mistral Small para eficiencia y menor costo
-        self.model = "mistral-small-latest"
+        Args:
+            backend: Servidor al que se envían las peticiones (por defecto, el
+                de `EXTRACCION_BACKEND`)
+        """
+        self.backend = backend or crear_backend()
+        self.model = self.backend.modelo
 
-        # Configuración optimizada para tokens (Mistral Small tiene menos context)
         self.max_tokens_output = 2000  # Límite para la respuesta
-        self.context_window = 32000  # Context window de Mistral Small (suficiente)
+        self.context_window = self.backend.context_window
+        # Tokenizador local del modelo para medir bloques y peticiones
+        self.contador = ContadorTokens(self.model)
         self.max_reintentos = int(os.getenv("MISTRAL_MAX_REINTENTOS", "3"))
         self.reintento_delay = float(os.getenv("MISTRAL_REINTENTO_DELAY", "2"))
-        self.delay_entre_llamadas = float(os.getenv("MISTRAL_DELAY_SEG", "1.5"))
-        self._ultimo_llamado = 0.0
+        self.politica = PoliticaReintentos(
+            max_reintentos=self.max_reintentos,
+            espera_base=self.reintento_delay,
+            espera_maxima=float(os.getenv("MISTRAL_REINTENTO_MAX_SEG", "60")),
+        )
+        # Pausa todas las llamadas durante una caída en lugar de recurrir al
+        # fallback regex; MISTRAL_CIRCUITO=false vuelve al comportamiento anterior
+        self.circuito: Optional[CircuitoMistral] = None
+        if os.getenv("MISTRAL_CIRCUITO", "true").lower() == "true":
+            self.circuito = CircuitoMistral(
+                umbral_fallos=int(os.getenv("MISTRAL_CIRCUITO_FALLOS", "5")),
+                pausa=float(os.getenv("MISTRAL_CIRCUITO_PAUSA_SEG", "30")),
+                pausa_maxima=float(os.getenv("MISTRAL_CIRCUITO_PAUSA_MAX_SEG", "300")),
+                caida_maxima=float(os.getenv("MISTRAL_CIRCUITO_CAIDA_MAX_SEG", "1800")),
+            )
+        # Salida JSON validada por la API contra el esquema de recetas
+        self.formato_respuesta = os.getenv("MISTRAL_FORMATO_RESPUESTA", "json_schema")
+        if self.formato_respuesta not in FORMATOS_RESPUESTA:
+            raise ValueError(
+                f"MISTRAL_FORMATO_RESPUESTA debe ser uno de {FORMATOS_RESPUESTA}"
+            )
+        # Variantes del prompt: la compacta primero y, si la respuesta no
+        # cumple el esquema, la de ejemplos
+        self.prompts = cadena_prompts(os.getenv("MISTRAL_PROMPT", MODO_ADAPTATIVO))
+        self.version_prompt = version_cadena(self.prompts)
+        # Respuestas por streaming: cada receta se entrega al cerrarse su objeto
+        self.streaming = os.getenv("MISTRAL_STREAMING", "false").lower() == "true"
+
+        # Duplica las llamadas que no responden en el percentil 90 de las
+        # latencias recientes, con un presupuesto de llamadas de más
+        self.cobertura: Optional[CoberturaLatencia] = None
+        if os.getenv("MISTRAL_COBERTURA", "false").lower() == "true":
+            self.cobertura = CoberturaLatencia(
+                percentil=float(os.getenv("MISTRAL_COBERTURA_PERCENTIL", "0.9")),
+                presupuesto=float(os.getenv("MISTRAL_COBERTURA_PRESUPUESTO", "0.05")),
+                muestras_minimas=int(os.getenv("MISTRAL_COBERTURA_MUESTRAS", "20")),
+            )
+
+        # Ritmo de llamadas según los límites del backend
+        self.limitador = self.backend.crear_limitador()
+
+        # Resultados ya pagados, por modelo + versión del prompt + texto
+        self.cache: Optional[CacheExtracciones] = None
+        self._refrescar_desde = 0.0
+        # Bloques idénticos que se están extrayendo ahora mismo (bucle asíncrono)
+        self._en_vuelo: Dict[bytes, "asyncio.Future[Dict[str, Any]]"] = {}
+        self.configurar_cache(os.getenv("CACHE_LLM", "true").lower() == "true")
+
+    def configurar_cache(self, usar: bool = True, refrescar: bool = False) -> None:
+        """
+        Activa o desactiva la caché de extracciones.
+
+        Args:
+            usar: Consultar y guardar resultados en la caché
+            refrescar: Ignorar las entradas anteriores a este momento (se
+                vuelven a pedir a Mistral y se reemplazan)
+        """
+        if not usar:
+            if self.cache is not None:
+                self.cache.cerrar()
+            self.cache = None
+            return
+        if self.cache is None:
+            self.cache = CacheExtracciones()
+        self._refrescar_desde = time.time() if refrescar else 0.0
+
+    def contar_tokens(self, texto: str) -> int:
+        """Tokens de un texto según el tokenizador del modelo (o su estimación)."""
+        return self.contador.contar(texto)
 
     def calcular_tokens_aproximado(self, texto: str) -> int:
         """
-        Calcula una aproximación de tokens en un texto.
-        Regla general: ~4 caracteres por token en inglés/español.
+        Calcula los tokens de una petición: el texto más el prompt.
 
         Args:
             texto: Texto a calcular
 
         Returns:
-            Número aproximado de tokens
+            Número de tokens (exacto si `mistral-common` está instalado)
         """
-        # Aproximación: 1 token ≈ 4 caracteres (incluyendo espacios y puntuación)
-        tokens = len(texto) // 4
+        return self.contar_tokens(texto) + self._tokens_prompt
 
-        # Agregar tokens para el prompt del sistema
-        prompt_tokens = len(self._crear_prompt_extraccion()) // 4
+    @functools.cached_property
+    def _tokens_prompt(self) -> int:
+        """
+        Tokens del prompt más largo de la cadena (con la instrucción de
+        paquetes), medidos una sola vez: el bloque tiene que caber también
+        si hay que repetirlo con los ejemplos.
+        """
+        return (
+            max(self.contar_tokens(prompt.instrucciones) for prompt in self.prompts)
+            + self.contar_tokens(INSTRUCCION_PAQUETE)
+            + self.contar_tokens(SEPARADOR_TEXTO)
+        )
 
-        return tokens + prompt_tokens
+    @property
+    def max_tokens_bloque(self) -> int:
+        """Tokens máximos del texto de un bloque para que quepa en una llamada."""
+        return self.context_window - self.max_tokens_output - self._tokens_prompt
 
     def verificar_limite_tokens(self, texto_bloque: str) -> bool:
         """
@@ -72,245 +218,827 @@ class MistralClient:
         """
         Extrae recetas de un bloque de texto usando Mistral.
 
+        Args:
+            texto_bloque: Bloque de texto de WhatsApp a procesar
+
+        Returns:
+            Diccionario con las recetas extraídas o error (`desde_cache` indica
+            que no hizo falta llamar a Mistral)
+        """
+        clave, guardado = self._consultar_cache(texto_bloque)
+        if guardado is not None:
+            return guardado
+        resultado = self._llamar(texto_bloque)
+        self._guardar_cache(clave, resultado)
+        return resultado
+
+    async def extraer_receta_async(self, texto_bloque: str) -> Dict[str, Any]:
+        """
+        Versión asíncrona de `extraer_receta` para tener varias llamadas en vuelo.
+
         Args:
             texto_bloque: Bloque de texto de WhatsApp a procesar
 
         Returns:
             Diccionario con las recetas extraídas o error
         """
-        # Verificar límite de tokens
-        if not self.verificar_limite_tokens(texto_bloque):
-            return {
-                "recetas": [],
-                "error": f"Texto demasiado largo ({self.calcular_tokens_aproximado(texto_bloque)} tokens). Límite: {self.context_window - self.max_tokens_output} tokens",
-            }
+        return (await self.extraer_recetas_async([texto_bloque]))[0]
 
-        prompt = self._crear_prompt_extraccion()
+    async def extraer_recetas_async(
+        self, textos: List[str], al_recibir: Optional[AlRecibir] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Extrae las recetas de varios bloques con una sola llamada a Mistral.
 
-        for intento in range(self.max_reintentos):
-            try:
-                self._respetar_intervalo_minimo()
-                # Usar la API con context manager (sintaxis correcta)
-                with Mistral(api_key=self.api_key) as client:
-                    response = client.chat.complete(
-                        model=self.model,
-                        messages=[
-                            {
-                                "role": "user",
-                                "content": f"{prompt}\n\nTexto del chat de WhatsApp:\n{texto_bloque}",
-                            }
-                        ],
-                        temperature=0.1,
-                        max_tokens=self.max_tokens_output,
-                    )
+        La caché se consulta y se actualiza bloque a bloque, y solo se envían
+        los que no están en ella; si un bloque idéntico ya está en vuelo en
+        otra llamada, se espera su respuesta en lugar de repetirlo. Comparte
+        con `extraer_receta` el limitador de peticiones y tokens por minuto,
+        los reintentos y la interpretación de la respuesta.
+
+        Con `MISTRAL_STREAMING=true` y `al_recibir`, cada receta válida se
+        entrega en cuanto llega su objeto completo, sin esperar al resto de
+        la respuesta; esas recetas ya no se repiten en el resultado final
+        (`emitidas` indica cuántas se entregaron), aunque la caché guarda
+        el resultado completo.
 
-                respuesta = response.choices[0].message.content.strip()
-                self._ultimo_llamado = time.time()
-                print(f"  🤖 Respuesta de Mistral ({len(respuesta)} caracteres):")
-                print(f"  📝 {respuesta[:200]}{'...' if len(respuesta) > 200 else ''}")
-
-                # Intentar parsear la respuesta como JSON
-                try:
-                    resultado = json.loads(respuesta)
-
-                    # Si la respuesta tiene el formato nuevo con array de recetas
-                    if isinstance(resultado, dict) and "recetas" in resultado:
-                        return resultado
-                    else:
-                        # Si es el formato antiguo con una sola receta
-                        return {
-                            "recetas": [resultado] if resultado.get("es_receta") else []
-                        }
-
-                except json.JSONDecodeError as e:
-                    print(f"  ❌ Error JSON: {e}")
-                    print(f"  📄 Respuesta completa: {respuesta}")
-
-                    # Intentar extraer JSON de la respuesta si está embebido en texto
-                    json_match = re.search(r"\{.*\}", respuesta, re.DOTALL)
-                    if json_match:
-                        try:
-                            resultado = json.loads(json_match.group())
-                            print(f"  ✅ JSON extraído del texto")
-                            return resultado
-                        except json.JSONDecodeError:
-                            pass
-
-                    # Intentar encontrar recetas en el texto usando regex más simple
-                    print(f"  🔍 Intentando extraer recetas del texto...")
-                    recetas_encontradas = self._extraer_recetas_simple(
-                        texto_bloque, respuesta
+        Args:
+            textos: Textos de los bloques, en el orden del chat
+            al_recibir: Función (posición en `textos`, receta) para las
+                recetas que se entregan antes de terminar la llamada
+
+        Returns:
+            Un resultado por bloque, en el mismo orden que `textos`
+        """
+        resultados: List[Optional[Dict[str, Any]]] = [None] * len(textos)
+        claves: List[Optional[bytes]] = []
+        pedir: List[int] = []
+        # Bloques que ya pide otra llamada (o un bloque anterior de esta)
+        ajenos: Dict[int, "asyncio.Future[Dict[str, Any]]"] = {}
+        propios: Dict[bytes, "asyncio.Future[Dict[str, Any]]"] = {}
+        # Recetas ya entregadas por streaming, por posición en `textos`
+        emitidas: Dict[int, List[Dict[str, Any]]] = {}
+        bucle = asyncio.get_running_loop()
+
+        def recibir(posicion_llamada: int, receta: Dict[str, Any]) -> None:
+            posicion = pedir[posicion_llamada]
+            entregadas = emitidas.setdefault(posicion, [])
+            # Un reintento tras cortarse el stream repite las primeras recetas
+            if receta in entregadas:
+                return
+            entregadas.append(receta)
+            al_recibir(posicion, dict(receta))
+
+        for posicion, texto in enumerate(textos):
+            clave, guardado = self._consultar_cache(texto)
+            claves.append(clave)
+            if guardado is not None:
+                resultados[posicion] = guardado
+                continue
+            if clave is not None:
+                en_vuelo = self._en_vuelo.get(clave)
+                if en_vuelo is not None:
+                    ajenos[posicion] = en_vuelo
+                    continue
+                propios[clave] = self._en_vuelo[clave] = bucle.create_future()
+            pedir.append(posicion)
+
+        try:
+            if pedir:
+                nuevos = await self._llamar_paquete_async(
+                    [textos[i] for i in pedir],
+                    recibir if self.streaming and al_recibir is not None else None,
+                )
+                for posicion, resultado in zip(pedir, nuevos):
+                    clave = claves[posicion]
+                    if clave is not None:
+                        self._guardar_cache(clave, resultado)
+                        propios[clave].set_result(resultado)
+                    resultados[posicion] = self._sin_emitidas(
+                        resultado, emitidas.get(posicion, [])
+                    )
+        finally:
+            for clave, futuro in propios.items():
+                self._en_vuelo.pop(clave, None)
+                if not futuro.done():
+                    futuro.set_result(
+                        {"recetas": [], "error": "Extracción interrumpida"}
                     )
 
-                    if recetas_encontradas:
-                        print(f"  ✅ Recetas extraídas con método simple")
-                        return {"recetas": recetas_encontradas}
+        for posicion, futuro in ajenos.items():
+            resultado = await asyncio.shield(futuro)
+            resultados[posicion] = (
+                resultado
+                if resultado.get("error")
+                else self._marcar_desde_cache(resultado)
+            )
+        return resultados
 
-                    # Si no es JSON válido, devolver array vacío
-                    return {"recetas": [], "error": "Respuesta no válida de Mistral"}
+    async def _llamar_paquete_async(
+        self, textos: List[str], al_recibir: Optional[AlRecibir] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        Envía uno o varios bloques en una llamada y reparte las recetas.
+
+        Si la respuesta de un paquete se cortó, los bloques posteriores al
+        último con recetas se devuelven con error (no se cachean ni se anotan
+        en el registro de huellas, así que se vuelven a pedir). Con
+        `al_recibir` la llamada se hace por streaming.
+        """
+        if len(textos) == 1:
+            recibir = functools.partial(al_recibir, 0) if al_recibir else None
+            return [
+                self._marcar_truncada(await self._llamar_async(textos[0], 1, recibir))
+            ]
+
+        def recibir_paquete(receta: Dict[str, Any]) -> None:
+            receta = dict(receta)
+            al_recibir(bloque_de_receta(receta, autores), receta)
+
+        autores = [autores_bloque(texto) for texto in textos]
+        resultado = await self._llamar_async(
+            componer_paquete(textos),
+            len(textos),
+            recibir_paquete if al_recibir else None,
+        )
+        truncada = resultado.pop("truncada", False)
+        tokens_entrada = resultado.pop("tokens_entrada", 0)
+        resultados = repartir_recetas(resultado, textos)
+        # Los tokens del paquete se reparten según el tamaño de cada bloque
+        total = sum(len(texto) for texto in textos) or 1
+        asignados = 0
+        for posicion, (bloque, texto) in enumerate(zip(resultados, textos)):
+            if posicion == len(textos) - 1:
+                bloque["tokens_entrada"] = tokens_entrada - asignados
+            else:
+                bloque["tokens_entrada"] = tokens_entrada * len(texto) // total
+                asignados += bloque["tokens_entrada"]
+        if truncada:
+            ultimo = max(
+                (i for i, r in enumerate(resultados) if r["recetas"]), default=-1
+            )
+            for posicion, bloque in enumerate(resultados):
+                if posicion == ultimo:
+                    bloque["warning"] = "respuesta_truncada"
+                elif posicion > ultimo:
+                    bloque["error"] = "Respuesta de Mistral truncada antes del bloque"
+        return resultados
+
+    def _llamar(self, texto_bloque: str) -> Dict[str, Any]:
+        """Llama a Mistral (con límite de ritmo y reintentos) sin pasar por la caché."""
+        error_limite = self._comprobar_limite(texto_bloque)
+        if error_limite:
+            return error_limite
+
+        tokens_entrada = 0
+        anteriores: List[Dict[str, Any]] = []
+        for nivel, prompt in enumerate(self.prompts):
+            resultado = self._pedir(texto_bloque, prompt)
+            tokens_entrada += resultado.pop("tokens_entrada", 0)
+            if not self._escalar(resultado, nivel):
+                break
+            anteriores.extend(resultado["recetas"])
+        self._sumar_anteriores(resultado, anteriores)
+        resultado = self._corregir_invalidas(resultado, texto_bloque)
+        resultado["tokens_entrada"] = tokens_entrada + resultado.pop(
+            "tokens_entrada", 0
+        )
+        return self._marcar_truncada(resultado)
+
+    def _pedir(self, texto_bloque: str, prompt: Prompt) -> Dict[str, Any]:
+        """Una petición con un prompt (y sus reintentos), ya interpretada."""
+        tokens = self._tokens_reserva(texto_bloque)
+        intento = 0
+        while True:
+            try:
+                if self.circuito is not None:
+                    self.circuito.esperar()
+                self.limitador.esperar(tokens)
+                peticion = self._peticion(texto_bloque, 1, prompt)
+                response = self.backend.completar(peticion)
+                self._registrar_respuesta()
+                resultado = self._procesar_respuesta(response, tokens, texto_bloque)
+                resultado["tokens_entrada"] = self._tokens_entrada(response, peticion)
+                return resultado
 
             except Exception as e:
-                error_str = str(e)
-                es_capacidad = any(
-                    term in error_str.lower()
-                    for term in ["429", "capacity", "service tier"]
-                )
-                if es_capacidad and intento < self.max_reintentos - 1:
-                    espera = self.reintento_delay * (intento + 1)
-                    print(
-                        f"  ⏳ Error de capacidad, reintento {intento + 1}/{self.max_reintentos - 1} en {espera:.1f}s"
+                espera = self._espera_reintento(e, intento)
+                if espera is None:
+                    return self._resultado_error(e, texto_bloque)
+                time.sleep(espera)
+                intento = self._siguiente_intento(intento)
+
+    async def _llamar_async(
+        self,
+        texto_bloque: str,
+        bloques: int = 1,
+        al_recibir: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """
+        Versión asíncrona de `_llamar`.
+
+        Args:
+            texto_bloque: Texto a enviar (un bloque o un paquete de `bloques`)
+            bloques: Bloques empaquetados en el texto
+            al_recibir: Si se indica, la respuesta se pide por streaming y
+                cada receta válida se pasa a esta función al llegar
+        """
+        error_limite = self._comprobar_limite(texto_bloque)
+        if error_limite:
+            return error_limite
+
+        tokens_entrada = 0
+        anteriores: List[Dict[str, Any]] = []
+        for nivel, prompt in enumerate(self.prompts):
+            # Salvo con el último prompt, las recetas que llegan por streaming
+            # se retienen hasta saber si hay que escalar: el siguiente prompt
+            # las volvería a redactar y se insertarían dos veces
+            retenidas: List[Dict[str, Any]] = []
+            recibir = al_recibir
+            if al_recibir is not None and nivel + 1 < len(self.prompts):
+                recibir = retenidas.append
+            resultado = await self._pedir_async(texto_bloque, prompt, bloques, recibir)
+            tokens_entrada += resultado.pop("tokens_entrada", 0)
+            if not self._escalar(resultado, nivel):
+                for receta in retenidas:
+                    al_recibir(receta)
+                break
+            anteriores.extend(resultado["recetas"])
+        self._sumar_anteriores(resultado, anteriores)
+        resultado = await self._corregir_invalidas_async(resultado, texto_bloque)
+        resultado["tokens_entrada"] = tokens_entrada + resultado.pop(
+            "tokens_entrada", 0
+        )
+        return resultado
+
+    async def _pedir_async(
+        self,
+        texto_bloque: str,
+        prompt: Prompt,
+        bloques: int = 1,
+        al_recibir: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """Versión asíncrona de `_pedir`."""
+        tokens = self._tokens_reserva(texto_bloque, bloques)
+        intento = 0
+        while True:
+            try:
+                if self.circuito is not None:
+                    await self.circuito.esperar_async()
+                await self.limitador.esperar_async(tokens)
+                peticion = self._peticion(texto_bloque, bloques, prompt)
+                if al_recibir is not None:
+                    response = await self._completar_streaming(
+                        peticion, texto_bloque, al_recibir
                     )
-                    time.sleep(espera)
-                    continue
+                else:
+                    response = await self._completar_cubierta(peticion, tokens)
+                self._registrar_respuesta()
+                resultado = self._procesar_respuesta(response, tokens, texto_bloque)
+                resultado["tokens_entrada"] = self._tokens_entrada(response, peticion)
+                return resultado
+
+            except Exception as e:
+                espera = self._espera_reintento(e, intento)
+                if espera is None:
+                    return self._resultado_error(e, texto_bloque)
+                await asyncio.sleep(espera)
+                intento = self._siguiente_intento(intento)
 
-                if es_capacidad:
-                    print("  ⚠️ Aplicando fallback regex por capacidad llena")
-                    recetas_fallback = self._extraer_recetas_simple(texto_bloque, "")
-                    if recetas_fallback:
-                        return {
-                            "recetas": recetas_fallback,
-                            "warning": "fallback_regex",
-                        }
+    async def _completar_streaming(
+        self,
+        peticion: Dict[str, Any],
+        texto_bloque: str,
+        al_recibir: Callable[[Dict[str, Any]], None],
+    ) -> Any:
+        """
+        Pide la respuesta por streaming y entrega cada receta según se cierra.
 
-                return {
-                    "recetas": [],
-                    "error": f"Error en la API de Mistral: {error_str}",
-                }
+        Las recetas se validan completas antes de entregarlas; las que no
+        pasan se quedan para la validación (y corrección) de la respuesta
+        entera.
+
+        Returns:
+            La respuesta reconstruida con la forma de la de `chat.complete`
+        """
+        lector = LectorRecetas()
+        autores = autores_bloque(texto_bloque)
+        partes: List[str] = []
+        fin = None
+        uso = None
+        async for fragmento in self.backend.stream_async(peticion):
+            uso = fragmento.usage or uso
+            if not fragmento.choices:
+                continue
+            eleccion = fragmento.choices[0]
+            fin = eleccion.finish_reason or fin
+            trozo = eleccion.delta.content
+            if not isinstance(trozo, str) or not trozo:
+                continue
+            partes.append(trozo)
+            for receta in lector.alimentar(trozo):
+                normalizada, _ = validar_receta(receta, autores, completa=True)
+                if normalizada is not None:
+                    al_recibir(normalizada)
+
+        mensaje = SimpleNamespace(content="".join(partes))
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=mensaje, finish_reason=fin)], usage=uso
+        )
+
+    async def _completar_cubierta(self, peticion: Dict[str, Any], tokens: int) -> Any:
+        """
+        `completar_async` del backend con cobertura de latencia.
+
+        Si la llamada no ha respondido al cumplirse el percentil de latencia
+        y queda presupuesto, se lanza una copia y se usa la primera respuesta
+        correcta; la otra se cancela. La copia reserva sus propios tokens en
+        el limitador y no se ajustan aunque se cancele, porque el proveedor
+        puede haberla procesado igualmente.
 
+        Al percentil solo va la latencia de la llamada original: la que tardó
+        si responde, o lo que llevaba esperando si se cancela porque ganó la
+        copia. Con la de la ganadora las llamadas lentas no llegarían nunca a
+        la ventana, el umbral iría bajando y se duplicaría cada vez más.
+        """
+        if self.cobertura is None:
+            return await self.backend.completar_async(peticion)
+        cobertura = self.cobertura
+        cobertura.registrar_llamada()
+        inicio = time.monotonic()
+        umbral = cobertura.umbral()
+        original = asyncio.ensure_future(self.backend.completar_async(peticion))
+
+        def anotar_original(tarea: asyncio.Future) -> None:
+            # Una cancelación deja una cota inferior; un error no dice nada
+            if tarea.cancelled() or tarea.exception() is None:
+                cobertura.registrar_latencia(time.monotonic() - inicio)
+
+        original.add_done_callback(anotar_original)
+        llamadas = [original]
+        try:
+            if umbral is not None:
+                hechas, _ = await asyncio.wait(llamadas, timeout=umbral)
+                if not hechas and await asyncio.to_thread(self._permitir_copia, tokens):
+                    print(f"  🪞 Sin respuesta en {umbral:.1f}s: se duplica la llamada")
+                    llamadas.append(
+                        asyncio.ensure_future(self.backend.completar_async(peticion))
+                    )
+            pendientes = set(llamadas)
+            while pendientes:
+                hechas, pendientes = await asyncio.wait(
+                    pendientes, return_when=asyncio.FIRST_COMPLETED
+                )
+                correctas = [tarea for tarea in hechas if tarea.exception() is None]
+                if correctas:
+                    ganadora = original if original in correctas else correctas[0]
+                    if ganadora is not original:
+                        cobertura.registrar_ganada()
+                    return ganadora.result()
+            # Han fallado todas: el error de la original decide el reintento
+            return original.result()
+        finally:
+            for tarea in llamadas:
+                if not tarea.done():
+                    tarea.cancel()
+
+    def _permitir_copia(self, tokens: int) -> bool:
+        """Hay presupuesto y saldo en el limitador para duplicar una llamada ya."""
+        if self._circuito_en_pausa() or not self.cobertura.permitir():
+            return False
+        if not self.limitador.reservar_sin_esperar(tokens):
+            self.cobertura.devolver()
+            return False
+        return True
+
+    @staticmethod
+    def _sin_emitidas(
+        resultado: Dict[str, Any], emitidas: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
+        """Quita del resultado final las recetas ya entregadas por streaming."""
+        if not emitidas:
+            return resultado
+        pendientes = list(emitidas)
+        recetas = []
+        for receta in resultado.get("recetas", []):
+            if receta in pendientes:
+                pendientes.remove(receta)
+            else:
+                recetas.append(receta)
+        return {**resultado, "recetas": recetas, "emitidas": len(emitidas)}
+
+    def utilizacion(self) -> Dict[str, Dict[str, float]]:
+        """Uso actual de los límites de peticiones y tokens por minuto."""
+        return self.limitador.utilizacion()
+
+    def cerrar(self) -> None:
+        """Cierra el cliente HTTP síncrono, sus conexiones, la caché y el limitador."""
+        self.backend.cerrar()
+        if self.cache is not None:
+            self.cache.cerrar()
+        self.limitador.cerrar()
+
+    async def cerrar_async(self) -> None:
+        """Cierra el cliente HTTP asíncrono desde el bucle que lo usa."""
+        await self.backend.cerrar_async()
+
+    def __enter__(self) -> "MistralClient":
+        return self
+
+    def __exit__(self, *excepcion: Any) -> None:
+        self.cerrar()
+
+    def _consultar_cache(
+        self, texto_bloque: str
+    ) -> Tuple[Optional[bytes], Optional[Dict[str, Any]]]:
+        """Devuelve (clave, resultado guardado); la clave es None sin caché."""
+        if self.cache is None:
+            return None, None
+        clave = clave_extraccion(self.model, self.version_prompt, texto_bloque)
+        guardado = self.cache.obtener(clave, no_antes_de=self._refrescar_desde)
+        if guardado is None:
+            return clave, None
+        return clave, self._marcar_desde_cache(guardado)
+
+    def _guardar_cache(self, clave: Optional[bytes], resultado: Dict[str, Any]) -> None:
+        """Guarda un resultado válido (los errores y fallbacks se reintentan)."""
+        if clave is None or self.cache is None:
+            return
+        if resultado.get("error") or resultado.get("warning"):
+            return
+        self.cache.guardar(clave, self._sin_tokens(resultado))
+
+    @staticmethod
+    def _sin_tokens(resultado: Dict[str, Any]) -> Dict[str, Any]:
+        """El resultado sin el recuento de tokens de la llamada que lo obtuvo."""
+        return {
+            clave: valor
+            for clave, valor in resultado.items()
+            if clave != "tokens_entrada"
+        }
+
+    @classmethod
+    def _marcar_desde_cache(cls, resultado: Dict[str, Any]) -> Dict[str, Any]:
+        return {**cls._sin_tokens(resultado), "desde_cache": True}
+
+    def _comprobar_limite(self, texto_bloque: str) -> Optional[Dict[str, Any]]:
+        """Devuelve el error a informar si el bloque no cabe en el contexto."""
+        if self.verificar_limite_tokens(texto_bloque):
+            return None
         return {
             "recetas": [],
-            "error": "Error en la API de Mistral tras múltiples reintentos",
+            "error": f"Texto demasiado largo ({self.calcular_tokens_aproximado(texto_bloque)} tokens). Límite: {self.context_window - self.max_tokens_output} tokens",
         }
 
-    def _respetar_intervalo_minimo(self) -> None:
-        """Espera el tiempo necesario entre llamadas consecutivas a la API."""
-        if self.delay_entre_llamadas <= 0:
-            return
+    def _tokens_reserva(self, texto_bloque: str, bloques: int = 1) -> int:
+        """Tokens a reservar: entrada estimada más la salida máxima."""
+        return self.calcular_tokens_aproximado(texto_bloque) + self._max_tokens_salida(
+            texto_bloque, bloques
+        )
 
-        transcurrido = time.time() - self._ultimo_llamado
-        restante = self.delay_entre_llamadas - transcurrido
+    def _max_tokens_salida(self, texto_bloque: str, bloques: int = 1) -> int:
+        """Salida máxima: la de un bloque por cada bloque, sin salir del contexto."""
+        if bloques == 1:
+            return self.max_tokens_output
+        disponible = self.context_window - self.calcular_tokens_aproximado(texto_bloque)
+        return max(
+            self.max_tokens_output, min(self.max_tokens_output * bloques, disponible)
+        )
 
-        if restante > 0:
-            print(f"  ⏳ Esperando {restante:.1f}s antes de llamar a Mistral")
-            time.sleep(restante)
+    def _peticion(
+        self, texto_bloque: str, bloques: int = 1, prompt: Optional[Prompt] = None
+    ) -> Dict[str, Any]:
+        """
+        Parámetros de la llamada a `chat.complete`.
 
-    def _extraer_recetas_simple(
-        self, texto_original: str, respuesta_mistral: str
-    ) -> List[Dict[str, Any]]:
+        Las instrucciones van en el mensaje de sistema, igual en todas las
+        llamadas con el mismo prompt, y el texto del chat en el de usuario.
         """
-        Método de fallback: extrae recetas directamente del texto usando regex.
+        instrucciones = (prompt or self.prompts[0]).instrucciones
+        if bloques > 1:
+            instrucciones += INSTRUCCION_PAQUETE
+        return {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": instrucciones},
+                {"role": "user", "content": f"{SEPARADOR_TEXTO}{texto_bloque}"},
+            ],
+            "temperature": 0.1,
+            "max_tokens": self._max_tokens_salida(texto_bloque, bloques),
+            **self._formato(bloques > 1),
+        }
 
-        Args:
-            texto_original: Texto del chat original
-            respuesta_mistral: Respuesta de Mistral (para logging)
+    def _formato(self, con_bloque: bool = False) -> Dict[str, Any]:
+        """Parámetro `response_format` según `MISTRAL_FORMATO_RESPUESTA`."""
+        if self.formato_respuesta == "text":
+            return {}
+        if self.formato_respuesta == "json_object":
+            return {"response_format": {"type": "json_object"}}
+        return {
+            "response_format": {
+                "type": "json_schema",
+                "json_schema": {
+                    "name": "recetas",
+                    "schema_definition": esquema_respuesta(con_bloque),
+                    "strict": True,
+                },
+            }
+        }
 
-        Returns:
-            Lista de recetas encontradas
+    def _procesar_respuesta(
+        self, response: Any, tokens_reservados: int, texto_bloque: str
+    ) -> Dict[str, Any]:
         """
-        recetas = []
+        Ajusta el limitador con el uso real e interpreta la respuesta.
+
+        El JSON se lee de forma tolerante (texto alrededor, comas finales,
+        respuesta cortada) y cada receta se valida por separado: las que no
+        cumplen el esquema se devuelven en `invalidas` para volver a pedirlas
+        y `truncada` indica que la respuesta se cortó.
+        """
+        uso = getattr(response, "usage", None)
+        self.limitador.ajustar(tokens_reservados, getattr(uso, "total_tokens", None))
+
+        eleccion = response.choices[0]
+        respuesta = (eleccion.message.content or "").strip()
+        print(f"  🤖 Respuesta de Mistral ({len(respuesta)} caracteres):")
+        print(f"  📝 {respuesta[:200]}{'...' if len(respuesta) > 200 else ''}")
+
+        try:
+            valor, cerrada = cargar_json_tolerante(respuesta)
+        except ValueError as e:
+            print(f"  ❌ Error JSON: {e}")
+            print(f"  📄 Respuesta completa: {respuesta}")
+            return {"recetas": [], "error": ERROR_RESPUESTA_NO_VALIDA}
+
+        truncada = cerrada or getattr(eleccion, "finish_reason", None) == "length"
+        if truncada:
+            print("  ✂️ Respuesta cortada: se conservan las recetas completas")
+        validas, invalidas = validar_recetas(
+            recetas_de_respuesta(valor), autores_bloque(texto_bloque), truncada
+        )
+        resultado: Dict[str, Any] = {"recetas": validas}
+        if invalidas:
+            resultado["invalidas"] = invalidas
+        if truncada:
+            resultado["truncada"] = True
+        return resultado
 
-        # Buscar patrones de recetas en el texto original
-        # Patrón: [fecha] Nombre: receta con ingredientes y pasos
-        patron_receta = r"\[(\d{2}/\d{2}/\d{2}),\s*(\d{2}:\d{2}:\d{2})\]\s*([^:]+):\s*(.+?)(?=\n\[|\n$|$)"
+    def _escalar(self, resultado: Dict[str, Any], nivel: int) -> bool:
+        """Repetir el bloque con el siguiente prompt de la cadena."""
+        if nivel + 1 >= len(self.prompts):
+            return False
+        if not (
+            resultado.get("invalidas")
+            or resultado.get("error") == ERROR_RESPUESTA_NO_VALIDA
+        ):
+            return False
+        print(
+            f"  📚 La respuesta no cumple el esquema: se repite con el prompt "
+            f"'{self.prompts[nivel + 1].nombre}'"
+        )
+        return True
 
-        matches = re.findall(patron_receta, texto_original, re.DOTALL | re.MULTILINE)
+    @staticmethod
+    def _sumar_anteriores(
+        resultado: Dict[str, Any], anteriores: List[Dict[str, Any]]
+    ) -> None:
+        """
+        Añade al resultado las recetas válidas de los prompts anteriores que
+        el último no ha devuelto (mismo bloque, autor y fecha del mensaje).
+        """
+        if not anteriores or resultado.get("error"):
+            return
 
-        for match in matches:
-            fecha, hora, creador, contenido = match
+        def origen(receta: Dict[str, Any]) -> Tuple[Any, Any, Any]:
+            return (
+                receta.get("bloque"),
+                receta.get("creador"),
+                receta.get("fecha_mensaje"),
+            )
 
-            # Verificar si el contenido parece una receta (ingredientes o pasos)
-            contenido_lower = contenido.lower()
+        vistas = {origen(receta) for receta in resultado["recetas"]}
+        for receta in anteriores:
+            if origen(receta) not in vistas:
+                vistas.add(origen(receta))
+                resultado["recetas"].append(receta)
 
-            # Buscar ingredientes (cantidades + palabras de comida)
-            tiene_ingredientes = bool(
-                re.search(r"\d+\s*[gkgmltazas]?\s+[a-zA-Z]", contenido)
-            ) or bool(re.search(r"\d+\s+[a-zA-Z]", contenido))
+    def _tokens_entrada(self, response: Any, peticion: Dict[str, Any]) -> int:
+        """Tokens enviados en una petición: los que indica la API o su estimación."""
+        tokens = getattr(getattr(response, "usage", None), "prompt_tokens", None)
+        if isinstance(tokens, int):
+            return tokens
+        return sum(
+            self.contar_tokens(mensaje["content"]) for mensaje in peticion["messages"]
+        )
 
-            # Buscar pasos de preparación
-            tiene_pasos = bool(
-                re.search(r"\d+\.|\-|\•|hornear|cocinar|freír|mezclar", contenido_lower)
+    def _corregir_invalidas(
+        self, resultado: Dict[str, Any], texto_bloque: str
+    ) -> Dict[str, Any]:
+        """Vuelve a pedir, una a una, las recetas que no cumplen el esquema."""
+        for receta, errores in resultado.pop("invalidas", []):
+            peticion = self._peticion_correccion(receta, errores, texto_bloque)
+            if peticion is None:
+                continue
+            try:
+                if self.circuito is not None:
+                    self.circuito.esperar()
+                self.limitador.esperar(peticion[1])
+                response = self.backend.completar(peticion[0])
+            except Exception as e:
+                print(f"  ⚠️ No se pudo corregir la receta: {e}")
+                self._anotar_error_correccion(e)
+                continue
+            self._registrar_respuesta()
+            resultado["tokens_entrada"] = resultado.get(
+                "tokens_entrada", 0
+            ) + self._tokens_entrada(response, peticion[0])
+            resultado["recetas"].extend(
+                self._receta_corregida(response, peticion[1], receta, texto_bloque)
             )
+        return resultado
 
-            if tiene_ingredientes or tiene_pasos:
-                # Extraer nombre de receta (primera línea o título)
-                lineas = contenido.strip().split("\n")
-                nombre_receta = lineas[0].strip() if lineas else None
+    async def _corregir_invalidas_async(
+        self, resultado: Dict[str, Any], texto_bloque: str
+    ) -> Dict[str, Any]:
+        """Versión asíncrona de `_corregir_invalidas` (correcciones en paralelo)."""
 
-                # Separar ingredientes y pasos
-                ingredientes = ""
-                pasos = ""
+        async def corregir(
+            receta: Any, errores: List[str]
+        ) -> Tuple[List[Dict[str, Any]], int]:
+            peticion = self._peticion_correccion(receta, errores, texto_bloque)
+            if peticion is None:
+                return [], 0
+            try:
+                if self.circuito is not None:
+                    await self.circuito.esperar_async()
+                await self.limitador.esperar_async(peticion[1])
+                response = await self.backend.completar_async(peticion[0])
+            except Exception as e:
+                print(f"  ⚠️ No se pudo corregir la receta: {e}")
+                self._anotar_error_correccion(e)
+                return [], 0
+            self._registrar_respuesta()
+            return (
+                self._receta_corregida(response, peticion[1], receta, texto_bloque),
+                self._tokens_entrada(response, peticion[0]),
+            )
 
-                # Buscar donde terminan los ingredientes y empiezan los pasos
-                ingredientes_end = -1
+        invalidas: List[RecetaInvalida] = resultado.pop("invalidas", [])
+        for corregidas, tokens in await asyncio.gather(
+            *(corregir(receta, errores) for receta, errores in invalidas)
+        ):
+            resultado["recetas"].extend(corregidas)
+            if tokens:
+                resultado["tokens_entrada"] = (
+                    resultado.get("tokens_entrada", 0) + tokens
+                )
+        return resultado
 
-                for i, linea in enumerate(lineas):
-                    if re.search(
-                        r"pasos?|preparación|instrucciones|modo de hacer", linea.lower()
-                    ):
-                        ingredientes_end = i
-                        break
+    def _peticion_correccion(
+        self, receta: Any, errores: List[str], texto_bloque: str
+    ) -> Optional[Tuple[Dict[str, Any], int]]:
+        """
+        Petición para volver a pedir una sola receta, con los mensajes de su
+        autor como contexto (o None si no hay nada que corregir).
 
-                if ingredientes_end > 0:
-                    ingredientes = "\n".join(lineas[:ingredientes_end])
-                    pasos = "\n".join(lineas[ingredientes_end:])
-                else:
-                    # Si no hay separación clara, todo son ingredientes
-                    ingredientes = "\n".join(lineas)
+        Returns:
+            Tupla (parámetros de `chat.complete`, tokens a reservar)
+        """
+        if not isinstance(receta, dict):
+            return None
+        creador = receta.get("creador")
+        mensajes = (
+            mensajes_de_autor(texto_bloque, creador) if isinstance(creador, str) else ""
+        )
+        contenido = PROMPT_CORRECCION.format(
+            errores="; ".join(errores),
+            receta=json.dumps(receta, ensure_ascii=False),
+            mensajes=mensajes or texto_bloque,
+        )
+        print(f"  🔁 Volviendo a pedir una receta: {'; '.join(errores)}")
+        peticion = {
+            "model": self.model,
+            "messages": [{"role": "user", "content": contenido}],
+            "temperature": 0.1,
+            "max_tokens": self.max_tokens_output,
+            **self._formato("bloque" in receta),
+        }
+        return peticion, self.contar_tokens(contenido) + self.max_tokens_output
 
-                # Crear fecha ISO
-                try:
-                    from datetime import datetime
+    def _receta_corregida(
+        self, response: Any, tokens_reservados: int, receta: Any, texto_bloque: str
+    ) -> List[Dict[str, Any]]:
+        """Recetas válidas de la respuesta a una corrección."""
+        uso = getattr(response, "usage", None)
+        self.limitador.ajustar(tokens_reservados, getattr(uso, "total_tokens", None))
+        try:
+            valor, _ = cargar_json_tolerante(response.choices[0].message.content or "")
+        except ValueError:
+            valor = None
+        validas, invalidas = validar_recetas(
+            recetas_de_respuesta(valor), autores_bloque(texto_bloque)
+        )
+        for corregida in validas:
+            if "bloque" in receta and "bloque" not in corregida:
+                corregida["bloque"] = receta["bloque"]
+        if invalidas or valor is None:
+            print("  ❌ La corrección tampoco cumple el esquema; se descarta")
+        return validas
 
-                    fecha_obj = datetime.strptime(
-                        f"20{fecha.replace('/', '-')}", "%Y-%d-%m"
-                    )
-                    fecha_iso = fecha_obj.strftime("%Y-%m-%d") + f"T{hora}:00+00:00"
-                except:
-                    fecha_iso = "2025-01-01T00:00:00+00:00"
-
-                receta = {
-                    "creador": creador.strip(),
-                    "nombre_receta": nombre_receta if nombre_receta else None,
-                    "ingredientes": ingredientes.strip(),
-                    "pasos_preparacion": pasos.strip() if pasos.strip() else None,
-                    "tiene_foto": "imagen" in contenido_lower
-                    or "foto" in contenido_lower,
-                    "fecha_mensaje": fecha_iso,
+    @staticmethod
+    def _marcar_truncada(resultado: Dict[str, Any]) -> Dict[str, Any]:
+        """Convierte la marca interna de respuesta cortada en un aviso."""
+        if resultado.pop("truncada", False):
+            resultado["warning"] = "respuesta_truncada"
+        return resultado
+
+    def _registrar_respuesta(self) -> None:
+        """La API ha respondido: el circuito (si estaba abierto) se cierra."""
+        if self.circuito is not None:
+            self.circuito.registrar_exito()
+
+    def _circuito_en_pausa(self) -> bool:
+        """Hay una caída en curso y las llamadas deben esperar al circuito."""
+        return (
+            self.circuito is not None
+            and self.circuito.abierto
+            and not self.circuito.caida_excedida()
+        )
+
+    def _siguiente_intento(self, intento: int) -> int:
+        """Durante una caída los intentos no cuentan: se espera al circuito."""
+        return 0 if self._circuito_en_pausa() else intento + 1
+
+    def _anotar_error_permanente(self, error: Exception) -> None:
+        """
+        Un error de la petición (con código HTTP) también es una respuesta de
+        la API y cierra el circuito; uno local no dice nada de la caída.
+        """
+        if codigo_http(error) is not None:
+            self._registrar_respuesta()
+        elif self.circuito is not None:
+            self.circuito.cancelar_sondeo()
+
+    def _anotar_error_correccion(self, error: Exception) -> None:
+        """Las correcciones no se reintentan, pero sus errores cuentan en el circuito."""
+        if clasificar_error(error) == ERROR_PERMANENTE:
+            self._anotar_error_permanente(error)
+        elif self.circuito is not None:
+            self.circuito.registrar_fallo(segundos_retry_after(error))
+
+    def _espera_reintento(self, error: Exception, intento: int) -> Optional[float]:
+        """Segundos antes de reintentar, o None si no hay que reintentar."""
+        tipo = clasificar_error(error)
+        if tipo == ERROR_PERMANENTE:
+            self._anotar_error_permanente(error)
+            return None
+        retry_after = segundos_retry_after(error)
+        espera = self.politica.espera(intento, retry_after)
+        if self.circuito is not None:
+            # Un bloque que agota sus reintentos también indica una caída
+            self.circuito.registrar_fallo(retry_after, abrir=espera is None)
+            if self._circuito_en_pausa():
+                # La espera la marca el circuito al volver a intentarlo
+                return 0.0
+        if espera is None:
+            return None
+        print(
+            f"  ⏳ Error de {tipo}, reintento {intento + 1}/{self.max_reintentos - 1} en {espera:.1f}s"
+        )
+        return espera
+
+    def _resultado_error(self, error: Exception, texto_bloque: str) -> Dict[str, Any]:
+        """Resultado a devolver cuando la llamada falla definitivamente."""
+        # Con el circuito, el bloque se devuelve con error y se vuelve a pedir
+        # en la próxima importación en lugar de quedarse con el fallback
+        if self.circuito is None and clasificar_error(error) == ERROR_CAPACIDAD:
+            print("  ⚠️ Aplicando fallback regex por capacidad llena")
+            recetas_fallback = self._extraer_recetas_simple(texto_bloque, "")
+            if recetas_fallback:
+                return {
+                    "recetas": recetas_fallback,
+                    "warning": "fallback_regex",
                 }
 
-                recetas.append(receta)
+        return {
+            "recetas": [],
+            "error": f"Error en la API de Mistral: {error}",
+        }
+
+    def _extraer_recetas_simple(
+        self, texto_original: str, respuesta_mistral: str
+    ) -> List[Dict[str, Any]]:
+        """
+        Método de fallback: extrae recetas directamente del texto usando regex.
 
+        Args:
+            texto_original: Texto del chat original
+            respuesta_mistral: Respuesta de Mistral (para logging)
+
+        Returns:
+            Lista de recetas encontradas
+        """
+        recetas = extraer_recetas_regex(texto_original)
         print(f"  🔄 Fallback encontró {len(recetas)} recetas con regex")
         return recetas
-
-    def _crear_prompt_extraccion(self) -> str:
-        """Crea el prompt para la extracción de recetas."""
-        return """Extrae recetas de este chat. Responde SOLO con JSON válido.
-
-IMPORTANTE:
-- Los INGREDIENTES son OBLIGATORIOS - sin ellos NO es una receta válida
-- Los ingredientes pueden estar marcados con "-", "*", números, o separados por comas
-- Los pasos pueden empezar con números, guiones, o palabras como "mezclar", "hornear", "cocinar"
-- Si encuentras "Ingredientes:" o "Pasos:" úsalos como separadores
-- Combina mensajes del mismo autor si forman parte de la misma receta
-
-Ejemplo 1 (ingredientes en una línea):
-Input: "Charlie Brown: Estofado costilla 1kg costilla, 1kg patatas, 15min olla exprés"
-Output: {"recetas": [{"creador": "Charlie Brown", "nombre_receta": "Estofado costilla", "ingredientes": "1kg costilla, 1kg patatas", "pasos_preparacion": "15min olla exprés", "tiene_foto": false, "fecha_mensaje": "2025-01-01T00:00:00+00:00"}]}
-
-Ejemplo 2 (ingredientes en lista):
-Input: "[01/10/25, 18:02:13] Ana: Ingredientes:\n- 200 g harina\n- 100 g azúcar\n- 2 huevos\nPasos:\n1. Mezclar todo.\n2. Hornear 30 minutos."
-Output: {"recetas": [{"creador": "Ana", "nombre_receta": "Receta de Ana", "ingredientes": "200 g harina, 100 g azúcar, 2 huevos", "pasos_preparacion": "Mezclar todo. Hornear 30 minutos.", "tiene_foto": false, "fecha_mensaje": "2025-10-01T18:02:13+00:00"}]}
-
-Ejemplo 3 (receta con imagen):
-Input: "[02/10/25, 12:10:01] Marta: Receta: Gazpacho\nIngredientes:\n- 1 kg tomates\n- 1 pepino\n- 1 pimiento\nPasos:\nTriturar y refrigerar.\n<adjunto: imagen incluida>"
-Output: {"recetas": [{"creador": "Marta", "nombre_receta": "Gazpacho", "ingredientes": "1 kg tomates, 1 pepino, 1 pimiento", "pasos_preparacion": "Triturar y refrigerar.", "tiene_foto": true, "fecha_mensaje": "2025-10-02T12:10:01+00:00"}]}
-
-REGLAS CRÍTICAS:
-- INGREDIENTES son OBLIGATORIOS - si no hay ingredientes, no es una receta válida
-- Combina todos los ingredientes en un solo campo de texto separado por comas
-- Combina todos los pasos en un solo campo de texto
-- Usa el nombre EXACTO de la persona del mensaje
-- Si hay "<adjunto:" o "imagen" marca "tiene_foto": true
-- Si no hay recetas válidas (sin ingredientes): {"recetas": []}
-- NO agregues texto fuera del JSON"""
@@ -0,0 +1,120 @@
+"""
+Parseo y clasificación en varios procesos para exportaciones muy grandes.
+
+El archivo se parte en tramos que empiezan siempre en una cabecera de
+mensaje (ver `planificar_tramos`); cada proceso parsea su tramo y analiza
+los mensajes con `DetectorReceta`, y los resultados se devuelven en el orden
+del archivo, idénticos a los del recorrido en serie.
+"""
+
+import io
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Deque, Iterator, List, Optional, Tuple
+
+from .chat_parser import Mensaje, ParserWhatsApp, PlanTramos, formato_por_nombre
+from .recipe_matcher import DetectorReceta, RasgosTexto
+
+# Tamaño aproximado de cada tramo que procesa un worker
+BYTES_POR_TRAMO = 4 * 1024 * 1024
+# Tramos en vuelo por worker: limita la memoria si el consumidor va más lento
+TRAMOS_EN_VUELO_POR_WORKER = 2
+
+MensajeAnalizado = Tuple[Mensaje, RasgosTexto]
+
+# Un detector por proceso, creado en la primera tarea que recibe
+_DETECTOR: Optional[DetectorReceta] = None
+
+
+def analizar_tramo(
+    ruta: str,
+    inicio: int,
+    fin: int,
+    formato: str,
+    mes_primero: bool,
+    desde: Optional[int] = None,
+) -> List[MensajeAnalizado]:
+    """
+    Parsea y clasifica los mensajes de un tramo del archivo.
+
+    Args:
+        ruta: Ruta a la exportación
+        inicio: Primer byte del tramo (inicio de una cabecera)
+        fin: Byte donde acaba el tramo
+        formato: Nombre del dialecto detectado para el archivo
+        mes_primero: Si las fechas van en orden mes/día
+        desde: Timestamp del primer mensaje que interesa
+
+    Returns:
+        Lista de pares (mensaje, rasgos) en el orden del archivo
+    """
+    global _DETECTOR
+    if _DETECTOR is None:
+        _DETECTOR = DetectorReceta()
+
+    with open(ruta, "rb") as f:
+        f.seek(inicio)
+        crudo = f.read(fin - inicio)
+    # Igual que en serie: el BOM solo se descarta al principio del archivo y
+    # los saltos de línea se traducen como en un archivo de texto
+    texto = crudo.decode("utf-8-sig" if inicio == 0 else "utf-8")
+    lineas = io.StringIO(texto, newline=None)
+
+    parser = ParserWhatsApp(_DETECTOR.es_linea_receta)
+    mensajes = list(
+        parser.iterar_mensajes(
+            lineas, desde=desde, formato=(formato_por_nombre(formato), mes_primero)
+        )
+    )
+    rasgos = _DETECTOR.analizar_lote(mensaje.mensaje for mensaje in mensajes)
+    return list(zip(mensajes, rasgos))
+
+
+def iterar_analizados_en_paralelo(
+    ruta: Any, plan: PlanTramos, workers: int, desde: Optional[int] = None
+) -> Iterator[MensajeAnalizado]:
+    """
+    Reparte los tramos de un plan entre procesos y devuelve los resultados en orden.
+
+    Solo hay `TRAMOS_EN_VUELO_POR_WORKER` tramos por worker pendientes de
+    consumir, así que la memoria no crece con el tamaño del archivo.
+
+    Args:
+        ruta: Ruta a la exportación
+        plan: Tramos calculados con `planificar_tramos`
+        workers: Número de procesos
+        desde: Timestamp del primer mensaje que interesa
+
+    Yields:
+        Pares (mensaje, rasgos) en el orden del archivo
+    """
+    ruta = os.fspath(ruta)
+    tramos = iter(plan.tramos)
+    pendientes: Deque[Future] = deque()
+    pool = ProcessPoolExecutor(max_workers=workers)
+
+    def enviar_siguiente() -> None:
+        tramo = next(tramos, None)
+        if tramo is not None:
+            pendientes.append(
+                pool.submit(
+                    analizar_tramo,
+                    ruta,
+                    tramo[0],
+                    tramo[1],
+                    plan.formato,
+                    plan.mes_primero,
+                    desde,
+                )
+            )
+
+    try:
+        for _ in range(workers * TRAMOS_EN_VUELO_POR_WORKER):
+            enviar_siguiente()
+        while pendientes:
+            resultado = pendientes.popleft().result()
+            enviar_siguiente()
+            yield from resultado
+    finally:
+        pool.shutdown(cancel_futures=True)
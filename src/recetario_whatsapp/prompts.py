@@ -0,0 +1,103 @@
+"""
+Registro versionado de los prompts de extracción.
+
+Cada bloque se pide primero con una variante compacta, sin ejemplos, y solo
+si su respuesta no cumple el esquema se repite con la variante con ejemplos.
+Las instrucciones van en el mensaje de sistema, que es idéntico en todas las
+llamadas de una misma variante: así el proveedor puede reutilizar ese prefijo
+y solo cambia el mensaje de usuario con el texto del chat.
+
+La versión de cada variante forma parte de la clave de la caché de
+extracciones: hay que subirla al cambiar su texto.
+"""
+
+from typing import Dict, NamedTuple, Tuple
+
+# Modo por defecto de MISTRAL_PROMPT: la variante compacta y, si falla la
+# validación, la de ejemplos
+MODO_ADAPTATIVO = "adaptativo"
+
+
+class Prompt(NamedTuple):
+    """Variante del prompt de extracción."""
+
+    nombre: str
+    version: str
+    instrucciones: str
+
+
+PROMPT_COMPACTO = Prompt(
+    nombre="compacto",
+    version="1",
+    instrucciones="""Extrae las recetas de un chat de WhatsApp. Responde SOLO con JSON válido: {"recetas": [{"creador", "nombre_receta", "ingredientes", "pasos_preparacion", "tiene_foto", "fecha_mensaje"}]}.
+- Sin ingredientes no es una receta; si no hay ninguna: {"recetas": []}
+- creador: nombre EXACTO del autor del mensaje
+- ingredientes: un solo texto separado por comas; pasos_preparacion: un solo texto
+- tiene_foto: true si hay "<adjunto:" o "imagen"
+- fecha_mensaje: fecha del mensaje en ISO 8601, como 2025-10-01T18:02:13+00:00
+- Combina mensajes seguidos del mismo autor que formen una receta""",
+)
+
+PROMPT_EJEMPLOS = Prompt(
+    nombre="ejemplos",
+    version="1",
+    instrucciones="""Extrae recetas de este chat. Responde SOLO con JSON válido.
+
+IMPORTANTE:
+- Los INGREDIENTES son OBLIGATORIOS - sin ellos NO es una receta válida
+- Los ingredientes pueden estar marcados con "-", "*", números, o separados por comas
+- Los pasos pueden empezar con números, guiones, o palabras como "mezclar", "hornear", "cocinar"
+- Si encuentras "Ingredientes:" o "Pasos:" úsalos como separadores
+- Combina mensajes del mismo autor si forman parte de la misma receta
+
+Ejemplo 1 (ingredientes en una línea):
+Input: "Charlie Brown: Estofado costilla 1kg costilla, 1kg patatas, 15min olla exprés"
+Output: {"recetas": [{"creador": "Charlie Brown", "nombre_receta": "Estofado costilla", "ingredientes": "1kg costilla, 1kg patatas", "pasos_preparacion": "15min olla exprés", "tiene_foto": false, "fecha_mensaje": "2025-01-01T00:00:00+00:00"}]}
+
+Ejemplo 2 (ingredientes en lista):
+Input: "[01/10/25, 18:02:13] Ana: Ingredientes:\n- 200 g harina\n- 100 g azúcar\n- 2 huevos\nPasos:\n1. Mezclar todo.\n2. Hornear 30 minutos."
+Output: {"recetas": [{"creador": "Ana", "nombre_receta": "Receta de Ana", "ingredientes": "200 g harina, 100 g azúcar, 2 huevos", "pasos_preparacion": "Mezclar todo. Hornear 30 minutos.", "tiene_foto": false, "fecha_mensaje": "2025-10-01T18:02:13+00:00"}]}
+
+Ejemplo 3 (receta con imagen):
+Input: "[02/10/25, 12:10:01] Marta: Receta: Gazpacho\nIngredientes:\n- 1 kg tomates\n- 1 pepino\n- 1 pimiento\nPasos:\nTriturar y refrigerar.\n<adjunto: imagen incluida>"
+Output: {"recetas": [{"creador": "Marta", "nombre_receta": "Gazpacho", "ingredientes": "1 kg tomates, 1 pepino, 1 pimiento", "pasos_preparacion": "Triturar y refrigerar.", "tiene_foto": true, "fecha_mensaje": "2025-10-02T12:10:01+00:00"}]}
+
+REGLAS CRÍTICAS:
+- INGREDIENTES son OBLIGATORIOS - si no hay ingredientes, no es una receta válida
+- Combina todos los ingredientes en un solo campo de texto separado por comas
+- Combina todos los pasos en un solo campo de texto
+- Usa el nombre EXACTO de la persona del mensaje
+- Si hay "<adjunto:" o "imagen" marca "tiene_foto": true
+- Si no hay recetas válidas (sin ingredientes): {"recetas": []}
+- NO agregues texto fuera del JSON""",
+)
+
+PROMPTS: Dict[str, Prompt] = {
+    prompt.nombre: prompt for prompt in (PROMPT_COMPACTO, PROMPT_EJEMPLOS)
+}
+
+
+def cadena_prompts(modo: str = MODO_ADAPTATIVO) -> Tuple[Prompt, ...]:
+    """
+    Variantes a probar, en orden, para cada bloque.
+
+    Args:
+        modo: `adaptativo` (compacta y, si no valida, con ejemplos) o el
+            nombre de una variante para usar siempre esa
+
+    Returns:
+        Tupla de prompts; cada uno solo se usa si la respuesta al anterior
+        no cumple el esquema
+    """
+    if modo == MODO_ADAPTATIVO:
+        return (PROMPT_COMPACTO, PROMPT_EJEMPLOS)
+    if modo in PROMPTS:
+        return (PROMPTS[modo],)
+    raise ValueError(
+        f"MISTRAL_PROMPT debe ser '{MODO_ADAPTATIVO}' o uno de {tuple(PROMPTS)}"
+    )
+
+
+def version_cadena(cadena: Tuple[Prompt, ...]) -> str:
+    """Versión de una cadena de prompts, para la clave de la caché."""
+    return "+".join(f"{prompt.nombre}-{prompt.version}" for prompt in cadena)
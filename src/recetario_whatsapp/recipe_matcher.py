@@ -0,0 +1,373 @@
+"""
+Heurísticas para reconocer recetas en mensajes de WhatsApp.
+
+Todas las palabras clave y patrones de cantidad se compilan una sola vez en
+una única expresión regular, de modo que cada texto se recorre una vez para
+obtener todos sus rasgos.
+"""
+
+import re
+from typing import Any, Dict, Iterable, List, NamedTuple
+
+# Palabras clave que indican inicio de receta
+INDICADORES_RECETA = ("receta:", "receta de", "ingredientes:", "receta")
+
+# Palabras que sugieren nombres de recetas
+PALABRAS_RECETA = (
+    "estofado",
+    "flan",
+    "torta",
+    "salsa",
+    "guiso",
+    "sopa",
+    "ensalada",
+    "pasta",
+    "arroz",
+    "pescado",
+    "carne",
+    "pollo",
+    "verduras",
+    "costilla",
+    "milagros",
+    "teriyaki",
+    "césar",
+    "patatas",
+)
+
+# Para casos sin indicador específico, ser más permisivo
+PALABRAS_COCINA = (
+    "hornear",
+    "cocinar",
+    "mezclar",
+    "batir",
+    "freír",
+    "asar",
+    "hervir",
+    "15min",
+    "olla",
+)
+
+# Palabras clave de continuación (incluye marcadores de lista y acciones de cocina)
+PALABRAS_CONTINUACION = (
+    "ingredientes",
+    "pasos",
+    "preparación",
+    "receta",
+    "-",
+    "•",
+    "*",
+    "mezclar",
+    "hornear",
+    "cocinar",
+    "batir",
+    "revolver",
+)
+
+# Palabras que sugieren ingredientes o pasos en una línea sin cabecera
+PALABRAS_LINEA = (
+    "hornear",
+    "cocinar",
+    "mezclar",
+    "batir",
+    "freír",
+    "asar",
+    "hervir",
+    "min",
+    "hora",
+    "minutos",
+    "pasos",
+    "preparación",
+    "ingredientes",
+    "elaboración",
+    "instrucciones",
+    "olla",
+    "sartén",
+    "tomates",
+    "cebolla",
+    "ajo",
+    "pimiento",
+    "patatas",
+    "carne",
+    "pollo",
+    "pescado",
+    "arroz",
+    "pasta",
+    "salsa",
+    "estofado",
+    "guiso",
+    "sopa",
+)
+
+# Mensajes del sistema de WhatsApp que nunca son receta
+PALABRAS_SISTEMA = ("multimedia omitido", "cifrado", "extremo a extremo")
+
+# Unidades tras un número. Basta con que el texto empiece por ellas, así que
+# "g" cubre "gr" y "gramos", "onz" cubre "onzas" y "unidade" equivale al
+# patrón histórico `unidades?`.
+UNIDADES_RECETA = (
+    "g",
+    "kg",
+    "ml",
+    "l",
+    "lt",
+    "onz",
+    "taza",
+    "cucharada",
+    "cuch",
+    "cda",
+    "cdita",
+    "pieza",
+    "unidade",
+    "ud",
+    "pz",
+    "gr",
+    "mg",
+    "cl",
+    "dl",
+)
+# Conjunto más estricto usado para continuaciones y líneas sueltas
+UNIDADES_SIMPLES = (
+    "g",
+    "kg",
+    "ml",
+    "l",
+    "lt",
+    "cucharada",
+    "cuch",
+    "cda",
+    "taza",
+    "onza",
+    "pieza",
+)
+
+_INDICADOR = 1
+_PALABRA_RECETA = 2
+_PALABRA_COCINA = 4
+_PALABRA_CONTINUACION = 8
+_PALABRA_LINEA = 16
+_SISTEMA = 32
+_CANTIDAD = 64
+_CANTIDAD_SIMPLE = 128
+
+_PATRON_INICIO = re.compile(r"\s*(?:(?P<lista>[-•*]\s)|(?P<numero>\d))")
+
+
+class RasgosTexto(NamedTuple):
+    """Rasgos de un texto relevantes para decidir si es (parte de) una receta."""
+
+    indicador: bool
+    palabra_receta: bool
+    palabra_cocina: bool
+    palabra_continuacion: bool
+    palabra_linea: bool
+    mensaje_sistema: bool
+    cantidad: bool
+    cantidad_simple: bool
+    marcador_lista: bool
+    paso_numerado: bool
+    texto_corto: bool
+    vacio: bool
+
+    @property
+    def es_receta(self) -> bool:
+        """Un mensaje individual parece contener una receta."""
+        # Considerar receta si:
+        # 1. Tiene indicador específico
+        # 2. Tiene palabras de receta + cantidades
+        # 3. Tiene palabras de receta + parece nombre corto
+        if self.indicador:
+            return True
+        if self.palabra_receta and (self.cantidad or self.texto_corto):
+            return True
+        return self.cantidad and self.palabra_cocina
+
+    @property
+    def es_continuacion(self) -> bool:
+        """Un mensaje parece continuación de una receta."""
+        return (
+            self.marcador_lista
+            or self.paso_numerado
+            or self.palabra_continuacion
+            or self.cantidad_simple
+        )
+
+    @property
+    def es_linea_receta(self) -> bool:
+        """Una línea sin formato de WhatsApp podría ser parte de una receta."""
+        if self.vacio or self.mensaje_sistema:
+            return False
+        return (
+            self.cantidad_simple
+            or self.marcador_lista
+            or self.paso_numerado
+            or self.palabra_linea
+        )
+
+
+class DetectorReceta:
+    """Motor de coincidencias precompilado para las heurísticas de receta."""
+
+    def __init__(self):
+        """Compila las palabras clave y las unidades en un único patrón."""
+        categorias = (
+            (INDICADORES_RECETA, _INDICADOR),
+            (PALABRAS_RECETA, _PALABRA_RECETA),
+            (PALABRAS_COCINA, _PALABRA_COCINA),
+            (PALABRAS_CONTINUACION, _PALABRA_CONTINUACION),
+            (PALABRAS_LINEA, _PALABRA_LINEA),
+            (PALABRAS_SISTEMA, _SISTEMA),
+        )
+        self._mascaras_palabras = self._construir_mascaras(categorias)
+        self._mascaras_unidades = self._construir_mascaras(
+            ((UNIDADES_RECETA, _CANTIDAD), (UNIDADES_SIMPLES, _CANTIDAD_SIMPLE))
+        )
+
+        # La alternativa más larga va primero; las más cortas que empiezan en la
+        # misma posición son prefijos suyos y ya están incluidas en su máscara.
+        # El lookahead no consume texto, así que se prueban todas las posiciones
+        # y también se detectan coincidencias solapadas.
+        palabras = self._alternativa(self._mascaras_palabras)
+        unidades = self._alternativa(self._mascaras_unidades)
+        nucleo = rf"(?=(?P<palabra>{palabras})|\d+\s*(?P<unidad>{unidades}))"
+        self._patron = re.compile(nucleo)
+        # Para lotes: los textos se unen con \x00, que no forma parte de
+        # ninguna palabra clave ni de `\s`, y marca el paso al siguiente texto
+        self._patron_lote = re.compile(rf"{nucleo}|(?P<separador>\x00)")
+
+    def analizar(self, texto: str) -> RasgosTexto:
+        """
+        Obtiene todos los rasgos de un texto en una sola pasada.
+
+        Args:
+            texto: Mensaje o línea a analizar (no hace falta pasarlo a minúsculas)
+
+        Returns:
+            Rasgos del texto
+        """
+        mascara = 0
+        mascaras_palabras = self._mascaras_palabras
+        mascaras_unidades = self._mascaras_unidades
+        for match in self._patron.finditer(texto.lower()):
+            palabra, unidad = match.groups()
+            if palabra is not None:
+                mascara |= mascaras_palabras[palabra]
+            else:
+                mascara |= mascaras_unidades[unidad]
+        return self._rasgos(texto, mascara)
+
+    def analizar_lote(self, textos: Iterable[str]) -> List[RasgosTexto]:
+        """
+        Analiza una lista de textos con un único recorrido del patrón.
+
+        Args:
+            textos: Mensajes a clasificar
+
+        Returns:
+            Rasgos de cada texto, en el mismo orden
+        """
+        textos = list(textos)
+        # Un \x00 dentro de un texto se confundiría con el separador; \x01
+        # tampoco forma parte de ningún patrón, así que el resultado no cambia
+        unido = "\x00".join(
+            texto.replace("\x00", "\x01") if "\x00" in texto else texto
+            for texto in textos
+        )
+        mascaras = [0] * len(textos)
+        mascaras_palabras = self._mascaras_palabras
+        mascaras_unidades = self._mascaras_unidades
+        indice = 0
+        for match in self._patron_lote.finditer(unido.lower()):
+            palabra, unidad, separador = match.groups()
+            if separador is not None:
+                indice += 1
+            elif palabra is not None:
+                mascaras[indice] |= mascaras_palabras[palabra]
+            else:
+                mascaras[indice] |= mascaras_unidades[unidad]
+        return [self._rasgos(t, m) for t, m in zip(textos, mascaras)]
+
+    def es_receta(self, texto: str) -> bool:
+        """Determina si un mensaje individual parece contener una receta."""
+        return self.analizar(texto).es_receta
+
+    def es_continuacion(self, texto: str) -> bool:
+        """Determina si un mensaje parece ser continuación de una receta."""
+        return self.analizar(texto).es_continuacion
+
+    def es_linea_receta(self, texto: str) -> bool:
+        """Determina si una línea sin formato de WhatsApp podría ser parte de una receta."""
+        return self.analizar(texto).es_linea_receta
+
+    @staticmethod
+    def _rasgos(texto: str, mascara: int) -> RasgosTexto:
+        inicio = _PATRON_INICIO.match(texto)
+        return RasgosTexto(
+            indicador=bool(mascara & _INDICADOR),
+            palabra_receta=bool(mascara & _PALABRA_RECETA),
+            palabra_cocina=bool(mascara & _PALABRA_COCINA),
+            palabra_continuacion=bool(mascara & _PALABRA_CONTINUACION),
+            palabra_linea=bool(mascara & _PALABRA_LINEA),
+            mensaje_sistema=bool(mascara & _SISTEMA),
+            cantidad=bool(mascara & _CANTIDAD),
+            cantidad_simple=bool(mascara & _CANTIDAD_SIMPLE),
+            marcador_lista=bool(inicio and inicio.group("lista")),
+            paso_numerado=bool(inicio and inicio.group("numero")),
+            # maxsplit acota el trabajo: solo importa si hay más de 3 palabras
+            texto_corto=len(texto.split(None, 3)) <= 3,
+            vacio=not texto.strip(),
+        )
+
+    @staticmethod
+    def _construir_mascaras(categorias) -> Dict[str, int]:
+        """Asigna a cada término las categorías de todos sus prefijos."""
+        mascaras: Dict[str, int] = {}
+        for terminos, bit in categorias:
+            for termino in terminos:
+                mascaras[termino] = mascaras.get(termino, 0) | bit
+        return {
+            termino: _mascara_con_prefijos(termino, mascaras) for termino in mascaras
+        }
+
+    @staticmethod
+    def _alternativa(mascaras: Dict[str, int]) -> str:
+        return _regex_trie(mascaras)
+
+
+def _regex_trie(terminos: Iterable[str]) -> str:
+    """
+    Construye una alternativa factorizada por prefijos comunes.
+
+    `("olla", "onz")` da `o(?:lla|nz)`: en cada posición el motor solo mira el
+    primer carácter en lugar de probar todos los términos uno a uno. Entre
+    alternativas gana siempre la más larga, igual que ordenando por longitud.
+    """
+    arbol: Dict[str, Any] = {}
+    for termino in terminos:
+        nodo = arbol
+        for caracter in termino:
+            nodo = nodo.setdefault(caracter, {})
+        nodo[""] = {}
+
+    def construir(nodo: Dict[str, Any]) -> str:
+        ramas = [
+            re.escape(caracter) + construir(hijo)
+            for caracter, hijo in sorted(nodo.items())
+            if caracter
+        ]
+        if not ramas:
+            return ""
+        opcional = "" in nodo
+        if len(ramas) == 1 and not opcional:
+            return ramas[0]
+        alternativa = "(?:" + "|".join(ramas) + ")"
+        return alternativa + "?" if opcional else alternativa
+
+    return construir(arbol)
+
+
+def _mascara_con_prefijos(termino: str, mascaras: Dict[str, int]) -> int:
+    mascara = 0
+    for otro, bits in mascaras.items():
+        if termino.startswith(otro):
+            mascara |= bits
+    return mascara
@@ -0,0 +1,140 @@
+"""
+Extracción local, por reglas, de recetas con secciones explícitas.
+
+Muchas recetas de los grupos siguen la plantilla "Receta: X / Ingredientes: /
+Pasos:". Esas se pueden leer sin Mistral: este módulo reconoce las marcas de
+sección y devuelve el mismo resultado que `MistralClient.extraer_receta`
+(`{"recetas": [...]}`). Ante cualquier duda (varias recetas, texto suelto
+antes de los ingredientes, secciones vacías o desordenadas) no devuelve nada
+y el bloque se envía a Mistral como siempre.
+"""
+
+import re
+from typing import Any, Dict, List, Optional
+
+from .adjuntos import adjuntos_referenciados
+from .esquema import fecha_iso
+
+# Origen que se anota en los resultados extraídos por reglas
+ORIGEN_REGLAS = "reglas"
+# Un título suelto antes de los ingredientes no suele ser más largo
+MAX_CARACTERES_TITULO = 80
+# Una línea que acaba así es conversación ("¡Probad esta receta!"), no un título
+_FINALES_FRASE = (".", "!", "?", "…")
+
+# Cabecera de cada mensaje formateado como "[fecha] autor: texto"
+_PATRON_CABECERA = re.compile(r"^\[(?P<fecha>[^\]\n]+)\] (?P<creador>[^:\n]+): ", re.M)
+# Viñetas, negritas y numeración al principio de una línea
+_PATRON_VINETA = re.compile(
+    r"^[\s*_•·▪►>\-–—]*(?:(?:paso\s*)?\d{1,2}\s*[.)º:-](?!\d)\s*)?"
+)
+# "Receta: Gazpacho", "*Receta*: Gazpacho", "Nombre: Gazpacho"
+_PATRON_NOMBRE = re.compile(
+    r"^[\s*_]*(?:receta|nombre)[\s*_]*:[\s*_]*(?P<nombre>.*?)[\s*_]*$", re.I
+)
+# Marcas de sección, con o sin dos puntos y con el contenido en la misma línea
+_PATRON_SECCION = re.compile(
+    r"^[\s*_•·#-]*(?P<seccion>ingredientes"
+    r"|pasos|preparaci[oó]n|elaboraci[oó]n|instrucciones"
+    r"|modo de (?:preparaci[oó]n|hacerlo|elaboraci[oó]n))"
+    r"[\s*_]*(?::[\s*_]*(?P<resto>.*?))?[\s*_]*$",
+    re.I,
+)
+# Avisos de WhatsApp en lugar de una foto
+_PATRON_FOTO = re.compile(r"imagen omitida|image omitted|<multimedia omitido>", re.I)
+
+
+def extraer_receta_por_reglas(texto: str) -> Optional[Dict[str, Any]]:
+    """
+    Extrae la receta de un bloque si sigue la plantilla de secciones.
+
+    Args:
+        texto: Texto de un bloque (mensajes formateados "[fecha] autor: texto")
+
+    Returns:
+        `{"recetas": [receta], "origen": "reglas"}` con los mismos campos que
+        devuelve Mistral, o None si el bloque no es inequívoco
+    """
+    cabeceras = list(_PATRON_CABECERA.finditer(texto))
+    if not cabeceras or cabeceras[0].start() != 0:
+        return None
+    creador = cabeceras[0].group("creador").strip()
+    fecha_mensaje = fecha_iso(cabeceras[0].group("fecha"))
+    if fecha_mensaje is None:
+        return None
+
+    # Contenido de los mensajes sin las cabeceras, línea a línea
+    lineas: List[str] = []
+    for numero, cabecera in enumerate(cabeceras):
+        final = cabeceras[numero + 1].start() if numero + 1 < len(cabeceras) else None
+        lineas.extend(texto[cabecera.end() : final].splitlines())
+
+    nombre: Optional[str] = None
+    sueltas: List[str] = []
+    ingredientes: Optional[List[str]] = None
+    pasos: Optional[List[str]] = None
+    actual: Optional[List[str]] = None
+    tiene_foto = False
+
+    for linea in lineas:
+        linea = linea.strip(" \t\u200e")
+        if not linea:
+            continue
+        if adjuntos_referenciados(linea) or _PATRON_FOTO.search(linea):
+            tiene_foto = True
+            continue
+
+        seccion = _PATRON_SECCION.match(linea)
+        if seccion:
+            es_ingredientes = seccion.group("seccion").lower() == "ingredientes"
+            # Una sola sección de cada tipo y los ingredientes antes que los pasos
+            if es_ingredientes and ingredientes is None and pasos is None:
+                actual = ingredientes = []
+            elif not es_ingredientes and ingredientes is not None and pasos is None:
+                actual = pasos = []
+            else:
+                return None
+            if seccion.group("resto"):
+                actual.append(seccion.group("resto"))
+            continue
+
+        marca_nombre = _PATRON_NOMBRE.match(linea)
+        if marca_nombre:
+            # Una segunda marca de receta indica varias recetas en el bloque
+            if nombre is not None or actual is not None:
+                return None
+            nombre = marca_nombre.group("nombre")
+            continue
+
+        if actual is None:
+            sueltas.append(linea)
+        else:
+            elemento = _PATRON_VINETA.sub("", linea).strip()
+            if elemento:
+                actual.append(elemento)
+
+    if not ingredientes or not pasos:
+        return None
+    # Sin marca de nombre se admite como mucho una línea corta de título
+    if len(sueltas) > int(nombre is None):
+        return None
+    if sueltas:
+        titulo = sueltas[0].strip(" *_:")
+        if len(titulo) > MAX_CARACTERES_TITULO or titulo.endswith(_FINALES_FRASE):
+            return None
+        nombre = titulo
+
+    receta = {
+        "creador": creador,
+        "nombre_receta": nombre or f"Receta de {creador}",
+        "ingredientes": ", ".join(elemento.rstrip(" ,;.") for elemento in ingredientes),
+        "pasos_preparacion": " ".join(_cerrar_frase(paso) for paso in pasos),
+        "tiene_foto": tiene_foto,
+        "fecha_mensaje": fecha_mensaje,
+    }
+    return {"recetas": [receta], "origen": ORIGEN_REGLAS}
+
+
+def _cerrar_frase(paso: str) -> str:
+    """Termina un paso en punto para poder unirlos en un solo párrafo."""
+    return paso if paso.endswith(_FINALES_FRASE) else f"{paso}."
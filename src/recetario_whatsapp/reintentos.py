@@ -0,0 +1,304 @@
+"""
+Reintentos de las llamadas a Mistral y circuito para las caídas prolongadas.
+
+Los errores se clasifican por tipo (capacidad, servidor, red o permanentes)
+a partir del código HTTP de la excepción y no de su texto. Los transitorios
+se reintentan con espera exponencial y jitter, respetando `Retry-After`
+cuando la API lo envía, para que los trabajadores no reintenten a la vez.
+
+Si los fallos transitorios se encadenan, el circuito se abre y todas las
+llamadas esperan juntas en lugar de agotar sus reintentos; pasada la pausa
+sale una sola llamada de prueba y, si responde, el circuito se cierra y la
+extracción continúa donde estaba.
+"""
+
+import asyncio
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Optional
+
+import httpx
+from mistralai.models import NoResponseError
+
+# Tipos de error según `clasificar_error`
+ERROR_CAPACIDAD = "capacidad"
+ERROR_SERVIDOR = "servidor"
+ERROR_RED = "red"
+ERROR_PERMANENTE = "permanente"
+
+# Códigos HTTP de un servidor saturado o caído momentáneamente
+_ESTADOS_SERVIDOR = {408, 500, 502, 503, 504}
+# Mensajes de capacidad de Mistral (también en excepciones sin código HTTP)
+_TEXTOS_CAPACIDAD = ("429", "capacity", "service tier")
+# Con el circuito medio abierto, cada cuánto miran las demás llamadas si la
+# llamada de prueba ha terminado
+ESPERA_SONDEO = 1.0
+
+
+def clasificar_error(error: Exception) -> str:
+    """
+    Tipo de un error de la API.
+
+    Args:
+        error: Excepción lanzada por el SDK de Mistral o por httpx
+
+    Returns:
+        Uno de `ERROR_CAPACIDAD`, `ERROR_SERVIDOR`, `ERROR_RED` o
+        `ERROR_PERMANENTE`
+    """
+    estado = codigo_http(error)
+    if estado == 429:
+        return ERROR_CAPACIDAD
+    if estado in _ESTADOS_SERVIDOR:
+        # Mistral responde 503 cuando el nivel contratado no tiene capacidad
+        if any(texto in str(error).lower() for texto in _TEXTOS_CAPACIDAD[1:]):
+            return ERROR_CAPACIDAD
+        return ERROR_SERVIDOR
+    if estado is not None:
+        return ERROR_PERMANENTE
+    if isinstance(
+        error, (httpx.TransportError, NoResponseError, TimeoutError, ConnectionError)
+    ):
+        return ERROR_RED
+    if any(texto in str(error).lower() for texto in _TEXTOS_CAPACIDAD):
+        return ERROR_CAPACIDAD
+    return ERROR_PERMANENTE
+
+
+def segundos_retry_after(error: Exception) -> Optional[float]:
+    """Segundos que pide esperar la cabecera `Retry-After` (None si no viene)."""
+    cabeceras = getattr(error, "headers", None)
+    if cabeceras is None:
+        respuesta = getattr(error, "response", None) or getattr(
+            error, "raw_response", None
+        )
+        cabeceras = getattr(respuesta, "headers", None)
+    if not cabeceras:
+        return None
+
+    milisegundos = cabeceras.get("retry-after-ms")
+    if milisegundos:
+        try:
+            return max(0.0, float(milisegundos) / 1000)
+        except ValueError:
+            pass
+    valor = cabeceras.get("retry-after")
+    if not valor:
+        return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        pass
+    # También puede ser una fecha HTTP
+    try:
+        fecha = parsedate_to_datetime(valor)
+    except (TypeError, ValueError):
+        return None
+    if fecha.tzinfo is None:
+        fecha = fecha.replace(tzinfo=timezone.utc)
+    return max(0.0, (fecha - datetime.now(timezone.utc)).total_seconds())
+
+
+class PoliticaReintentos:
+    """Espera exponencial con jitter entre los intentos de una llamada."""
+
+    def __init__(
+        self,
+        max_reintentos: int = 3,
+        espera_base: float = 2.0,
+        espera_maxima: float = 60.0,
+        aleatorio: Callable[[], float] = random.random,
+    ):
+        """
+        Inicializa la política.
+
+        Args:
+            max_reintentos: Intentos totales de cada llamada
+            espera_base: Espera máxima tras el primer fallo; se dobla en cada
+                intento
+            espera_maxima: Tope de la espera exponencial
+            aleatorio: Fuente de números en [0, 1) para el jitter
+        """
+        self.max_reintentos = max(1, max_reintentos)
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+        self._aleatorio = aleatorio
+
+    def espera(
+        self, intento: int, retry_after: Optional[float] = None
+    ) -> Optional[float]:
+        """
+        Segundos antes del siguiente intento.
+
+        Args:
+            intento: Intento que acaba de fallar (empezando en 0)
+            retry_after: Espera pedida por la API, si la indicó
+
+        Returns:
+            La espera, o None si ya no quedan intentos
+        """
+        if intento >= self.max_reintentos - 1:
+            return None
+        # Mitad fija y mitad aleatoria: nunca reintenta de inmediato y los
+        # trabajadores que fallaron a la vez no vuelven a coincidir
+        techo = min(self.espera_maxima, self.espera_base * 2**intento)
+        espera = techo / 2 + self._aleatorio() * techo / 2
+        if retry_after is not None:
+            espera = retry_after + self._aleatorio() * self.espera_base
+        return espera
+
+
+class CircuitoMistral:
+    """
+    Circuito que pausa todas las llamadas durante una caída de la API.
+
+    Cerrado, las llamadas salen sin esperar. Tras `umbral_fallos` errores
+    transitorios seguidos (o cuando una llamada agota sus reintentos) se
+    abre durante `pausa` segundos (o lo que pida `Retry-After`); luego deja
+    salir una llamada de prueba: si responde se cierra y, si vuelve a
+    fallar, se abre de nuevo con el doble de pausa, hasta `pausa_maxima`.
+    """
+
+    def __init__(
+        self,
+        umbral_fallos: int = 5,
+        pausa: float = 30.0,
+        pausa_maxima: float = 300.0,
+        caida_maxima: float = 1800.0,
+        reloj: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Inicializa el circuito cerrado.
+
+        Args:
+            umbral_fallos: Errores transitorios seguidos que lo abren
+            pausa: Segundos que permanece abierto la primera vez
+            pausa_maxima: Tope de la pausa al reabrirse
+            caida_maxima: Segundos de caída a partir de los cuales las
+                llamadas dejan de esperar y devuelven su error
+            reloj: Función que da el instante actual en segundos
+        """
+        self.umbral_fallos = max(1, umbral_fallos)
+        self.pausa = pausa
+        self.pausa_maxima = max(pausa, pausa_maxima)
+        self.caida_maxima = caida_maxima
+        self._reloj = reloj
+        self._fallos = 0
+        self._pausa_actual = pausa
+        # Instante en que termina la pausa (None con el circuito cerrado)
+        self._abierto_hasta: Optional[float] = None
+        self._abierto_desde: Optional[float] = None
+        # Hay una llamada de prueba en curso
+        self._sondeo = False
+        self._lock = threading.Lock()
+
+    @property
+    def abierto(self) -> bool:
+        """El circuito está abierto o esperando el resultado de la prueba."""
+        return self._abierto_hasta is not None
+
+    def caida_excedida(self) -> bool:
+        """La caída dura ya más de `caida_maxima` segundos."""
+        desde = self._abierto_desde
+        return desde is not None and self._reloj() - desde > self.caida_maxima
+
+    def reservar(self) -> float:
+        """
+        Pide paso para una llamada.
+
+        Returns:
+            Segundos que hay que esperar antes de volver a pedirlo (0 si la
+            llamada puede salir ya)
+        """
+        with self._lock:
+            if self._abierto_hasta is None or self.caida_excedida():
+                return 0.0
+            restante = self._abierto_hasta - self._reloj()
+            if restante > 0:
+                return restante
+            if self._sondeo:
+                return ESPERA_SONDEO
+            self._sondeo = True
+            print("  🔌 Probando si Mistral vuelve a responder")
+            return 0.0
+
+    def registrar_exito(self) -> None:
+        """Una llamada ha recibido respuesta: cierra el circuito."""
+        with self._lock:
+            if self._abierto_hasta is not None:
+                print("  🔌 Mistral vuelve a responder: se reanuda la extracción")
+            self._fallos = 0
+            self._pausa_actual = self.pausa
+            self._abierto_hasta = None
+            self._abierto_desde = None
+            self._sondeo = False
+
+    def registrar_fallo(
+        self, retry_after: Optional[float] = None, abrir: bool = False
+    ) -> None:
+        """
+        Anota un error transitorio y abre el circuito si procede.
+
+        Args:
+            retry_after: Espera pedida por la API, si la indicó
+            abrir: Abrirlo aunque no se haya llegado a `umbral_fallos` (una
+                llamada ha agotado sus reintentos)
+        """
+        with self._lock:
+            self._fallos += 1
+            ahora = self._reloj()
+            if self._sondeo:
+                # Ha fallado la llamada de prueba: otra pausa, más larga
+                self._pausa_actual = min(self.pausa_maxima, self._pausa_actual * 2)
+            elif self._abierto_hasta is not None:
+                # Llamadas que ya estaban en vuelo al abrirse
+                if retry_after is not None:
+                    self._abierto_hasta = max(self._abierto_hasta, ahora + retry_after)
+                return
+            elif self._fallos < self.umbral_fallos and not abrir:
+                return
+
+            pausa = max(self._pausa_actual, retry_after or 0.0)
+            self._abierto_hasta = ahora + pausa
+            if self._abierto_desde is None:
+                self._abierto_desde = ahora
+            self._sondeo = False
+            print(
+                f"  🔌 {self._fallos} errores seguidos de Mistral: extracción "
+                f"en pausa {pausa:.0f}s"
+            )
+
+    def cancelar_sondeo(self) -> None:
+        """
+        La llamada de prueba falló sin llegar a la API (un error local): no
+        dice nada de la caída, así que la siguiente llamada vuelve a probar.
+        """
+        with self._lock:
+            self._sondeo = False
+
+    def esperar(self) -> None:
+        """Espera (bloqueando el hilo) hasta que la llamada pueda salir."""
+        espera = self.reservar()
+        while espera > 0:
+            time.sleep(espera)
+            espera = self.reservar()
+
+    async def esperar_async(self) -> None:
+        """Espera sin bloquear el bucle de eventos."""
+        espera = self.reservar()
+        while espera > 0:
+            await asyncio.sleep(espera)
+            espera = self.reservar()
+
+
+def codigo_http(error: Exception) -> Optional[int]:
+    """Código HTTP de la respuesta que causó el error, si lo hay."""
+    estado = getattr(error, "status_code", None)
+    if isinstance(estado, int):
+        return estado
+    respuesta: Any = getattr(error, "response", None)
+    estado = getattr(respuesta, "status_code", None)
+    return estado if isinstance(estado, int) else None
@@ -0,0 +1,95 @@
+"""
+Extracción de respaldo, sin Mistral, para cuando la API no tiene capacidad.
+
+Recorre el bloque una sola vez, de cabecera de mensaje en cabecera de
+mensaje, y marca como receta cada mensaje con cantidades o pasos. Todos los
+patrones están precompilados y anclados para que ninguno retroceda más allá
+de su propio tramo: el coste es lineal en el tamaño del bloque aunque llegue
+un mensaje enorme sin cabeceras o con largas series de dígitos y espacios.
+"""
+
+import re
+from typing import Any, Dict, Iterator, List, Tuple
+
+from .esquema import fecha_iso
+
+# "[01/10/25 18:02:13] Ana: " (bloques) o "[01/10/25, 18:02:13] Ana: " (chat)
+_PATRON_CABECERA = re.compile(
+    r"^\[(?P<fecha>\d{1,2}/\d{1,2}/\d{2,4}),? (?P<hora>\d{1,2}:\d{2}(?::\d{2})?)\]"
+    r" ?(?P<creador>[^:\n]+):[ \t]*",
+    re.MULTILINE,
+)
+# Cantidad seguida de unidad o de una palabra ("200 g harina", "2 huevos");
+# el lookbehind hace que cada serie de dígitos se pruebe una sola vez
+_PATRON_CANTIDAD = re.compile(r"(?<!\d)\d+(?:\s*[gkmltazs])?\s+[a-zA-Z]")
+# Pasos numerados, viñetas o verbos de cocina
+_PATRON_PASOS = re.compile(r"(?<!\d)\d+\.|-|•|hornear|cocinar|freír|mezclar")
+# Línea a partir de la cual empiezan los pasos
+_PATRON_INICIO_PASOS = re.compile(r"pasos?|preparación|instrucciones|modo de hacer")
+
+
+def extraer_recetas_regex(texto: str) -> List[Dict[str, Any]]:
+    """
+    Extrae recetas de un bloque con heurísticas, sin llamar a Mistral.
+
+    Args:
+        texto: Texto del bloque (mensajes formateados "[fecha] autor: texto")
+
+    Returns:
+        Recetas con los mismos campos que devuelve Mistral
+    """
+    recetas = []
+    for fecha, hora, creador, contenido in _iterar_mensajes(texto):
+        contenido_lower = contenido.lower()
+        if not (
+            _PATRON_CANTIDAD.search(contenido) or _PATRON_PASOS.search(contenido_lower)
+        ):
+            continue
+
+        lineas = contenido.strip().split("\n")
+        # Los pasos empiezan en la primera línea que los anuncia (si no es la
+        # primera); sin separación clara, todo son ingredientes
+        inicio_pasos = next(
+            (
+                i
+                for i, linea in enumerate(lineas)
+                if _PATRON_INICIO_PASOS.search(linea.lower())
+            ),
+            -1,
+        )
+        if inicio_pasos > 0:
+            ingredientes = "\n".join(lineas[:inicio_pasos])
+            pasos = "\n".join(lineas[inicio_pasos:]).strip()
+        else:
+            ingredientes = "\n".join(lineas)
+            pasos = ""
+
+        if hora.count(":") == 1:
+            hora += ":00"
+        recetas.append(
+            {
+                "creador": creador.strip(),
+                "nombre_receta": lineas[0].strip() or None,
+                "ingredientes": ingredientes.strip(),
+                "pasos_preparacion": pasos or None,
+                "tiene_foto": "imagen" in contenido_lower or "foto" in contenido_lower,
+                "fecha_mensaje": fecha_iso(f"{fecha} {hora}"),
+            }
+        )
+    return recetas
+
+
+def _iterar_mensajes(texto: str) -> Iterator[Tuple[str, str, str, str]]:
+    """(fecha, hora, creador, contenido) de cada mensaje, en una pasada."""
+    cabeceras = _PATRON_CABECERA.finditer(texto)
+    actual = next(cabeceras, None)
+    while actual is not None:
+        siguiente = next(cabeceras, None)
+        final = siguiente.start() if siguiente is not None else len(texto)
+        yield (
+            actual["fecha"],
+            actual["hora"],
+            actual["creador"],
+            texto[actual.end() : final],
+        )
+        actual = siguiente
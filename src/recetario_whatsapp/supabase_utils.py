@@ -347,3 +347,74 @@ class SupabaseManager:
         except Exception as e:
             print(f"Error obteniendo estado de Supabase: {e}")
             return None
+
+    def guardar_checkpoint_chat(self, chat: str, checkpoint: Dict[str, Any]) -> bool:
+        """Guarda el checkpoint de ingesta incremental de un chat."""
+        try:
+            payload = {
+                "chat": chat,
+                "offset_bytes": checkpoint.get("offset_bytes"),
+                "hash_prefijo": checkpoint.get("hash_prefijo"),
+                "ultimo_timestamp": checkpoint.get("ultimo_timestamp"),
+                "ultima_fecha": checkpoint.get("ultima_fecha"),
+                "ultima_actualizacion": datetime.utcnow().isoformat(),
+            }
+
+            self.client.table("checkpoints_chat").upsert(payload).execute()
+            return True
+        except Exception as e:
+            print(f"Error guardando checkpoint en Supabase: {e}")
+            return False
+
+    def obtener_checkpoint_chat(self, chat: str) -> Optional[Dict[str, Any]]:
+        """Obtiene el checkpoint de ingesta incremental de un chat."""
+        try:
+            response = (
+                self.client.table("checkpoints_chat")
+                .select("offset_bytes,hash_prefijo,ultimo_timestamp,ultima_fecha")
+                .eq("chat", chat)
+                .limit(1)
+                .execute()
+            )
+            if response.data:
+                return response.data[0]
+            return None
+        except Exception as e:
+            print(f"Error obteniendo checkpoint de Supabase: {e}")
+            return None
+
+    def guardar_huellas_chat(self, chat: str, huellas: List[str]) -> bool:
+        """Guarda huellas (hex) de mensajes ya procesados de un chat."""
+        try:
+            for inicio in range(0, len(huellas), 1000):
+                payload = [
+                    {"chat": chat, "huella": huella}
+                    for huella in huellas[inicio : inicio + 1000]
+                ]
+                self.client.table("huellas_mensajes").upsert(payload).execute()
+            return True
+        except Exception as e:
+            print(f"Error guardando huellas en Supabase: {e}")
+            return False
+
+    def obtener_huellas_chat(self, chat: str) -> List[str]:
+        """Obtiene todas las huellas (hex) registradas para un chat."""
+        huellas: List[str] = []
+        try:
+            inicio = 0
+            while True:
+                response = (
+                    self.client.table("huellas_mensajes")
+                    .select("huella")
+                    .eq("chat", chat)
+                    .range(inicio, inicio + 999)
+                    .execute()
+                )
+                filas = response.data or []
+                huellas.extend(fila["huella"] for fila in filas)
+                if len(filas) < 1000:
+                    return huellas
+                inicio += 1000
+        except Exception as e:
+            print(f"Error obteniendo huellas de Supabase: {e}")
+            return huellas
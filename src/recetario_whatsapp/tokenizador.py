@@ -0,0 +1,71 @@
+"""
+Recuento de tokens con el tokenizador local de Mistral.
+
+Con `mistral-common` instalado los tokens se cuentan con el mismo tokenizador
+que usa el modelo; sin él se estiman a razón de ~4 caracteres por token. El
+tokenizador se carga una sola vez por modelo y se comparte entre hilos.
+"""
+
+import functools
+from typing import Any, Optional
+
+try:
+    from mistral_common.tokens.tokenizers.mistral import MistralTokenizer
+
+    MISTRAL_COMMON_AVAILABLE = True
+except ImportError:
+    MISTRAL_COMMON_AVAILABLE = False
+
+# Regla general para español/inglés cuando no hay tokenizador
+CARACTERES_POR_TOKEN = 4
+
+
+def contar_aproximado(texto: str) -> int:
+    """Estimación de tokens sin tokenizador (~4 caracteres por token)."""
+    return len(texto) // CARACTERES_POR_TOKEN
+
+
+@functools.lru_cache(maxsize=None)
+def _cargar_tokenizador(modelo: str) -> Optional[Any]:
+    """Tokenizador de texto plano del modelo, o None si no está disponible."""
+    if not MISTRAL_COMMON_AVAILABLE:
+        return None
+    try:
+        tokenizador = MistralTokenizer.from_model(modelo, strict=False)
+    except Exception as e:
+        print(f"Warning: tokenizador de {modelo} no disponible ({e}); se estiman")
+        return None
+    return tokenizador.instruct_tokenizer.tokenizer
+
+
+class ContadorTokens:
+    """Cuenta tokens de texto para un modelo de Mistral."""
+
+    def __init__(self, modelo: str):
+        """
+        Carga (una vez por modelo) el tokenizador.
+
+        Args:
+            modelo: Nombre del modelo de Mistral (p. ej. `mistral-small-latest`)
+        """
+        self.modelo = modelo
+        self._tokenizador = _cargar_tokenizador(modelo)
+
+    @property
+    def exacto(self) -> bool:
+        """Indica si se cuenta con el tokenizador real y no con la estimación."""
+        return self._tokenizador is not None
+
+    def contar(self, texto: str) -> int:
+        """
+        Cuenta los tokens de un texto.
+
+        Args:
+            texto: Texto a medir
+
+        Returns:
+            Número de tokens
+        """
+        if self._tokenizador is None:
+            return contar_aproximado(texto)
+        return len(self._tokenizador.encode(texto, bos=False, eos=False))
@@ -29,6 +29,12 @@ def mock_env_vars():
         yield env_vars
 
 
+@pytest.fixture(autouse=True)
+def limitador_aislado(tmp_path, monkeypatch):
+    """Cada test usa su propio limitador compartido en lugar del de `state/`."""
+    monkeypatch.setenv("MISTRAL_LIMITADOR_PATH", str(tmp_path / "limitador.sqlite3"))
+
+
 @pytest.fixture
 def mock_cloudinary():
     """Fixture para mockear configuración y subida de Cloudinary."""
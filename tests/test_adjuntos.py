@@ -0,0 +1,56 @@
+"""Tests para `adjuntos.py`."""
+
+import io
+import zipfile
+
+import pytest
+
+from src.recetario_whatsapp.adjuntos import (
+    ExportacionZip,
+    adjuntos_referenciados,
+    solo_adjuntos,
+)
+
+
+def _zip(miembros):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archivo:
+        for nombre, contenido in miembros.items():
+            archivo.writestr(nombre, contenido)
+    buffer.seek(0)
+    return buffer
+
+
+def test_referencias_de_ios_y_android():
+    assert adjuntos_referenciados("\u200e<adjunto: 00000012-PHOTO-x.jpg>") == [
+        "00000012-PHOTO-x.jpg"
+    ]
+    assert adjuntos_referenciados("IMG-20251001-WA0003.jpg (archivo adjunto)") == [
+        "IMG-20251001-WA0003.jpg"
+    ]
+    assert adjuntos_referenciados("<Multimedia omitido>") == []
+    assert solo_adjuntos("\u200e<adjunto: a.jpg>")
+    assert not solo_adjuntos("<adjunto: a.jpg>\nTarta de queso")
+
+
+def test_exportacion_zip_localiza_chat_y_fotos():
+    fuente = _zip(
+        {
+            "WhatsApp Chat with Cocina.txt": "01/10/25, 18:02 - Ana: Hola\n",
+            "notas.txt": "",
+            "IMG-1.jpg": b"foto",
+            "AUD-1.opus": b"audio",
+        }
+    )
+
+    with ExportacionZip(fuente) as exportacion:
+        assert exportacion.chat.read().startswith(b"01/10/25")
+        assert exportacion.resolver("img-1.jpg") == "IMG-1.jpg"
+        assert exportacion.resolver("AUD-1.opus") is None
+        assert exportacion.resolver("IMG-2.jpg") is None
+        assert exportacion.leer("IMG-1.jpg") == b"foto"
+
+
+def test_exportacion_zip_sin_chat():
+    with pytest.raises(ValueError):
+        ExportacionZip(_zip({"IMG-1.jpg": b"foto"}))
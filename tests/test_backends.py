@@ -0,0 +1,199 @@
+"""Tests para `backends.py` contra un servidor local compatible con OpenAI."""
+
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.recetario_whatsapp import mistral_client
+from src.recetario_whatsapp.backends import (
+    BackendExtraccion,
+    BackendMistral,
+    BackendOpenAI,
+    crear_backend,
+    cuerpo_openai,
+)
+from src.recetario_whatsapp.mistral_client import MistralClient
+
+RECETA = {
+    "creador": "Ana",
+    "nombre_receta": "Bizcocho",
+    "ingredientes": "200 g harina, 2 huevos",
+    "pasos_preparacion": "Mezclar. Hornear.",
+    "tiene_foto": False,
+    "fecha_mensaje": "2025-10-01T18:02:13+00:00",
+}
+TEXTO = "[01/10/25 18:02:13] Ana: Bizcocho\n"
+
+
+def _completa(contenido):
+    return {
+        "choices": [
+            {"message": {"content": contenido}, "finish_reason": "stop"},
+        ],
+        "usage": {"prompt_tokens": 120, "total_tokens": 180},
+    }
+
+
+class _Servidor(BaseHTTPRequestHandler):
+    """Imita `/v1/chat/completions`: responde en orden lo que haya en `respuestas`."""
+
+    protocol_version = "HTTP/1.1"
+    respuestas = []
+    peticiones = []
+
+    def do_POST(self):
+        cuerpo = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        type(self).peticiones.append((self.path, dict(self.headers), cuerpo))
+        estado, datos = type(self).respuestas.pop(0)
+        if cuerpo.get("stream"):
+            # Un evento SSE por cada 15 caracteres del contenido
+            contenido = datos["choices"][0]["message"]["content"]
+            eventos = [
+                {"choices": [{"delta": {"content": contenido[i : i + 15]}}]}
+                for i in range(0, len(contenido), 15)
+            ]
+            eventos.append({"choices": [{"delta": {}, "finish_reason": "stop"}]})
+            eventos.append({"choices": [], "usage": datos["usage"]})
+            salida = "".join(f"data: {json.dumps(e)}\n\n" for e in eventos)
+            salida = (salida + "data: [DONE]\n\n").encode("utf-8")
+            tipo = "text/event-stream"
+        else:
+            salida = json.dumps(datos).encode("utf-8")
+            tipo = "application/json"
+        self.send_response(estado)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(salida)))
+        if estado == 429:
+            self.send_header("Retry-After", "0")
+        self.end_headers()
+        self.wfile.write(salida)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def servidor(monkeypatch):
+    _Servidor.respuestas = []
+    _Servidor.peticiones = []
+    http = ThreadingHTTPServer(("127.0.0.1", 0), _Servidor)
+    hilo = threading.Thread(target=http.serve_forever, daemon=True)
+    hilo.start()
+    monkeypatch.setenv("EXTRACCION_BACKEND", "openai")
+    monkeypatch.setenv(
+        "OPENAI_COMPAT_URL", f"http://127.0.0.1:{http.server_address[1]}/v1"
+    )
+    monkeypatch.setenv("OPENAI_COMPAT_MODELO", "qwen2.5-7b-instruct")
+    monkeypatch.setenv("OPENAI_COMPAT_API_KEY", "clave-local")
+    monkeypatch.setenv("CACHE_LLM", "false")
+    yield _Servidor
+    http.shutdown()
+    http.server_close()
+
+
+def test_cada_backend_tiene_su_configuracion(servidor, monkeypatch):
+    monkeypatch.setenv("MISTRAL_API_KEY", "clave")
+    monkeypatch.setenv("MISTRAL_CONCURRENCIA", "2")
+    monkeypatch.setenv("OPENAI_COMPAT_CONCURRENCIA", "16")
+    monkeypatch.setenv("OPENAI_COMPAT_TIMEOUT_SEG", "900")
+
+    local = crear_backend()
+    mistral = crear_backend("mistral")
+
+    assert isinstance(local, BackendOpenAI) and isinstance(mistral, BackendMistral)
+    assert (local.concurrencia, local.timeout) == (16, 900)
+    assert (mistral.concurrencia, mistral.timeout) == (2, 120)
+    # El servidor propio no tiene límites de ritmo por defecto
+    assert local.crear_limitador().utilizacion() == {}
+    with pytest.raises(ValueError):
+        crear_backend("otro")
+    monkeypatch.delenv("OPENAI_COMPAT_MODELO")
+    with pytest.raises(ValueError):
+        crear_backend()
+
+
+def test_un_backend_incompleto_falla_al_crearse():
+    class SinStreaming(BackendExtraccion):
+        def crear_limitador(self):
+            return None
+
+        def completar(self, peticion):
+            return None
+
+        async def completar_async(self, peticion):
+            return None
+
+    with pytest.raises(TypeError):
+        SinStreaming("m", 1, 10, 32000, 1)
+
+
+def test_el_esquema_se_envia_con_el_nombre_de_openai():
+    peticion = {
+        "model": "m",
+        "response_format": {
+            "type": "json_schema",
+            "json_schema": {"name": "recetas", "schema_definition": {"type": "object"}},
+        },
+    }
+
+    cuerpo = cuerpo_openai(peticion)
+
+    assert cuerpo["response_format"]["json_schema"] == {
+        "name": "recetas",
+        "schema": {"type": "object"},
+    }
+    # La petición original no se modifica
+    assert "schema_definition" in peticion["response_format"]["json_schema"]
+
+
+def test_extraccion_contra_servidor_compatible(servidor):
+    servidor.respuestas = [(200, _completa(json.dumps({"recetas": [RECETA]})))]
+
+    with MistralClient() as cliente:
+        resultado = cliente.extraer_receta(TEXTO)
+
+    assert resultado == {"recetas": [RECETA], "tokens_entrada": 120}
+    ruta, cabeceras, cuerpo = servidor.peticiones[0]
+    assert ruta == "/v1/chat/completions"
+    assert cabeceras["Authorization"] == "Bearer clave-local"
+    assert cuerpo["model"] == "qwen2.5-7b-instruct"
+    assert "schema" in cuerpo["response_format"]["json_schema"]
+
+
+def test_errores_http_del_servidor_se_reintentan(servidor, monkeypatch):
+    monkeypatch.setattr(mistral_client.time, "sleep", lambda segundos: None)
+    servidor.respuestas = [
+        (429, {"error": "ocupado"}),
+        (200, _completa(json.dumps({"recetas": [RECETA]}))),
+    ]
+
+    with MistralClient() as cliente:
+        resultado = cliente.extraer_receta(TEXTO)
+
+    assert resultado["recetas"] == [RECETA]
+    assert len(servidor.peticiones) == 2
+
+
+def test_streaming_contra_servidor_compatible(servidor, monkeypatch):
+    monkeypatch.setenv("MISTRAL_STREAMING", "true")
+    servidor.respuestas = [(200, _completa(json.dumps({"recetas": [RECETA]})))]
+    recibidas = []
+
+    async def extraer(cliente):
+        try:
+            return await cliente.extraer_recetas_async(
+                [TEXTO], lambda posicion, receta: recibidas.append(receta)
+            )
+        finally:
+            await cliente.cerrar_async()
+
+    with MistralClient() as cliente:
+        (resultado,) = asyncio.run(extraer(cliente))
+
+    assert recibidas == [RECETA]
+    # La receta ya entregada no se repite y el uso llega en el último evento
+    assert resultado == {"recetas": [], "emitidas": 1, "tokens_entrada": 120}
+    assert servidor.peticiones[0][2]["stream"] is True
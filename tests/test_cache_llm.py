@@ -0,0 +1,113 @@
+"""Tests para `cache_llm.py`."""
+
+import asyncio
+import time
+
+from src.recetario_whatsapp.cache_llm import CacheExtracciones, clave_extraccion
+from src.recetario_whatsapp.mistral_client import MistralClient
+
+
+def test_clave_depende_de_modelo_prompt_y_texto():
+    base = clave_extraccion("mistral-small-latest", "1", "texto")
+
+    assert base == clave_extraccion("mistral-small-latest", "1", "texto")
+    assert base != clave_extraccion("mistral-large-latest", "1", "texto")
+    assert base != clave_extraccion("mistral-small-latest", "2", "texto")
+    assert base != clave_extraccion("mistral-small-latest", "1", "texto ")
+
+
+def test_cache_guarda_y_refresca(tmp_path):
+    cache = CacheExtracciones(ruta=str(tmp_path / "cache.sqlite3"))
+    clave = clave_extraccion("m", "1", "bloque")
+    assert cache.obtener(clave) is None
+
+    cache.guardar(clave, {"recetas": [{"nombre_receta": "Tortilla"}]})
+    cache.cerrar()
+
+    # Persistente entre ejecuciones
+    cache = CacheExtracciones(ruta=str(tmp_path / "cache.sqlite3"))
+    assert cache.obtener(clave) == {"recetas": [{"nombre_receta": "Tortilla"}]}
+    # Con --refresh-cache las entradas anteriores no cuentan
+    assert cache.obtener(clave, no_antes_de=time.time() + 1) is None
+    cache.cerrar()
+
+
+def test_cache_expulsa_caducadas_y_menos_usadas(tmp_path):
+    cache = CacheExtracciones(ruta=str(tmp_path / "cache.sqlite3"), max_dias=1)
+    claves = [clave_extraccion("m", "1", str(i)) for i in range(4)]
+    for clave in claves:
+        cache.guardar(clave, {"recetas": [], "relleno": "x" * 1000})
+    cache.conexion.execute(
+        "UPDATE extracciones SET creada = ? WHERE clave = ?",
+        (time.time() - 2 * 86400, claves[0]),
+    )
+    assert cache.obtener(claves[0]) is None
+
+    # Límite para una sola entrada: se van las usadas hace más tiempo
+    cache.max_bytes = 1500
+    cache.obtener(claves[1])
+    assert cache.purgar() == 3
+    assert cache.obtener(claves[1]) is not None
+    assert all(cache.obtener(clave) is None for clave in claves[2:])
+    cache.cerrar()
+
+
+def test_bloques_identicos_en_vuelo_comparten_una_llamada(
+    mock_env_vars, tmp_path, monkeypatch
+):
+    monkeypatch.setenv("CACHE_LLM_PATH", str(tmp_path / "cache.sqlite3"))
+    cliente = MistralClient()
+    llamadas = []
+
+    async def llamar(texto, bloques=1, al_recibir=None):
+        llamadas.append(texto)
+        await asyncio.sleep(0.01)
+        return {"recetas": [{"nombre_receta": texto}]}
+
+    monkeypatch.setattr(cliente, "_llamar_async", llamar)
+
+    async def extraer():
+        return await asyncio.gather(
+            *(cliente.extraer_receta_async(t) for t in ("a", "a", "b"))
+        )
+
+    primero, repetido, otro = asyncio.run(extraer())
+    assert llamadas == ["a", "b"]
+    assert "desde_cache" not in primero
+    assert repetido["desde_cache"] is True
+    assert otro == {"recetas": [{"nombre_receta": "b"}]}
+
+    # En la siguiente ejecución sale de disco; sin caché se vuelve a llamar
+    assert asyncio.run(cliente.extraer_receta_async("b"))["desde_cache"] is True
+    cliente.configurar_cache(usar=False)
+    asyncio.run(cliente.extraer_receta_async("b"))
+    assert llamadas == ["a", "b", "b"]
+    cliente.cerrar()
+
+
+def test_paquete_solo_envia_los_bloques_que_no_estan_en_cache(
+    mock_env_vars, tmp_path, monkeypatch
+):
+    monkeypatch.setenv("CACHE_LLM_PATH", str(tmp_path / "cache.sqlite3"))
+    cliente = MistralClient()
+    paquetes = []
+
+    async def llamar_paquete(textos, al_recibir=None):
+        paquetes.append(textos)
+        return [{"recetas": [{"nombre_receta": texto}]} for texto in textos]
+
+    monkeypatch.setattr(cliente, "_llamar_paquete_async", llamar_paquete)
+
+    asyncio.run(cliente.extraer_recetas_async(["a", "b"]))
+    resultados = asyncio.run(cliente.extraer_recetas_async(["a", "c", "b", "c"]))
+
+    # Los repetidos dentro del paquete también se piden una sola vez
+    assert paquetes == [["a", "b"], ["c"]]
+    assert [r["recetas"][0]["nombre_receta"] for r in resultados] == list("acbc")
+    assert [bool(r.get("desde_cache")) for r in resultados] == [
+        True,
+        False,
+        True,
+        True,
+    ]
+    cliente.cerrar()
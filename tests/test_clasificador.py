@@ -0,0 +1,60 @@
+"""Tests para `clasificador.py`."""
+
+from src.recetario_whatsapp.clasificador import (
+    ClasificadorBloques,
+    HistorialBloques,
+    rasgos_bloque,
+)
+from src.recetario_whatsapp.recipe_matcher import DetectorReceta
+
+RECETAS = [
+    "[01/10/25 10:00:00] Ana: Receta de bizcocho\n- 3 huevos\n- 200 g harina",
+    "[01/10/25 11:00:00] Luis: Ingredientes: 1 kg tomates, 1 pepino. Triturar",
+    "[02/10/25 09:00:00] Marta: Receta: lentejas\n200 g lentejas, 1 cebolla",
+    "[03/10/25 18:00:00] Pili: Ingredientes:\n- 2 huevos\n- 100 g azúcar",
+]
+CHARLA = [
+    "[01/10/25 12:00:00] Ana: Mañana te paso la receta que me pediste",
+    "[01/10/25 13:00:00] Luis: La receta de tu madre era mejor jaja",
+    "[02/10/25 10:00:00] Marta: ¿Alguien tiene la receta? mañana quedamos",
+    "[03/10/25 19:00:00] Pili: Qué buena pinta la receta, luego te digo",
+]
+
+
+def test_rasgos_ignoran_cabeceras_y_normalizan():
+    rasgos = rasgos_bloque(
+        "[01/10/25 10:00:00] Ana: Añade 200 g de azúcar", DetectorReceta()
+    )
+
+    assert "ana" not in rasgos
+    assert {"anade", "0 g", "azucar", "@cantidad", "@lineas_1"} <= rasgos
+
+
+def test_clasificador_separa_recetas_de_charla_y_se_guarda(tmp_path):
+    ejemplos = [(t, True) for t in RECETAS] + [(t, False) for t in CHARLA]
+    clasificador = ClasificadorBloques.entrenar(ejemplos * 2)
+    clasificador.evaluar(ejemplos)
+
+    receta = "[05/10/25 10:00:00] Sara: Receta de flan\n- 4 huevos\n- 500 ml leche"
+    charla = "[05/10/25 11:00:00] Sara: Luego te paso la receta, mañana quedamos"
+    assert clasificador.probabilidad(receta) > 0.9
+    assert clasificador.probabilidad(charla) < 0.1
+    assert clasificador.perdida_recall(0.05) == 0.0
+    assert clasificador.ahorro(0.5) == 0.5
+
+    ruta = str(tmp_path / "modelo.json")
+    clasificador.guardar(ruta)
+    cargado = ClasificadorBloques.cargar(ruta)
+    assert cargado.probabilidad(receta) == clasificador.probabilidad(receta)
+    assert cargado.validacion == clasificador.validacion
+    assert ClasificadorBloques.cargar(str(tmp_path / "no_existe.json")) is None
+
+
+def test_historial_guarda_la_ultima_etiqueta_de_cada_bloque(tmp_path):
+    historial = HistorialBloques(ruta=str(tmp_path / "historial.sqlite3"))
+    historial.registrar("bloque a", False)
+    historial.registrar("bloque b", True)
+    historial.registrar("bloque a", True)
+
+    assert sorted(historial.ejemplos()) == [("bloque a", True), ("bloque b", True)]
+    historial.cerrar()
@@ -0,0 +1,129 @@
+"""Tests para `cobertura.py` y las llamadas duplicadas de `MistralClient`."""
+
+import asyncio
+import json
+import time
+
+import pytest
+
+from src.recetario_whatsapp.backends import BackendExtraccion, respuesta_openai
+from src.recetario_whatsapp.cobertura import CoberturaLatencia
+from src.recetario_whatsapp.limitador import LimitadorMistral
+from src.recetario_whatsapp.mistral_client import MistralClient
+
+RECETA = {
+    "creador": "Ana",
+    "nombre_receta": "Bizcocho",
+    "ingredientes": "200 g harina, 2 huevos",
+    "pasos_preparacion": "Mezclar. Hornear.",
+    "tiene_foto": False,
+    "fecha_mensaje": "2025-10-01T18:02:13+00:00",
+}
+TEXTO = "[01/10/25 18:02:13] Ana: Bizcocho\n"
+
+
+class _BackendLento(BackendExtraccion):
+    """Backend falso: cada llamada tarda lo indicado en `demoras`, en orden."""
+
+    nombre = "falso"
+
+    def __init__(self, demoras, rpm=0):
+        super().__init__(
+            modelo="falso",
+            concurrencia=1,
+            timeout=10,
+            context_window=32000,
+            conexiones=1,
+        )
+        self.demoras = list(demoras)
+        self.rpm = rpm
+        self.llamadas = 0
+
+    def crear_limitador(self):
+        return LimitadorMistral(peticiones_por_minuto=self.rpm, tokens_por_minuto=0)
+
+    def completar(self, peticion):
+        raise AssertionError("la cobertura solo cubre llamadas asíncronas")
+
+    def stream_async(self, peticion):
+        raise AssertionError("las llamadas por streaming no se duplican")
+
+    async def completar_async(self, peticion):
+        self.llamadas += 1
+        await asyncio.sleep(self.demoras.pop(0))
+        return respuesta_openai(
+            {
+                "choices": [
+                    {
+                        "message": {"content": json.dumps({"recetas": [RECETA]})},
+                        "finish_reason": "stop",
+                    }
+                ]
+            }
+        )
+
+
+@pytest.fixture(autouse=True)
+def entorno(monkeypatch):
+    monkeypatch.setenv("MISTRAL_COBERTURA", "true")
+    monkeypatch.setenv("MISTRAL_COBERTURA_MUESTRAS", "1")
+    monkeypatch.setenv("CACHE_LLM", "false")
+
+
+def _extraer(backend, llamadas_previas=100):
+    cliente = MistralClient(backend)
+    cliente.cobertura.registrar_latencia(0.05)
+    cliente.cobertura.llamadas = llamadas_previas
+    inicio = time.monotonic()
+    (resultado,) = asyncio.run(cliente.extraer_recetas_async([TEXTO]))
+    cliente.cerrar()
+    return cliente, resultado, time.monotonic() - inicio
+
+
+def test_umbral_es_el_percentil_de_las_latencias_recientes():
+    cobertura = CoberturaLatencia(percentil=0.9, muestras_minimas=10)
+    for segundos in range(1, 10):
+        cobertura.registrar_latencia(segundos)
+    assert cobertura.umbral() is None
+
+    cobertura.registrar_latencia(10)
+    assert cobertura.umbral() == 9
+
+
+def test_presupuesto_limita_las_duplicadas():
+    cobertura = CoberturaLatencia(presupuesto=0.05)
+    for _ in range(40):
+        cobertura.registrar_llamada()
+
+    assert cobertura.permitir() and cobertura.permitir()
+    assert not cobertura.permitir()
+    cobertura.devolver()
+    assert cobertura.permitir()
+
+
+def test_la_copia_responde_antes_que_la_llamada_lenta():
+    backend = _BackendLento([5, 0])
+
+    cliente, resultado, segundos = _extraer(backend)
+
+    assert resultado["recetas"] == [RECETA]
+    assert segundos < 2
+    assert backend.llamadas == 2
+    assert (cliente.cobertura.duplicadas, cliente.cobertura.ganadas) == (1, 1)
+    # Se anota lo que llevaba esperando la original al cancelarla, no la copia
+    latencias = list(cliente.cobertura._latencias)
+    assert len(latencias) == 2 and latencias[-1] >= 0.05
+
+
+def test_sin_presupuesto_ni_saldo_no_se_duplica():
+    # Sin llamadas previas no hay presupuesto para copias
+    backend = _BackendLento([0.3])
+    cliente, resultado, _ = _extraer(backend, llamadas_previas=0)
+    assert resultado["recetas"] == [RECETA]
+    assert backend.llamadas == 1
+
+    # Con presupuesto, pero el limitador no tiene saldo para otra petición
+    backend = _BackendLento([0.3], rpm=1)
+    cliente, resultado, _ = _extraer(backend)
+    assert backend.llamadas == 1
+    assert cliente.cobertura.duplicadas == 0
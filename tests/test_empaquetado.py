@@ -0,0 +1,76 @@
+"""Tests para `empaquetado.py`."""
+
+from src.recetario_whatsapp.empaquetado import (
+    componer_paquete,
+    dividir_partes,
+    empaquetar_bloques,
+    repartir_recetas,
+)
+
+
+def test_empaquetar_respeta_presupuesto_y_maximo_de_bloques():
+    bloques = [{"texto": "x" * 400} for _ in range(7)]  # ~108 tokens cada uno
+    bloques.insert(3, {"texto": "y" * 4000})  # mayor que el presupuesto
+
+    paquetes = list(
+        empaquetar_bloques(enumerate(bloques), presupuesto_tokens=350, max_bloques=2)
+    )
+
+    assert [[indice for indice, _ in paquete] for paquete in paquetes] == [
+        [0, 1],
+        [2],
+        [3],
+        [4, 5],
+        [6, 7],
+    ]
+
+
+def test_repartir_recetas_por_numero_de_bloque_y_por_autor():
+    textos = [
+        "[01/10/25 18:02:12] Ana: Ingredientes: harina\n",
+        "[01/10/25 19:00:00] Luis: Gazpacho: tomates, pepino\n",
+        "[01/10/25 20:00:00] Marta: Bizcocho: huevos\n",
+    ]
+    paquete = componer_paquete(textos)
+    assert paquete.startswith("### BLOQUE 1\n[01/10/25 18:02:12] Ana:")
+    assert "\n### BLOQUE 3\n" in paquete
+
+    resultado = {
+        "recetas": [
+            {"creador": "Marta", "nombre_receta": "Bizcocho", "bloque": 3},
+            {"creador": "Ana", "nombre_receta": "Pan", "bloque": "1"},
+            # Sin número válido: se asigna por autor
+            {"creador": "Luis", "nombre_receta": "Gazpacho", "bloque": 9},
+        ]
+    }
+
+    por_bloque = repartir_recetas(resultado, textos)
+
+    assert [[r["nombre_receta"] for r in b["recetas"]] for b in por_bloque] == [
+        ["Pan"],
+        ["Gazpacho"],
+        ["Bizcocho"],
+    ]
+    assert all("bloque" not in r for b in por_bloque for r in b["recetas"])
+    # La respuesta original no se modifica (puede estar en la caché)
+    assert resultado["recetas"][0]["bloque"] == 3
+
+
+def test_repartir_recetas_copia_errores_a_cada_bloque():
+    por_bloque = repartir_recetas({"recetas": [], "error": "timeout"}, ["a", "b"])
+
+    assert por_bloque == [
+        {"error": "timeout", "recetas": []},
+        {"error": "timeout", "recetas": []},
+    ]
+
+
+def test_dividir_partes_corta_entre_mensajes_y_parte_los_enormes():
+    partes = ["a" * 40, "b" * 40, "c" * 40, "línea\n" * 30]
+
+    trozos = dividir_partes(partes, contar=len, limite=90)
+
+    assert all(len(texto) <= 90 for texto, _ in trozos)
+    assert "".join(texto for texto, _ in trozos) == "".join(partes)
+    # Cada mensaje se anota en el trozo donde termina
+    assert [terminados for _, terminados in trozos] == [[0, 1], [2], [], [3]]
@@ -0,0 +1,274 @@
+"""Tests para `esquema.py` y la validación de respuestas en `MistralClient`."""
+
+import asyncio
+import json
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from src.recetario_whatsapp.esquema import (
+    LectorRecetas,
+    cargar_json_tolerante,
+    esquema_respuesta,
+    recetas_de_respuesta,
+    validar_recetas,
+)
+from src.recetario_whatsapp.mistral_client import MistralClient
+from src.recetario_whatsapp.prompts import PROMPT_COMPACTO
+
+RECETA = {
+    "creador": "Ana",
+    "nombre_receta": "Bizcocho",
+    "ingredientes": "200 g harina, 2 huevos",
+    "pasos_preparacion": "Mezclar. Hornear.",
+    "tiene_foto": False,
+    "fecha_mensaje": "2025-10-01T18:02:13+00:00",
+}
+COMPLETA = json.dumps({"recetas": [RECETA]}, ensure_ascii=False)
+
+# Respuestas con los deslices de formato vistos en producción
+CORPUS = [
+    COMPLETA,
+    f"```json\n{COMPLETA}\n```",
+    f"Aquí tienes las recetas:\n{COMPLETA}\n¡Que aproveche!",
+    COMPLETA.replace("}]}", "},]}"),
+    json.dumps({"recetas": [{**RECETA, "ingredientes": ["200 g harina", "2 huevos"]}]}),
+    json.dumps({"recetas": [{**RECETA, "fecha_mensaje": "01/10/25 18:02:13"}]}),
+    json.dumps({"recetas": [{**RECETA, "tiene_foto": "false"}]}),
+    json.dumps({"es_receta": True, **RECETA}),
+    # Cortada por max_tokens en mitad de la segunda receta
+    COMPLETA[:-2] + ', {"creador": "Luis", "ingredientes": "arroz", "pasos_prep',
+]
+
+
+@pytest.mark.parametrize("respuesta", CORPUS)
+def test_corpus_no_descarta_ninguna_respuesta(respuesta):
+    valor, _ = cargar_json_tolerante(respuesta)
+    validas, _ = validar_recetas(recetas_de_respuesta(valor), completas=True)
+
+    assert validas == [RECETA]
+
+
+def test_respuesta_cortada_cierra_tras_el_ultimo_valor_completo():
+    valor, cerrada = cargar_json_tolerante(CORPUS[-1])
+
+    assert cerrada
+    assert valor["recetas"][1] == {"creador": "Luis", "ingredientes": "arroz"}
+    # La receta a medias no se da por buena: se vuelve a pedir
+    _, invalidas = validar_recetas(valor["recetas"], completas=True)
+    assert "receta incompleta" in invalidas[0][1][0]
+
+    with pytest.raises(ValueError):
+        cargar_json_tolerante("No hay recetas en este texto")
+
+
+def test_validacion_separa_invalidas_y_descarta_las_que_no_son_recetas():
+    recetas = [
+        {**RECETA, "creador": None},
+        {**RECETA, "ingredientes": ""},
+        {**RECETA, "fecha_mensaje": "ayer por la tarde"},
+    ]
+
+    validas, invalidas = validar_recetas(recetas, autores={"Ana"})
+
+    # Con un solo autor en el bloque, el creador se completa localmente
+    assert validas == [RECETA]
+    assert [errores for _, errores in invalidas] == [
+        ["fecha_mensaje no es una fecha ISO 8601: 'ayer por la tarde'"]
+    ]
+    items = esquema_respuesta(con_bloque=True)["properties"]["recetas"]["items"]
+    assert "bloque" in items["required"]
+
+
+def _respuesta(contenido, fin="stop"):
+    eleccion = SimpleNamespace(
+        message=SimpleNamespace(content=contenido), finish_reason=fin
+    )
+    return SimpleNamespace(choices=[eleccion], usage=None)
+
+
+@pytest.fixture
+def cliente(mock_env_vars, monkeypatch):
+    monkeypatch.setenv("CACHE_LLM", "false")
+    monkeypatch.setenv("MISTRAL_RPM", "0")
+    cliente = MistralClient()
+    yield cliente
+    cliente.cerrar()
+
+
+def test_solo_se_vuelve_a_pedir_la_receta_invalida(cliente, monkeypatch):
+    mala = {**RECETA, "creador": "Luis", "fecha_mensaje": "ayer"}
+    sdk = MagicMock()
+    sdk.chat.complete.side_effect = [
+        # El prompt compacto y, al no validar, el de ejemplos
+        _respuesta(json.dumps({"recetas": [RECETA, mala]})),
+        _respuesta(json.dumps({"recetas": [RECETA, mala]})),
+        _respuesta(json.dumps({"recetas": [{**mala, "fecha_mensaje": None}]})),
+    ]
+    monkeypatch.setattr(cliente.backend, "_cliente", lambda: sdk)
+    texto = "[01/10/25 18:02:13] Ana: Bizcocho\n[01/10/25 18:03:00] Luis: Arroz\n"
+
+    resultado = cliente.extraer_receta(texto)
+
+    assert resultado["recetas"] == [RECETA, {**mala, "fecha_mensaje": None}]
+    compacta, ejemplos, correccion = [
+        c.kwargs for c in sdk.chat.complete.call_args_list
+    ]
+    assert compacta["response_format"]["type"] == "json_schema"
+    # Las instrucciones van en el mensaje de sistema y el chat en el de usuario
+    assert [m["role"] for m in compacta["messages"]] == ["system", "user"]
+    assert "Ejemplo 1" not in compacta["messages"][0]["content"]
+    assert "Ejemplo 1" in ejemplos["messages"][0]["content"]
+    assert compacta["messages"][1] == ejemplos["messages"][1]
+    assert resultado["tokens_entrada"] > 0
+    # La corrección lleva solo la receta y los mensajes de su autor
+    contenido = correccion["messages"][0]["content"]
+    assert "Luis: Arroz" in contenido and "Ana: Bizcocho" not in contenido
+    assert correccion["max_tokens"] == cliente.max_tokens_output
+
+
+def test_paquete_cortado_devuelve_error_en_los_bloques_sin_respuesta(
+    cliente, monkeypatch
+):
+    recetas = [{**RECETA, "bloque": 1}, {**RECETA, "creador": "Luis", "bloque": 2}]
+    respuesta = json.dumps({"recetas": recetas})[:-60]
+    sdk = MagicMock()
+    sdk.chat.complete_async = AsyncMock(return_value=_respuesta(respuesta, "length"))
+    monkeypatch.setattr(cliente.backend, "_cliente_async", lambda: sdk)
+    # La receta a medias del bloque 2 no se puede corregir
+    monkeypatch.setattr(cliente, "_peticion_correccion", lambda *args: None)
+    textos = [
+        "[01/10/25 18:02:13] Ana: Bizcocho\n",
+        "[01/10/25 18:03:00] Luis: Arroz\n",
+        "[01/10/25 18:04:00] Eva: Tarta\n",
+    ]
+
+    primero, segundo, tercero = asyncio.run(cliente.extraer_recetas_async(textos))
+
+    assert primero.pop("tokens_entrada") > 0
+    assert primero == {"recetas": [RECETA], "warning": "respuesta_truncada"}
+    assert "error" in segundo and "error" in tercero
+
+
+def _fragmento(contenido, fin=None):
+    eleccion = SimpleNamespace(
+        delta=SimpleNamespace(content=contenido), finish_reason=fin
+    )
+    return SimpleNamespace(data=SimpleNamespace(choices=[eleccion], usage=None))
+
+
+class _Stream:
+    """Stream falso de `chat.stream_async` que recuerda cuánto se ha leído."""
+
+    def __init__(self, trozos):
+        self.eventos = [_fragmento(t) for t in trozos] + [_fragmento("", "stop")]
+        self.leidos = 0
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *excepcion):
+        return None
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.leidos == len(self.eventos):
+            raise StopAsyncIteration
+        self.leidos += 1
+        return self.eventos[self.leidos - 1]
+
+
+def test_lector_entrega_cada_receta_al_cerrarse():
+    lector = LectorRecetas()
+    respuesta = json.dumps({"recetas": [RECETA, {**RECETA, "nombre_receta": "{x}"}]})
+    mitad = respuesta.index("}") + 1
+
+    assert lector.alimentar("Aquí va: " + respuesta[:mitad]) == [RECETA]
+    assert lector.alimentar(respuesta[mitad:]) == [{**RECETA, "nombre_receta": "{x}"}]
+
+
+def test_streaming_entrega_recetas_antes_de_terminar(cliente, monkeypatch):
+    cliente.streaming = True
+    # Con un solo prompt no hay escalado: las recetas se entregan al llegar
+    cliente.prompts = (PROMPT_COMPACTO,)
+    otra = {**RECETA, "creador": "Luis", "nombre_receta": "Arroz"}
+    respuesta = json.dumps(
+        {"recetas": [{**RECETA, "bloque": 1}, {**otra, "bloque": 2}]}
+    )
+    stream = _Stream([respuesta[i : i + 20] for i in range(0, len(respuesta), 20)])
+    sdk = MagicMock()
+    sdk.chat.stream_async = AsyncMock(return_value=stream)
+    monkeypatch.setattr(cliente.backend, "_cliente_async", lambda: sdk)
+    textos = [
+        "[01/10/25 18:02:13] Ana: Bizcocho\n",
+        "[01/10/25 18:03:00] Luis: Arroz\n",
+    ]
+    recibidas = []
+
+    def al_recibir(posicion, receta):
+        recibidas.append((posicion, receta, stream.leidos))
+
+    resultados = asyncio.run(cliente.extraer_recetas_async(textos, al_recibir))
+    # Los tokens del paquete se reparten entre sus bloques
+    assert all(resultado.pop("tokens_entrada") > 0 for resultado in resultados)
+
+    assert [(p, r) for p, r, _ in recibidas] == [(0, RECETA), (1, otra)]
+    # Cada receta llega en cuanto se cierra, sin esperar al resto
+    assert recibidas[0][2] < recibidas[1][2] < len(stream.eventos)
+    assert resultados == [
+        {"recetas": [], "emitidas": 1},
+        {"recetas": [], "emitidas": 1},
+    ]
+
+
+def test_al_escalar_se_conservan_las_recetas_validas_del_primer_prompt(
+    cliente, monkeypatch
+):
+    mala = {**RECETA, "creador": "Luis", "fecha_mensaje": "ayer"}
+    luis = {**RECETA, "creador": "Luis", "fecha_mensaje": "2025-10-01T18:03:00+00:00"}
+    sdk = MagicMock()
+    sdk.chat.complete.side_effect = [
+        _respuesta(json.dumps({"recetas": [RECETA, mala]})),
+        # El prompt con ejemplos solo devuelve la receta que faltaba
+        _respuesta(json.dumps({"recetas": [luis]})),
+    ]
+    monkeypatch.setattr(cliente.backend, "_cliente", lambda: sdk)
+    texto = "[01/10/25 18:02:13] Ana: Bizcocho\n[01/10/25 18:03:00] Luis: Arroz\n"
+
+    resultado = cliente.extraer_receta(texto)
+
+    assert resultado["recetas"] == [luis, RECETA]
+
+
+def test_streaming_no_entrega_recetas_de_un_prompt_que_se_escala(cliente, monkeypatch):
+    cliente.streaming = True
+    mala = {**RECETA, "creador": "Luis", "fecha_mensaje": "ayer"}
+    luis = {**RECETA, "creador": "Luis", "fecha_mensaje": "2025-10-01T18:03:00+00:00"}
+    # El prompt con ejemplos redacta de otra forma la receta de Ana
+    ana = {**RECETA, "nombre_receta": "Bizcocho de Ana"}
+    compacta = json.dumps({"recetas": [RECETA, mala]})
+    ejemplos = json.dumps({"recetas": [ana, luis]})
+    sdk = MagicMock()
+    sdk.chat.stream_async = AsyncMock(
+        side_effect=[
+            _Stream([compacta[i : i + 20] for i in range(0, len(compacta), 20)]),
+            _Stream([ejemplos[i : i + 20] for i in range(0, len(ejemplos), 20)]),
+        ]
+    )
+    monkeypatch.setattr(cliente.backend, "_cliente_async", lambda: sdk)
+    texto = "[01/10/25 18:02:13] Ana: Bizcocho\n[01/10/25 18:03:00] Luis: Arroz\n"
+    recibidas = []
+
+    (resultado,) = asyncio.run(
+        cliente.extraer_recetas_async(
+            [texto], lambda posicion, receta: recibidas.append(receta)
+        )
+    )
+
+    # La receta de Ana del primer prompt no se entrega: solo las del último
+    assert recibidas == [ana, luis]
+    resultado.pop("tokens_entrada")
+    assert resultado == {"recetas": [], "emitidas": 2}
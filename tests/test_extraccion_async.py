@@ -0,0 +1,93 @@
+"""Tests para `extraccion_async.py`."""
+
+import asyncio
+
+from src.recetario_whatsapp.extraccion_async import MotorExtraccion
+
+
+class ClienteLento:
+    """Cliente falso cuyo tiempo de respuesta depende del texto."""
+
+    def __init__(self):
+        self.en_vuelo = 0
+        self.maximo = 0
+
+        self.paquetes = []
+
+    async def extraer_recetas_async(self, textos):
+        self.paquetes.append(textos)
+        self.en_vuelo += 1
+        self.maximo = max(self.maximo, self.en_vuelo)
+        try:
+            await asyncio.sleep(max(map(float, textos)))
+            if "0.03" in textos:
+                raise RuntimeError("timeout")
+            return [{"recetas": [{"titulo": texto}]} for texto in textos]
+        finally:
+            self.en_vuelo -= 1
+
+
+def test_motor_limita_llamadas_en_vuelo_y_conserva_posiciones():
+    cliente = ClienteLento()
+    motor = MotorExtraccion(cliente, concurrencia=3, bloques_por_llamada=1)
+    bloques = [{"texto": t} for t in ("0.2", "0.01", "0.05", "0.03", "0.01", "0")]
+
+    try:
+        resultados = list(motor.iterar_resultados(iter(bloques)))
+    finally:
+        motor.cerrar()
+
+    assert cliente.maximo == 3
+    # Los bloques rápidos terminan antes que el primero, que es el más lento
+    assert resultados[-1][0] == 0
+    assert sorted(indice for indice, _, _ in resultados) == list(range(6))
+    for indice, bloque, resultado in resultados:
+        assert bloque is bloques[indice]
+        if bloque["texto"] == "0.03":
+            assert resultado["error"] == "Error en la API de Mistral: timeout"
+        else:
+            assert resultado["recetas"][0]["titulo"] == bloque["texto"]
+
+
+def test_motor_empaqueta_bloques_y_los_devuelve_por_separado():
+    cliente = ClienteLento()
+    motor = MotorExtraccion(cliente, concurrencia=2, bloques_por_llamada=3)
+    bloques = [{"texto": t} for t in ("0.01", "0", "0.02", "0.01", "0.03")]
+
+    try:
+        resultados = sorted(motor.iterar_resultados(bloques), key=lambda r: r[0])
+    finally:
+        motor.cerrar()
+
+    assert cliente.paquetes == [["0.01", "0", "0.02"], ["0.01", "0.03"]]
+    assert [r[2]["recetas"][0]["titulo"] for r in resultados[:3]] == [
+        "0.01",
+        "0",
+        "0.02",
+    ]
+    # Si falla la llamada, todos los bloques de su paquete llevan el error
+    assert all(r[2]["error"].endswith("timeout") for r in resultados[3:])
+
+
+class ClienteStreaming:
+    """Cliente falso que entrega una receta antes de terminar la llamada."""
+
+    async def extraer_recetas_async(self, textos, al_recibir=None):
+        al_recibir(1, {"titulo": "primera"})
+        await asyncio.sleep(0.05)
+        return [{"recetas": [], "emitidas": 0}, {"recetas": [], "emitidas": 1}]
+
+
+def test_motor_devuelve_las_recetas_parciales_antes_del_resultado():
+    motor = MotorExtraccion(ClienteStreaming(), bloques_por_llamada=2, parciales=True)
+    bloques = [{"texto": "a"}, {"texto": "b"}]
+
+    try:
+        resultados = list(motor.iterar_resultados(bloques))
+    finally:
+        motor.cerrar()
+
+    indice, bloque, parcial = resultados[0]
+    assert (indice, bloque) == (1, bloques[1])
+    assert parcial == {"recetas": [{"titulo": "primera"}], "parcial": True}
+    assert [r[2]["emitidas"] for r in resultados[1:]] == [0, 1]
@@ -1,26 +1,49 @@
 """Tests actualizados para `extractor.py`."""
 
-from unittest.mock import MagicMock, mock_open, patch
+import io
+import zipfile
+from unittest.mock import AsyncMock, MagicMock, mock_open, patch
 
 import pytest
 
+from src.recetario_whatsapp.chat_parser import (
+    BYTES_MINIMOS_BISECCION,
+    LINEAS_MUESTRA_FORMATO,
+    abrir_lineas,
+    detectar_formato,
+    timestamp_de_fecha_iso,
+)
 from src.recetario_whatsapp.extractor import WhatsAppExtractor
+from src.recetario_whatsapp.tokenizador import contar_aproximado
 
 
 @pytest.fixture
-def extractor(mock_env_vars):
+def extractor(mock_env_vars, tmp_path, monkeypatch):
     """Crea un extractor con dependencias mockeadas."""
+    monkeypatch.setenv("LEDGER_PATH", str(tmp_path / "ledger.sqlite3"))
+    monkeypatch.setenv("HISTORIAL_BLOQUES_PATH", str(tmp_path / "historial.sqlite3"))
 
     with (
         patch("src.recetario_whatsapp.extractor.MistralClient") as mistral_cls,
         patch("src.recetario_whatsapp.extractor.SupabaseManager") as supabase_cls,
     ):
         mistral_instance = MagicMock()
+        mistral_instance.max_tokens_bloque = 29_000
+        mistral_instance.contar_tokens = contar_aproximado
+        mistral_instance.streaming = False
+        # La versión asíncrona delega en la síncrona para configurar solo una
+        mistral_instance.extraer_recetas_async = AsyncMock(
+            side_effect=lambda textos: [
+                mistral_instance.extraer_receta(texto) for texto in textos
+            ]
+        )
         supabase_instance = MagicMock()
         mistral_cls.return_value = mistral_instance
         supabase_cls.return_value = supabase_instance
 
-        yield WhatsAppExtractor(), mistral_instance, supabase_instance
+        extractor = WhatsAppExtractor()
+        yield extractor, mistral_instance, supabase_instance
+        extractor.motor.cerrar()
 
 
 def test_parsear_mensajes_acepta_formatos_varios(extractor):
@@ -37,6 +60,87 @@ def test_parsear_mensajes_acepta_formatos_varios(extractor):
     assert mensajes[1]["mensaje"] == "¡Hola!"
 
 
+def test_iterar_mensajes_es_perezoso_y_une_continuaciones(extractor):
+    extractor_obj, _, _ = extractor
+    leidas = []
+
+    def lineas():
+        yield "[01/10/25, 18:02:12] Ana: Ingredientes:"
+        yield "- 200 g harina"
+        yield "- 2 huevos"
+        for i in range(10_000):
+            leidas.append(i)
+            yield f"[01/10/25, 18:05:00] Luis: mensaje {i}"
+
+    mensajes = extractor_obj.parser.iterar_mensajes(lineas())
+    primero = next(mensajes)
+
+    assert primero["mensaje"] == "Ingredientes:\n- 200 g harina\n- 2 huevos"
+    # Solo se ha leído la muestra usada para detectar el formato
+    assert len(leidas) == LINEAS_MUESTRA_FORMATO - 3
+    assert next(mensajes)["mensaje"] == "mensaje 0"
+
+
+def test_procesar_archivo_acepta_stream_subido(extractor, sample_whatsapp_text):
+    extractor_obj, mistral, supabase = extractor
+    mistral.extraer_receta.return_value = {
+        "recetas": [{"creador": "Ana"}],
+        "tokens_entrada": 240,
+    }
+    supabase.insertar_receta.return_value = {"id": 1}
+    archivo = io.BytesIO(sample_whatsapp_text.encode("utf-8"))
+    archivo.name = "chat.txt"
+
+    with patch.object(extractor_obj, "_actualizar_estado_procesamiento"):
+        resultado = extractor_obj.procesar_archivo(archivo, "2025-01-01")
+
+    assert resultado["mensajes_procesados"] == 3
+    assert resultado["bloques_procesados"] == 1
+    assert resultado["recetas_insertadas"] == 1
+    assert "2 huevos" in mistral.extraer_receta.call_args[0][0]
+    assert resultado["tokens_enviados"] == 240
+    assert resultado["tokens_por_receta"] == 240
+    assert resultado["bloques"] == [
+        {
+            "creador": "Ana",
+            "fecha": resultado["bloques"][0]["fecha"],
+            "recetas_extraidas": 1,
+            "recetas_insertadas": 1,
+        }
+    ]
+
+
+@pytest.mark.parametrize(
+    "linea, nombre, fecha",
+    [
+        ("[01/10/25, 18:02:13] Ana: Hola", "ios", "01/10/25 18:02:13"),
+        ("[01/10/25, 18:02] Ana: Hola", "ios_sin_segundos", "01/10/25 18:02:00"),
+        ("21/10/25, 16:35 - Ana: Hola", "android", "21/10/25 16:35:00"),
+        ("21/10/2025, 16:35 - Ana: Hola", "android", "21/10/25 16:35:00"),
+        ("[10/21/25, 6:02:13 PM] Ana: Hola", "ios_ampm", "21/10/25 18:02:13"),
+        ("21/10/25, 12:05 a. m. - Ana: Hola", "android_ampm", "21/10/25 00:05:00"),
+    ],
+)
+def test_detectar_formato_y_normalizar_fecha(extractor, linea, nombre, fecha):
+    extractor_obj, _, _ = extractor
+
+    formato, _ = detectar_formato([linea])
+    mensajes = extractor_obj._parsear_mensajes(f"{linea}\nsigue 2 kg")
+
+    assert formato.nombre == nombre
+    assert mensajes[0]["fecha"] == fecha
+    assert mensajes[0]["creador"] == "Ana"
+
+
+def test_detectar_formato_fechas_de_estados_unidos():
+    formato, mes_primero = detectar_formato(
+        ["10/1/25, 18:02 - Ana: Hola", "10/21/25, 18:03 - Luis: Hola"]
+    )
+
+    assert formato.nombre == "android"
+    assert mes_primero is True
+
+
 def test_filtrar_por_fecha_descarta_antiguos(extractor):
     extractor_obj, _, _ = extractor
     mensajes = [
@@ -50,6 +154,68 @@ def test_filtrar_por_fecha_descarta_antiguos(extractor):
     assert filtrados[0]["creador"] == "Luis"
 
 
+def test_filtrar_por_fecha_ignora_mensajes_sin_fecha_para_el_corte(extractor):
+    extractor_obj, _, _ = extractor
+    mensajes = [
+        {"fecha": "01/10/25 12:00:00", "creador": "Ana", "mensaje": "Viejo"},
+        {"fecha": "02/10/25 12:00:00", "creador": "Ana", "mensaje": "Viejo"},
+        {"fecha": "sin fecha", "creador": "Eva", "mensaje": "Suelto"},
+        {"fecha": "03/10/25 12:00:00", "creador": "Ana", "mensaje": "Viejo"},
+        {"fecha": "15/10/25 12:00:00", "creador": "Luis", "mensaje": "Nuevo"},
+        {"fecha": "sin fecha", "creador": "Eva", "mensaje": "Nuevo"},
+    ]
+
+    filtrados = extractor_obj._filtrar_por_fecha(mensajes, "2025-10-10")
+
+    assert [m["creador"] for m in filtrados] == ["Luis", "Eva"]
+
+
+def test_parser_adjunta_timestamp(extractor):
+    extractor_obj, _, _ = extractor
+
+    mensajes = extractor_obj._parsear_mensajes("[02/01/70, 01:00:05] Ana: Hola")
+
+    assert mensajes[0]["timestamp"] == 86400 + 3605
+
+
+def test_parser_devuelve_mensajes_compactos(extractor):
+    extractor_obj, _, _ = extractor
+
+    mensajes = extractor_obj._parsear_mensajes(
+        "[02/01/70, 01:00:05] Ana: Hola\n[02/01/70, 01:00:06] Ana: Adiós"
+    )
+
+    assert not hasattr(mensajes[0], "__dict__")
+    assert mensajes[0].creador is mensajes[1].creador
+    assert mensajes[1].get("mensaje") == mensajes[1]["mensaje"] == "Adiós"
+    with pytest.raises(KeyError):
+        mensajes[0]["inexistente"]
+
+
+def test_corte_por_fecha_salta_el_archivo_por_biseccion(extractor, tmp_path):
+    extractor_obj, _, _ = extractor
+    ruta = tmp_path / "chat.txt"
+    lineas = []
+    for dia in range(1, 29):
+        for minuto in range(200):
+            lineas.append(
+                f"{dia:02d}/02/25, {minuto // 60:02d}:{minuto % 60:02d} - Ana: hola"
+            )
+            lineas.append("- 2 huevos")
+    ruta.write_text("\n".join(lineas), encoding="utf-8")
+    assert ruta.stat().st_size > 2 * BYTES_MINIMOS_BISECCION
+
+    desde = timestamp_de_fecha_iso("2025-02-27")
+    with abrir_lineas(ruta) as f:
+        todos = list(extractor_obj.parser.iterar_mensajes(f))
+    with abrir_lineas(str(ruta)) as f:
+        recientes = list(extractor_obj.parser.iterar_mensajes(f, desde=desde))
+
+    assert recientes == [m for m in todos if m["timestamp"] >= desde]
+    assert len(recientes) == 400
+    assert recientes[0]["mensaje"] == "hola\n- 2 huevos"
+
+
 def test_agrupar_mensajes_consecutivos_crea_bloques(extractor):
     extractor_obj, _, _ = extractor
     mensajes = [
@@ -68,6 +234,114 @@ def test_agrupar_mensajes_consecutivos_crea_bloques(extractor):
     assert "Ingredientes" in bloques[0]["texto"]
 
 
+def test_bloque_con_mas_tokens_que_caracteres_se_divide(extractor):
+    extractor_obj, mistral, _ = extractor
+    # Un tokenizador con bytes de respaldo: un token por byte
+    mistral.contar_tokens = lambda texto: len(texto.encode("utf-8"))
+    mistral.max_tokens_bloque = 80
+    mensajes = [
+        {"fecha": "01/10/25 10:00:00", "creador": "Ana", "mensaje": "Receta 🍰🍰🍰"},
+        {
+            "fecha": "01/10/25 10:01:00",
+            "creador": "Ana",
+            "mensaje": "Ingredientes: 🥚🥚🥚",
+        },
+    ]
+
+    bloques = extractor_obj._agrupar_mensajes_consecutivos(mensajes)
+
+    # Caben en caracteres, pero no en tokens
+    assert len("".join(bloque["texto"] for bloque in bloques)) <= 80
+    assert len(bloques) == 2
+    assert all(mistral.contar_tokens(bloque["texto"]) <= 80 for bloque in bloques)
+
+
+def test_el_resumen_del_bloque_muestra_los_tokens_del_tokenizador(
+    extractor, sample_whatsapp_text, capsys
+):
+    extractor_obj, mistral, _ = extractor
+    mistral.contar_tokens = lambda texto: len(texto.encode("utf-8"))
+    mistral.extraer_receta.return_value = {"recetas": []}
+    archivo = io.BytesIO(sample_whatsapp_text.encode("utf-8"))
+    archivo.name = "chat.txt"
+
+    with patch.object(extractor_obj, "_actualizar_estado_procesamiento"):
+        extractor_obj.procesar_archivo(archivo, "2025-01-01")
+
+    texto = mistral.extraer_receta.call_args.args[0]
+    assert f"Tokens del bloque: {len(texto.encode('utf-8'))}" in capsys.readouterr().out
+
+
+def test_bloque_demasiado_largo_se_divide_entre_mensajes(extractor):
+    extractor_obj, mistral, _ = extractor
+    mistral.max_tokens_bloque = 25  # ~100 caracteres por trozo
+    mensajes = [
+        {"fecha": "01/10/25 10:00:00", "creador": "Ana", "mensaje": "Receta"},
+        {
+            "fecha": "01/10/25 10:01:00",
+            "creador": "Ana",
+            "mensaje": "Ingredientes: 1 huevo, 200 g harina",
+        },
+        {
+            "fecha": "01/10/25 10:02:00",
+            "creador": "Ana",
+            "mensaje": "Pasos: mezclar y hornear 30 minutos",
+        },
+    ]
+
+    bloques = extractor_obj._agrupar_mensajes_consecutivos(mensajes)
+
+    assert len(bloques) == 2
+    assert all(len(bloque["texto"]) <= 100 for bloque in bloques)
+    assert "".join(bloque["texto"] for bloque in bloques).count("Ana:") == 3
+    # Cada mensaje se registra con el trozo en el que termina
+    assert [len(bloque["huellas"]) for bloque in bloques] == [2, 1]
+    assert bloques[1]["creador"] == "Ana"
+
+
+def test_preclasificador_descarta_bloques_improbables(extractor):
+    extractor_obj, mistral, _ = extractor
+    extractor_obj.clasificador = MagicMock()
+    extractor_obj.clasificador.probabilidad.side_effect = lambda texto: (
+        0.9 if "harina" in texto else 0.01
+    )
+    bloques = [{"texto": "Receta: harina"}, {"texto": "la receta de tu madre"}]
+    estadisticas = {"bloques_descartados": 0}
+
+    pasan = list(extractor_obj._omitir_bloques_improbables(bloques, estadisticas))
+
+    assert pasan == bloques[:1]
+    assert estadisticas["bloques_descartados"] == 1
+
+
+def test_recetas_con_plantilla_no_llaman_a_mistral(extractor, tmp_path):
+    extractor_obj, mistral, supabase = extractor
+    mistral.extraer_receta.return_value = {"recetas": [{"creador": "Luis"}]}
+    supabase.insertar_receta.return_value = {"id": 1}
+    ruta = tmp_path / "chat.txt"
+    ruta.write_text(
+        "[01/10/25, 18:02:13] Ana: Receta: Pan\n"
+        "Ingredientes:\n- 500 g harina\n- agua\n"
+        "Pasos:\n1. Amasar\n2. Hornear 40 minutos\n"
+        "[01/10/25, 18:05:00] Luis: Receta de mi abuela con 200 g de harina, "
+        "se mezcla todo y se hornea\n",
+        encoding="utf-8",
+    )
+
+    with patch.object(extractor_obj, "_actualizar_estado_procesamiento"):
+        resultado = extractor_obj.procesar_archivo(str(ruta), "2025-01-01")
+
+    assert resultado["bloques_procesados"] == 2
+    assert resultado["recetas_reglas"] == 1
+    assert resultado["recetas_llm"] == 1
+    # Solo el bloque sin plantilla va a Mistral
+    mistral.extraer_receta.assert_called_once()
+    assert "Luis" in mistral.extraer_receta.call_args[0][0]
+    insertadas = [c.args[0] for c in supabase.insertar_receta.call_args_list]
+    assert insertadas[0]["nombre_receta"] == "Pan"
+    assert insertadas[0]["ingredientes"] == "500 g harina, agua"
+
+
 def test_procesar_archivo_con_error_de_lectura(extractor):
     extractor_obj, _, _ = extractor
 
@@ -79,13 +353,288 @@ def test_procesar_archivo_con_error_de_lectura(extractor):
 
 def test_actualizar_estado_guarda_archivo(extractor):
     extractor_obj, _, supabase = extractor
-    supabase.guardar_estado_procesamiento.return_value = True
+    checkpoint = {"offset_bytes": 10, "ultima_fecha": "01/10/25 10:00:00"}
 
     with (
         patch("os.makedirs") as makedirs,
         patch("builtins.open", mock_open()) as mocked_open,
     ):
-        extractor_obj._actualizar_estado_procesamiento("01/10/25 10:00:00")
+        extractor_obj._actualizar_estado_procesamiento("chat.txt", checkpoint)
 
     makedirs.assert_called_once_with("state", exist_ok=True)
     assert mocked_open.called
+    supabase.guardar_checkpoint_chat.assert_called_once_with("chat.txt", checkpoint)
+
+
+def test_cada_chat_guarda_solo_su_checkpoint(extractor, tmp_path, monkeypatch):
+    extractor_obj, mistral, supabase = extractor
+    monkeypatch.chdir(tmp_path)
+    supabase.obtener_checkpoint_chat.return_value = None
+    mistral.extraer_receta.return_value = {"recetas": []}
+    for nombre, fecha in (("grupoA.txt", "21/10/25"), ("grupoB.txt", "01/03/24")):
+        (tmp_path / nombre).write_text(
+            f"[{fecha}, 10:00:00] Ana: Hola\n", encoding="utf-8"
+        )
+        extractor_obj.procesar_archivo(str(tmp_path / nombre))
+
+    estado = extractor_obj._leer_estado_local()
+
+    # Ninguna fecha común que decida el corte de otros archivos
+    assert "ultima_fecha_iso" not in estado
+    assert sorted(estado["checkpoints"]) == ["grupoA.txt", "grupoB.txt"]
+    assert estado["checkpoints"]["grupoB.txt"]["ultima_fecha"] == "01/03/24 10:00:00"
+    supabase.guardar_estado_procesamiento.assert_not_called()
+
+
+def test_reanuda_desde_checkpoint_al_reexportar(extractor, tmp_path, monkeypatch):
+    extractor_obj, mistral, supabase = extractor
+    monkeypatch.chdir(tmp_path)
+    supabase.obtener_checkpoint_chat.return_value = None
+    mistral.extraer_receta.return_value = {"recetas": []}
+    ruta = tmp_path / "chat.txt"
+    ruta.write_text(
+        "[01/10/25, 10:00:00] Ana: Receta de flan\n[01/10/25, 10:05:00] Luis: Hola\n",
+        encoding="utf-8",
+    )
+
+    primero = extractor_obj.procesar_archivo(str(ruta))
+    with open(ruta, "a", encoding="utf-8") as f:
+        f.write("[02/10/25, 09:00:00] Luis: Receta de sopa\n- 2 l agua\n")
+    segundo = extractor_obj.procesar_archivo(str(ruta))
+
+    assert primero["mensajes_procesados"] == 2
+    assert segundo["mensajes_procesados"] == 1
+    assert "sopa" in mistral.extraer_receta.call_args.args[0]
+    checkpoint = supabase.guardar_checkpoint_chat.call_args.args[1]
+    assert checkpoint["offset_bytes"] == ruta.stat().st_size
+    assert checkpoint["ultima_fecha"] == "02/10/25 09:00:00"
+
+
+def test_bloques_con_error_no_avanzan_el_checkpoint(extractor, tmp_path, monkeypatch):
+    extractor_obj, mistral, supabase = extractor
+    monkeypatch.chdir(tmp_path)
+    supabase.obtener_checkpoint_chat.return_value = None
+    mistral.extraer_receta.return_value = {"recetas": [], "error": "caída"}
+    ruta = tmp_path / "chat.txt"
+    ruta.write_text(
+        "[01/10/25, 10:00:00] Ana: Receta de flan\n- 2 huevos\n", encoding="utf-8"
+    )
+
+    extractor_obj.procesar_archivo(str(ruta))
+    supabase.guardar_checkpoint_chat.assert_not_called()
+
+    mistral.extraer_receta.return_value = {"recetas": []}
+    segundo = extractor_obj.procesar_archivo(str(ruta))
+
+    # El bloque fallido se vuelve a pedir y ahora sí avanza el checkpoint
+    assert segundo["bloques_procesados"] == 1
+    assert mistral.extraer_receta.call_count == 2
+    supabase.guardar_checkpoint_chat.assert_called_once()
+
+
+def test_recetas_emitidas_de_un_bloque_fallido_no_se_repiten(
+    extractor, tmp_path, monkeypatch
+):
+    extractor_obj, _, supabase = extractor
+    monkeypatch.chdir(tmp_path)
+    supabase.obtener_checkpoint_chat.return_value = None
+    supabase.insertar_receta.return_value = {"id": 1}
+    receta = {
+        "creador": "Ana",
+        "nombre_receta": "Flan",
+        "fecha_mensaje": "2025-10-01T10:00:00+00:00",
+    }
+    ruta = tmp_path / "chat.txt"
+    ruta.write_text(
+        "[01/10/25, 10:00:00] Ana: Receta de flan\n- 2 huevos\n", encoding="utf-8"
+    )
+
+    def streaming(final):
+        # La receta llega por streaming antes que el resultado del bloque
+        def iterar_resultados(bloques):
+            for indice, bloque in enumerate(bloques):
+                yield indice, bloque, {"recetas": [receta], "parcial": True}
+                yield indice, bloque, final
+
+        return iterar_resultados
+
+    monkeypatch.setattr(
+        extractor_obj.motor,
+        "iterar_resultados",
+        streaming({"recetas": [], "error": "JSON cortado"}),
+    )
+    primero = extractor_obj.procesar_archivo(str(ruta))
+    monkeypatch.setattr(
+        extractor_obj.motor, "iterar_resultados", streaming({"recetas": []})
+    )
+    segundo = extractor_obj.procesar_archivo(str(ruta))
+
+    # El bloque fallido se vuelve a pedir, pero su receta no se inserta otra vez
+    assert segundo["bloques_procesados"] == 1
+    assert (primero["recetas_insertadas"], segundo["recetas_insertadas"]) == (1, 0)
+    supabase.insertar_receta.assert_called_once()
+
+
+def test_checkpoint_no_valido_procesa_el_archivo_completo(
+    extractor, tmp_path, monkeypatch
+):
+    extractor_obj, mistral, supabase = extractor
+    monkeypatch.chdir(tmp_path)
+    mistral.extraer_receta.return_value = {"recetas": []}
+    ruta = tmp_path / "chat.txt"
+    ruta.write_text(
+        "[01/10/25, 10:00:00] Ana: Otra cosa\n[02/10/25, 09:00:00] Luis: Hola\n",
+        encoding="utf-8",
+    )
+    supabase.obtener_checkpoint_chat.return_value = {
+        "offset_bytes": 10,
+        "hash_prefijo": "no coincide",
+        "ultimo_timestamp": timestamp_de_fecha_iso("2025-10-02"),
+        "ultima_fecha": "02/10/25 00:00:00",
+    }
+
+    resultado = extractor_obj.procesar_archivo(str(ruta))
+
+    # Otro chat con el mismo nombre de archivo no pierde los mensajes
+    # anteriores a la última fecha del checkpoint
+    assert resultado["mensajes_procesados"] == 2
+
+
+def test_primera_importacion_de_otro_chat_no_usa_la_fecha_de_otro(
+    extractor, tmp_path, monkeypatch
+):
+    extractor_obj, mistral, supabase = extractor
+    monkeypatch.chdir(tmp_path)
+    supabase.obtener_checkpoint_chat.return_value = None
+    supabase.obtener_estado_procesamiento.return_value = "2025-10-21"
+    mistral.extraer_receta.return_value = {"recetas": []}
+    grupo_a = tmp_path / "grupoA.txt"
+    grupo_a.write_text("[21/10/25, 10:00:00] Ana: Receta de flan\n", encoding="utf-8")
+    grupo_b = tmp_path / "grupoB.txt"
+    grupo_b.write_text(
+        "[01/03/24, 10:00:00] Luis: Receta de sopa\n- 2 l agua\n"
+        "[02/03/24, 09:00:00] Luis: Hola\n",
+        encoding="utf-8",
+    )
+
+    extractor_obj.procesar_archivo(str(grupo_a))
+    resultado = extractor_obj.procesar_archivo(str(grupo_b))
+
+    assert resultado["mensajes_procesados"] == 2
+    assert "sopa" in mistral.extraer_receta.call_args.args[0]
+
+
+def test_reimportar_export_solapado_no_llama_a_mistral(extractor, tmp_path):
+    extractor_obj, mistral, supabase = extractor
+    mistral.extraer_receta.return_value = {"recetas": []}
+    ruta = tmp_path / "grupo.txt"
+    ruta.write_text(
+        "[01/10/25, 10:00:00] Ana: Receta de flan\n"
+        "[01/10/25, 10:01:00] Ana: - 2 huevos\n",
+        encoding="utf-8",
+    )
+
+    with patch.object(extractor_obj, "_actualizar_estado_procesamiento"):
+        primero = extractor_obj.procesar_archivo(str(ruta), "2025-01-01")
+        ruta.write_text(
+            ruta.read_text(encoding="utf-8")
+            + "[02/10/25, 09:00:00] Luis: Receta de sopa\n",
+            encoding="utf-8",
+        )
+        segundo = extractor_obj.procesar_archivo(str(ruta), "2025-01-01")
+
+    assert primero["bloques_procesados"] == 1
+    assert segundo["bloques_procesados"] == 1
+    assert segundo["bloques_repetidos"] == 1
+    assert mistral.extraer_receta.call_count == 2
+    assert "sopa" in mistral.extraer_receta.call_args.args[0]
+
+
+def test_workers_dan_el_mismo_resultado_que_en_serie(extractor, tmp_path):
+    extractor_obj, mistral, _ = extractor
+    mistral.extraer_receta.return_value = {"error": "sin llamada real"}
+    lineas = []
+    for i in range(300):
+        dia = 1 + i // 30
+        if i % 7 == 0:
+            lineas.append(
+                f"[{dia:02d}/10/25, 10:{i % 60:02d}:00] Ana: Receta de flan {i}"
+            )
+            lineas.extend(["Ingredientes:", "- 2 huevos", "texto suelto"])
+        elif i % 11 == 0:
+            lineas.append(f"{dia:02d}/10/25, 11:{i % 60:02d} - Luis: - 200 g harina")
+        else:
+            lineas.append(f"[{dia:02d}/10/25, 12:{i % 60:02d}:00] Ana: hola {i}")
+    ruta = tmp_path / "chat.txt"
+    ruta.write_bytes(("﻿" + "\r\n".join(lineas) + "\r\n").encode("utf-8"))
+
+    def procesar(workers):
+        mistral.extraer_receta.reset_mock()
+        with patch.object(extractor_obj, "_actualizar_estado_procesamiento"):
+            resultado = extractor_obj.procesar_archivo(str(ruta), "2025-10-03", workers)
+        return resultado, [c.args[0] for c in mistral.extraer_receta.call_args_list]
+
+    # Tramos diminutos para que cada cabecera pueda acabar en un tramo distinto
+    with patch("src.recetario_whatsapp.extractor.BYTES_POR_TRAMO", 256):
+        en_serie = procesar(1)
+        en_paralelo = procesar(2)
+
+    assert en_serie == en_paralelo
+    assert en_serie[0]["bloques_procesados"] > 0
+
+
+def test_zip_avisa_de_que_no_usa_varios_workers(extractor, tmp_path, capsys):
+    extractor_obj, mistral, _ = extractor
+    mistral.extraer_receta.return_value = {"recetas": []}
+    ruta = tmp_path / "chat.zip"
+    with zipfile.ZipFile(ruta, "w") as archivo:
+        archivo.writestr("_chat.txt", "[01/10/25, 10:00:00] Ana: Receta de flan\n")
+
+    with patch.object(extractor_obj, "_actualizar_estado_procesamiento"):
+        resultado = extractor_obj.procesar_archivo(str(ruta), "2025-01-01", 4)
+
+    assert resultado["mensajes_procesados"] == 1
+    assert "solo disponible para rutas .txt" in capsys.readouterr().out
+
+
+def test_zip_enlaza_fotos_solo_de_recetas_insertadas(extractor, tmp_path, monkeypatch):
+    extractor_obj, mistral, supabase = extractor
+    monkeypatch.chdir(tmp_path)
+    supabase.obtener_checkpoint_chat.return_value = None
+    supabase.imagenes_habilitadas.return_value = True
+    supabase.subir_imagen.side_effect = lambda datos, nombre: {"url": nombre}
+    supabase.insertar_receta.side_effect = [{"id": 7}, None]
+    mistral.extraer_receta.side_effect = [
+        {"recetas": [{"nombre_receta": "Flan", "creador": "Ana"}]},
+        {"recetas": [{"nombre_receta": "Sopa", "creador": "Luis"}]},
+    ]
+    chat = (
+        "\u200e[01/10/25, 10:00:00] Ana: \u200e<adjunto: 0001-PHOTO.jpg>\n"
+        "[01/10/25, 10:00:30] Ana: Receta de flan\n"
+        "\u200e[01/10/25, 10:01:00] Ana: \u200e<adjunto: 0002-PHOTO.jpg>\n"
+        "[01/10/25, 10:05:00] Luis: Receta de sopa\n"
+        "\u200e[01/10/25, 10:06:00] Luis: \u200e<adjunto: 0003-PHOTO.jpg>\n"
+    )
+    ruta = tmp_path / "WhatsApp Chat - Cocina.zip"
+    with zipfile.ZipFile(ruta, "w") as archivo:
+        archivo.writestr("_chat.txt", "\ufeff" + chat)
+        for nombre in ("0001-PHOTO.jpg", "0002-PHOTO.jpg", "0003-PHOTO.jpg"):
+            archivo.writestr(nombre, nombre.encode())
+
+    resultado = extractor_obj.procesar_archivo(str(ruta))
+
+    assert resultado["mensajes_procesados"] == 5
+    assert resultado["recetas_insertadas"] == 1
+    # Solo se suben las fotos de la receta insertada (la sopa falló)
+    assert [c.args[0] for c in supabase.subir_imagen.call_args_list] == [
+        b"0001-PHOTO.jpg",
+        b"0002-PHOTO.jpg",
+    ]
+    receta_id, datos = supabase.actualizar_receta.call_args.args
+    assert receta_id == 7
+    assert len(datos["imagenes"]) == 2
+    assert supabase.insertar_receta.call_args_list[0].args[0]["tiene_foto"] is True
+    assert "adjunto" not in mistral.extraer_receta.call_args_list[0].args[0]
+    assert "WhatsApp Chat - Cocina.zip" in (
+        supabase.guardar_checkpoint_chat.call_args.args[0]
+    )
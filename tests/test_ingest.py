@@ -0,0 +1,87 @@
+"""Tests para `ingest.py`."""
+
+import threading
+from unittest.mock import MagicMock
+
+from src.recetario_whatsapp import ingest
+from src.recetario_whatsapp.ingest import (
+    descubrir_archivos,
+    ingerir_archivos,
+    resumir_resultados,
+)
+
+
+def test_descubrir_archivos_expande_directorios_y_globs(tmp_path):
+    (tmp_path / "grupos" / "viejos").mkdir(parents=True)
+    for nombre in ("grupos/a.txt", "grupos/viejos/b.txt", "grupos/notas.md", "r.xlsx"):
+        (tmp_path / nombre).write_text("x", encoding="utf-8")
+
+    archivos = descubrir_archivos(
+        [
+            str(tmp_path / "grupos"),
+            str(tmp_path / "*.xlsx"),
+            # Ya incluido por el directorio: no se repite
+            str(tmp_path / "grupos" / "a.txt"),
+            str(tmp_path / "no_existe.txt"),
+        ]
+    )
+
+    assert archivos == [
+        str(tmp_path / "grupos" / "a.txt"),
+        str(tmp_path / "grupos" / "viejos" / "b.txt"),
+        str(tmp_path / "r.xlsx"),
+        str(tmp_path / "no_existe.txt"),
+    ]
+
+
+def test_ingerir_archivos_comparte_extractor_y_limita_concurrencia():
+    extractor = MagicMock()
+    activos = []
+    maximo = []
+    lock = threading.Lock()
+    barrera = threading.Barrier(2)
+
+    def procesar(ruta, fecha_desde, workers, refrescar_claves=True):
+        with lock:
+            activos.append(ruta)
+            maximo.append(len(activos))
+        barrera.wait(timeout=5)
+        with lock:
+            activos.remove(ruta)
+        if ruta == "roto.txt":
+            raise OSError("sin permiso")
+        return {"mensajes_procesados": 3, "recetas_extraidas": 1}
+
+    extractor.procesar_archivo.side_effect = procesar
+    archivos = ["a.txt", "b.txt", "c.txt", "roto.txt"]
+
+    resultados = ingerir_archivos(extractor, archivos, concurrencia=2)
+
+    assert [r["archivo"] for r in resultados] == archivos
+    assert max(maximo) == 2
+    assert resultados[3]["error"] == "sin permiso"
+    for llamada in extractor.procesar_archivo.call_args_list:
+        assert llamada.kwargs["refrescar_claves"] is False
+
+    totales = resumir_resultados(resultados)
+    assert totales["archivos"] == 4
+    assert totales["errores"] == 1
+    assert totales["mensajes_procesados"] == 9
+    assert totales["recetas_extraidas"] == 3
+
+
+def test_main_muestra_las_estimaciones_del_clasificador(tmp_path, monkeypatch):
+    chat = tmp_path / "chat.txt"
+    chat.write_text("x", encoding="utf-8")
+    extractor = MagicMock()
+    extractor.umbral_clasificador = 0.05
+    extractor.procesar_archivo.return_value = {"mensajes_procesados": 1}
+    estimaciones = MagicMock()
+    monkeypatch.setattr(ingest, "WhatsAppExtractor", lambda: extractor)
+    monkeypatch.setattr(ingest, "imprimir_estimaciones", estimaciones)
+    monkeypatch.setattr("sys.argv", ["recetario-ingest", str(chat)])
+
+    ingest.main()
+
+    estimaciones.assert_called_once_with(extractor.clasificador, 0.05)
+    extractor.cerrar.assert_called_once()
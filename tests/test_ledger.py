@@ -0,0 +1,81 @@
+"""Tests para `ledger.py`."""
+
+import os
+
+from src.recetario_whatsapp.ledger import (
+    FiltroBloom,
+    LedgerMensajes,
+    huella_mensaje,
+    huella_receta,
+)
+
+
+def _huellas(n, prefijo="m"):
+    return [
+        huella_mensaje({"timestamp": i, "creador": "Ana", "mensaje": f"{prefijo}{i}"})
+        for i in range(n)
+    ]
+
+
+def test_huella_depende_de_fecha_autor_y_texto():
+    base = {"timestamp": 1, "creador": "Ana", "mensaje": "Flan"}
+
+    assert huella_mensaje(base) == huella_mensaje(dict(base))
+    for cambio in ({"timestamp": 2}, {"creador": "Luis"}, {"mensaje": "flan"}):
+        assert huella_mensaje({**base, **cambio}) != huella_mensaje(base)
+
+
+def test_filtro_bloom_sin_falsos_negativos_y_pocos_positivos():
+    filtro = FiltroBloom(5000)
+    dentro = _huellas(5000)
+    for huella in dentro:
+        filtro.agregar(huella)
+
+    falsos_positivos = sum(huella in filtro for huella in _huellas(20000, "otro"))
+
+    assert all(huella in filtro for huella in dentro)
+    assert falsos_positivos < 20000 * 0.02
+
+
+def test_ledger_persiste_por_chat(tmp_path):
+    ruta = str(tmp_path / "ledger.sqlite3")
+    huellas = _huellas(3)
+    ledger = LedgerMensajes(ruta)
+
+    assert ledger.registrar("grupo", huellas[:2]) == 2
+    assert ledger.registrar("grupo", huellas[:2]) == 0
+    ledger.cerrar()
+
+    reabierto = LedgerMensajes(ruta)
+    assert reabierto.conocidas("grupo", huellas) == set(huellas[:2])
+    assert reabierto.todas_conocidas("grupo", huellas[:2])
+    assert not reabierto.todas_conocidas("grupo", huellas)
+    assert not reabierto.conocidas("otro_grupo", huellas)
+    assert os.path.exists(ruta)
+
+
+def test_ledger_reconstruye_el_filtro_al_llenarse(tmp_path):
+    ledger = LedgerMensajes(str(tmp_path / "ledger.sqlite3"))
+    huellas = _huellas(3000)
+
+    ledger.registrar("grupo", huellas)
+
+    assert ledger.todas_conocidas("grupo", huellas)
+    assert ledger._filtro("grupo").capacidad >= 3000
+
+
+def test_ledger_recuerda_recetas_insertadas_por_chat(tmp_path):
+    ruta = str(tmp_path / "ledger.sqlite3")
+    receta = {"creador": "Ana", "nombre_receta": "Flan", "fecha_mensaje": "2025"}
+    huella = huella_receta(receta)
+    ledger = LedgerMensajes(ruta)
+
+    ledger.registrar_receta("grupo", huella)
+    ledger.cerrar()
+
+    reabierto = LedgerMensajes(ruta)
+    assert reabierto.receta_registrada("grupo", huella)
+    assert not reabierto.receta_registrada("otro_grupo", huella)
+    # Sin distinguir mayúsculas ni espacios, pero sí la fecha del mensaje
+    assert huella_receta({**receta, "nombre_receta": " flan "}) == huella
+    assert huella_receta({**receta, "fecha_mensaje": "2024"}) != huella
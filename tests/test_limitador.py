@@ -0,0 +1,105 @@
+"""Tests para `limitador.py`."""
+
+import asyncio
+import threading
+
+from src.recetario_whatsapp.limitador import (
+    CuboTokens,
+    LimitadorCompartido,
+    LimitadorMistral,
+)
+
+
+def test_cubo_espera_lo_justo_para_cubrir_la_deuda():
+    cubo = CuboTokens(60)  # una unidad por segundo
+    cubo.actualizado = 0.0
+
+    assert cubo.reservar(60, ahora=0.0) == 0.0
+    # Sin saldo: la siguiente unidad llega en un segundo, la otra en dos
+    assert cubo.reservar(1, ahora=0.0) == 1.0
+    assert cubo.reservar(1, ahora=0.0) == 2.0
+    # Pasado el tiempo la deuda se ha cubierto
+    assert cubo.reservar(1, ahora=5.0) == 0.0
+
+
+def test_cubo_limita_reservas_mayores_que_su_capacidad():
+    cubo = CuboTokens(60)
+    cubo.actualizado = 0.0
+
+    assert cubo.reservar(600, ahora=0.0) == 0.0
+    assert cubo.reservar(30, ahora=0.0) == 30.0
+
+    cubo.devolver(30, ahora=0.0)
+    assert cubo.saldo == 0.0
+
+
+def test_limitador_devuelve_tokens_no_usados():
+    limitador = LimitadorMistral(peticiones_por_minuto=0, tokens_por_minuto=1000)
+
+    assert limitador.reservar(1000) == 0.0
+    limitador.ajustar(reservados=1000, usados=400)
+    # Los 600 devueltos cubren la siguiente reserva sin espera
+    assert limitador.reservar(500) == 0.0
+    assert limitador.reservar(500) > 0
+
+
+def test_limitador_con_limites_a_cero_no_espera():
+    limitador = LimitadorMistral(peticiones_por_minuto=0, tokens_por_minuto=0)
+
+    for _ in range(100):
+        assert limitador.reservar(10_000) == 0.0
+    limitador.ajustar(10_000, None)
+
+
+def test_limitador_compartido_descuenta_el_mismo_saldo(tmp_path):
+    ruta = str(tmp_path / "limitador.sqlite3")
+    # Dos instancias con su propia conexión, como dos procesos distintos
+    cli = LimitadorCompartido(peticiones_por_minuto=2, tokens_por_minuto=0, ruta=ruta)
+    streamlit = LimitadorCompartido(
+        peticiones_por_minuto=2, tokens_por_minuto=0, ruta=ruta
+    )
+
+    try:
+        assert cli.reservar(100) == 0.0
+        assert streamlit.reservar(100) == 0.0
+        # El cubo de peticiones ya está vacío para los dos
+        assert cli.reservar(100) > 0
+
+        uso = streamlit.utilizacion()
+        assert list(uso) == ["peticiones"]
+        assert uso["peticiones"]["uso"] > 1
+        assert uso["peticiones"]["espera_seg"] > 0
+    finally:
+        cli.cerrar()
+        streamlit.cerrar()
+
+
+def test_reservar_sin_esperar_no_deja_deuda():
+    limitador = LimitadorMistral(peticiones_por_minuto=60, tokens_por_minuto=1000)
+
+    assert limitador.reservar_sin_esperar(900)
+    # No hay saldo para otros 900 tokens: no se reserva nada
+    assert not limitador.reservar_sin_esperar(900)
+    assert limitador.utilizacion()["peticiones"]["disponible"] < 60
+    assert limitador.reservar(100) == 0.0
+
+
+def test_limitador_compartido_reserva_fuera_del_bucle(tmp_path, monkeypatch):
+    limitador = LimitadorCompartido(
+        peticiones_por_minuto=60, tokens_por_minuto=0, ruta=str(tmp_path / "l.db")
+    )
+    hilos = []
+    reservar = limitador.reservar
+
+    def reservar_y_anotar(tokens):
+        hilos.append(threading.get_ident())
+        return reservar(tokens)
+
+    monkeypatch.setattr(limitador, "reservar", reservar_y_anotar)
+
+    try:
+        asyncio.run(limitador.esperar_async(100))
+    finally:
+        limitador.cerrar()
+
+    assert hilos and hilos[0] != threading.get_ident()
@@ -0,0 +1,25 @@
+"""Tests para `prompts.py`."""
+
+import pytest
+
+from src.recetario_whatsapp.prompts import (
+    PROMPT_COMPACTO,
+    PROMPT_EJEMPLOS,
+    cadena_prompts,
+    version_cadena,
+)
+from src.recetario_whatsapp.tokenizador import contar_aproximado
+
+
+def test_cadena_adaptativa_empieza_por_el_prompt_compacto():
+    cadena = cadena_prompts("adaptativo")
+
+    assert cadena == (PROMPT_COMPACTO, PROMPT_EJEMPLOS)
+    assert contar_aproximado(PROMPT_COMPACTO.instrucciones) * 3 < contar_aproximado(
+        PROMPT_EJEMPLOS.instrucciones
+    )
+    # Cambiar la cadena cambia la clave de la caché
+    assert version_cadena(cadena) != version_cadena(cadena_prompts("ejemplos"))
+
+    with pytest.raises(ValueError):
+        cadena_prompts("largo")
@@ -0,0 +1,63 @@
+"""Tests para `recipe_matcher.py`."""
+
+import pytest
+
+from src.recetario_whatsapp.recipe_matcher import DetectorReceta
+
+
+@pytest.fixture(scope="module")
+def detector():
+    return DetectorReceta()
+
+
+def test_analizar_devuelve_todos_los_rasgos(detector):
+    rasgos = detector.analizar("- 200 g HARINA y hornear")
+
+    assert rasgos.marcador_lista
+    assert rasgos.cantidad and rasgos.cantidad_simple
+    assert rasgos.palabra_cocina and rasgos.palabra_continuacion
+    assert not rasgos.indicador
+    assert rasgos.es_receta and rasgos.es_continuacion and rasgos.es_linea_receta
+
+
+@pytest.mark.parametrize(
+    "texto, es_receta",
+    [
+        ("Receta de lentejas", True),
+        ("Estofado costilla", True),
+        ("El estofado de ayer me salió fatal, la próxima vez", False),
+        ("Pollo 1kg", True),
+        ("2 cditas y hervir", True),
+        ("jaja qué guay", False),
+    ],
+)
+def test_es_receta(detector, texto, es_receta):
+    assert detector.es_receta(texto) is es_receta
+
+
+def test_coincidencias_solapadas_no_se_pierden(detector):
+    # "pasos" y "sopa" comparten la "s"; ambas deben detectarse
+    rasgos = detector.analizar("pasosopa")
+
+    assert rasgos.palabra_continuacion
+    assert rasgos.palabra_receta
+
+
+def test_linea_de_sistema_no_es_receta(detector):
+    assert not detector.es_linea_receta("<Multimedia omitido> 2 kg")
+    assert not detector.es_linea_receta("   ")
+    assert detector.es_linea_receta("3. Servir")
+
+
+def test_analizar_lote_equivale_a_analizar_uno_a_uno(detector):
+    textos = [
+        "Receta: flan",
+        "",
+        "2 kg\n- huevos",
+        "2\x00kg",
+        "hola",
+        "1 unidades",
+        "15min olla",
+    ]
+
+    assert detector.analizar_lote(textos) == [detector.analizar(t) for t in textos]
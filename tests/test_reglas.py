@@ -0,0 +1,64 @@
+"""Tests para `reglas.py`."""
+
+import pytest
+
+from src.recetario_whatsapp.reglas import extraer_receta_por_reglas
+
+
+def test_plantilla_da_el_mismo_resultado_que_mistral():
+    texto = (
+        "[02/10/25 12:10:01] Marta: *Receta:* Gazpacho\n"
+        "Ingredientes:\n- 1 kg tomates\n- 1 pepino\n- 1.5 pimientos\n"
+        "[02/10/25 12:11:30] Marta: Pasos:\n1. Triturar todo\n2) Refrigerar.\n"
+        "<adjunto: 00000012-PHOTO-2025-10-02-12-11-30.jpg>\n"
+    )
+
+    assert extraer_receta_por_reglas(texto) == {
+        "recetas": [
+            {
+                "creador": "Marta",
+                "nombre_receta": "Gazpacho",
+                "ingredientes": "1 kg tomates, 1 pepino, 1.5 pimientos",
+                "pasos_preparacion": "Triturar todo. Refrigerar.",
+                "tiene_foto": True,
+                "fecha_mensaje": "2025-10-02T12:10:01+00:00",
+            }
+        ],
+        "origen": "reglas",
+    }
+
+
+def test_titulo_suelto_e_ingredientes_en_linea():
+    texto = (
+        "[01/10/25 18:02:13] Ana: Bizcocho de yogur\n"
+        "Ingredientes: 1 yogur, 3 huevos, harina\n"
+        "Elaboración: batir y hornear 40 minutos\n"
+    )
+
+    receta = extraer_receta_por_reglas(texto)["recetas"][0]
+
+    assert receta["nombre_receta"] == "Bizcocho de yogur"
+    assert receta["ingredientes"] == "1 yogur, 3 huevos, harina"
+    assert receta["pasos_preparacion"] == "batir y hornear 40 minutos."
+    assert receta["tiene_foto"] is False
+
+
+@pytest.mark.parametrize(
+    "texto",
+    [
+        # Sin pasos
+        "[01/10/25 18:02:13] Ana: Ingredientes:\n- harina\n",
+        # Conversación antes de la receta
+        "[01/10/25 18:02:12] Ana: ¡Probad esta receta!\n"
+        "[01/10/25 18:02:13] Ana: Ingredientes:\n- harina\nPasos:\nHornear\n",
+        # Dos recetas en el mismo bloque
+        "[01/10/25 18:02:13] Ana: Receta: Pan\nIngredientes: harina\nPasos: hornear\n"
+        "Receta: Bizcocho\nIngredientes: huevos\nPasos: hornear\n",
+        # Pasos antes que los ingredientes
+        "[01/10/25 18:02:13] Ana: Pasos: hornear\nIngredientes: harina\n",
+        # Trozo de un bloque partido que no empieza en un mensaje
+        "- harina\nPasos:\nHornear\n",
+    ],
+)
+def test_bloques_ambiguos_se_dejan_a_mistral(texto):
+    assert extraer_receta_por_reglas(texto) is None
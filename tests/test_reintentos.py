@@ -0,0 +1,153 @@
+"""Tests para `reintentos.py` y los reintentos de `MistralClient`."""
+
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+import httpx
+import pytest
+from mistralai.models import SDKError
+
+from src.recetario_whatsapp import mistral_client
+from src.recetario_whatsapp.mistral_client import MistralClient
+from src.recetario_whatsapp.reintentos import (
+    ERROR_CAPACIDAD,
+    ERROR_PERMANENTE,
+    ERROR_RED,
+    ERROR_SERVIDOR,
+    CircuitoMistral,
+    PoliticaReintentos,
+    clasificar_error,
+    segundos_retry_after,
+)
+
+
+def _error_http(estado, cabeceras=None, cuerpo=""):
+    respuesta = httpx.Response(
+        estado, headers=cabeceras or {}, text=cuerpo, request=httpx.Request("POST", "/")
+    )
+    return SDKError("API error occurred", respuesta)
+
+
+def test_clasifica_errores_por_codigo_y_lee_retry_after():
+    assert clasificar_error(_error_http(429)) == ERROR_CAPACIDAD
+    assert clasificar_error(_error_http(503, cuerpo="capacity exceeded")) == (
+        ERROR_CAPACIDAD
+    )
+    assert clasificar_error(_error_http(502)) == ERROR_SERVIDOR
+    # Un 400 que menciona "429" en el cuerpo no es de capacidad
+    assert clasificar_error(_error_http(400, cuerpo="max 429 tokens")) == (
+        ERROR_PERMANENTE
+    )
+    assert clasificar_error(httpx.ConnectTimeout("timeout")) == ERROR_RED
+
+    assert segundos_retry_after(_error_http(429, {"Retry-After": "7"})) == 7.0
+    fecha = "Wed, 21 Oct 2015 07:28:00 GMT"
+    assert segundos_retry_after(_error_http(429, {"Retry-After": fecha})) == 0.0
+    assert segundos_retry_after(_error_http(429)) is None
+
+
+def test_politica_exponencial_con_jitter_y_retry_after():
+    politica = PoliticaReintentos(
+        max_reintentos=5, espera_base=2, espera_maxima=10, aleatorio=lambda: 0.5
+    )
+
+    assert [politica.espera(i) for i in range(4)] == [1.5, 3.0, 6.0, 7.5]
+    assert politica.espera(4) is None
+    assert politica.espera(0, retry_after=20) == 21.0
+
+
+def test_circuito_se_abre_prueba_y_se_cierra():
+    ahora = [0.0]
+    circuito = CircuitoMistral(umbral_fallos=2, pausa=10, reloj=lambda: ahora[0])
+
+    circuito.registrar_fallo()
+    assert circuito.reservar() == 0.0
+    circuito.registrar_fallo()
+    assert circuito.abierto and circuito.reservar() == 10.0
+
+    # Pasada la pausa sale una sola llamada de prueba
+    ahora[0] = 10.0
+    assert circuito.reservar() == 0.0
+    assert circuito.reservar() > 0
+    # Si falla, la siguiente pausa es el doble
+    circuito.registrar_fallo()
+    assert circuito.reservar() == 20.0
+
+    ahora[0] = 30.0
+    assert circuito.reservar() == 0.0
+    circuito.registrar_exito()
+    assert not circuito.abierto and circuito.reservar() == 0.0
+
+
+@pytest.fixture
+def cliente(mock_env_vars, monkeypatch):
+    monkeypatch.setenv("CACHE_LLM", "false")
+    monkeypatch.setenv("MISTRAL_RPM", "0")
+    monkeypatch.setenv("MISTRAL_MAX_REINTENTOS", "2")
+    monkeypatch.setenv("MISTRAL_CIRCUITO_FALLOS", "3")
+    monkeypatch.setenv("MISTRAL_CIRCUITO_PAUSA_SEG", "0.01")
+    cliente = MistralClient()
+    yield cliente
+    cliente.cerrar()
+
+
+def _respuesta_vacia():
+    eleccion = SimpleNamespace(
+        message=SimpleNamespace(content='{"recetas": []}'), finish_reason="stop"
+    )
+    return SimpleNamespace(choices=[eleccion], usage=None)
+
+
+def test_una_racha_de_429_pausa_en_lugar_de_usar_el_fallback(cliente, monkeypatch):
+    sdk = MagicMock()
+    sdk.chat.complete.side_effect = [_error_http(429)] * 6 + [_respuesta_vacia()]
+    monkeypatch.setattr(cliente.backend, "_cliente", lambda: sdk)
+    monkeypatch.setattr(mistral_client.time, "sleep", lambda segundos: None)
+
+    resultado = cliente.extraer_receta("[01/10/25 18:02:13] Ana: 200 g harina\n")
+
+    # Más fallos que reintentos, pero con el circuito abierto no se agotan
+    assert resultado.pop("tokens_entrada") > 0
+    assert resultado == {"recetas": []}
+    assert sdk.chat.complete.call_count == 7
+    assert not cliente.circuito.abierto
+
+
+def test_errores_permanentes_no_se_reintentan(cliente, monkeypatch):
+    sdk = MagicMock()
+    sdk.chat.complete.side_effect = _error_http(401)
+    monkeypatch.setattr(cliente.backend, "_cliente", lambda: sdk)
+
+    resultado = cliente.extraer_receta("[01/10/25 18:02:13] Ana: 200 g harina\n")
+
+    assert "error" in resultado
+    sdk.chat.complete.assert_called_once()
+
+
+def test_un_error_local_no_cierra_el_circuito(cliente):
+    cliente.circuito.registrar_fallo(abrir=True)
+
+    assert cliente._espera_reintento(ValueError("JSON mal formado"), 0) is None
+    assert cliente.circuito.abierto
+
+    # Un error HTTP permanente sí es una respuesta de la API
+    cliente._espera_reintento(_error_http(401), 0)
+    assert not cliente.circuito.abierto
+
+
+def test_las_correcciones_esperan_al_circuito(cliente, monkeypatch):
+    sdk = MagicMock()
+    sdk.chat.complete.side_effect = _error_http(503)
+    monkeypatch.setattr(cliente.backend, "_cliente", lambda: sdk)
+    esperas = []
+    monkeypatch.setattr(cliente.circuito, "esperar", lambda: esperas.append(1))
+    receta = {"creador": "Ana", "ingredientes": "harina", "fecha_mensaje": "ayer"}
+
+    cliente._corregir_invalidas(
+        {"recetas": [], "invalidas": [(receta, ["fecha"])] * 3},
+        "[01/10/25 18:02:13] Ana: 200 g harina\n",
+    )
+
+    assert len(esperas) == 3
+    # Sus errores transitorios también cuentan para abrirlo
+    assert cliente.circuito.abierto
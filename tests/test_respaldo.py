@@ -0,0 +1,60 @@
+"""Tests para `respaldo.py`."""
+
+import time
+
+import pytest
+
+from src.recetario_whatsapp.respaldo import extraer_recetas_regex
+
+
+def test_extrae_recetas_de_bloques_y_de_lineas_del_chat():
+    texto = (
+        "[01/10/25 18:02:13] Ana: Bizcocho\n- 200 g harina\n- 2 huevos\n"
+        "Preparación: mezclar y hornear\n"
+        "[01/10/25, 18:05] Luis: jaja qué bien\n"
+        "[02/10/25 09:00:00] Eva: 1 kg tomates, triturar (foto)\n"
+    )
+
+    ana, eva = extraer_recetas_regex(texto)
+
+    assert ana == {
+        "creador": "Ana",
+        "nombre_receta": "Bizcocho",
+        "ingredientes": "Bizcocho\n- 200 g harina\n- 2 huevos",
+        "pasos_preparacion": "Preparación: mezclar y hornear",
+        "tiene_foto": False,
+        "fecha_mensaje": "2025-10-01T18:02:13+00:00",
+    }
+    assert eva["creador"] == "Eva"
+    assert eva["tiene_foto"] is True
+    assert eva["pasos_preparacion"] is None
+
+
+def _tiempo(texto):
+    mejor = float("inf")
+    for _ in range(3):
+        inicio = time.perf_counter()
+        extraer_recetas_regex(texto)
+        mejor = min(mejor, time.perf_counter() - inicio)
+    return mejor
+
+
+@pytest.mark.parametrize(
+    "generar",
+    [
+        # Mensaje enorme sin cabeceras
+        lambda n: "x[" * n,
+        # Series de dígitos y espacios que no forman una cantidad
+        lambda n: "[01/10/25 18:02:13] Ana: " + "1" * n + " " * n + "!",
+        # Muchos corchetes y dos puntos que casi son cabeceras
+        lambda n: "\n[01/10/25 18:02:13] Ana" * (n // 24),
+        # Muchos mensajes cortos
+        lambda n: "[01/10/25 18:02:13] Ana: 2 huevos\n" * (n // 34),
+    ],
+)
+def test_coste_lineal_con_entradas_adversas(generar):
+    pequeno = _tiempo(generar(20_000))
+    grande = _tiempo(generar(160_000))
+
+    # Lineal: ~8 veces más; cuadrático: ~64
+    assert grande < pequeno * 20 + 0.05
@@ -0,0 +1,25 @@
+"""Tests para `tokenizador.py`."""
+
+from unittest.mock import MagicMock, patch
+
+from src.recetario_whatsapp import tokenizador
+from src.recetario_whatsapp.tokenizador import ContadorTokens, contar_aproximado
+
+
+def test_sin_tokenizador_se_estima_por_caracteres():
+    with patch.object(tokenizador, "_cargar_tokenizador", return_value=None):
+        contador = ContadorTokens("mistral-small-latest")
+
+    assert not contador.exacto
+    assert contador.contar("x" * 41) == contar_aproximado("x" * 41) == 10
+
+
+def test_con_tokenizador_cuenta_tokens_reales():
+    real = MagicMock()
+    real.encode.return_value = [1, 2, 3]
+    with patch.object(tokenizador, "_cargar_tokenizador", return_value=real):
+        contador = ContadorTokens("mistral-small-latest")
+
+    assert contador.exacto
+    assert contador.contar("hola mundo") == 3
+    real.encode.assert_called_once_with("hola mundo", bos=False, eos=False)